@@ -1,3 +1,4 @@
 from .abie import ABIE
+from .farm import farm
 from .snapshot_serialization import snapshot_convert
 from .tools import Tools
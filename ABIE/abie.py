@@ -15,6 +15,8 @@ import numpy as np
 import sys
 from .data_io import DataIO
 from .integrator import Integrator
+from .clibabie import CLibABIE
+from .async_integration import AsyncIntegration
 
 
 class ABIE(object):
@@ -35,6 +37,16 @@ class ABIE(object):
         self.__max_close_encounter_events = 1
         self.__max_collision_events = 1
         self.__close_encounter_distance = 0.0
+        self.__force_method = 'direct'
+        self.__opening_angle = 0.5
+        self.__expansion_order = 4
+        self.__mixed_precision = False
+        self.__num_threads = None
+        self.__collision_outcome = 'stop'
+        self.__restitution = 1.0
+        self.__continuous_collisions = True
+        self.__output_schedule = None
+        self.__n_outputs = None
         # self.acceleration_method = 'numpy'
 
         # load integrator modules
@@ -86,6 +98,136 @@ class ABIE(object):
         if self.__integrator is not None:
             self.__integrator.close_encounter_distance = value
 
+    @property
+    def force_method(self):
+        if self.__integrator is not None:
+            self.__force_method = self.__integrator.force_method
+            return self.__force_method
+        else:
+            return self.__force_method
+
+    @force_method.setter
+    def force_method(self, value):
+        self.__force_method = value
+        if self.__integrator is not None:
+            self.__integrator.force_method = value
+
+    @property
+    def opening_angle(self):
+        if self.__integrator is not None:
+            self.__opening_angle = self.__integrator.opening_angle
+            return self.__opening_angle
+        else:
+            return self.__opening_angle
+
+    @opening_angle.setter
+    def opening_angle(self, value):
+        self.__opening_angle = value
+        if self.__integrator is not None:
+            self.__integrator.opening_angle = value
+
+    @property
+    def expansion_order(self):
+        if self.__integrator is not None:
+            self.__expansion_order = self.__integrator.expansion_order
+            return self.__expansion_order
+        else:
+            return self.__expansion_order
+
+    @expansion_order.setter
+    def expansion_order(self, value):
+        self.__expansion_order = value
+        if self.__integrator is not None:
+            self.__integrator.expansion_order = value
+
+    @property
+    def mixed_precision(self):
+        if self.__integrator is not None:
+            self.__mixed_precision = self.__integrator.mixed_precision
+            return self.__mixed_precision
+        else:
+            return self.__mixed_precision
+
+    @mixed_precision.setter
+    def mixed_precision(self, value):
+        self.__mixed_precision = value
+        if self.__integrator is not None:
+            self.__integrator.mixed_precision = value
+
+    @property
+    def num_threads(self):
+        if self.__integrator is not None:
+            self.__num_threads = self.__integrator.num_threads
+            return self.__num_threads
+        else:
+            return self.__num_threads
+
+    @num_threads.setter
+    def num_threads(self, value):
+        self.__num_threads = value
+        if self.__integrator is not None:
+            self.__integrator.num_threads = value
+
+    @property
+    def collision_outcome(self):
+        if self.__integrator is not None:
+            self.__collision_outcome = self.__integrator.collision_outcome
+            return self.__collision_outcome
+        else:
+            return self.__collision_outcome
+
+    @collision_outcome.setter
+    def collision_outcome(self, value):
+        self.__collision_outcome = value
+        if self.__integrator is not None:
+            self.__integrator.collision_outcome = value
+
+    @property
+    def restitution(self):
+        if self.__integrator is not None:
+            self.__restitution = self.__integrator.restitution
+            return self.__restitution
+        else:
+            return self.__restitution
+
+    @restitution.setter
+    def restitution(self, value):
+        self.__restitution = value
+        if self.__integrator is not None:
+            self.__integrator.restitution = value
+
+    @property
+    def continuous_collisions(self):
+        if self.__integrator is not None:
+            self.__continuous_collisions = self.__integrator.continuous_collisions
+            return self.__continuous_collisions
+        else:
+            return self.__continuous_collisions
+
+    @continuous_collisions.setter
+    def continuous_collisions(self, value):
+        self.__continuous_collisions = value
+        if self.__integrator is not None:
+            self.__integrator.continuous_collisions = value
+
+    @property
+    def output_schedule(self):
+        if self.__integrator is not None:
+            return self.__integrator.output_schedule
+        else:
+            return self.__output_schedule
+
+    def set_output_schedule(self, schedule='uniform', n=None):
+        """
+        Collect the snapshots in the C library according to an output schedule (see Integrator.set_output_schedule)
+        :param schedule: 'uniform', 'log', an array of output times, or None
+        :param n: the number of snapshots of the 'log' schedule
+        """
+        self.__output_schedule = schedule
+        self.__n_outputs = n
+        if self.__integrator is not None:
+            self.__integrator.set_output_schedule(schedule, n)
+
     @property
     def close_encounter_output_file(self):
         if self.__integrator is not None:
@@ -243,6 +385,15 @@ class ABIE(object):
             self.__integrator.close_encounter_output_file = self.close_encounter_output_file
             self.__integrator.store_dt = self.__store_dt
             self.__integrator.buffer_len = self.__buffer_len
+            self.__integrator.force_method = self.__force_method
+            self.__integrator.opening_angle = self.__opening_angle
+            self.__integrator.expansion_order = self.__expansion_order
+            self.__integrator.mixed_precision = self.__mixed_precision
+            self.__integrator.num_threads = self.__num_threads
+            self.__integrator.restitution = self.__restitution
+            self.__integrator.collision_outcome = self.__collision_outcome
+            self.__integrator.continuous_collisions = self.__continuous_collisions
+            self.__integrator.set_output_schedule(self.__output_schedule, self.__n_outputs)
 
     def initialize(self, config=None):
         # Initialize the integrator
@@ -263,17 +414,37 @@ class ABIE(object):
 
 
         if config is not None:
-            # Gravitational parameter
-            self.integrator.CONST_G = np.array(config['physical_params']['G'])
-
             # Integration parameters
             self.integrator = config['integration']['integrator']
             self.integrator.initialize()
+
+            # Gravitational parameter (set after the integrator is created, which takes it from this instance)
+            self.CONST_G = float(config['physical_params']['G'])
             self.integrator.h = float(config['integration']['h'])
             if 'acc_method' in config['integration']:
                 self.integrator.acceleration_method = config['integration']['acc_method']
             else:
                 self.integrator.acceleration_method = 'ctypes'
+            if 'force_method' in config['integration']:
+                self.force_method = config['integration']['force_method']
+            if 'opening_angle' in config['integration']:
+                self.opening_angle = float(config['integration']['opening_angle'])
+            if 'expansion_order' in config['integration']:
+                self.expansion_order = int(config['integration']['expansion_order'])
+            if 'mixed_precision' in config['integration']:
+                self.mixed_precision = bool(config['integration']['mixed_precision'])
+            if 'num_threads' in config['integration']:
+                self.num_threads = int(config['integration']['num_threads'])
+            if 'collision_outcome' in config['integration']:
+                self.collision_outcome = config['integration']['collision_outcome']
+            if 'restitution' in config['integration']:
+                self.restitution = float(config['integration']['restitution'])
+            if 'continuous_collisions' in config['integration']:
+                self.continuous_collisions = bool(config['integration']['continuous_collisions'])
+            if 'output_schedule' in config['integration']:
+                n_outputs = config['integration'].get('n_outputs', None)
+                self.set_output_schedule(config['integration']['output_schedule'],
+                                         None if n_outputs is None else int(n_outputs))
 
             # Load sequence of object names
             if 'names' in config:
@@ -307,12 +478,63 @@ class ABIE(object):
             self.stop()
             sys.exit(0)
 
+    def integrate_async(self, to_time=None, progress=None):
+        """
+        Integrate the system in a worker thread, so that the asyncio event loop stays responsive; must be called from
+        a coroutine. Several simulations can be integrated concurrently this way, with the C library or in numpy mode
+        (every simulation has its own C context, and its own NumPy force threads and work buffers), but one
+        simulation must not be integrated by two calls at the same time.
+        :param to_time: the termination time, as in integrate()
+        :param progress: called in the event loop after each chunk of output steps as progress(t, steps_per_sec, dE/E0)
+        :return: an AsyncIntegration, which can be awaited for the return value of integrate(), iterated with
+                 `async for` over the state after each chunk, and cancelled with cancel()
+        """
+        return AsyncIntegration(self.integrator, to_time, progress)
+
+    def integrate_ensemble(self, states, masses, t_end, radii=None, t=0.0, close_encounter_distance=0.0):
+        """
+        Integrate an ensemble of independent small systems (e.g., a parameter sweep) in one call of the C library,
+        with the systems distributed over the OpenMP threads. Each system is integrated with adaptive Gauss-Radau15
+        steps and stops at its first collision or close encounter, independently of the others. The particles of the
+        simulation are not used.
+        :param states: M x N x 6 array of [x, y, z, vx, vy, vz] of the N bodies of each of the M systems
+        :param masses: the masses, either N (the same for all systems) or M x N
+        :param t_end: the termination time
+        :param radii: the radii, either N or M x N (default: 0, no collisions)
+        :param t: the initial time
+        :param close_encounter_distance: the separation that counts as a close encounter (0 to ignore)
+        :return: the M x N x 6 states at the end, the status of each system (0: reached t_end; 1: close encounter;
+                 2: collision; 3: stopped because its state or step size was not finite) and an M x 4 array of
+                 [time, id1, id2, distance] of the events
+        """
+        states = np.asarray(states, dtype=np.double)
+        if states.ndim != 3 or states.shape[2] != 6 or states.shape[1] < 2:
+            raise ValueError('states must be an M x N x 6 array with N >= 2')
+        M, N = states.shape[:2]
+        if t_end <= t:
+            raise ValueError('t_end must be larger than t')
+        masses = np.ascontiguousarray(np.broadcast_to(masses, (M, N)), dtype=np.double)
+        radii = np.zeros((M, N)) if radii is None else np.ascontiguousarray(np.broadcast_to(radii, (M, N)),
+                                                                              dtype=np.double)
+        pos = np.ascontiguousarray(states[:, :, 0:3]).reshape(M, 3 * N)
+        vel = np.ascontiguousarray(states[:, :, 3:6]).reshape(M, 3 * N)
+
+        libabie = self.__integrator.libabie if self.__integrator is not None else CLibABIE()
+        if self.__num_threads is not None:
+            libabie.set_num_threads(int(self.__num_threads))
+        status, events = libabie.integrator_ensemble(pos, vel, masses, radii, self.CONST_G, t, t_end,
+                                                     close_encounter_distance)
+        return np.concatenate((pos.reshape(M, N, 3), vel.reshape(M, N, 3)), axis=2), status, events
+
     def calculate_orbital_elements(self, primary=None):
         return self.integrator.calculate_orbital_elements(primary)
 
     def calculate_energy(self):
         return self.integrator.calculate_energy()
 
+    def calculate_force_error(self, n_sample=1000):
+        return self.integrator.calculate_force_error(n_sample)
+
     def add(self, pos=None, vel=None, x=None, y=None, z=None, vx=None, vy=None, vz=None, mass=0.0, name=None,
             radius=0.0, ptype=0, a=None, e=0.0, i=0.0, Omega=0.0, omega=0.0, f=0.0, primary=None):
         if x is not None and y is not None and z is not None:
@@ -334,6 +556,11 @@ class ABIE(object):
 
 
 def main():
+    if len(sys.argv) > 1 and sys.argv[1] == 'farm':
+        # abie farm <config files>: run many simulations on a pool of processes
+        from .farm import main as farm_main
+        return farm_main(sys.argv[2:])
+
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', '--config', help='config file', default=None)
     parser.add_argument('-o', '--output_file', dest='output_file', help='output data file', default='data.hdf5')
@@ -0,0 +1,66 @@
+import asyncio
+
+
+class AsyncIntegration(object):
+    """
+    An integration running in a worker thread of the asyncio event loop, returned by ABIE.integrate_async().
+
+    Awaiting it returns the value of integrate() (0, or 1 / 2 after a collision / close encounter). Iterating over it
+    with `async for` yields the state after each chunk of output steps as (t, positions, velocities, dE/E0), until
+    the integration ends. The progress callback, if any, is called in the event loop as progress(t, steps_per_sec,
+    dE/E0) after each chunk.
+    """
+
+    def __init__(self, integrator, to_time=None, progress=None):
+        self.__integrator = integrator
+        self.__progress = progress
+        self.__loop = asyncio.get_running_loop()
+        self.__states = asyncio.Queue()
+        self.__previous_callback = integrator.progress_callback
+        integrator.cancel_event.clear()
+        integrator.progress_callback = self.__on_chunk
+        self.__future = self.__loop.run_in_executor(None, self.__run, to_time)
+        # cancelling the awaiting task (e.g., by asyncio.wait_for) also stops the integration
+        self.__future.add_done_callback(lambda future: future.cancelled() and self.cancel())
+
+    def __run(self, to_time):
+        try:
+            return self.__integrator.integrate(to_time)
+        finally:
+            self.__integrator.progress_callback = self.__previous_callback
+            self.__loop.call_soon_threadsafe(self.__states.put_nowait, None)
+
+    def __on_chunk(self, t, steps_per_sec, energy_error):
+        # called in the worker thread
+        state = (t, self.__integrator.particles.positions.copy(), self.__integrator.particles.velocities.copy(),
+                 energy_error)
+        self.__loop.call_soon_threadsafe(self.__publish, state, steps_per_sec)
+
+    def __publish(self, state, steps_per_sec):
+        self.__states.put_nowait(state)
+        if self.__progress is not None:
+            self.__progress(state[0], steps_per_sec, state[3])
+
+    def cancel(self):
+        """
+        Stop the integration at the end of the current chunk. The simulation keeps the state at that time, and can be
+        continued by another call of integrate() or integrate_async().
+        """
+        self.__integrator.cancel_event.set()
+
+    def done(self):
+        return self.__future.done()
+
+    def __await__(self):
+        return self.__future.__await__()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        state = await self.__states.get()
+        if state is None:
+            # keep the end marker for later iterations
+            self.__states.put_nowait(None)
+            raise StopAsyncIteration
+        return state
@@ -3,13 +3,113 @@ import inspect
 import os
 import sys
 import platform
+import types
 import numpy as np
 from .events import CollisionException, CloseEncounterException
 
 
+def _array(dtype, nullable=False):
+    """
+    The ctypes argument type of a C-contiguous NumPy array of dtype, which is passed to C as a pointer to its data. The
+    array is checked on every call; the pointer is taken from its buffer rather than through the slower ndarray.ctypes.
+    """
+    dtype = np.dtype(dtype)
+
+    class Array(object):
+        @classmethod
+        def from_param(cls, obj):
+            if obj is None and nullable:
+                return None
+            if not isinstance(obj, np.ndarray) or obj.dtype != dtype or not obj.flags.c_contiguous:
+                raise TypeError('a C-contiguous array of type %s is required' % dtype.name)
+            if obj.flags.writeable and obj.size > 0:
+                return ctypes.byref(ctypes.c_char.from_buffer(obj))
+            return ctypes.c_void_p(obj.ctypes.data)
+
+    return Array
+
+
+def _prototypes(real_dtype):
+    """
+    The prototypes of the functions of the C library called by CLibABIE, as name: (restype, argtypes). real is the
+    floating-point type of the state of the C library (double, or long double in the LONGDOUBLE build).
+    """
+    c_double, c_int, c_size_t, c_void_p = ctypes.c_double, ctypes.c_int, ctypes.c_size_t, ctypes.c_void_p
+    c_real = c_double if np.dtype(real_dtype) == np.dtype(np.double) else ctypes.c_longdouble
+    doubles = _array(np.double)
+    doubles_or_null = _array(np.double, nullable=True)
+    ints = _array(np.int32)
+    ints_or_null = _array(np.int32, nullable=True)
+    reals = _array(real_dtype)
+    return {
+        'abie_create': (c_void_p, []),
+        'abie_use': (c_void_p, [c_void_p]),
+        'abie_destroy': (None, [c_void_p]),
+        'get_real_size': (c_int, []),
+        'initialize_code': (c_int, [c_double, c_double, c_int, c_int, c_int]),
+        'finalize_code': (c_int, []),
+        'set_state': (None, [doubles_or_null, doubles_or_null, doubles, doubles, ints_or_null, c_int, c_double,
+                             c_double]),
+        'get_state': (c_int, [doubles, doubles, doubles, doubles]),
+        'set_state_buffers': (c_int, [reals, reals, c_int]),
+        'synchronize_state': (c_int, []),
+        'get_model_time': (c_double, []),
+        'set_close_encounter_distance': (None, [c_double]),
+        'get_close_encounter_buffer': (None, [doubles]),
+        'get_collision_buffer': (None, [doubles]),
+        'reset_close_encounter_buffer': (None, []),
+        'reset_collision_buffer': (None, []),
+        'set_collision_outcome': (c_int, [c_int, c_double]),
+        'set_continuous_collisions': (None, [c_int]),
+        'get_collision_log_count': (c_int, []),
+        'get_collision_log': (c_int, [doubles, c_int]),
+        'reset_collision_log': (None, []),
+        'get_particle_ids': (c_int, [ints, doubles, doubles]),
+        'set_force_method': (c_int, [c_int]),
+        'set_opening_angle': (None, [c_double]),
+        'set_expansion_order': (c_int, [c_int]),
+        'set_simd_level': (c_int, [c_int]),
+        'get_simd_level': (c_int, []),
+        'set_mixed_precision': (None, [c_int]),
+        'set_num_threads': (None, [c_int]),
+        'calculate_force_error': (c_double, [c_int]),
+        'calculate_energy': (c_double, []),
+        'calculate_energy_supplied': (c_double, [doubles, doubles, doubles, c_int, c_double]),
+        'set_additional_forces': (c_size_t, [c_int, doubles]),
+        'integrator_gr': (c_int, [c_double, c_double, c_double]),
+        'integrator_rk': (c_int, [c_double, c_double, c_double]),
+        'integrator_wh': (c_int, [c_double, c_double, c_double]),
+        'integrator_hm': (c_int, [c_double, c_double, c_double, c_double]),
+        'integrator_hy': (c_int, [c_double, c_double, c_double, c_double]),
+        'integrate_snapshots': (c_int, [c_int, c_double, doubles, c_int, c_double, c_double, doubles, doubles,
+                                        doubles]),
+        'get_snapshot_count': (c_int, []),
+        'integrator_runge_kutta': (None, [reals, reals, reals, reals, c_size_t, c_real, c_double, c_double, c_double]),
+        'integrator_gauss_radau15': (c_size_t, [reals, reals, reals, reals, c_size_t, c_real, c_real, c_real, c_real]),
+        'integrator_wisdom_holman': (None, [reals, reals, reals, reals, c_size_t, c_real, c_real, c_real, c_real]),
+        'wisdom_holman_synchronize': (None, [reals, c_size_t]),
+        'ode_n_body_first_order': (c_size_t, [reals, c_size_t, c_real, reals, reals]),
+        'ode_n_body_second_order': (c_size_t, [reals, c_size_t, c_real, reals, reals, reals]),
+        'integrator_ensemble': (c_int, [doubles, doubles, doubles, doubles, c_int, c_int, c_double, c_double, c_double,
+                                        c_double, ints, doubles]),
+    }
+
+
 class CLibABIE(object):
 
     lib = None
+    real_dtype = np.double
+    # the functions of the C library with their prototypes declared, looked up once when the library is loaded
+    fn = None
+
+    # force calculation methods supported by the C library
+    FORCE_METHODS = {'direct': 0, 'tree': 1, 'fmm': 2}
+
+    # outcomes of the collisions: returned to Python, or resolved by the C library
+    COLLISION_OUTCOMES = {'stop': 0, 'merge': 1, 'bounce': 2}
+
+    # integrators that can be driven through an output schedule by integrate_snapshots()
+    SNAPSHOT_INTEGRATORS = {'GaussRadau15': 0, 'WisdomHolman': 1, 'Hermite': 2, 'Hybrid': 3}
 
     def __init__(self):
         # Only load once
@@ -68,118 +168,244 @@ class CLibABIE(object):
                 os.environ['PATH'] += ";" + os.path.dirname(lib_path)
 
             # Finally in a position to load the C library - will throw exception if fails
-            self.lib = ctypes.cdll.LoadLibrary(lib_path)
-
+            lib = ctypes.cdll.LoadLibrary(lib_path)
+            lib.get_real_size.restype = ctypes.c_int
+            # the floating-point type of the state vectors (long double in the LONGDOUBLE build)
+            if lib.get_real_size() != np.dtype(np.double).itemsize:
+                CLibABIE.real_dtype = np.longdouble
+            # declare all prototypes once, so that the calls convert and check their arguments without any per-call
+            # set up, and cache the function objects
+            functions = {}
+            for name, (restype, argtypes) in _prototypes(CLibABIE.real_dtype).items():
+                func = getattr(lib, name)
+                func.restype = restype
+                func.argtypes = argtypes
+                functions[name] = func
+            CLibABIE.fn = types.SimpleNamespace(**functions)
+            CLibABIE.lib = lib
+
+        # every instance owns a simulation context of the C library, which is selected before each call, so that the
+        # instances do not share any state and can be used concurrently from different threads
+        self.ctx = self.fn.abie_create()
         self.max_close_encounter_events = 1
         self.max_collision_events = 1
+        self.state_buffers = None
+
+    def __del__(self):
+        if self.fn is not None and getattr(self, 'ctx', None) is not None:
+            self.fn.abie_destroy(self.ctx)
+            self.ctx = None
+
+    def multi_call(self, calls):
+        """
+        Call a sequence of functions of the C library on this simulation, selecting its context only once, e.g.
+        multi_call([('integrator_gr', t, t + dt, dt), ('calculate_energy',)]).
+        :param calls: a list of tuples of the name of a function (one of those prototyped in _prototypes()) and its
+                      arguments
+        :return: the list of the return values
+        """
+        fn = self.fn
+        fn.abie_use(self.ctx)
+        return [getattr(fn, call[0])(*call[1:]) for call in calls]
 
     def initialize_code(self, G, C, N_MAX, MAX_CE_EVENTS=1, MAX_COLLISION_EVENTS=1, close_encounter_distance=0):
-        self.lib.initialize_code(ctypes.c_double(G),
-                                 ctypes.c_double(C),
-                                 ctypes.c_int(N_MAX),
-                                 ctypes.c_int(MAX_CE_EVENTS),
-                                 ctypes.c_int(MAX_COLLISION_EVENTS))
-        self.lib.set_close_encounter_distance(ctypes.c_double(close_encounter_distance))
+        self.fn.abie_use(self.ctx)
+        self.fn.initialize_code(G, C, N_MAX, MAX_CE_EVENTS, MAX_COLLISION_EVENTS)
+        self.fn.set_close_encounter_distance(close_encounter_distance)
         self.max_close_encounter_events = MAX_CE_EVENTS
         self.max_collision_events = MAX_COLLISION_EVENTS
 
     def finalize_code(self):
-        self.lib.finalize_code()
-
-    def set_state(self, pos, vel, masses, radii, N, G, C):
-        self.lib.set_state(ctypes.c_void_p(pos.ctypes.data),
-                           ctypes.c_void_p(vel.ctypes.data),
-                           ctypes.c_void_p(masses.ctypes.data),
-                           ctypes.c_void_p(radii.ctypes.data),
-                           ctypes.c_int(N),
-                           ctypes.c_double(G),
-                           ctypes.c_double(C))
+        self.fn.abie_use(self.ctx)
+        self.fn.finalize_code()
+        self.state_buffers = None
+
+    def set_state(self, pos, vel, masses, radii, N, G, C, ptypes=None):
+        self.fn.abie_use(self.ctx)
+        # particle types: test particles (ptype = 1) never act as gravitational sources
+        if ptypes is not None:
+            ptypes = np.ascontiguousarray(ptypes, dtype=np.int32)
+        # pos and vel may be None, if the state is already in the buffers registered by set_state_buffers()
+        if pos is not None:
+            pos = np.ascontiguousarray(pos, dtype=np.double)
+        if vel is not None:
+            vel = np.ascontiguousarray(vel, dtype=np.double)
+        self.fn.set_state(pos, vel, np.ascontiguousarray(masses, dtype=np.double),
+                          np.ascontiguousarray(radii, dtype=np.double), ptypes, N, G, C)
 
     def get_state(self, pos, vel, masses, radii):
-        self.lib.get_state(ctypes.c_void_p(pos.ctypes.data),
-                           ctypes.c_void_p(vel.ctypes.data),
-                           ctypes.c_void_p(masses.ctypes.data),
-                           ctypes.c_void_p(radii.ctypes.data))
+        self.fn.abie_use(self.ctx)
+        self.fn.get_state(pos, vel, masses, radii)
+
+    def set_state_buffers(self, pos, vel):
+        """
+        Let the C library integrate in place in the arrays pos and vel, which must be C-contiguous arrays of
+        real_dtype with the 3N elements of the last set_state(). The arrays are referenced here, so that they stay
+        valid while the C library uses them.
+        """
+        self.fn.abie_use(self.ctx)
+        for vec in (pos, vel):
+            if vec.dtype != self.real_dtype or not vec.flags['C_CONTIGUOUS'] or not vec.flags['WRITEABLE']:
+                raise ValueError('State buffers must be writeable C-contiguous arrays of type %s'
+                                 % np.dtype(self.real_dtype).name)
+        if self.fn.set_state_buffers(pos, vel, pos.size // 3) != 0:
+            raise ValueError('State buffers do not match the state set by set_state()')
+        self.state_buffers = (pos, vel)
+
+    def synchronize_state(self):
+        self.fn.abie_use(self.ctx)
+        return self.fn.synchronize_state()
 
     def get_model_time(self):
-        self.lib.get_model_time.restype = ctypes.c_double
-        return self.lib.get_model_time()
+        self.fn.abie_use(self.ctx)
+        return self.fn.get_model_time()
 
     def get_close_encounter_data(self):
+        self.fn.abie_use(self.ctx)
         # each row: time, object 1, object 2, distance
         buf = np.zeros(4 * self.max_close_encounter_events)
-        self.lib.get_close_encounter_buffer(ctypes.c_void_p(buf.ctypes.data))
+        self.fn.get_close_encounter_buffer(buf)
         return buf.reshape(self.max_close_encounter_events, 4)
 
     def get_collision_data(self):
+        self.fn.abie_use(self.ctx)
         # each row: time, object 1, object 2, distance
         buf = np.zeros(4 * self.max_collision_events)
-        self.lib.get_collision_buffer(ctypes.c_void_p(buf.ctypes.data))
+        self.fn.get_collision_buffer(buf)
         return buf.reshape(self.max_collision_events, 4)
 
     def reset_close_encounter_buffer(self):
-        self.lib.reset_close_encounter_buffer()
+        self.fn.abie_use(self.ctx)
+        self.fn.reset_close_encounter_buffer()
 
     def reset_collision_buffer(self):
-        self.lib.reset_collision_buffer()
+        self.fn.abie_use(self.ctx)
+        self.fn.reset_collision_buffer()
+
+    def set_collision_outcome(self, outcome, restitution=1.0):
+        self.fn.abie_use(self.ctx)
+        if outcome not in self.COLLISION_OUTCOMES:
+            raise ValueError('Unknown collision outcome: %s. Supported outcomes: %s'
+                             % (outcome, list(self.COLLISION_OUTCOMES.keys())))
+        self.fn.set_collision_outcome(self.COLLISION_OUTCOMES[outcome], restitution)
+
+    def set_continuous_collisions(self, flag):
+        self.fn.abie_use(self.ctx)
+        self.fn.set_continuous_collisions(1 if flag else 0)
+
+    def get_collision_log(self):
+        """
+        Take the collisions resolved by the C library since the last call.
+        :return: an n x 5 array of [time, id1, id2, distance, outcome] (outcome 1: id2 merged into id1; 2: bounce),
+                 where the ids are the indices of the particles in the state of the last set_state()
+        """
+        self.fn.abie_use(self.ctx)
+        n = self.fn.get_collision_log_count()
+        buf = np.zeros((n, 5))
+        if n > 0:
+            self.fn.get_collision_log(buf, n)
+            self.fn.reset_collision_log()
+        return buf
+
+    def get_particle_ids(self, N):
+        """
+        :param N: the number of particles of the last set_state()
+        :return: the indices in the state of the last set_state() of the particles that are left after mergers, with
+                 their masses and radii
+        """
+        self.fn.abie_use(self.ctx)
+        ids = np.zeros(N, dtype=np.int32)
+        masses = np.zeros(N)
+        radii = np.zeros(N)
+        n = self.fn.get_particle_ids(ids, masses, radii)
+        return ids[:n], masses[:n], radii[:n]
 
     def set_close_encounter_distance(self, value):
-        self.lib.set_close_encounter_distance(ctypes.c_double(value))
+        self.fn.abie_use(self.ctx)
+        self.fn.set_close_encounter_distance(value)
+
+    def set_force_method(self, method):
+        self.fn.abie_use(self.ctx)
+        if method not in self.FORCE_METHODS:
+            raise ValueError('Unknown force method: %s. Supported methods: %s' % (method, list(self.FORCE_METHODS.keys())))
+        self.fn.set_force_method(self.FORCE_METHODS[method])
+
+    def set_opening_angle(self, theta):
+        self.fn.abie_use(self.ctx)
+        self.fn.set_opening_angle(theta)
+
+    def set_expansion_order(self, p):
+        self.fn.abie_use(self.ctx)
+        return self.fn.set_expansion_order(p)
+
+    def set_simd_level(self, level):
+        self.fn.abie_use(self.ctx)
+        return self.fn.set_simd_level(level)
+
+    def get_simd_level(self):
+        self.fn.abie_use(self.ctx)
+        return self.fn.get_simd_level()
+
+    def set_mixed_precision(self, flag):
+        self.fn.abie_use(self.ctx)
+        self.fn.set_mixed_precision(1 if flag else 0)
+
+    def set_num_threads(self, n):
+        self.fn.abie_use(self.ctx)
+        self.fn.set_num_threads(n)
+
+    def get_force_error(self, n_sample):
+        self.fn.abie_use(self.ctx)
+        return self.fn.calculate_force_error(n_sample)
 
     def get_total_energy(self):
-        self.lib.calculate_energy.restype = ctypes.c_double
-        return self.lib.calculate_energy()
+        self.fn.abie_use(self.ctx)
+        return self.fn.calculate_energy()
 
     def get_total_energy_supplied(self, pos, vel, masses, G):
-        n = masses.shape
-        self.lib.calculate_energy_supplied.restype = ctypes.c_double
-        return self.lib.calculate_energy_supplied(ctypes.c_void_p(pos.ctypes.data),
-                                                  ctypes.c_void_p(vel.ctypes.data),
-                                                  ctypes.c_void_p(masses.ctypes.data),
-                                                  ctypes.c_int(masses.shape[0]),
-                                                  ctypes.c_double(G))
+        self.fn.abie_use(self.ctx)
+        return self.fn.calculate_energy_supplied(np.ascontiguousarray(pos, dtype=np.double),
+                                                 np.ascontiguousarray(vel, dtype=np.double),
+                                                 np.ascontiguousarray(masses, dtype=np.double),
+                                                 masses.shape[0], G)
 
     def set_additional_forces(self, ext_acc):
         """
         :param ext_acc: A 3 * N vector
         :return:
         """
-        self.lib.set_additional_forces(ctypes.c_int(len(ext_acc)/3),
-                                      ctypes.c_void_p(ext_acc.ctypes.data))
-
-    def integrator_runge_kutta(self, pos, vel, masses, N, G, t, t_end, dt):
-        self.lib.integrator_runge_kutta(ctypes.c_void_p(pos.ctypes.data),
-                                        ctypes.c_void_p(vel.ctypes.data),
-                                        ctypes.c_void_p(masses.ctypes.data),
-                                        ctypes.c_int(N),
-                                        ctypes.c_double(G),
-                                        ctypes.c_double(t),
-                                        ctypes.c_double(t_end),
-                                        ctypes.c_double(dt))
-
-    def integrator_gauss_radau15(self, pos, vel, masses, N, G, t, t_end, dt):
-        self.lib.integrator_gauss_radau15(ctypes.c_void_p(pos.ctypes.data),
-                                          ctypes.c_void_p(vel.ctypes.data),
-                                          ctypes.c_void_p(masses.ctypes.data),
-                                          ctypes.c_int(N),
-                                          ctypes.c_double(G),
-                                          ctypes.c_double(t),
-                                          ctypes.c_double(t_end),
-                                          ctypes.c_double(dt))
-
-    def integrator_wisdom_holman(self, pos, vel, masses, N, G, t, t_end, dt):
-        self.lib.integrator_wisdom_holman(ctypes.c_void_p(pos.ctypes.data),
-                                          ctypes.c_void_p(vel.ctypes.data),
-                                          ctypes.c_void_p(masses.ctypes.data),
-                                          ctypes.c_int(N),
-                                          ctypes.c_double(G),
-                                          ctypes.c_double(t),
-                                          ctypes.c_double(t_end),
-                                          ctypes.c_double(dt))
+        self.fn.abie_use(self.ctx)
+        self.fn.set_additional_forces(len(ext_acc) // 3, np.ascontiguousarray(ext_acc, dtype=np.double))
 
-    def integrator_gr(self, t, t_end, dt):
-        self.lib.integrator_gr.restype = ctypes.c_int
-        ret = self.lib.integrator_gr(ctypes.c_double(t), ctypes.c_double(t_end), ctypes.c_double(dt))
+    def __reals(self, vec, N):
+        # the masses and radii of the integrators working on the supplied state, as vectors of real_dtype
+        if vec is None:
+            return np.zeros(N, dtype=self.real_dtype)
+        return np.ascontiguousarray(vec, dtype=self.real_dtype)
+
+    def integrator_runge_kutta(self, pos, vel, masses, N, G, t, t_end, dt, radii=None):
+        """
+        Integrate the supplied state (pos and vel, C-contiguous arrays of real_dtype updated in place) from t to t_end,
+        independently of the state of set_state(). The same holds for integrator_gauss_radau15() and
+        integrator_wisdom_holman().
+        """
+        self.fn.abie_use(self.ctx)
+        self.fn.integrator_runge_kutta(pos, vel, self.__reals(masses, N), self.__reals(radii, N), N, G, t, t_end, dt)
+
+    def integrator_gauss_radau15(self, pos, vel, masses, N, G, t, t_end, dt, radii=None):
+        self.fn.abie_use(self.ctx)
+        self.__raise_event(self.fn.integrator_gauss_radau15(pos, vel, self.__reals(masses, N), self.__reals(radii, N),
+                                                            N, G, t, t_end, dt))
+
+    def integrator_wisdom_holman(self, pos, vel, masses, N, G, t, t_end, dt, radii=None):
+        self.fn.abie_use(self.ctx)
+        masses = self.__reals(masses, N)
+        self.fn.integrator_wisdom_holman(pos, vel, masses, self.__reals(radii, N), N, G, t, t_end, dt)
+        # apply the half kick that the map keeps pending between calls
+        self.fn.wisdom_holman_synchronize(vel, N)
+
+    def __raise_event(self, ret):
+        # the return value of the integrators: 1 after a close encounter, 2 after a collision
         if ret == 1:
             col_buf = self.get_close_encounter_data()
             raise CloseEncounterException(col_buf[-1, 0], int(col_buf[-1, 1]), int(col_buf[-1, 2]), col_buf[-1, 3])
@@ -187,26 +413,68 @@ class CLibABIE(object):
             col_buf = self.get_collision_data()
             raise CollisionException(col_buf[-1, 0], int(col_buf[-1, 1]), int(col_buf[-1, 2]), col_buf[-1, 3])
 
+    def integrator_gr(self, t, t_end, dt):
+        self.fn.abie_use(self.ctx)
+        self.__raise_event(self.fn.integrator_gr(t, t_end, dt))
+
+    def integrator_hm(self, t, t_end, dt, eta):
+        self.fn.abie_use(self.ctx)
+        self.__raise_event(self.fn.integrator_hm(t, t_end, dt, eta))
+
+    def integrator_hy(self, t, t_end, dt, hill_factor):
+        self.fn.abie_use(self.ctx)
+        self.__raise_event(self.fn.integrator_hy(t, t_end, dt, hill_factor))
+
+    def integrate_snapshots(self, integrator, t, t_out, dt, param, buf_t, buf_pos, buf_vel):
+        """
+        Integrate through the output times t_out in one call, writing the snapshots to buf_t[n_out], buf_pos[n_out, 3N]
+        and buf_vel[n_out, 3N]. The number of snapshots written is returned by get_snapshot_count(), also when an
+        event ends the integration early.
+        """
+        self.fn.abie_use(self.ctx)
+        t_out = np.ascontiguousarray(t_out, dtype=np.double)
+        self.__raise_event(self.fn.integrate_snapshots(self.SNAPSHOT_INTEGRATORS[integrator], t, t_out, t_out.size, dt,
+                                                     param, buf_t, buf_pos, buf_vel))
+
+    def get_snapshot_count(self):
+        self.fn.abie_use(self.ctx)
+        return self.fn.get_snapshot_count()
+
+    def integrator_ensemble(self, pos, vel, masses, radii, G, t, t_end, close_encounter_distance=0.0):
+        """
+        Integrate M independent systems of N bodies each from t to t_end in one call. pos and vel (M x 3N) are updated
+        in place; masses and radii are M x N arrays.
+        :return: the status of each system (0: reached t_end; 1: close encounter; 2: collision; 3: not finite) and an
+                 M x 4 array of [time, id1, id2, distance] of the events (the time reached and -1 for the systems without
+                 events)
+        """
+        self.fn.abie_use(self.ctx)
+        M, N = masses.shape
+        status = np.zeros(M, dtype=np.int32)
+        events = np.zeros((M, 4), dtype=np.double)
+        events[:, 0] = t
+        events[:, 1:3] = -1
+        self.fn.integrator_ensemble(pos, vel, masses, radii, M, N, G, t, t_end, close_encounter_distance, status, events)
+        return status, events
+
     def integrator_rk(self, t, t_end, dt):
-        self.lib.integrator_rk(ctypes.c_double(t), ctypes.c_double(t_end), ctypes.c_double(dt))
+        self.fn.abie_use(self.ctx)
+        self.fn.integrator_rk(t, t_end, dt)
 
     def integrator_wh(self, t, t_end, dt):
-        self.lib.integrator_wh(ctypes.c_double(t), ctypes.c_double(t_end), ctypes.c_double(dt))
+        self.fn.abie_use(self.ctx)
+        self.fn.integrator_wh(t, t_end, dt)
 
     def ode_n_body_first_order(self, x, N, G, masses):
-        dxdt = np.zeros(x.size, dtype=np.double)
-        self.lib.ode_n_body_first_order(ctypes.c_void_p(x.ctypes.data),
-                                        ctypes.c_int(N),
-                                        ctypes.c_double(G),
-                                        ctypes.c_void_p(masses.ctypes.data),
-                                        ctypes.c_void_p(dxdt.ctypes.data))
+        self.fn.abie_use(self.ctx)
+        dxdt = np.zeros(x.size, dtype=self.real_dtype)
+        self.fn.ode_n_body_first_order(np.ascontiguousarray(x, dtype=self.real_dtype), N, G, self.__reals(masses, N),
+                                       dxdt)
         return dxdt
 
-    def ode_n_body_second_order(self, x, N, G, masses):
-        acc = np.zeros(x.size, dtype=np.double)
-        self.lib.ode_n_body_second_order(ctypes.c_void_p(x.ctypes.data),
-                                        ctypes.c_int(N),
-                                        ctypes.c_double(G),
-                                        ctypes.c_void_p(masses.ctypes.data),
-                                        ctypes.c_void_p(acc.ctypes.data))
+    def ode_n_body_second_order(self, x, N, G, masses, radii=None):
+        self.fn.abie_use(self.ctx)
+        acc = np.zeros(x.size, dtype=self.real_dtype)
+        self.fn.ode_n_body_second_order(np.ascontiguousarray(x, dtype=self.real_dtype), N, G, self.__reals(masses, N),
+                                        self.__reals(radii, N), acc)
         return acc
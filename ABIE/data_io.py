@@ -28,6 +28,9 @@ class DataIO(object):
         self.buf_ecc = None
         self.buf_inc = None
         self.buf_cursor = 0
+        # the collision / close encounter files of a previous run are removed only once, not when the buffer is
+        # re-initialized after particles were merged
+        self.event_files_removed = False
         self.output_file_name = output_file_name
         self.collision_output_file_name = collision_output_file_name
         self.close_encounter_output_file_name = close_encounter_output_file_name
@@ -56,10 +59,12 @@ class DataIO(object):
             self.buf_cursor = 0
             # self.h5_step_id = 0
             # remove the previously generated collision / close encounter files
-            if os.path.isfile(self.close_encounter_output_file_name):
-                os.remove(self.close_encounter_output_file_name)
-            if os.path.isfile(self.collision_output_file_name):
-                os.remove(self.collision_output_file_name)
+            if self.event_files_removed is False:
+                if os.path.isfile(self.close_encounter_output_file_name):
+                    os.remove(self.close_encounter_output_file_name)
+                if os.path.isfile(self.collision_output_file_name):
+                    os.remove(self.collision_output_file_name)
+                self.event_files_removed = True
 
             self.buf_initialized = True
 
@@ -138,6 +143,54 @@ class DataIO(object):
         self.store_t = t
         self.buf_cursor += 1
 
+    def store_states(self, t, pos, vel, masses, radii=None, names=None, ptypes=None, a=None, e=None, i=None):
+        """
+        Store a series of snapshots at once. The masses, radii, names and ptypes are the same for all snapshots.
+
+        :param t: the times of the snapshots, an array of length n_snapshots
+        :param pos: the positions, an array of shape (n_snapshots, 3 * N)
+        :param vel: the velocities, an array of shape (n_snapshots, 3 * N)
+        :param a, e, i: the orbital elements, arrays of shape (n_snapshots, N)
+        :return:
+        """
+        n_snapshots = len(t)
+        first = 0
+        # skip the first snapshot if this time is already stored
+        if n_snapshots > 0 and self.store_t == t[0]:
+            first = 1
+        while first < n_snapshots:
+            if self.buf_cursor == self.buf_len:
+                # the buffer is full, trigger store
+                self.flush()
+                self.buf_cursor = 0
+            n = min(self.buf_len - self.buf_cursor, n_snapshots - first)
+            cur = slice(self.buf_cursor, self.buf_cursor + n)
+            snap = slice(first, first + n)
+            self.buf_t[cur] = t[snap]
+            self.buf_x[cur] = pos[snap, 0::3]
+            self.buf_y[cur] = pos[snap, 1::3]
+            self.buf_z[cur] = pos[snap, 2::3]
+            self.buf_vx[cur] = vel[snap, 0::3]
+            self.buf_vy[cur] = vel[snap, 1::3]
+            self.buf_vz[cur] = vel[snap, 2::3]
+            self.buf_mass[cur] = masses
+            if radii is not None:
+                self.buf_radius[cur] = radii
+            if names is not None:
+                self.buf_hashes[cur] = names
+            if ptypes is not None:
+                self.buf_ptype[cur] = ptypes
+            if a is not None:
+                self.buf_semi[cur] = a[snap]
+            if e is not None:
+                self.buf_ecc[cur] = e[snap]
+            if i is not None:
+                self.buf_inc[cur] = i[snap]
+            self.buf_cursor += n
+            first += n
+        if n_snapshots > 0:
+            self.store_t = t[-1]
+
     def store(self, buf_t, buf_state, buf_len, n_particles):
         """
         Append `buf_t` and `buf_state` to the instance-wide simulation data buffer. If the buffer is full, it will be
@@ -182,6 +235,19 @@ class DataIO(object):
             np.savetxt(self.collision_output_file_name, collision_buffer, fmt='%g, %d, %d, %g',
                        header='Time, Particle 1, Particle 2, Distance')
 
+    def store_collision_log(self, collision_log):
+        """
+        Append the collisions resolved by the C library to the collision file.
+        :param collision_log: An array of rows (time, particle 1, particle 2, distance, outcome)
+        :return:
+        """
+        if self.collision_output_file_name is not None:
+            new_file = not os.path.isfile(self.collision_output_file_name)
+            with open(self.collision_output_file_name, 'a') as col_file:
+                np.savetxt(col_file, collision_log, fmt='%g, %d, %d, %g, %d',
+                           header='Time, Particle 1, Particle 2, Distance, Outcome (1: merged into particle 1; '
+                                  '2: bounced)' if new_file else '')
+
     def store_close_encounters(self, ce_buffer):
         if self.close_encounter_output_file_name is not None:
             np.savetxt(self.close_encounter_output_file_name, ce_buffer, fmt='%g, %d, %d, %g',
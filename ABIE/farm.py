@@ -0,0 +1,154 @@
+"""
+Simulation farm: many independent simulations on a pool of worker processes.
+
+Each simulation is described by a config in the format read by DataIO.parse_config_file() (a TOML file, or the dict
+it returns). The simulations are run on a bounded pool of worker processes, each pinned to a core, which import ABIE
+and load libabie once and then run one simulation after the other. Every simulation writes its own HDF5 file; the final
+states and the diagnostics are written by the workers to shared-memory arrays, from which they are returned.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from .abie import ABIE
+from .data_io import DataIO
+
+# columns of the diagnostics returned by farm()
+FARM_DIAGNOSTICS = ['t', 'N', 'energy', 'dE/E0', 'status', 'wall_time']
+
+# state of a worker process, set up by _farm_init()
+_farm_jobs = None
+_farm_shm = None
+_farm_states = None
+_farm_diagnostics = None
+
+
+def _farm_init(jobs, offsets, shm_names, num_threads, quiet, counter, cores):
+    global _farm_jobs, _farm_shm, _farm_states, _farm_diagnostics
+    if cores and hasattr(os, 'sched_setaffinity'):
+        with counter.get_lock():
+            worker_id = counter.value
+            counter.value += 1
+        os.sched_setaffinity(0, {cores[worker_id % len(cores)]})
+    if quiet:
+        # silence the progress output of the simulations, including that of libabie
+        sys.stdout.flush()
+        os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+    _farm_jobs = [(job + (num_threads,), offsets[i]) for i, job in enumerate(jobs)]
+    _farm_shm = [shared_memory.SharedMemory(name=name) for name in shm_names]
+    _farm_states = np.ndarray((offsets[-1], 7), dtype=np.double, buffer=_farm_shm[0].buf)
+    _farm_diagnostics = np.ndarray((len(jobs), len(FARM_DIAGNOSTICS)), dtype=np.double, buffer=_farm_shm[1].buf)
+
+
+def _farm_run(i):
+    (config, output_file, store_dt, num_threads), offset = _farm_jobs[i]
+    wall_time = time.time()
+    status = -1
+    try:
+        sim = ABIE()
+        sim.output_file = output_file
+        stem = os.path.splitext(output_file)[0]
+        sim.close_encounter_output_file = stem + '_close_encounters.txt'
+        sim.collision_output_file = stem + '_collisions.txt'
+        sim.initialize(config)
+        sim.store_dt = float(config['integration'].get('store_dt', store_dt))
+        if num_threads is not None:
+            sim.num_threads = num_threads
+        # integrate() returns None if there is nothing to integrate (t >= t_end)
+        status = sim.integrate() or 0
+        n = sim.particles.N
+        _farm_states[offset:offset + n, 0:3] = sim.particles.positions.reshape(n, 3)
+        _farm_states[offset:offset + n, 3:6] = sim.particles.velocities.reshape(n, 3)
+        _farm_states[offset:offset + n, 6] = sim.particles.masses
+        energy = sim.calculate_energy()
+        # (the initial energy is only calculated if there was something to integrate)
+        energy_init = sim.integrator.energy_init or energy
+        # (the relative energy error is undefined for a system without energy, e.g., without mass)
+        energy_error = (energy - energy_init) / energy_init if energy_init != 0 else np.nan
+        _farm_diagnostics[i, 0:4] = [sim.t, n, energy, energy_error]
+    except Exception as e:
+        print('Simulation %d (%s) failed: %s' % (i, output_file, e), file=sys.stderr)
+        status = -1
+    _farm_diagnostics[i, 4] = status
+    _farm_diagnostics[i, 5] = time.time() - wall_time
+    return i, status
+
+
+def farm(configs, output_files=None, n_workers=None, store_dt=100, num_threads=1, pin=True, quiet=True):
+    """
+    Run a list of independent simulations on a pool of worker processes.
+    :param configs: the simulations, each either the name of a TOML config file or a dict returned by
+                    DataIO.parse_config_file()
+    :param output_files: the HDF5 output file of each simulation (default: the name of the config file with the
+                         extension .h5, or farm_<i>.h5 for dicts)
+    :param n_workers: the number of worker processes (default: the number of available cores)
+    :param store_dt: the output time step, unless set by store_dt in the [integration] section of a config
+    :param num_threads: the number of OpenMP threads of each simulation (None for the OpenMP default)
+    :param pin: pin each worker process to a core (Linux only)
+    :param quiet: suppress the progress output of the simulations
+    :return: a list of the final states, an N x 7 array of [x, y, z, vx, vy, vz, mass] per simulation, and an M x 6
+             array of the diagnostics [t, N, energy, dE/E0, status, wall_time] (status: the return value of
+             integrate(), or -1 if the simulation failed; dE/E0 is NaN if the initial energy is 0)
+    """
+    jobs = []
+    for i, config in enumerate(configs):
+        if isinstance(config, dict):
+            name = 'farm_%d.h5' % i
+        else:
+            name = os.path.splitext(config)[0] + '.h5'
+            config = DataIO.parse_config_file(config)
+        jobs.append((config, name if output_files is None else output_files[i], store_dt))
+    if len(jobs) == 0:
+        return [], np.zeros((0, len(FARM_DIAGNOSTICS)))
+
+    # the final states may have fewer particles than the initial conditions (mergers), never more
+    offsets = np.cumsum([0] + [len(job[0]['initial_conds']) for job in jobs]).tolist()
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else []
+    if n_workers is None:
+        n_workers = len(cores) if cores else os.cpu_count()
+    n_workers = max(1, min(n_workers, len(jobs)))
+
+    n_bytes = [max(1, offsets[-1] * 7 * 8), len(jobs) * len(FARM_DIAGNOSTICS) * 8]
+    shm = [shared_memory.SharedMemory(create=True, size=n) for n in n_bytes]
+    try:
+        states = np.ndarray((offsets[-1], 7), dtype=np.double, buffer=shm[0].buf)
+        diagnostics = np.ndarray((len(jobs), len(FARM_DIAGNOSTICS)), dtype=np.double, buffer=shm[1].buf)
+        states[:] = np.nan
+        diagnostics[:] = np.nan
+        counter = multiprocessing.Value('i', 0)
+        init_args = (jobs, offsets, [s.name for s in shm], num_threads, quiet, counter, cores if pin else [])
+        with multiprocessing.Pool(n_workers, initializer=_farm_init, initargs=init_args) as pool:
+            for i, status in pool.imap_unordered(_farm_run, range(len(jobs))):
+                if not quiet:
+                    print('Simulation %d finished with status %d' % (i, status))
+        n_final = [int(n) if n == n else 0 for n in diagnostics[:, 1]]
+        results = [states[offsets[i]:offsets[i] + n_final[i]].copy() for i in range(len(jobs))]
+        diagnostics = diagnostics.copy()
+    finally:
+        for s in shm:
+            s.close()
+            s.unlink()
+    return results, diagnostics
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='abie farm', description='Run many simulations on a pool of processes')
+    parser.add_argument('configs', nargs='+', help='config files')
+    parser.add_argument('-j', '--workers', type=int, dest='n_workers', help='number of worker processes', default=None)
+    parser.add_argument('-s', '--store_dt', type=float, dest='store_dt', help='output time step', default=100)
+    parser.add_argument('-n', '--num_threads', type=int, dest='num_threads', help='OpenMP threads per simulation',
+                    default=1)
+    parser.add_argument('--no-pin', action='store_false', dest='pin', help='do not pin the workers to cores')
+    parser.add_argument('-v', '--verbose', action='store_false', dest='quiet', help='show the simulation output')
+    args = parser.parse_args(argv)
+
+    results, diagnostics = farm(args.configs, n_workers=args.n_workers, store_dt=args.store_dt,
+                            num_threads=args.num_threads, pin=args.pin, quiet=args.quiet)
+    print('%-40s %12s %6s %12s %6s %10s' % ('config', 't', 'N', 'dE/E0', 'status', 'wall [s]'))
+    for config, d in zip(args.configs, diagnostics):
+        # the diagnostics of a simulation whose worker died are NaN; its status is shown as failed
+        print('%-40s %12g %6d %12g %6d %10.2f' % (config, d[0], np.nan_to_num(d[1]), d[3], np.nan_to_num(d[4], nan=-1),
+                                                  d[5]))
@@ -14,10 +14,14 @@ import inspect
 import glob
 import os
 import sys
+import time
+import threading
 import numpy as np
 from .particles import Particles
 from .clibabie import CLibABIE
+from .ode import ODE
 from .data_io import DataIO
+from .events import CollisionException, CloseEncounterException
 
 class Integrator(object):
 
@@ -44,20 +48,145 @@ class Integrator(object):
         self.max_close_encounter_events = 1
         self.max_collision_events = 1
         self.close_encounter_distance = 0.0
+        self.__force_method = 'direct'
+        self.__opening_angle = 0.5
+        self.__expansion_order = 4
+        self.__mixed_precision = False
+        self.__num_threads = None
+        self.__collision_outcome = 'stop'
+        self.__restitution = 1.0
+        self.__continuous_collisions = True
         self.energy_init = 0.0
         self.__energy = 0.0
         self.__buf = None
         self.buffer_len = 1024
         self.__initialized = False
         self.write_update = 1000
+        self.__output_schedule = None
+        self.__n_outputs = None
+        # called after each chunk of output steps as progress_callback(t, steps_per_sec, dE/E0)
+        self.progress_callback = None
+        # the integration stops after the current chunk when this event is set (as with a STOP file)
+        self.cancel_event = threading.Event()
 
         # =============== C Library =============
         self.libabie = CLibABIE()
+        # the right-hand sides of the NumPy implementation, with the worker threads and buffers of this integrator
+        self.ode = ODE()
 
     @property
     def t(self):
         return self._t
 
+    @property
+    def force_method(self):
+        return self.__force_method
+
+    @force_method.setter
+    def force_method(self, value):
+        """
+        Select how the C library calculates the gravitational forces (only effective with acceleration_method 'ctypes')
+        :param value: 'direct' for direct summation, 'tree' for the Barnes-Hut tree code, or 'fmm' for the fast
+                      multipole method
+        """
+        self.libabie.set_force_method(value)
+        self.__force_method = value
+
+    @property
+    def opening_angle(self):
+        return self.__opening_angle
+
+    @opening_angle.setter
+    def opening_angle(self, value):
+        """
+        The opening angle of the tree code and of the fast multipole method. Smaller values are more accurate but
+        slower; 0 is equivalent to direct summation.
+        """
+        self.libabie.set_opening_angle(value)
+        self.__opening_angle = value
+
+    @property
+    def expansion_order(self):
+        return self.__expansion_order
+
+    @expansion_order.setter
+    def expansion_order(self, value):
+        """
+        The order of the multipole expansions of the fast multipole method (1 to 12). Higher orders are more accurate
+        but slower.
+        """
+        self.__expansion_order = self.libabie.set_expansion_order(value)
+
+    @property
+    def mixed_precision(self):
+        return self.__mixed_precision
+
+    @mixed_precision.setter
+    def mixed_precision(self, value):
+        """
+        If True, the forces on the test particles (ptype=1) are calculated in single precision. The forces on the other
+        particles are not affected. Only effective with the direct summation of the C library.
+        """
+        self.libabie.set_mixed_precision(value)
+        self.__mixed_precision = bool(value)
+
+    @property
+    def num_threads(self):
+        return self.__num_threads
+
+    @num_threads.setter
+    def num_threads(self, value):
+        """
+        The number of threads used for the force calculation: the OpenMP threads of the C library, and the worker
+        threads of the NumPy implementation. None keeps the defaults (all cores for OpenMP, 1 for NumPy).
+        """
+        if value is not None:
+            self.ode.set_num_threads(value)
+            self.libabie.set_num_threads(int(value))
+        self.__num_threads = value
+
+    @property
+    def collision_outcome(self):
+        return self.__collision_outcome
+
+    @collision_outcome.setter
+    def collision_outcome(self, value):
+        """
+        What happens when particles collide: 'stop' returns each collision to Python, which stores it and merges the
+        pair; 'merge' (perfectly inelastic merging) and 'bounce' resolve the collisions in the C library, which keeps
+        integrating and logs them. Only 'stop' is available with the integrators other than GaussRadau15, and with
+        acceleration_method 'numpy'.
+        """
+        self.libabie.set_collision_outcome(value, self.__restitution)
+        self.__collision_outcome = value
+
+    @property
+    def restitution(self):
+        return self.__restitution
+
+    @restitution.setter
+    def restitution(self, value):
+        """
+        The coefficient of restitution of the 'bounce' collision outcome: 1 for elastic bounces, 0 for the normal
+        relative velocity to vanish.
+        """
+        self.libabie.set_collision_outcome(self.__collision_outcome, value)
+        self.__restitution = value
+
+    @property
+    def continuous_collisions(self):
+        return self.__continuous_collisions
+
+    @continuous_collisions.setter
+    def continuous_collisions(self, value):
+        """
+        If True (the default), the C implementation of Gauss-Radau15 follows the paths of the particles within each
+        step and ends the step at the first contact, so that fast particles cannot pass through each other between two
+        steps. If False, the collisions are only detected at the end of the steps.
+        """
+        self.libabie.set_continuous_collisions(value)
+        self.__continuous_collisions = bool(value)
+
     @property
     def particles(self):
         if self._particles is None:
@@ -127,14 +256,176 @@ class Integrator(object):
         # return energy of supplied data
         return self.libabie.get_total_energy_supplied(pos, vel, masses, G)
 
+    def calculate_force_error(self, n_sample=1000):
+        """
+        Estimate the relative error of the accelerations calculated with the selected force method
+        :param n_sample: the number of particles for which the accelerations are compared against direct summation
+        :return: the root-mean-square of the relative acceleration error of the sampled particles
+        """
+        if self.__initialized is False:
+            self.initialize()
+            self.integrator_warmup()
+            self.__initialized = True
+        return self.libabie.get_force_error(n_sample)
+
     def set_additional_forces(self, ext_acc):
         self.libabie.set_additional_forces(ext_acc)
 
+    @property
+    def output_schedule(self):
+        return self.__output_schedule
+
+    def set_output_schedule(self, schedule='uniform', n=None):
+        """
+        Let the C library integrate through a schedule of output times, writing the snapshots to a buffer and returning
+        to Python only when the buffer (of buffer_len snapshots) is full or an event occurs. Only effective with
+        acceleration_method 'ctypes', for the GaussRadau15, WisdomHolman, Hermite and Hybrid integrators.
+        :param schedule: 'uniform' for a snapshot every store_dt; 'log' for n snapshots logarithmically spaced between
+                         t_start + store_dt and t_end; an array of output times; or None to return to Python for every
+                         snapshot
+        :param n: the number of snapshots of the 'log' schedule (default: 100)
+        """
+        if schedule is not None and not isinstance(schedule, str):
+            schedule = np.sort(np.asarray(schedule, dtype=np.double).ravel())
+        elif schedule not in (None, 'uniform', 'log'):
+            raise ValueError('Unknown output schedule: %s' % schedule)
+        self.__output_schedule = schedule
+        self.__n_outputs = n
+
+    def output_times(self, t, t_end):
+        """
+        The output times of the output schedule after t, up to and including t_end
+        """
+        schedule = self.__output_schedule
+        if isinstance(schedule, str) and schedule == 'uniform':
+            times = t + self.store_dt * np.arange(1, int(np.ceil((t_end - t) / self.store_dt)))
+        elif isinstance(schedule, str) and schedule == 'log':
+            n = 100 if self.__n_outputs is None else self.__n_outputs
+            times = self.t_start + np.geomspace(self.store_dt, t_end - self.t_start, n)
+        else:
+            times = schedule
+        times = times[(times > t) & (times < t_end)]
+        return np.append(times, t_end)
+
+    def snapshot_args(self):
+        """
+        The arguments of the integrator for the C snapshot driver: the time step and the additional parameter of the
+        integrator. None if the integrator cannot be driven by the C library.
+        """
+        return None
+
+    def integrate_snapshots(self):
+        """
+        Integrate to t_end through the output schedule, with the snapshots collected by the C library.
+        :return: 1 if a collision occurred, 2 if a close encounter occurred, 0 otherwise
+        """
+        N = self.particles.N
+        buf_t = np.empty(self.buffer_len)
+        buf_pos = np.empty((self.buffer_len, 3 * N))
+        buf_vel = np.empty((self.buffer_len, 3 * N))
+        dt, param = self.snapshot_args()
+        times = self.output_times(self.t, self.t_end)
+
+        ret = 0
+        event = 0
+        while self.t < self.t_end:
+            t_out = times[times > self.t][:self.buffer_len]
+            wall_time = time.time()
+            try:
+                self.libabie.integrate_snapshots(self.__class__.__name__, self.t, t_out, dt, param,
+                                                 buf_t, buf_pos, buf_vel)
+            except CollisionException as e:
+                print(e)
+                ret = 1
+            except CloseEncounterException as e:
+                print(e)
+                ret = 2
+            n = self.libabie.get_snapshot_count()
+            if n > 0:
+                elem = self.particles.calculate_aei_snapshots(buf_pos[:n], buf_vel[:n])
+                self.buf.store_states(buf_t[:n], buf_pos[:n], buf_vel[:n], self.particles.masses,
+                                      radii=self.particles.radii, names=self.particles.hashes,
+                                      ptypes=self.particles.ptypes,
+                                      a=elem[:, :, 0], e=elem[:, :, 1], i=elem[:, :, 2])
+
+            # the state at the last snapshot, or at the event
+            self.update_state()
+            if self.particles.N != N and ret == 0:
+                # particles were merged: the snapshot at the merger did not fit in the buffers
+                self.store_state()
+                N = self.particles.N
+                buf_pos = np.empty((self.buffer_len, 3 * N))
+                buf_vel = np.empty((self.buffer_len, 3 * N))
+            if ret == 1:
+                self.handle_collisions(self.libabie.get_collision_data())
+            elif ret == 2:
+                self.store_close_encounters(self.libabie.get_close_encounter_data())
+                self.store_state()
+            if ret > 0:
+                # the system may have changed: continue with a new buffer
+                event = ret
+                N = self.particles.N
+                buf_pos = np.empty((self.buffer_len, 3 * N))
+                buf_vel = np.empty((self.buffer_len, 3 * N))
+                ret = 0
+
+            if self.report_progress(n, time.time() - wall_time):
+                break
+        return event
+
+    def report_progress(self, n_steps, wall_time):
+        """
+        Report the energy error after a chunk of n_steps output steps that took wall_time seconds, and pass the
+        progress to progress_callback.
+        :return: True if the integration should stop (a STOP file exists or cancel_event is set)
+        """
+        self.__energy = self.calculate_energy()
+        # (the relative energy error is undefined for a system without energy, e.g., without mass)
+        energy_error = (self.__energy - self.energy_init) / self.energy_init if self.energy_init != 0 else np.nan
+        print(('t = %f, N = %d, E = %g, dE/E0 = %g' % (self.t, self.particles.N, self.__energy, energy_error)))
+        if self.progress_callback is not None:
+            self.progress_callback(self.t, n_steps / wall_time if wall_time > 0 else np.inf, energy_error)
+        return os.path.isfile('STOP') or self.cancel_event.is_set()
+
     def integrator_warmup(self):
-        pos = self.particles.positions.copy()
-        vel = self.particles.velocities.copy()
-        self.libabie.set_state(pos, vel, self.particles.masses, self.particles.radii, self.particles.N,
-                               self.CONST_G, self.CONST_C)
+        # the C library integrates in place in the position and velocity vectors of the particles
+        self.particles.set_dtype(self.libabie.real_dtype)
+        self.libabie.set_state(None, None, self.particles.masses, self.particles.radii, self.particles.N,
+                               self.CONST_G, self.CONST_C, ptypes=self.particles.ptypes)
+        self.libabie.set_state_buffers(self.particles.positions, self.particles.velocities)
+
+    def update_state(self):
+        """
+        Bring the particles up to date after an integration by the C library, which integrates in place in their
+        position and velocity vectors.
+        """
+        self.libabie.synchronize_state()
+        self._t = self.libabie.get_model_time()
+        if self.__collision_outcome != 'stop':
+            self.handle_resolved_collisions()
+
+    def handle_resolved_collisions(self):
+        """
+        Store the collisions resolved by the C library since the last call, and remove the particles it merged away.
+        """
+        collision_log = self.libabie.get_collision_log()
+        if len(collision_log) == 0:
+            return
+        hashes = self.particles.hashes
+        ids, masses, radii = self.libabie.get_particle_ids(self.particles.N)
+        if len(ids) != self.particles.N:
+            merged = {int(row[2]): int(row[1]) for row in collision_log if int(row[4]) == 1}
+            self.particles.compact(ids, masses, radii, merged)
+            self.integrator_warmup()
+            if self.buf.buf_cursor > 0:
+                self.buf.flush()
+            self.buf.reset_buffer()
+            self.buf.initialize_buffer(self.particles.N)
+        # the particles are identified by their hashes, as the indices change after mergers
+        collision_log[:, 1] = [hashes[int(pid)] for pid in collision_log[:, 1]]
+        collision_log[:, 2] = [hashes[int(pid)] for pid in collision_log[:, 2]]
+        self.buf.store_collision_log(collision_log)
+        print('t = %f, %d collisions resolved, N = %d' % (self.t, len(collision_log), self.particles.N))
 
     def integrate(self, to_time=None):
         """
@@ -158,23 +449,28 @@ class Integrator(object):
         dt = min(self.store_dt, self.t_end-self.t)
 
         ret = 0
-        # launch the integration
-        while self.t < self.t_end:
-            # If initial energy has not been calculated then do so, and store initial state
+        if (self.__output_schedule is not None and self.acceleration_method == 'ctypes'
+                and self.snapshot_args() is not None):
             if self.energy_init == 0:
                 self.energy_init = self.calculate_energy()
                 self.store_state()
-            next_t = min(self.t + dt, self.t_end)
-            if self.acceleration_method == 'numpy':
-                ret = self.integrate_numpy(next_t)
-            elif self.acceleration_method == 'ctypes':
-                ret = self.integrate_ctypes(next_t)
-            # the self.t is updated by the subclass
-            # energy check
-            self.__energy = self.calculate_energy()
-            print(('t = %f, N = %d, E = %g, dE/E0 = %g' % (self.t, self.particles.N, self.__energy, (self.__energy - self.energy_init) / self.energy_init)))
-            if os.path.isfile('STOP'):
-                break
+            ret = self.integrate_snapshots()
+        else:
+            # launch the integration
+            while self.t < self.t_end:
+                # If initial energy has not been calculated then do so, and store initial state
+                if self.energy_init == 0:
+                    self.energy_init = self.calculate_energy()
+                    self.store_state()
+                next_t = min(self.t + dt, self.t_end)
+                wall_time = time.time()
+                if self.acceleration_method == 'numpy':
+                    ret = self.integrate_numpy(next_t)
+                elif self.acceleration_method == 'ctypes':
+                    ret = self.integrate_ctypes(next_t)
+                # the self.t is updated by the subclass
+                if self.report_progress(1, time.time() - wall_time):
+                    break
 
         if to_time is None:
             # triggering the termination of the code, save the buffer to the file and close it
@@ -222,6 +518,8 @@ class Integrator(object):
     def handle_collisions(self, collision_buffer, actions=None):
         if actions is None:
             actions = ['merge', 'store']
+        if self.acceleration_method == 'ctypes':
+            self.update_state()
         if 'store' in actions:
             self.store_state()
             self.store_collisions(collision_buffer)
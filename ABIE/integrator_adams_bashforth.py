@@ -1,6 +1,5 @@
 import numpy as np
 from .integrator import Integrator
-from .ode import ODE
 
 __integrator__ = 'AdamsBashforth'
 
@@ -26,13 +25,13 @@ class AdamsBashforth(Integrator):
         sol_time = np.linspace(self.t_start, self.t_start + self.h * (npts - 1), npts)
 
         # Compute second step
-        dxdt0 = ODE.ode_n_body_first_order(x, self.CONST_G, self._particles.masses)
+        dxdt0 = self.ode.ode_n_body_first_order(x, self.CONST_G, self._particles.masses)
         x = x + dxdt0 * self.h
         energy_init = self.calculate_energy()
         # Launch integration
         count = 2
         for t in sol_time[count:]:
-            dxdt = ODE.ode_n_body_first_order(x, self.CONST_G, self._particles.masses)
+            dxdt = self.ode.ode_n_body_first_order(x, self.CONST_G, self._particles.masses)
             # Advance step
             x += 0.5 * self.h * (3 * dxdt - dxdt0)
 
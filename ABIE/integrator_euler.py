@@ -1,6 +1,5 @@
 import numpy as np
 from .integrator import Integrator
-from .ode import ODE
 
 __integrator__ = 'Euler'
 
@@ -29,7 +28,7 @@ class Euler(Integrator):
         # Launch integration
         count = 1
         for t in sol_time[count:]:
-            dxdt = ODE.ode_n_body_first_order(x, self.CONST_G, self._particles.masses)
+            dxdt = self.ode.ode_n_body_first_order(x, self.CONST_G, self._particles.masses)
             # Advance step
             x = x + dxdt * self.h
 
@@ -1,6 +1,5 @@
 import numpy as np
 from .integrator import Integrator
-from .ode import ODE
 from .events import *
 
 __integrator__ = 'GaussRadau15'
@@ -12,6 +11,9 @@ class GaussRadau15(Integrator):
         super(self.__class__, self).__init__()
         self.tol = 1.e-9
 
+    def snapshot_args(self):
+        return 1.0, 0.0
+
     def integrate_ctypes(self, to_time=None):
         ret = 0
         try:
@@ -26,12 +28,7 @@ class GaussRadau15(Integrator):
             self.store_close_encounters(self.libabie.get_close_encounter_data())
             ret = 2
         finally:
-            pos = self.particles.positions.copy()
-            vel = self.particles.velocities.copy()
-            self.libabie.get_state(pos, vel, self.particles.masses, self.particles.radii)
-            self.particles.positions = pos
-            self.particles.velocities = vel
-            self._t = self.libabie.get_model_time()
+            self.update_state()
             self.store_state()
             # self._t = to_time
 
@@ -51,15 +48,14 @@ class GaussRadau15(Integrator):
         h[7] = 0.9775206135612875018911745
         return h, nh
 
-    @staticmethod
-    def __initial_time_step(y0, dy0, G, masses, nbodies):
+    def __initial_time_step(self, y0, dy0, G, masses, nbodies):
 
         p = 15
         ###########   ESTIMATE INITIAL STEP SIZE
         # Compute scaling
         # sc =  abs(y0)*epsb
         # Evaluate function
-        f0 = ODE.ode_n_body_second_order(y0, G, masses)
+        f0 = self.ode.ode_n_body_second_order(y0, G, masses)
         d0 = max(abs(y0))
         d1 = max(abs(f0))
 
@@ -72,7 +68,7 @@ class GaussRadau15(Integrator):
         y1 = y0 + dt0 * dy0
         dy1 = dy0 + dt0 * f0
         # Call function
-        f1 = ODE.ode_n_body_second_order(y1, G, masses)
+        f1 = self.ode.ode_n_body_second_order(y1, G, masses)
         d2 = max(abs((f1 - f0))) / dt0
 
         if max(d1, d2) <= 1e-15:
@@ -294,7 +290,7 @@ class GaussRadau15(Integrator):
                     y = self.__approx_pos(y0, dy0, ddy0, hs[ih], bs, dt)
                     dy = self.__approx_vel(dy0, ddy0, hs[ih], bs, dt)
                     # Evaluate force function and store
-                    ddys[ih, :] = ODE.ode_n_body_second_order(y, self.CONST_G, self._particles.masses)
+                    ddys[ih, :] = self.ode.ode_n_body_second_order(y, self.CONST_G, self._particles.masses)
                     g = self.__compute_gs(g, r, ddys, ih)
                     bs = self.__compute_bs_from_gs(bs, g, ih, c)
                 # Estimate convergence of PC
@@ -306,7 +302,7 @@ class GaussRadau15(Integrator):
             # Advance the solution:
             y = self.__approx_pos(y0, dy0, ddy0, 1., bs, dt)
             dy = self.__approx_vel(dy0, ddy0, 1., bs, dt)
-            ddy = ODE.ode_n_body_second_order(y, self.CONST_G, self.particles.masses)
+            ddy = self.ode.ode_n_body_second_order(y, self.CONST_G, self.particles.masses)
 
             # Estimate relative error
             estim_b6 = max(abs(bs[-1, :])) / max(abs(ddy))
@@ -374,7 +370,7 @@ class GaussRadau15(Integrator):
         # Return Radau spacing
         [hs, nh] = self.__radau_spacing()
 
-        ddy0 = ODE.ode_n_body_second_order(y0, self.CONST_G, self._particles.masses)
+        ddy0 = self.ode.ode_n_body_second_order(y0, self.CONST_G, self._particles.masses)
 
         # Initial time step
         self.h = self.__initial_time_step(y0, dy0, self.CONST_G, self._particles.masses, self.particles.N)
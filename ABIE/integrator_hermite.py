@@ -0,0 +1,45 @@
+import numpy as np
+from .integrator import Integrator
+from .events import *
+
+__integrator__ = 'Hermite'
+
+
+class Hermite(Integrator):
+    """
+    Fourth-order Hermite predictor-corrector with individual (block) time steps, implemented in C.
+    The time steps are power-of-two fractions of the output interval (store_dt), chosen per particle with the Aarseth
+    criterion, so that only the particles in close interactions are integrated with small steps. If h is set, it is
+    the largest time step allowed. The steps are kept from one output interval to the next, and the snapshots between
+    the block times are extrapolated from the last step of each particle; they are discarded if the state is changed.
+    """
+
+    def __init__(self):
+        super(Hermite, self).__init__()
+        # accuracy parameter of the time step criterion
+        self.eta = 0.02
+
+    def snapshot_args(self):
+        return self.h, self.eta
+
+    def integrate_ctypes(self, to_time=None):
+        ret = 0
+        try:
+            self.libabie.integrator_hm(self.t, to_time, self.h, self.eta)
+
+        except CollisionException as e:
+            print(e)
+            self.handle_collisions(self.libabie.get_collision_data())
+            ret = 1
+        except CloseEncounterException as e:
+            print(e)
+            self.store_close_encounters(self.libabie.get_close_encounter_data())
+            ret = 2
+        finally:
+            self.update_state()
+            self.store_state()
+
+        return ret
+
+    def integrate_numpy(self, to_time=None):
+        raise NotImplementedError('The Hermite integrator is only available with acceleration_method = "ctypes"')
@@ -0,0 +1,43 @@
+from .integrator_wisdom_holman import WisdomHolman
+from .events import *
+
+__integrator__ = 'Hybrid'
+
+
+class Hybrid(WisdomHolman):
+    """
+    Hybrid symplectic integrator, implemented in C. The Wisdom-Holman map is used with the time step h, except for
+    the steps in which two bodies come within a changeover radius of each other; in these steps the encountering bodies
+    are integrated together with the central body with the Gauss-Radau15 scheme. The changeover radius is hill_factor
+    times the larger of the Hill radii of the two bodies.
+    """
+
+    def __init__(self):
+        super(Hybrid, self).__init__()
+        # changeover radius, in units of the Hill radius
+        self.hill_factor = 3.0
+
+    def snapshot_args(self):
+        return self.h, self.hill_factor
+
+    def integrate_ctypes(self, to_time=None):
+        ret = 0
+        try:
+            self.libabie.integrator_hy(self.t, to_time, self.h, self.hill_factor)
+
+        except CollisionException as e:
+            print(e)
+            self.handle_collisions(self.libabie.get_collision_data())
+            ret = 1
+        except CloseEncounterException as e:
+            print(e)
+            self.store_close_encounters(self.libabie.get_close_encounter_data())
+            ret = 2
+        finally:
+            self.update_state()
+            self.store_state()
+
+        return ret
+
+    def integrate_numpy(self, to_time=None):
+        raise NotImplementedError('The Hybrid integrator is only available with acceleration_method = "ctypes"')
@@ -1,6 +1,5 @@
 import numpy as np
 from .integrator import Integrator
-from .ode import ODE
 
 __integrator__ = 'LeapFrog'
 
@@ -26,13 +25,13 @@ class LeapFrog(Integrator):
         sol_time = np.linspace(self.t_start, self.t_start + self.h * (npts - 1), npts)
         energy_init = self.calculate_energy()
         # Compute second step
-        dxdt0 = ODE.ode_n_body_first_order(x, self.CONST_G, self.particles.masses)
+        dxdt0 = self.ode.ode_n_body_first_order(x, self.CONST_G, self.particles.masses)
         x = x + dxdt0 * self.h
 
         # Launch integration
         count = 2
         for t in sol_time[count:]:
-            dxdt = ODE.ode_n_body_first_order(x, self.CONST_G, self.particles.masses)
+            dxdt = self.ode.ode_n_body_first_order(x, self.CONST_G, self.particles.masses)
             # Advance step
             x += 0.5 * self.h * (3 * dxdt - dxdt0)
 
@@ -1,6 +1,5 @@
 import numpy as np
 from .integrator import Integrator
-from .ode import ODE
 import ctypes
 import os
 
@@ -21,10 +20,7 @@ class RungeKutta(Integrator):
     def integrate_ctypes(self, to_time=None):
         energy_init = self.calculate_energy()
         dt = min(self.store_dt, self.t_end-self.t)
-        self.libabie.initialize_code(self.CONST_G, self.CONST_C, self.particles.N)
-        pos = self.particles.positions.copy()
-        vel = self.particles.velocities.copy()
-        self.libabie.set_state(pos, vel, self.particles.masses, self.particles.radii, self.particles.N, self.CONST_G, self.CONST_C)
+        self.integrator_warmup()
         energy = self.calculate_energy()
         print(('t = %f, E/E0 = %g' % (self.t, np.abs(energy-energy_init)/energy_init)))
         self.store_state()
@@ -40,9 +36,7 @@ class RungeKutta(Integrator):
             # self.libabie.integrator_gauss_radau15(pos, vel, self.particles.masses, self.particles.N, self.CONST_G, self.t, self.t+dt, dt)
             self.libabie.integrator_rk(self.t, self.t+dt, self.h)
             self._t += dt
-            self.libabie.get_state(pos, vel, self.particles.masses, self.particles.radii)
-            self.particles.positions = pos
-            self.particles.velocities = vel
+            # the state is integrated in place in the particle vectors
             self.store_state()
             energy = self.calculate_energy()
             print(('t = %f, E/E0 = %g' % (self.t, np.abs(energy-energy_init)/energy_init)))
@@ -105,10 +99,10 @@ class RungeKutta(Integrator):
         count = 1
         for t in sol_time[count:]:
             # Evaluate coefficients
-            k1 = ODE.ode_n_body_first_order(x, self.CONST_G, self._particles.masses)
-            k2 = ODE.ode_n_body_first_order(x + 0.5 * self.h * k1, self.CONST_G, self._particles.masses)
-            k3 = ODE.ode_n_body_first_order(x + 0.5 * self.h * k2, self.CONST_G, self._particles.masses)
-            k4 = ODE.ode_n_body_first_order(x + self.h * k3, self.CONST_G, self._particles.masses)
+            k1 = self.ode.ode_n_body_first_order(x, self.CONST_G, self._particles.masses)
+            k2 = self.ode.ode_n_body_first_order(x + 0.5 * self.h * k1, self.CONST_G, self._particles.masses)
+            k3 = self.ode.ode_n_body_first_order(x + 0.5 * self.h * k2, self.CONST_G, self._particles.masses)
+            k4 = self.ode.ode_n_body_first_order(x + self.h * k3, self.CONST_G, self._particles.masses)
 
             # Advance the state
             x += (self.h * (k1 + 2 * k2 + 2 * k3 + k4) / 6.0)
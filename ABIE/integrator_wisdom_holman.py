@@ -10,37 +10,44 @@ __integrator__ = 'WisdomHolman'
 class WisdomHolman(Integrator):
 
     def __init__(self):
-        super(self.__class__, self).__init__()
+        super(WisdomHolman, self).__init__()
 
     def integrator_warmup(self):
+        # the map is split around the Kepler orbits about particle 0, and is undefined without its mass
+        if self.particles.masses[0] <= 0:
+            raise ValueError('The Wisdom-Holman map needs a massive central body (particle 0)')
         state_vec = np.concatenate((self.particles.positions, self.particles.velocities))
         helio = WisdomHolman.move_to_helio(state_vec, self.particles.N)
-        pos = helio[0:3*self.particles.N].copy()
-        vel = helio[3*self.particles.N:].copy()
-        self.libabie.set_state(pos, vel, self.particles.masses, self.particles.radii, self.particles.N,
-                               self.CONST_G, self.CONST_C)
+        pos = helio[0:3*self.particles.N]
+        vel = helio[3*self.particles.N:]
+        elem = self.particles.calculate_aei()
+        if self.acceleration_method == 'ctypes':
+            # The C library integrates in place in the particle vectors, in the heliocentric frame
+            self.particles.positions = pos
+            self.particles.velocities = vel
+            super(WisdomHolman, self).integrator_warmup()
+        else:
+            # integrate_numpy() moves the particles to the heliocentric frame itself
+            self.libabie.set_state(pos.copy(), vel.copy(), self.particles.masses, self.particles.radii,
+                                   self.particles.N, self.CONST_G, self.CONST_C, ptypes=self.particles.ptypes)
 
-        # Call the base method, as particle positions and velocities are not stored in self.particles
         self.energy_init = self.compute_energy(helio, self.particles.masses, self.particles.N, self.CONST_G)
 
-        # Store the initial state - note particle positions and velocities are not stored in self.particles
-        elem = self.particles.calculate_aei()
+        # Store the initial state
         self.buf.store_state(self.t, pos, vel, self.particles.masses,
                              radii=self.particles.radii, names=self.particles.hashes, ptypes=self.particles.ptypes,
                              a=elem[:, 0], e=elem[:, 1], i=elem[:, 2])
 
 
+    def snapshot_args(self):
+        return self.h, 0.0
+
     def integrate_ctypes(self, to_time=None):
         ret = 0
         try:
-            pos = np.empty(3 * self.particles.N)
-            vel = np.empty(3 * self.particles.N)
             self.libabie.integrator_wh(self.t, to_time, self.h)
 
-            self.libabie.get_state(pos, vel, self.particles.masses, self.particles.radii)
-            self.particles.positions = pos
-            self.particles.velocities = vel
-            self._t = self.libabie.get_model_time()
+            self.update_state()
             self.store_state()
             # self._t = to_time
         except CollisionException as e:
@@ -225,6 +232,74 @@ class WisdomHolman(Integrator):
         return c2, c3
 
 
+    @staticmethod
+    def compute_c2c3_batch(psi):
+        """
+        Vectorized version of compute_c2c3
+
+        :param psi: array of universal variables
+        :return: c2, c3: arrays of auxiliary C2 and C3 functions
+        """
+        # Take the square roots of the elliptic and hyperbolic cases separately, to avoid invalid values:
+        sp = np.sqrt(np.where(psi > 1e-10, psi, 1.0))
+        sn = np.sqrt(np.where(psi < -1e-6, -psi, 1.0))
+        c2 = np.where(psi > 1e-10, (1 - np.cos(sp)) / sp ** 2,
+                      np.where(psi < -1e-6, (1 - np.cosh(sn)) / -sn ** 2, 0.5))
+        c3 = np.where(psi > 1e-10, (sp - np.sin(sp)) / sp ** 3,
+                      np.where(psi < -1e-6, (np.sinh(sn) - sn) / sn ** 3, 1.0 / 6.0))
+        return c2, c3
+
+    @staticmethod
+    def propagate_kepler_batch(dt, vr0, vv0, gm, tol=1e-12, max_iter=500):
+        """
+        Propagate the Keplerian states of many bodies at once using f and g functions
+
+        :param dt: time step
+        :param vr0: initial position vectors, shape (n, 3)
+        :param vv0: initial velocity vectors, shape (n, 3)
+        :param gm: gravitational parameters, shape (n,)
+        :return: vrf: final position vectors; vvf: final velocity vectors
+        """
+        r0 = np.linalg.norm(vr0, axis=1)
+        sqrtgm = np.sqrt(gm)
+        rv = np.einsum('ij,ij->i', vr0, vv0) / sqrtgm
+        alpha = 2.0 / r0 - np.einsum('ij,ij->i', vv0, vv0) / gm
+
+        # Initial guesses (elliptic and hyperbolic orbits; parabolic orbits are not treated separately):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sma = 1.0 / alpha
+            chi_hyp = np.sign(dt) * np.sqrt(np.abs(sma)) * np.log(np.abs(-2.0 * gm * alpha * dt / (
+                rv * sqrtgm + np.sqrt(np.abs(gm * sma)) * (1.0 - r0 * alpha))))
+        chi = np.where(alpha > 0, sqrtgm * dt * alpha, chi_hyp)
+
+        # Solve Kepler's equation, only updating the bodies that have not converged:
+        active = np.ones(chi.size, dtype=bool)
+        psi = c2 = c3 = r = None
+        for j in range(max_iter):
+            psi = chi ** 2 * alpha
+            c2, c3 = WisdomHolman.compute_c2c3_batch(psi)
+            r = chi ** 2 * c2 + rv * chi * (1 - psi * c3) + r0 * (1 - psi * c2)
+            dchi = (sqrtgm * dt - chi ** 3 * c3 - rv * chi ** 2 * c2 - r0 * chi * (1 - psi * c3)) / r
+            chi = np.where(active, chi + dchi, chi)
+            active &= np.abs(dchi) >= tol
+            if not active.any():
+                break
+
+        if active.any():
+            print("WARNING: failed to solver Kepler's equation for %d bodies\n" % np.count_nonzero(active))
+
+        # Compute f and g functions, together with their derivatives:
+        f = 1 - chi ** 2 / r0 * c2
+        g = dt - chi ** 3 / sqrtgm * c3
+        dg = 1 - chi ** 2 / r * c2
+        df = sqrtgm / (r * r0) * chi * (psi * c3 - 1)
+
+        # Propagate states:
+        vr = f[:, None] * vr0 + g[:, None] * vv0
+        vv = df[:, None] * vr0 + dg[:, None] * vv0
+
+        return vr, vv
+
     @staticmethod
     def wh_advance_step(x, t, dt, masses, nbodies, accel, G):
         """
@@ -302,27 +377,20 @@ class WisdomHolman(Integrator):
         # Drifted state:
         drift = np.zeros(nbodies * 6)
 
-        # Propagate each body assuming Keplerian motion:
-        eta0 = masses[0]
-        for ibod in range(1, nbodies):
-            # Interior mass:
-            eta = eta0 + masses[ibod]
-
-            # Compute equivalent GM:
-            gm = G * masses[0] * eta / eta0
-
-            # Initial conditions:
-            pos0 = x[ibod * 3: (ibod + 1) * 3]
-            vel0 = x[(nbodies + ibod) * 3: (nbodies + ibod + 1) * 3]
+        # Compute equivalent GM from the interior masses:
+        eta = np.cumsum(masses[:nbodies])
+        gm = G * masses[0] * eta[1:] / eta[:-1]
 
-            # Propagate:
-            pos, vel = WisdomHolman.propagate_kepler(0.0, dt, pos0, vel0, gm)
+        # Initial conditions:
+        pos0 = x[3: nbodies * 3].reshape(-1, 3)
+        vel0 = x[(nbodies + 1) * 3: nbodies * 6].reshape(-1, 3)
 
-            # Store states:
-            drift[ibod * 3: (ibod + 1) * 3] = pos
-            drift[(nbodies + ibod) * 3: (nbodies + ibod + 1) * 3] = vel
+        # Propagate all bodies at once assuming Keplerian motion:
+        pos, vel = WisdomHolman.propagate_kepler_batch(dt, pos0, vel0, gm)
 
-            eta0 = eta
+        # Store states:
+        drift[3: nbodies * 3] = pos.ravel()
+        drift[(nbodies + 1) * 3:] = vel.ravel()
 
         return drift
 
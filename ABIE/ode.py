@@ -1,6 +1,8 @@
 import numpy as np
 import ctypes
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 # from clibabie import CLibABIE
 
 # if not os.path.isfile('libabie.so'):
@@ -27,8 +29,97 @@ class ODE(object):
     #     dxdt = libabie.ode_n_body_second_order(x, x.size/3, const_g, masses)
     #     return dxdt
 
-    @staticmethod
-    def ode_n_body_first_order(x, const_g, masses):
+    # maximum number of pairwise separations evaluated at once, which bounds the size of the work buffers
+    CHUNK_PAIRS = 1 << 18
+
+    # below this number of pairwise separations, the threads are not worth their overhead
+    PARALLEL_PAIRS = 1 << 14
+
+    def __init__(self, num_threads=1):
+        # number of threads evaluating blocks of sinks concurrently (NumPy releases the GIL in the array operations)
+        self.num_threads = 1
+        self._executor = None
+        # work buffers reused between calls, indexed by name; every thread (the callers and the workers of the
+        # executor) has its own, so that simulations integrated concurrently do not share them
+        self._local = threading.local()
+        self.set_num_threads(num_threads)
+
+    def set_num_threads(self, n):
+        n = max(1, int(n))
+        if n != self.num_threads and self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self.num_threads = n
+
+    def _work_buffer(self, name, shape, dtype=np.float64):
+        size = int(np.prod(shape))
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            buffers = self._local.buffers = {}
+        buf = buffers.get(name)
+        if buf is None or buf.size < size:
+            buf = np.empty(size, dtype=dtype)
+            buffers[name] = buf
+        return buf[:size].reshape(shape)
+
+    def _accelerations(self, pos, const_g, masses, acc):
+        """
+        Gravitational accelerations by direct summation, vectorized over blocks of sinks
+        :param pos: the positions, shape (N, 3)
+        :param const_g:
+        :param masses:
+        :param acc: the output array, shape (N, 3)
+        """
+        nbodies = pos.shape[0]
+        masses = np.asarray(masses, dtype=np.float64)
+        # particles without mass do not act as sources
+        src = np.flatnonzero(masses[:nbodies] != 0)
+        if src.size == 0:
+            acc[:] = 0.0
+            return acc
+        pos_src = pos[src]
+        gm = const_g * masses[src]
+
+        n_workers = min(self.num_threads, nbodies)
+        if n_workers <= 1 or nbodies * src.size < self.PARALLEL_PAIRS:
+            self._accelerations_block(pos, pos_src, gm, acc, 0, nbodies)
+            return acc
+        # each worker writes into its own slice of acc
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.num_threads)
+        bounds = np.linspace(0, nbodies, n_workers + 1).astype(int)
+        futures = [self._executor.submit(self._accelerations_block, pos, pos_src, gm, acc, bounds[w], bounds[w + 1])
+                   for w in range(n_workers)]
+        for future in futures:
+            future.result()
+        return acc
+
+    def _accelerations_block(self, pos, pos_src, gm, acc, start, end):
+        """
+        Accelerations of the sinks [start, end) due to the sources at pos_src with G * m = gm
+        """
+        n_src = pos_src.shape[0]
+        chunk = max(1, self.CHUNK_PAIRS // n_src)
+        for j0 in range(start, end, chunk):
+            j1 = min(end, j0 + chunk)
+            rel_sep = self._work_buffer('rel_sep', (j1 - j0, n_src, 3))
+            rel_sep2 = self._work_buffer('rel_sep2', (j1 - j0, n_src))
+            factor = self._work_buffer('factor', (j1 - j0, n_src))
+            self_pair = self._work_buffer('self_pair', (j1 - j0, n_src), dtype=bool)
+
+            np.subtract(pos[j0:j1, np.newaxis, :], pos_src[np.newaxis, :, :], out=rel_sep)
+            np.einsum('ijk,ijk->ij', rel_sep, rel_sep, out=rel_sep2)
+            # G m_k / |r_jk|^3; the particle itself (zero separation) is excluded
+            np.equal(rel_sep2, 0.0, out=self_pair)
+            rel_sep2[self_pair] = 1.0
+            np.sqrt(rel_sep2, out=factor)
+            factor *= rel_sep2
+            np.divide(gm, factor, out=factor)
+            factor[self_pair] = 0.0
+            np.einsum('ij,ijk->ik', factor, rel_sep, out=acc[j0:j1])
+            np.negative(acc[j0:j1], out=acc[j0:j1])
+
+    def ode_n_body_first_order(self, x, const_g, masses):
         """
         TWO-BODY EQUATIONS
         :param x: the flattened state vector. The first half of x is the positions; the second half is velocities.
@@ -37,56 +128,22 @@ class ODE(object):
         :return: the first derivative of x; the first half is velocities; the second half is accelerations.
         """
         # Allocate
-        dxdt = x * 0.0
-
-        # Compute additional perturbations
-        # perturbation = compute_perturbation(x, t, G, masses, nbodies)
+        dxdt = np.empty_like(x)
 
         # Differential equations:
         # - Position
         nbodies = x.size // 6
-        dxdt[0:nbodies*3] = x[nbodies*3:]  # velocities
-        for j in range(0, nbodies):
-            # dxdt[j * 3:3 + j * 3] = x[nbodies * 3 + j * 3:nbodies * 3 + 3 + j * 3]
-            Rj = x[j * 3:3 + j * 3]
-            aj = Rj * 0
-            for k in range(0, nbodies):
-                if j == k:
-                    continue
-                Rk = x[k * 3:k * 3 + 3]
-                rel_sep = Rj - Rk
-                aj += (-const_g * masses[k] * rel_sep / np.linalg.norm(rel_sep) ** 3)
-            dxdt[nbodies * 3 + j * 3:nbodies * 3 + 3 + j * 3] = aj  # accelerations
-
-        # Add extra accelerations
-        # dxdt[nbodies * 3:] += perturbation
+        dxdt[0:nbodies * 3] = x[nbodies * 3:]  # velocities
+        # - Velocity
+        self._accelerations(x[0:nbodies * 3].reshape(nbodies, 3), const_g, masses,
+                            dxdt[nbodies * 3:].reshape(nbodies, 3))
         return dxdt
 
-    @staticmethod
-    def ode_n_body_second_order(x, const_g, masses):
+    def ode_n_body_second_order(self, x, const_g, masses):
 
         nbodies = x.size // 3  # WARNING: this x contains only positions!!
 
         # Allocate
-        acc = x * 0.0
-
-        # Compute additional perturbations
-        # perturbation = compute_perturbation(x, t, G, masses, nbodies)
-
-        # Differential equations:
-        # - Position
-        for j in range(0, nbodies):
-            Rj = x[j * 3:3 + j * 3]
-            aj = Rj * 0
-            for k in range(0, nbodies):
-                if j == k:
-                    continue
-                Rk = x[k * 3:3 + k * 3]
-                rel_sep = Rj - Rk
-                aj += -const_g * masses[k] * rel_sep / np.linalg.norm(rel_sep) ** 3
-            acc[j * 3:3 + j * 3] = aj
-
-        # Add extra accelerations
-        # acc += perturbation
-
+        acc = np.empty_like(x)
+        self._accelerations(x.reshape(nbodies, 3), const_g, masses, acc.reshape(nbodies, 3))
         return acc
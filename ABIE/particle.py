@@ -10,14 +10,10 @@ class Particle(object):
         # self.hash = hash(self)  # unique key of the particle
         self.hash = np.random.randint(100000000, 999999999)
         self.primary = primary  # this defines the primary object that it is orbiting
+        # usually views of the position and velocity vectors of the particle set, so that x, y, z, vx, vy and vz
+        # follow the state of the integrator without copies
         self.__pos = pos
         self.__vel = vel
-        self.x = pos[0]  # x
-        self.y = pos[1]  # y
-        self.z = pos[2]  # z
-        self.vx = vel[0]  # vx
-        self.vy = vel[1]  # vy
-        self.vz = vel[2]  # vz
 
     def __repr__(self):
         return "Particle(m={0:g}, x={1:g}, y={2:g}, z={3:g}, vx={4:g}, vy={5:g}, vz={6:g}, r={7:g}, name='{8:s}', hash={9:d})".format(
@@ -38,9 +34,6 @@ class Particle(object):
     def pos(self, pos_vec):
         if type(pos_vec).__module__ == np.__name__:
             if pos_vec.size == 3:
-                self.x = pos_vec[0]
-                self.y = pos_vec[1]
-                self.z = pos_vec[2]
                 self.__pos = pos_vec
             else:
                 raise ValueError('Position vector must be len=3 vector.')
@@ -51,11 +44,56 @@ class Particle(object):
     def vel(self, vel_vec):
         if type(vel_vec).__module__ == np.__name__:
             if vel_vec.size == 3:
-                self.vx = vel_vec[0]
-                self.vy = vel_vec[1]
-                self.vz = vel_vec[2]
                 self.__vel = vel_vec
             else:
                 raise ValueError('Velocity vector must be len=3 vector.')
         else:
             raise TypeError('Velocity vector must be a numpy vector with len=3.')
+
+    @property
+    def x(self):
+        return self.__pos[0]
+
+    @x.setter
+    def x(self, value):
+        self.__pos[0] = value
+
+    @property
+    def y(self):
+        return self.__pos[1]
+
+    @y.setter
+    def y(self, value):
+        self.__pos[1] = value
+
+    @property
+    def z(self):
+        return self.__pos[2]
+
+    @z.setter
+    def z(self, value):
+        self.__pos[2] = value
+
+    @property
+    def vx(self):
+        return self.__vel[0]
+
+    @vx.setter
+    def vx(self, value):
+        self.__vel[0] = value
+
+    @property
+    def vy(self):
+        return self.__vel[1]
+
+    @vy.setter
+    def vy(self, value):
+        self.__vel[1] = value
+
+    @property
+    def vz(self):
+        return self.__vel[2]
+
+    @vz.setter
+    def vz(self, value):
+        self.__vel[2] = value
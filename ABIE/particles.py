@@ -16,10 +16,14 @@ class Particles(object):
         self.__masses = np.array([])
         self.__names = dict()
         self.__N = 0
+        # the particles view their positions and velocities in the vectors above; the views are renewed lazily after
+        # the vectors are reallocated (adding or removing particles)
+        self.__views_stale = False
         self.CONST_G = const_g
         self.primary = '#COM#'  # '#COM#', '#M_MAX#', '#M_MIN#', or name/ID
 
     def __repr__(self):
+        self.__bind_views()
         str_concat = 'Total number of particles: %d\n' % len(self.__particles)
         for pid, p in enumerate(self.__particles):
             str_concat += (p.__repr__() + '\n')
@@ -68,15 +72,14 @@ class Particles(object):
     @positions.setter
     def positions(self, pos_vec):
         """
-        Set the positions of all particles with a flattened position vector.
+        Set the positions of all particles with a flattened position vector. The values are copied into the position
+        vector of the particle set, which the C library may use as its state buffer (see set_dtype()).
         :param pos_vec: The position vector
         :return:
         """
         if type(pos_vec).__module__ == np.__name__:
             if pos_vec.size == 3 * self.__N:
-                for p_id in range(self.__N):
-                    self.__particles[p_id].pos = pos_vec[3*p_id:3*p_id+3]
-                self.__positions = pos_vec
+                self.__positions[:] = pos_vec
             else:
                 raise ValueError('Position vector must be len=3 vector.')
         else:
@@ -95,9 +98,7 @@ class Particles(object):
         """
         if type(vel_vec).__module__ == np.__name__:
             if vel_vec.size == 3 * self.__N:
-                for p_id in range(self.__N):
-                    self.__particles[p_id].vel = vel_vec[3*p_id:3*p_id+3]
-                self.__velocities = vel_vec
+                self.__velocities[:] = vel_vec
             else:
                 raise ValueError('Velocity vector must be len=3*N vector.')
         else:
@@ -107,6 +108,25 @@ class Particles(object):
     def masses(self):
         return self.__masses
 
+    def set_dtype(self, dtype):
+        """
+        Store the positions and velocities as C-contiguous vectors of the given type (e.g., np.longdouble for the
+        LONGDOUBLE build of the C library), so that the C library can integrate in place in them.
+        """
+        if self.__positions.dtype != dtype or not self.__positions.flags['C_CONTIGUOUS']:
+            self.__positions = np.ascontiguousarray(self.__positions, dtype=dtype)
+            self.__views_stale = True
+        if self.__velocities.dtype != dtype or not self.__velocities.flags['C_CONTIGUOUS']:
+            self.__velocities = np.ascontiguousarray(self.__velocities, dtype=dtype)
+            self.__views_stale = True
+
+    def __bind_views(self):
+        if self.__views_stale:
+            for p_id, p in enumerate(self.__particles):
+                p.pos = self.__positions[3*p_id:3*p_id+3]
+                p.vel = self.__velocities[3*p_id:3*p_id+3]
+            self.__views_stale = False
+
     def add(self, pos=np.zeros(3), vel=np.zeros(3), mass=0.0, name=None, radius=0.0, ptype=0,
             a=None, e=0.0, i=0.0, Omega=0.0, omega=0.0, f=0.0, primary=None):
         """
@@ -154,6 +174,7 @@ class Particles(object):
                             name=name, radius=radius, ptype=ptype, primary=primary_original)
         self.__particles.append(particle)
         self.__N += 1
+        self.__views_stale = True
 
     def add_particle(self, particle):
         """
@@ -167,10 +188,9 @@ class Particles(object):
             self.__masses = np.append(self.__masses, np.array([particle.mass]))
             if particle.name is not None:
                 self.__names[particle.name] = self.__N
-            particle.pos = self.__positions[3*self.__N, 3*self.__N+3]
-            particle.vel = self.__velocities[3*self.__N+3, 3*self.__N+6]
             self.__particles.append(particle)
             self.__N += 1
+            self.__views_stale = True
         else:
             raise TypeError('Incompatible particle type.')
 
@@ -187,9 +207,57 @@ class Particles(object):
             self.__masses = np.delete(self.__masses, pid)
             self.__particles.remove(particle)
             self.__N -= 1
+            self.__views_stale = True
         else:
             raise TypeError('Incompatible particle type.')
 
+    def compact(self, ids, masses, radii, merged=None):
+        """
+        Keep only the particles with the indices ids, in this order, after the C library merged particles in place in
+        the position and velocity vectors: the positions and velocities of the kept particles are the first 3 * len(ids)
+        elements of the vectors.
+        :param ids: The indices of the kept particles
+        :param masses: The masses of the kept particles
+        :param radii: The radii of the kept particles
+        :param merged: A dict mapping the index of each removed particle to the index of the particle it merged into.
+                       The particles that use a removed particle as their primary are moved to its survivor.
+        :return:
+        """
+        ids = [int(pid) for pid in ids]
+        merged = {} if merged is None else merged
+        new_index = {pid: n for n, pid in enumerate(ids)}
+        old_index = {p.name: pid for pid, p in enumerate(self.__particles) if p.name is not None}
+        kept = [self.__particles[pid] for pid in ids]
+        for p in kept:
+            # the primary is given either by name or by index
+            if isinstance(p.primary, string_types) and p.primary in old_index:
+                primary = old_index[p.primary]
+            elif isinstance(p.primary, (int, np.integer)):
+                primary = int(p.primary)
+            else:
+                continue
+            removed = primary in merged
+            while primary in merged:
+                primary = merged[primary]
+            if primary not in new_index:
+                continue
+            if removed and self.__particles[primary].name is not None:
+                p.primary = self.__particles[primary].name
+            elif removed or not isinstance(p.primary, string_types):
+                p.primary = new_index[primary]
+        for p, mass, radius in zip(kept, masses, radii):
+            p.mass = float(mass)
+            p.radius = float(radius)
+
+        n = len(ids)
+        self.__positions = self.__positions[:3 * n].copy()
+        self.__velocities = self.__velocities[:3 * n].copy()
+        self.__masses = np.array(masses, dtype=np.double)
+        self.__particles = kept
+        self.__names = {p.name: pid for pid, p in enumerate(kept) if p.name is not None}
+        self.__N = n
+        self.__views_stale = True
+
     def merge_particles_inelastically(self, pid1, pid2):
         """
         Merge particles with IDs (pid1, pid2) inelastically, conserving momentum but not energy.
@@ -242,6 +310,7 @@ class Particles(object):
 
 
     def __getitem__(self, item):
+        self.__bind_views()
         if isinstance(item, int):
             if item < len(self.__particles):
                 return self.__particles[item]
@@ -261,12 +330,9 @@ class Particles(object):
         the system, and subtracting that for all particles in the system. 
         """
         com = self.get_center_of_mass()
-        # Need to keep both copies of velocity and position in sync
-        for pid in range(0, self.N):
-            self.__particles[pid].vel -= com.vel
-            self.__velocities[3*pid:3*pid+3] = self.__particles[pid].vel
-            self.__particles[pid].pos -= com.pos
-            self.__positions[3*pid:3*pid+3] = self.__particles[pid].pos
+        # the particles view the position and velocity vectors
+        self.__positions -= np.tile(com.pos, self.N)
+        self.__velocities -= np.tile(com.vel, self.N)
 
     def get_center_of_mass(self, subset=None):
         """
@@ -318,23 +384,78 @@ class Particles(object):
         # calculate the orbital elements
         orbital_elem = np.zeros((self.N, 3))
         if self.N < 2:
-            return np.array([np.nan, np.nan, np.nan])
+            return orbital_elem * np.nan
 
         for pid in range(0, self.N):
             p = self.particles[pid]
             if p.primary is not None:
                 # if the particle itself has its own primary object, use its own primary object
-                primary = self.determine_primary_body(p.primary)
+                p_primary = self.determine_primary_body(p.primary)
             else:
                 # else use the globally-defined primary
-                primary = self.determine_primary_body(primary)
-            a, e, i = Tools.from_cartesian_to_aei(mp=p.mass, ms=primary.mass,
-                                                  position=np.array([p.x-primary.x, p.y-primary.y, p.z-primary.z]),
-                                                  velocity=np.array([p.vx-primary.vx, p.vy-primary.vy, p.vz-primary.vz]),
+                p_primary = self.determine_primary_body(primary)
+            a, e, i = Tools.from_cartesian_to_aei(mp=p.mass, ms=p_primary.mass,
+                                                  position=np.array([p.x-p_primary.x, p.y-p_primary.y, p.z-p_primary.z]),
+                                                  velocity=np.array([p.vx-p_primary.vx, p.vy-p_primary.vy, p.vz-p_primary.vz]),
                                                   G=self.CONST_G)
             orbital_elem[pid, :] = np.array([a, e, i])
         return orbital_elem
 
+    def calculate_aei_snapshots(self, pos, vel, primary=None):
+        """
+        Calculate the orbital elements a, e, i of a series of snapshots at once
+        :param pos: the positions of the particles in the snapshots, an array of shape (n_snapshots, 3 * N)
+        :param vel: the velocities of the particles in the snapshots, an array of shape (n_snapshots, 3 * N)
+        :return: an array of shape (n_snapshots, N, 3), with the elements calculate_aei() would give for each snapshot
+        """
+        n_snapshots = pos.shape[0]
+        if self.N < 2:
+            return np.zeros((n_snapshots, self.N, 3)) * np.nan
+
+        # the primary body of every particle, as a weighted sum of the particles
+        weights = np.zeros((self.N, self.N))
+        m_primary = np.zeros(self.N)
+        for pid in range(0, self.N):
+            p = self.particles[pid]
+            weights[pid], m_primary[pid] = self.__primary_weights(p.primary if p.primary is not None else primary)
+        pos = pos.reshape(n_snapshots, self.N, 3)
+        vel = vel.reshape(n_snapshots, self.N, 3)
+        rel_pos = pos - np.matmul(weights, pos)
+        rel_vel = vel - np.matmul(weights, vel)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            a, e, i = Tools.from_cartesian_to_aei(mp=np.tile(self.masses, n_snapshots),
+                                                  ms=np.tile(m_primary, n_snapshots),
+                                                  position=rel_pos.reshape(-1, 3).T,
+                                                  velocity=rel_vel.reshape(-1, 3).T,
+                                                  G=self.CONST_G)
+        orbital_elem = np.stack((a, e, i), axis=-1).reshape(n_snapshots, self.N, 3)
+        # the elements of a body with respect to itself are undefined
+        orbital_elem[np.all(rel_pos == 0, axis=2)] = np.nan
+        return orbital_elem
+
+    def __primary_weights(self, primary):
+        # the weights of the particles in the position of the primary body (see determine_primary_body), and its mass
+        weights = np.zeros(self.N)
+        if primary is None:
+            primary = self.primary
+            if isinstance(primary, string_types) and primary in ('#COM#', '#M_MAX#', '#M_MIN#'):
+                if primary == '#COM#':
+                    primary = list(range(self.N))
+                elif primary == '#M_MAX#':
+                    primary = int(np.argmax(self.masses))
+                else:
+                    primary = int(np.argmin(self.masses))
+        if isinstance(primary, list):
+            weights[primary] = self.masses[primary]
+            m_primary = np.sum(weights)
+            return weights / m_primary, m_primary
+        if isinstance(primary, string_types):
+            if primary not in self.__names:
+                raise ValueError('Object with the name %s not found!' % primary)
+            primary = self.__names[primary]
+        weights[primary] = 1.0
+        return weights, self.masses[primary]
+
     def determine_primary_body(self, primary):
         if primary is None:
             if self.primary == '#COM#':
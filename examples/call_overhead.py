@@ -0,0 +1,95 @@
+"""
+Microbenchmark of the per-call overhead of the libabie binding.
+
+Compares the calls through CLibABIE (prototypes declared once at load time, cached function objects) with the same
+calls made in the old style (restype set and every argument wrapped in ctypes on each call), and with a batch of calls
+through multi_call(). The calls are cheap in C (setters, getters and zero-length integration chunks), so the timings
+are dominated by the overhead of the binding.
+"""
+import ctypes
+import timeit
+import numpy as np
+from ABIE import ABIE
+
+
+class OldStyleCLib(object):
+    """ The wrappers of CLibABIE as they were before the prototypes were declared. """
+
+    def __init__(self, clib):
+        # a second handle of the library, whose functions have no prototypes declared
+        self.lib = ctypes.CDLL(clib.lib._name)
+        self.lib.abie_use.argtypes = [ctypes.c_void_p]
+        self.lib.abie_use.restype = ctypes.c_void_p
+        self.ctx = clib.ctx
+
+    def get_model_time(self):
+        self.lib.abie_use(self.ctx)
+        self.lib.get_model_time.restype = ctypes.c_double
+        return self.lib.get_model_time()
+
+    def set_close_encounter_distance(self, value):
+        self.lib.abie_use(self.ctx)
+        self.lib.set_close_encounter_distance(ctypes.c_double(value))
+
+    def get_collision_data(self):
+        self.lib.abie_use(self.ctx)
+        buf = np.zeros(4)
+        self.lib.get_collision_buffer(ctypes.c_void_p(buf.ctypes.data))
+        return buf.reshape(1, 4)
+
+    def integrator_gr(self, t, t_end, dt):
+        self.lib.abie_use(self.ctx)
+        self.lib.integrator_gr.restype = ctypes.c_int
+        return self.lib.integrator_gr(ctypes.c_double(t), ctypes.c_double(t_end), ctypes.c_double(dt))
+
+    def get_total_energy_supplied(self, pos, vel, masses, G):
+        self.lib.abie_use(self.ctx)
+        self.lib.calculate_energy_supplied.restype = ctypes.c_double
+        return self.lib.calculate_energy_supplied(ctypes.c_void_p(pos.ctypes.data),
+                                                  ctypes.c_void_p(vel.ctypes.data),
+                                                  ctypes.c_void_p(masses.ctypes.data),
+                                                  ctypes.c_int(masses.shape[0]),
+                                                  ctypes.c_double(G))
+
+
+def setup(n=10):
+    sim = ABIE()
+    sim.CONST_G = 4 * np.pi ** 2
+    sim.integrator = 'GaussRadau15'
+    sim.add(mass=1.0, x=0, y=0, z=0, vx=0, vy=0, vz=0, name='Sun')
+    for k in range(n):
+        a = 1.0 + 0.3 * k
+        sim.add(mass=1.e-7, x=a, y=0, z=0, vx=0, vy=2 * np.pi / np.sqrt(a), vz=0)
+    sim.initialize()
+    sim.integrator.integrator_warmup()
+    return sim
+
+
+def main(n_calls=100000):
+    sim = setup()
+    clib = sim.integrator.libabie
+    old = OldStyleCLib(clib)
+    p = sim.particles
+    pos, vel, masses = p.positions.astype(np.double), p.velocities.astype(np.double), p.masses
+    t = clib.get_model_time()
+    calls = ['get_model_time()',
+             'set_close_encounter_distance(0.0)',
+             'get_collision_data()',
+             'integrator_gr(t, t, 0.01)',
+             'get_total_energy_supplied(pos, vel, masses, 1.0)']
+    args = {'t': t, 'pos': pos, 'vel': vel, 'masses': masses}
+    print('%-50s %10s %10s' % ('call', 'old [us]', 'new [us]'))
+    for call in calls:
+        t_call = [timeit.timeit('lib.' + call, number=n_calls, globals=dict(args, lib=lib)) / n_calls * 1e6
+                  for lib in (old, clib)]
+        print('%-50s %10.3f %10.3f' % (call, t_call[0], t_call[1]))
+
+    # one context switch for a batch of calls
+    batch = [('get_model_time',), ('set_close_encounter_distance', 0.0), ('integrator_gr', t, t, 0.01)] * 10
+    n_batches = n_calls // len(batch)
+    t_call = timeit.timeit(lambda: clib.multi_call(batch), number=n_batches) / n_batches / len(batch) * 1e6
+    print('%-50s %10s %10.3f' % ('multi_call(), per call', '', t_call))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Behavioural check of the continuous collision detection of Gauss-Radau15.
+
+Without gravity, a fast massless comet crosses the path of a planet with an impact parameter of half the radius of
+the planet. The steps are as long as the output interval, so the comet passes through the planet between two steps.
+The continuous detection must catch the collision at the analytic time of contact, whatever the output interval,
+while the checks at the end of the steps must miss it.
+"""
+import os
+import tempfile
+import numpy as np
+from ABIE import ABIE
+
+
+def run(continuous, store_dt, end_time=2.0):
+    sim = ABIE()
+    sim.integrator = 'GaussRadau15'
+    sim.CONST_G = 0.0
+    sim.acceleration_method = 'ctypes'
+    sim.collision_outcome = 'merge'
+    sim.continuous_collisions = continuous
+    sim.store_dt = store_dt
+    out_dir = tempfile.mkdtemp()
+    sim.output_file = os.path.join(out_dir, 'collisions.h5')
+    sim.close_encounter_output_file = os.path.join(out_dir, 'close_encounters.txt')
+    sim.collision_output_file = os.path.join(out_dir, 'collisions.txt')
+    sim.add(mass=1.0, x=0, y=0, z=0, vx=0, vy=0, vz=0, radius=0.005, name='Sun')
+    sim.add(mass=1.e-3, x=1, y=0, z=0, vx=0, vy=1, vz=0, radius=0.001, name='planet')
+    sim.add(mass=0.0, x=-4, y=0.0005, z=0, vx=10, vy=1, vz=0, radius=0.0, name='comet')
+    sim.initialize()
+    sim.integrate(end_time)
+    sim.stop()
+    assert np.isclose(sim.t, end_time)
+    if not os.path.isfile(sim.collision_output_file):
+        return sim.particles.N, None
+    return sim.particles.N, np.loadtxt(sim.collision_output_file, delimiter=',', ndmin=2)[0, 0]
+
+
+def main():
+    # the comet reaches the surface of the planet when it is sqrt(0.001^2 - 0.0005^2) short of its centre
+    t_contact = (5.0 - np.sqrt(0.001 ** 2 - 0.0005 ** 2)) / 10.0
+    for store_dt in [1.0, 0.0625]:
+        n, t = run(True, store_dt)
+        print('store_dt = %g: N = %d, collision at t = %.9f (contact at %.9f)' % (store_dt, n, t, t_contact))
+        assert n == 2
+        # (the time is written to the collision file with 6 significant digits)
+        assert abs(t - t_contact) < 1.e-6
+    n, t = run(False, 1.0)
+    print('collisions checked at the end of the steps: N = %d' % n)
+    assert n == 3 and t is None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Behavioural check of the ensemble integrator, against one Gauss-Radau15 simulation per system.
+
+The ensemble holds a sweep over the initial position of the outer planet of a sun-planet-planet system, a system
+without mass (whose bodies must move on straight lines) and a system with two massive bodies at the same position
+(whose accelerations are not finite, so that it must stop at once with status 3 while the others go on).
+"""
+import os
+import tempfile
+import numpy as np
+from ABIE import ABIE
+
+MASSES = [1.0, 1.e-3, 1.e-3]
+
+
+def gauss_radau15(state, end_time):
+    sim = ABIE()
+    sim.integrator = 'GaussRadau15'
+    sim.CONST_G = 1.0
+    sim.acceleration_method = 'ctypes'
+    sim.store_dt = end_time / 4
+    out_dir = tempfile.mkdtemp()
+    sim.output_file = os.path.join(out_dir, 'ensemble.h5')
+    sim.close_encounter_output_file = os.path.join(out_dir, 'close_encounters.txt')
+    sim.collision_output_file = os.path.join(out_dir, 'collisions.txt')
+    for i, m in enumerate(MASSES):
+        sim.add(mass=m, pos=state[i, 0:3], vel=state[i, 3:6], name='b%d' % i)
+    sim.initialize()
+    sim.integrate(end_time)
+    sim.stop()
+    return sim.particles.positions.reshape(-1, 3)
+
+
+def main(end_time=10.0):
+    sweep = []
+    for y in [-1.4, -1.5, -1.6, -1.7]:
+        sweep.append([[0, 0, 0, 0, 0, 0], [1, 0, 0, 0, 1, 0], [0, y, 0, abs(y) ** -0.5, 0, 0]])
+    states = np.array(sweep + [sweep[0], sweep[0]], dtype=np.double)
+    masses = np.array([MASSES] * len(states))
+    # a system without mass
+    masses[-2] = 0.0
+    # a system with two massive bodies at the same position
+    states[-1, 1, 0:3] = states[-1, 0, 0:3]
+
+    sim = ABIE()
+    sim.CONST_G = 1.0
+    final, status, events = sim.integrate_ensemble(states, masses, end_time)
+    print('status:', status)
+    assert list(status) == [0] * len(sweep) + [0, 3]
+    assert np.allclose(events[:-1, 0], end_time)
+    assert events[-1, 0] == 0.0
+
+    for k in range(len(sweep)):
+        pos = gauss_radau15(states[k], end_time)
+        deviation = np.abs((final[k, :, 0:3] - final[k, 0, 0:3]) - (pos - pos[0])).max()
+        print('system %d: largest deviation from Gauss-Radau15 %g' % (k, deviation))
+        assert deviation < 1.e-10
+    assert np.allclose(final[-2, :, 0:3], states[-2, :, 0:3] + states[-2, :, 3:6] * end_time, rtol=0, atol=1.e-12)
+    assert np.array_equal(final[-1], states[-1])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Behavioural check of the simulation farm, against the same simulations run one after the other in this process.
+
+The farm runs a sun with a planet, the same system without mass and a simulation that ends where it starts (nothing
+to integrate). The final states must agree exactly with those of the simulations run here, and all of them must be
+reported as finished (status 0).
+"""
+import os
+import tempfile
+import numpy as np
+from ABIE import ABIE
+from ABIE.farm import farm
+from ABIE.data_io import DataIO
+
+CONFIG = """[physical_params]
+G = 1.0
+[integration]
+integrator = 'GaussRadau15'
+t0 = 0.0
+tf = %r
+h = 0.01
+acc_method = 'ctypes'
+store_dt = 0.5
+[initial_conds]
+Sun = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, %r]
+planet = [1.0, 0.0, 0.0, 0.0, 1.0, 0.0, %r]
+"""
+
+
+def run_here(config_file):
+    config = DataIO.parse_config_file(config_file)
+    sim = ABIE()
+    stem = os.path.splitext(config_file)[0]
+    sim.output_file = stem + '_here.h5'
+    sim.close_encounter_output_file = stem + '_here_close_encounters.txt'
+    sim.collision_output_file = stem + '_here_collisions.txt'
+    sim.initialize(config)
+    sim.store_dt = float(config['integration']['store_dt'])
+    sim.integrate()
+    sim.stop()
+    n = sim.particles.N
+    return np.hstack((sim.particles.positions.reshape(n, 3), sim.particles.velocities.reshape(n, 3),
+                      sim.particles.masses[:, None]))
+
+
+def main():
+    out_dir = tempfile.mkdtemp()
+    configs = []
+    for name, t_end, masses in [('planet', 4.0, (1.0, 1.e-3)), ('massless', 4.0, (0.0, 0.0)),
+                                ('empty', 0.0, (1.0, 1.e-3))]:
+        configs.append(os.path.join(out_dir, name + '.toml'))
+        with open(configs[-1], 'w') as f:
+            f.write(CONFIG % ((t_end,) + masses))
+
+    results, diagnostics = farm(configs, n_workers=2)
+    print('status:', diagnostics[:, 4])
+    assert np.array_equal(diagnostics[:, 4], [0, 0, 0])
+    for config, result in zip(configs, results):
+        assert np.array_equal(result, run_here(config))
+    # without mass, the planet moves on a straight line
+    assert np.allclose(results[1][1, 0:3], [1.0, 4.0, 0.0], rtol=0, atol=1.e-12)
+
+
+if __name__ == "__main__":
+    main()
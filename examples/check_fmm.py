@@ -0,0 +1,33 @@
+"""
+Behavioural check of the fast multipole method: the force error against direct summation for several expansion orders.
+
+At a fixed opening angle the error must fall with the order, and from order 6 on it must be below that of the tree code.
+"""
+import numpy as np
+from ABIE import ABIE
+
+
+def cluster(force_method, n=3000, seed=1, order=4, theta=0.5):
+    rng = np.random.default_rng(seed)
+    sim = ABIE()
+    sim.integrator = 'GaussRadau15'
+    sim.CONST_G = 1.0
+    sim.acceleration_method = 'ctypes'
+    sim.force_method = force_method
+    sim.opening_angle = theta
+    sim.expansion_order = order
+    for i in range(n):
+        sim.add(mass=1.0 / n, pos=rng.normal(size=3), vel=[0, 0, 0], name='s%d' % i)
+    return sim
+
+
+def main():
+    errors = [cluster('fmm', order=p).calculate_force_error(n_sample=500) for p in [2, 4, 6, 8]]
+    tree_error = cluster('tree').calculate_force_error(n_sample=500)
+    print('FMM errors of the orders 2, 4, 6, 8:', errors, ', tree:', tree_error)
+    assert all(np.diff(errors) < 0)
+    assert errors[2] < tree_error
+
+
+if __name__ == "__main__":
+    main()
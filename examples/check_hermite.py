@@ -0,0 +1,80 @@
+"""
+Behavioural check of the Hermite integrator with block time steps, against Gauss-Radau15 and against itself.
+
+A sun with two planets and a moon on a tight orbit around the first planet, so that the moon takes much smaller steps
+than the other bodies. The integration must:
+- agree with Gauss-Radau15 to the accuracy set by eta,
+- give the same result whether integrate() is called once or in two parts (the block steps are kept between calls),
+- start afresh when the state is edited between two calls, i.e., agree exactly with a new simulation that starts from
+  the edited state,
+- move the bodies on straight lines if they have no mass.
+"""
+import os
+import tempfile
+import numpy as np
+from ABIE import ABIE
+
+MASSES = [1.0, 1.e-3, 1.e-3, 1.e-6]
+
+
+def make_sim(integrator, pos=None, vel=None, eta=0.005, masses=MASSES):
+    sim = ABIE()
+    sim.integrator = integrator
+    sim.CONST_G = 1.0
+    sim.acceleration_method = 'ctypes'
+    if integrator == 'Hermite':
+        sim.integrator.eta = eta
+    # an output interval that is a power of two, so that the output times are exact
+    sim.store_dt = 0.125
+    out_dir = tempfile.mkdtemp()
+    sim.output_file = os.path.join(out_dir, 'hermite.h5')
+    sim.close_encounter_output_file = os.path.join(out_dir, 'close_encounters.txt')
+    sim.collision_output_file = os.path.join(out_dir, 'collisions.txt')
+    if pos is None:
+        pos = [0, 0, 0, 1, 0, 0, 0, 2, 0, 1.05, 0, 0]
+        vel = [0, 0, 0, 0, 1, 0, -0.7, 0, 0, 0, 1.12, 0]
+    for i, m in enumerate(masses):
+        sim.add(mass=m, pos=pos[3 * i:3 * i + 3], vel=vel[3 * i:3 * i + 3], name='b%d' % i)
+    sim.initialize()
+    return sim
+
+
+def main(end_time=8.0):
+    single = make_sim('Hermite')
+    single.integrate(end_time)
+    split = make_sim('Hermite')
+    split.integrate(end_time / 4)
+    split.integrate(end_time)
+    reference = make_sim('GaussRadau15')
+    reference.integrate(end_time)
+
+    deviation = np.abs(single.particles.positions - reference.particles.positions).max()
+    print('largest deviation from Gauss-Radau15: %g' % deviation)
+    assert deviation < 1.e-4
+    assert np.array_equal(split.particles.positions, single.particles.positions)
+    assert np.array_equal(split.particles.velocities, single.particles.velocities)
+
+    # move the moon between two calls
+    edited = make_sim('Hermite')
+    edited.integrate(end_time / 4)
+    pos = edited.particles.positions.copy()
+    pos[9] += 1.e-3
+    edited.particles.positions = pos
+    vel = edited.particles.velocities.copy()
+    edited.integrate(end_time / 2)
+    fresh = make_sim('Hermite', pos=pos, vel=vel)
+    fresh.integrate(end_time / 4)
+    deviation = np.abs(edited.particles.positions - fresh.particles.positions).max()
+    print('largest deviation of the edited state from a new simulation: %g' % deviation)
+    assert deviation == 0.0
+
+    # a system without mass
+    massless = make_sim('Hermite', masses=[0.0] * len(MASSES))
+    pos = massless.particles.positions.copy()
+    vel = massless.particles.velocities.copy()
+    massless.integrate(end_time)
+    assert np.allclose(massless.particles.positions, pos + vel * end_time, rtol=0, atol=1.e-12)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Behavioural check of the Hybrid integrator, against Gauss-Radau15 and the plain Wisdom-Holman map.
+
+Two Jupiter-mass planets on neighbouring circular orbits have a close encounter at t ~ 2, well inside the changeover
+radius. The Hybrid integrator must follow Gauss-Radau15 through the encounter much more closely than the plain
+Wisdom-Holman map with the same step. Without gravity (G = 0), the same encounter must still be integrated, and all
+bodies must move on straight lines.
+"""
+import os
+import tempfile
+import numpy as np
+from ABIE import ABIE
+
+
+def make_sim(integrator, G=1.0, h=1 / 32.):
+    sim = ABIE()
+    sim.integrator = integrator
+    sim.CONST_G = G
+    sim.acceleration_method = 'ctypes'
+    sim.h = h
+    sim.store_dt = 0.25
+    out_dir = tempfile.mkdtemp()
+    sim.output_file = os.path.join(out_dir, 'hybrid.h5')
+    sim.close_encounter_output_file = os.path.join(out_dir, 'close_encounters.txt')
+    sim.collision_output_file = os.path.join(out_dir, 'collisions.txt')
+    sim.add(mass=1.0, x=0, y=0, z=0, vx=0, vy=0, vz=0, name='Sun')
+    sim.add(mass=1.e-3, x=1, y=0, z=0, vx=0, vy=1, vz=0, name='p1')
+    r, phi = 1.04, 0.2
+    v = r ** -0.5
+    sim.add(mass=1.e-3, x=r * np.cos(phi), y=r * np.sin(phi), z=0, vx=-v * np.sin(phi), vy=v * np.cos(phi), vz=0,
+            name='p2')
+    sim.initialize()
+    return sim
+
+
+def heliocentric(sim):
+    pos = sim.particles.positions.reshape(-1, 3)
+    return pos - pos[0]
+
+
+def main(end_time=8.0):
+    final = {}
+    for integrator in ['GaussRadau15', 'Hybrid', 'WisdomHolman']:
+        sim = make_sim(integrator)
+        sim.integrate(end_time)
+        sim.stop()
+        final[integrator] = heliocentric(sim)
+    deviation_hybrid = np.abs(final['Hybrid'] - final['GaussRadau15']).max()
+    deviation_wh = np.abs(final['WisdomHolman'] - final['GaussRadau15']).max()
+    print('largest deviation from Gauss-Radau15: Hybrid %g, WisdomHolman %g' % (deviation_hybrid, deviation_wh))
+    assert deviation_hybrid < 1.e-4
+    assert deviation_hybrid < 0.1 * deviation_wh
+
+    # without gravity
+    sim = make_sim('Hybrid', G=0.0)
+    pos = sim.particles.positions.copy()
+    vel = sim.particles.velocities.copy()
+    sim.integrate(end_time)
+    sim.stop()
+    print('t = %g' % sim.t)
+    assert np.isclose(sim.t, end_time)
+    assert np.allclose(sim.particles.positions, pos + vel * end_time, rtol=0, atol=1.e-12)
+
+
+if __name__ == "__main__":
+    main()
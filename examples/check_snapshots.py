@@ -0,0 +1,52 @@
+"""
+Behavioural check of the snapshots collected by libabie through an output schedule, against chunked output.
+
+For each integrator that can be driven by the C library, the snapshots collected in C (output schedule 'uniform')
+must agree with those returned to Python after every output interval (no output schedule), both at the output times
+and at the end. The two runs take exactly the same steps, so the results agree to the rounding errors.
+"""
+import os
+import tempfile
+import h5py
+import numpy as np
+from ABIE import ABIE
+
+
+def run(integrator, schedule, end_time):
+    sim = ABIE()
+    sim.integrator = integrator
+    sim.CONST_G = 1.0
+    sim.acceleration_method = 'ctypes'
+    sim.h = 1 / 64.
+    sim.store_dt = 0.125
+    sim.buffer_len = 7
+    out_dir = tempfile.mkdtemp()
+    sim.output_file = os.path.join(out_dir, 'snapshots.h5')
+    sim.close_encounter_output_file = os.path.join(out_dir, 'close_encounters.txt')
+    sim.collision_output_file = os.path.join(out_dir, 'collisions.txt')
+    sim.add(mass=1.0, x=0, y=0, z=0, vx=0, vy=0, vz=0, name='Sun')
+    sim.add(mass=1.e-3, x=1, y=0, z=0, vx=0, vy=1, vz=0, name='p1')
+    sim.add(mass=1.e-3, x=0, y=-1.6, z=0, vx=0.79, vy=0, vz=0, name='p2')
+    sim.set_output_schedule(schedule)
+    sim.initialize()
+    sim.integrate(end_time)
+    sim.stop()
+    with h5py.File(sim.output_file, 'r') as h5f:
+        steps = sorted(h5f.keys(), key=lambda name: int(name.split('#')[1]))
+        t = np.concatenate([h5f[step]['time'][()] for step in steps])
+        x = np.concatenate([h5f[step]['x'][()] for step in steps])
+    return sim.particles.positions.copy(), t, x
+
+
+def main(end_time=4.0):
+    for integrator in ['GaussRadau15', 'WisdomHolman', 'Hermite', 'Hybrid']:
+        pos_c, t_c, x_c = run(integrator, 'uniform', end_time)
+        pos_py, t_py, x_py = run(integrator, None, end_time)
+        deviation = max(np.abs(pos_c - pos_py).max(), np.abs(x_c - x_py).max())
+        print('%s: %d snapshots, largest deviation %g' % (integrator, len(t_c), deviation))
+        assert np.allclose(t_c, t_py, rtol=0, atol=1.e-12)
+        assert deviation < 1.e-12
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Behavioural check of the Barnes-Hut tree force: the force error against direct summation for several opening angles.
+
+An opening angle of 0 must reproduce direct summation, and the error must grow with the opening angle. With an opening
+angle above 1, a cell that contains the sink could be accepted, so that the sink felt its own mass; those cells are
+always opened, which keeps the error of theta = 1.5 below 0.2 for this cluster (it was about 0.23 before).
+"""
+import numpy as np
+from ABIE import ABIE
+
+
+def force_error(theta, n=3000, seed=1):
+    rng = np.random.default_rng(seed)
+    sim = ABIE()
+    sim.integrator = 'GaussRadau15'
+    sim.CONST_G = 1.0
+    sim.acceleration_method = 'ctypes'
+    sim.force_method = 'tree'
+    sim.opening_angle = theta
+    for i in range(n):
+        sim.add(mass=1.0 / n, pos=rng.normal(size=3), vel=[0, 0, 0], name='s%d' % i)
+    return sim.calculate_force_error(n_sample=500)
+
+
+def main():
+    errors = {theta: force_error(theta) for theta in [0.0, 0.25, 0.5, 1.5]}
+    for theta, error in errors.items():
+        print('theta = %4g: RMS relative force error %g' % (theta, error))
+    assert errors[0.0] < 1.e-12
+    assert errors[0.25] < errors[0.5] < errors[1.5]
+    assert errors[0.5] < 1.e-2
+    assert errors[1.5] < 0.2
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Behavioural check of the state shared between NumPy and libabie without copies.
+
+The C library integrates in place in the position and velocity vectors of the particle set, and the position and
+velocity of every particle are views into them. After an integration, the arrays held before the call and the
+attributes of the particles must therefore show the new state, equal to that of an independent run. An edit made
+through a particle between two calls must be picked up by the integrator, which must then start afresh, i.e., agree
+with a new simulation that starts from the edited state (exactly, except for the rounding errors of the step times of
+Gauss-Radau15, which the new simulation counts from 0).
+"""
+import os
+import tempfile
+import numpy as np
+from ABIE import ABIE
+
+
+def make_sim(integrator, pos=None, vel=None):
+    sim = ABIE()
+    sim.integrator = integrator
+    sim.CONST_G = 1.0
+    sim.acceleration_method = 'ctypes'
+    # a step and an output interval that are powers of two, so that the output times are exact
+    sim.h = 1 / 64.
+    sim.store_dt = 0.125
+    out_dir = tempfile.mkdtemp()
+    sim.output_file = os.path.join(out_dir, 'views.h5')
+    sim.close_encounter_output_file = os.path.join(out_dir, 'close_encounters.txt')
+    sim.collision_output_file = os.path.join(out_dir, 'collisions.txt')
+    sim.add(mass=1.0, x=0, y=0, z=0, vx=0, vy=0, vz=0, name='Sun')
+    sim.add(mass=1.e-3, x=1, y=0, z=0, vx=0, vy=1, vz=0, name='p1')
+    sim.add(mass=1.e-3, x=0, y=-1.6, z=0, vx=0.79, vy=0, vz=0, name='p2')
+    if pos is not None:
+        sim.particles.positions = pos
+        sim.particles.velocities = vel
+    sim.initialize()
+    return sim
+
+
+def main(end_time=2.0):
+    for integrator in ['GaussRadau15', 'WisdomHolman', 'Hermite']:
+        sim = make_sim(integrator)
+        sim.integrate(end_time / 2)
+        positions = sim.particles.positions
+        velocities = sim.particles.velocities
+        planet = sim.particles['p1']
+        assert np.shares_memory(planet.pos, positions) and np.shares_memory(planet.vel, velocities)
+
+        sim.integrate(end_time)
+        reference = make_sim(integrator)
+        reference.integrate(end_time)
+        assert sim.particles.positions is positions and sim.particles.velocities is velocities
+        assert np.array_equal(positions, reference.particles.positions)
+        assert np.array_equal(velocities, reference.particles.velocities)
+        assert planet.x == positions[3] and planet.vy == velocities[4]
+
+        # edit the state through a particle
+        planet.x += 1.e-3
+        planet.vy *= 0.99
+        pos = positions.copy()
+        vel = velocities.copy()
+        sim.integrate(1.5 * end_time)
+        fresh = make_sim(integrator, pos=pos, vel=vel)
+        fresh.integrate(end_time / 2)
+        deviation = np.abs(positions - fresh.particles.positions).max()
+        print('%s: largest deviation of the edited state from a new simulation %g' % (integrator, deviation))
+        assert deviation < 1.e-12
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Behavioural check of the Wisdom-Holman integrator, whose state is kept in libabie between calls.
+
+A sun with two planets. The integration must:
+- agree with Gauss-Radau15 to the accuracy of the map,
+- give the same result whether integrate() is called once or in two parts,
+- restart the map when the state is edited between two calls, i.e., agree exactly with a new simulation that starts
+  from the edited state,
+- refuse a system without a massive central body, for which the map is undefined.
+"""
+import os
+import tempfile
+import numpy as np
+from ABIE import ABIE
+
+
+def make_sim(integrator, pos=None, vel=None, masses=(1.0, 1.e-3, 1.e-3)):
+    sim = ABIE()
+    sim.integrator = integrator
+    sim.CONST_G = 1.0
+    sim.acceleration_method = 'ctypes'
+    # a step and an output interval that are powers of two, so that the output times are exact
+    sim.h = 1 / 64.
+    sim.store_dt = 0.125
+    out_dir = tempfile.mkdtemp()
+    sim.output_file = os.path.join(out_dir, 'wisdom_holman.h5')
+    sim.close_encounter_output_file = os.path.join(out_dir, 'close_encounters.txt')
+    sim.collision_output_file = os.path.join(out_dir, 'collisions.txt')
+    sim.add(mass=masses[0], x=0, y=0, z=0, vx=0, vy=0, vz=0, name='Sun')
+    sim.add(mass=masses[1], x=1, y=0, z=0, vx=0, vy=1, vz=0, name='p1')
+    sim.add(mass=masses[2], x=0, y=-1.6, z=0, vx=0.79, vy=0, vz=0, name='p2')
+    if pos is not None:
+        sim.particles.positions = pos
+        sim.particles.velocities = vel
+    sim.initialize()
+    return sim
+
+
+def heliocentric(sim):
+    pos = sim.particles.positions.reshape(-1, 3)
+    return pos - pos[0]
+
+
+def main(end_time=4.0):
+    single = make_sim('WisdomHolman')
+    single.integrate(end_time)
+    split = make_sim('WisdomHolman')
+    split.integrate(end_time / 4)
+    split.integrate(end_time)
+    reference = make_sim('GaussRadau15')
+    reference.integrate(end_time)
+
+    deviation = np.abs(heliocentric(single) - heliocentric(reference)).max()
+    print('largest deviation from Gauss-Radau15: %g' % deviation)
+    assert deviation < 1.e-4
+    assert np.array_equal(split.particles.positions, single.particles.positions)
+    assert np.array_equal(split.particles.velocities, single.particles.velocities)
+
+    # move a planet between two calls
+    edited = make_sim('WisdomHolman')
+    edited.integrate(end_time / 4)
+    pos = edited.particles.positions.copy()
+    pos[3:6] *= 1.01
+    edited.particles.positions = pos
+    vel = edited.particles.velocities.copy()
+    edited.integrate(end_time / 2)
+    fresh = make_sim('WisdomHolman', pos=pos, vel=vel)
+    fresh.integrate(end_time / 4)
+    deviation = np.abs(edited.particles.positions - fresh.particles.positions).max()
+    print('largest deviation of the edited state from a new simulation: %g' % deviation)
+    assert deviation == 0.0
+
+    # a system without mass
+    massless = make_sim('WisdomHolman', masses=(0.0, 0.0, 0.0))
+    try:
+        massless.integrate(end_time)
+    except ValueError as e:
+        print(e)
+    else:
+        raise AssertionError('a system without a massive central body was integrated')
+
+
+if __name__ == "__main__":
+    main()
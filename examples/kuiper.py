@@ -54,9 +54,9 @@ def execute_simulation(output_file):
     n_oc = 1000
     start_semi = np.linspace(33.501, 53.501, n_oc, endpoint=False)
 
-    # Circular orbits with no inclination
+    # Circular orbits with no inclination. As test particles (ptype=1) they do not act as gravitational sources
     for i in range(n_oc):
-        sim.add(mass=1e-15, a=start_semi[i], e=0, i=0, primary='Sun', name=('test_particle{}'.format(i)))
+        sim.add(mass=1e-15, a=start_semi[i], e=0, i=0, primary='Sun', name=('test_particle{}'.format(i)), ptype=1)
 
     # Set the momentum in the system to 0
     sim.particles.balance_system()
@@ -0,0 +1,43 @@
+"""
+Regression check of the collisions merged by libabie: a sun and two planets that merge down to a single body.
+
+The two planets start at (+-1, 0, 0) with the same velocity, so they collide and merge at t ~ 1.5, and the merged
+planet falls into the sun at t ~ 2.7. The integration must then carry the last body to the end time and return, with
+the total mass and momentum conserved.
+"""
+import os
+import tempfile
+import numpy as np
+from ABIE import ABIE
+
+
+def main(end_time=4.0):
+    sim = ABIE()
+    sim.integrator = 'GaussRadau15'
+    sim.CONST_G = 1.0
+    sim.acceleration_method = 'ctypes'
+    sim.collision_outcome = 'merge'
+    sim.store_dt = 0.1
+    out_dir = tempfile.mkdtemp()
+    sim.output_file = os.path.join(out_dir, 'merge.h5')
+    sim.collision_output_file = os.path.join(out_dir, 'collisions.txt')
+    sim.add(mass=1.0, x=0, y=0, z=0, vx=0, vy=0, vz=0, radius=0.05, name='Sun')
+    sim.add(mass=1.e-3, x=1, y=0, z=0, vx=0, vy=1, vz=0, radius=0.05, name='p1')
+    sim.add(mass=1.e-3, x=-1, y=0, z=0, vx=0, vy=1, vz=0, radius=0.05, name='p2')
+    p = sim.particles
+    momentum = np.sum(p.masses[:, None] * p.velocities.reshape(-1, 3), axis=0)
+
+    sim.initialize()
+    sim.integrate(end_time)
+    sim.stop()
+
+    p = sim.particles
+    print('t = %g, N = %d' % (sim.t, p.N))
+    assert p.N == 1
+    assert np.isclose(sim.t, end_time)
+    assert np.isclose(p.masses[0], 1.002)
+    assert np.allclose(p.masses[0] * p.velocities, momentum)
+
+
+if __name__ == "__main__":
+    main()
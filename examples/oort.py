@@ -53,14 +53,14 @@ def execute_simulation(output_file):
     sim.add(mass=4.366e-5, a=19.189, e=0.05, name='Uranus')
     sim.add(mass=5.15e-5, a=30.07, e=0.0086, name='Neptune')
 
-    # Add the oort cloud particles
+    # Add the oort cloud particles, as test particles (ptype=1) that do not act as gravitational sources
     n_oc = 1000
     semi = np.random.uniform(500, 10000, n_oc)
     ecc = np.random.uniform(0.3, 0.99, n_oc)
     inc = np.random.uniform(-np.pi, np.pi, n_oc)
 
     for i in range(n_oc):
-        sim.add(mass=0, a=semi[i], e=ecc[i], i=inc[i], primary='Sun', name=('test_particle{}'.format(i)))
+        sim.add(mass=0, a=semi[i], e=ecc[i], i=inc[i], primary='Sun', name=('test_particle{}'.format(i)), ptype=1)
 
     # The output file name. If not specified, the default is 'data.hdf5'
     sim.output_file = output_file
@@ -1,4 +1,7 @@
 #include "common.h"
+#if OPENMP
+#include <omp.h>
+#endif
 
 size_t ode_n_body_first_order(real *vec, size_t N, real G, const real *masses, real *dxdt) {
     real x, y, z;
@@ -115,28 +118,21 @@ inline size_t ode_n_body_second_order_massless(const real vec[], size_t N, real
     return EXIT_NORMAL;
 }
 
-size_t ode_n_body_second_order_omp(const real vec[], size_t N, real G, const real masses[], const real radii[], real acc[]) {
-    // Calculate the combined accelerations onto particle j
-    // i.e. j is the sink, k is the source
-    for (int j = 0; j < N; j++) {
-        acc[j * 3] = 0;
-        acc[j * 3 + 1] = 0;
-        acc[j * 3 + 2] = 0;
-    }
-
-#if OPENMP
-#pragma omp parallel for reduction(+: acc[:3*N]) schedule(dynamic)
-#endif
-    for (int j = 0; j < N; j++) {
-        if (masses[j] < 0.0) {
-            // if the mass is negative, the particle is deleted
-            continue;
-        }
-        for (int k = j + 1; k < N; k++) {
+/*
+ * Pairwise interactions between the particles [j0, j1) and [k0, k1) with Newton's third law. If the two ranges are
+ * the same, each pair is evaluated once.
+ */
+static void omp_tile_pairs(const real vec[], real G, const real masses[], real acc[], int j0, int j1, int k0, int k1) {
+    int same = (j0 == k0);
+    for (int j = j0; j < j1; j++) {
+        if (masses[j] < 0.0) continue;
+        real xj = vec[j * 3], yj = vec[j * 3 + 1], zj = vec[j * 3 + 2];
+        real axj = 0.0, ayj = 0.0, azj = 0.0;
+        for (int k = same ? j + 1 : k0; k < k1; k++) {
             if (masses[k] < 0.0) continue;
-            real dx = vec[j * 3] - vec[k * 3];
-            real dy = vec[j * 3 + 1] - vec[k * 3 + 1];
-            real dz = vec[j * 3 + 2] - vec[k * 3 + 2];
+            real dx = xj - vec[k * 3];
+            real dy = yj - vec[k * 3 + 1];
+            real dz = zj - vec[k * 3 + 2];
 
             real rel_sep2 = dx * dx + dy * dy + dz * dz;
             real rel_sep3 = G / (sqrt(rel_sep2) * rel_sep2);
@@ -145,14 +141,98 @@ size_t ode_n_body_second_order_omp(const real vec[], size_t N, real G, const rea
             real ay = dy * rel_sep3;
             real az = dz * rel_sep3;
 
-            acc[j * 3] -= ax * masses[k];
-            acc[j * 3 + 1] -= ay * masses[k];
-            acc[j * 3 + 2] -= az * masses[k];
+            axj -= ax * masses[k];
+            ayj -= ay * masses[k];
+            azj -= az * masses[k];
 
             acc[k * 3] += ax * masses[j];
             acc[k * 3 + 1] += ay * masses[j];
             acc[k * 3 + 2] += az * masses[j];
         }
+        acc[j * 3] += axj;
+        acc[j * 3 + 1] += ayj;
+        acc[j * 3 + 2] += azj;
+    }
+}
+
+size_t ode_n_body_second_order_omp(const real vec[], size_t N, real G, const real masses[], const real radii[], real acc[]) {
+    // Calculate the combined accelerations onto particle j
+    // i.e. j is the sink, k is the source
+    // The particles are split into blocks of OMP_BLOCK_SIZE, so that the positions of a pair of blocks stay in the
+    // cache. If there are enough blocks to keep all threads busy, the pairs of blocks are processed in rounds of a
+    // round-robin tournament: the pairs of one round share no block, so the threads can apply Newton's third law
+    // without write conflicts. Otherwise, every thread calculates the forces on its own blocks of sinks due to all
+    // particles, which doubles the number of interactions but needs no synchronization at all.
+    for (int j = 0; j < N; j++) {
+        acc[j * 3] = 0;
+        acc[j * 3 + 1] = 0;
+        acc[j * 3 + 2] = 0;
+    }
+
+    int n_blocks = (int) ((N + OMP_BLOCK_SIZE - 1) / OMP_BLOCK_SIZE);
+    int n_threads = 1;
+#if OPENMP
+    n_threads = omp_get_max_threads();
+#endif
+
+    if (n_blocks / 2 >= 2 * n_threads) {
+        // blocks on the diagonal
+#if OPENMP
+#pragma omp parallel for schedule(dynamic) copyin(abie_ctx)
+#endif
+        for (int b = 0; b < n_blocks; b++) {
+            int j0 = b * OMP_BLOCK_SIZE;
+            int j1 = (j0 + OMP_BLOCK_SIZE < N) ? j0 + OMP_BLOCK_SIZE : (int) N;
+            omp_tile_pairs(vec, G, masses, acc, j0, j1, j0, j1);
+        }
+        // off-diagonal pairs of blocks: with an even number of players (a dummy block is added if necessary),
+        // n_even - 1 rounds of n_even / 2 disjoint pairs cover every pair exactly once
+        int n_even = n_blocks + (n_blocks % 2);
+        for (int round = 0; round < n_even - 1; round++) {
+#if OPENMP
+#pragma omp parallel for schedule(dynamic) copyin(abie_ctx)
+#endif
+            for (int p = 0; p < n_even / 2; p++) {
+                int a = (p == 0) ? n_even - 1 : (round + p) % (n_even - 1);
+                int b = (round - p + n_even - 1) % (n_even - 1);
+                if (a >= n_blocks || b >= n_blocks) continue; // the dummy block
+                int j0 = a * OMP_BLOCK_SIZE;
+                int j1 = (j0 + OMP_BLOCK_SIZE < N) ? j0 + OMP_BLOCK_SIZE : (int) N;
+                int k0 = b * OMP_BLOCK_SIZE;
+                int k1 = (k0 + OMP_BLOCK_SIZE < N) ? k0 + OMP_BLOCK_SIZE : (int) N;
+                omp_tile_pairs(vec, G, masses, acc, j0, j1, k0, k1);
+            }
+        }
+    } else {
+#if OPENMP
+#pragma omp parallel for schedule(dynamic) copyin(abie_ctx)
+#endif
+        for (int b = 0; b < n_blocks; b++) {
+            int j0 = b * OMP_BLOCK_SIZE;
+            int j1 = (j0 + OMP_BLOCK_SIZE < N) ? j0 + OMP_BLOCK_SIZE : (int) N;
+            for (int k0 = 0; k0 < N; k0 += OMP_BLOCK_SIZE) {
+                int k1 = (k0 + OMP_BLOCK_SIZE < N) ? k0 + OMP_BLOCK_SIZE : (int) N;
+                for (int j = j0; j < j1; j++) {
+                    if (masses[j] < 0.0) continue;
+                    real xj = vec[j * 3], yj = vec[j * 3 + 1], zj = vec[j * 3 + 2];
+                    real axj = 0.0, ayj = 0.0, azj = 0.0;
+                    for (int k = k0; k < k1; k++) {
+                        if (k == j || masses[k] <= 0.0) continue;
+                        real dx = xj - vec[k * 3];
+                        real dy = yj - vec[k * 3 + 1];
+                        real dz = zj - vec[k * 3 + 2];
+                        real rel_sep2 = dx * dx + dy * dy + dz * dz;
+                        real rel_sep3 = G * masses[k] / (sqrt(rel_sep2) * rel_sep2);
+                        axj -= dx * rel_sep3;
+                        ayj -= dy * rel_sep3;
+                        azj -= dz * rel_sep3;
+                    }
+                    acc[j * 3] += axj;
+                    acc[j * 3 + 1] += ayj;
+                    acc[j * 3 + 2] += azj;
+                }
+            }
+        }
     }
     return EXIT_NORMAL;
 }
@@ -162,7 +242,7 @@ inline size_t ode_n_body_second_order_omp_massless(const real vec[], size_t N, r
     // i.e. j is the sink, k is the source
     // This version is more efficient for massless particles
 #if OPENMP
-#pragma omp parallel for
+#pragma omp parallel for copyin(abie_ctx)
 #endif
     for (int j = 0; j < N; j++) {
         if (masses[j] < 0.0) {
@@ -194,38 +274,105 @@ inline size_t ode_n_body_second_order_omp_massless(const real vec[], size_t N, r
     return EXIT_NORMAL;
 }
 
+size_t ode_n_body_second_order_active(const real vec[], size_t N, real G, const real masses[], const int active[], size_t N_active, real acc[]) {
+    // Calculate the combined accelerations onto particle j due to the active particles only
+    // i.e. j is the sink, active[a] is the source
+    // Test particles and massless particles never act as sources, so the cost scales as N_active * N
+#if OPENMP
+#pragma omp parallel for if (N > USE_PARALLEL) copyin(abie_ctx)
+#endif
+    for (int j = 0; j < N; j++) {
+        real ax = 0.0;
+        real ay = 0.0;
+        real az = 0.0;
+        if (masses[j] >= 0.0) {
+            // if the mass is negative, the particle is deleted
+            for (size_t a = 0; a < N_active; a++) {
+                int k = active[a];
+                if (j == k) continue;
+                real GM = G * masses[k];
+                real dx = vec[j * 3] - vec[k * 3];
+                real dy = vec[j * 3 + 1] - vec[k * 3 + 1];
+                real dz = vec[j * 3 + 2] - vec[k * 3 + 2];
+                real rel_sep2 = dx * dx + dy * dy + dz * dz;
+                real rel_sep3 = GM / (sqrt(rel_sep2) * rel_sep2);
+                ax -= dx * rel_sep3;
+                ay -= dy * rel_sep3;
+                az -= dz * rel_sep3;
+            }
+        }
+        acc[j * 3] = ax;
+        acc[j * 3 + 1] = ay;
+        acc[j * 3 + 2] = az;
+    }
+    return EXIT_NORMAL;
+}
 
-size_t calculate_accelerations(const real pos[], const real vel[], size_t N, real G, const real masses[], const real radii[], real acc[]) {
-    // calculate the accelerations due to N bodies
-#ifdef GPU
-    if (N > USE_PARALLEL) {
-        // Use GPU to carry out the force calculation when N is large
-        ode_n_body_second_order_gpu(pos, N, G, masses, radii, acc);
+size_t calculate_gravity(const real pos[], size_t N, real G, const real masses[], const real radii[], int sources, real acc[]) {
+    // calculate the accelerations due to N bodies with the force method selected by the user
+    // with sources == SOURCES_ACTIVE, the particles are those of the simulation state, and if some of them are passive
+    // (e.g., test particles), only the active particles act as sources
+    int passive = (sources == SOURCES_ACTIVE && N == N_global && N_active_global < N);
+    const real *src_masses = passive ? m_src_global : masses;
+    if (force_method_global == FORCE_METHOD_TREE) {
+        ode_n_body_second_order_tree(pos, N, G, src_masses, radii, acc);
+    } else if (force_method_global == FORCE_METHOD_FMM) {
+        ode_n_body_second_order_fmm(pos, N, G, src_masses, radii, acc);
+    } else if (passive && mixed_precision_global && N_passive_global > 0) {
+        // test particles in single precision, the other particles in full precision
+        ode_n_body_second_order_mixed(pos, N, G, masses, src_masses, acc);
+#if !defined(GPU) && !defined(OPENCL)
+    } else if (passive && get_simd_level() > SIMD_NONE) {
+        // the SIMD kernel packs only the sources with a positive mass, i.e. the active particles of src_masses, so
+        // the cost scales as N_active * N as with ode_n_body_second_order_active()
+        ode_n_body_second_order_simd(pos, N, G, src_masses, radii, acc);
+#endif
+    } else if (passive) {
+        // only the N_active active particles act as sources, so the cost scales as N_active * N
+        ode_n_body_second_order_active(pos, N, G, masses, active_global, N_active_global, acc);
+#if !defined(GPU) && !defined(OPENCL)
+    } else if (get_simd_level() > SIMD_NONE) {
+        // vectorized direct summation over the sources with a positive mass, in cache-blocked tiles distributed
+        // over the OpenMP threads (see simd_force.c); it takes the place of ode_n_body_second_order_omp()
+        ode_n_body_second_order_simd(pos, N, G, masses, radii, acc);
+#endif
     } else {
-        // Switch to CPU when N is small
-        ode_n_body_second_order(pos, N, G, masses, radii, acc);
-    }
+#ifdef GPU
+        if (N > USE_PARALLEL) {
+            // Use GPU to carry out the force calculation when N is large
+            ode_n_body_second_order_gpu(pos, N, G, masses, radii, acc);
+        } else {
+            // Switch to CPU when N is small
+            ode_n_body_second_order(pos, N, G, masses, radii, acc);
+        }
 #elif OPENCL
-    if (N > USE_PARALLEL) {
-        // Use OpenCL to carry out the force calculation when N is large
-        ode_n_body_second_order_opencl(pos, N, G, masses, radii, acc);
-    }
-    else {
-        // Switch to CPU when N is small
-        ode_n_body_second_order(pos, N, G, masses, radii, acc);
-    }
+        if (N > USE_PARALLEL) {
+            // Use OpenCL to carry out the force calculation when N is large
+            ode_n_body_second_order_opencl(pos, N, G, masses, radii, acc);
+        }
+        else {
+            // Switch to CPU when N is small
+            ode_n_body_second_order(pos, N, G, masses, radii, acc);
+        }
 #elif SAPPORO
-    ode_n_body_second_order_sapporo(pos, N, G, masses, radii, acc);
+        ode_n_body_second_order_sapporo(pos, N, G, masses, radii, acc);
 #elif OPENMP
-    if(N>USE_PARALLEL)
-    {
-        ode_n_body_second_order_omp(pos, N, G, masses, radii, acc);
-    } else {
-        ode_n_body_second_order(pos, N, G, masses, radii, acc);
-    }
+        if(N>USE_PARALLEL)
+        {
+            ode_n_body_second_order_omp(pos, N, G, masses, radii, acc);
+        } else {
+            ode_n_body_second_order(pos, N, G, masses, radii, acc);
+        }
 #else
-    ode_n_body_second_order(pos, N, G, masses, radii, acc);
+        ode_n_body_second_order(pos, N, G, masses, radii, acc);
 #endif
+    }
+    return EXIT_NORMAL;
+}
+
+size_t calculate_accelerations(const real pos[], const real vel[], size_t N, real G, const real masses[], const real radii[], int sources, real acc[]) {
+    // calculate the accelerations due to N bodies
+    calculate_gravity(pos, N, G, masses, radii, sources, acc);
     //for (int i = 0; i < 3 * N; i++) printf("%lg\t", acc[i]);
     //printf("\n");
     //exit(0);
@@ -248,104 +395,124 @@ size_t calculate_accelerations(const real pos[], const real vel[], size_t N, rea
     return EXIT_NORMAL;
 }
 
-inline size_t check_collisions_close_encounters_omp(const real* vec, const real radii[], size_t N, real t) {
-    real x, y, z;
-    real dx, dy, dz;
+/*
+ * Record a colliding pair of particles to be resolved by resolve_collisions(), if the outcome of the collisions is
+ * handled by the library: always when merging, and only if the particles approach each other when bouncing, so that
+ * overlapping particles that already move apart are left alone.
+ */
+void collision_pair_append(const real *vec, const real *vel, int j, int k) {
+    if (collision_outcome_global == COLLISION_BOUNCE) {
+        real dvdx = 0.0;
+        for (int d = 0; d < 3; d++) dvdx += (vel[3 * k + d] - vel[3 * j + d]) * (vec[3 * k + d] - vec[3 * j + d]);
+        if (dvdx >= 0.0) return;
+    }
+    if (abie_ctx->n_col_pairs == abie_ctx->cap_col_pairs) {
+        abie_ctx->cap_col_pairs = (abie_ctx->cap_col_pairs > 0) ? 2 * abie_ctx->cap_col_pairs : 64;
+        abie_ctx->col_pairs = (int *) realloc(abie_ctx->col_pairs, 2 * abie_ctx->cap_col_pairs * sizeof(int));
+    }
+    abie_ctx->col_pairs[2 * abie_ctx->n_col_pairs] = j;
+    abie_ctx->col_pairs[2 * abie_ctx->n_col_pairs + 1] = k;
+    abie_ctx->n_col_pairs++;
+}
 
+/*
+ * Record the close encounter and the collision, if any, of the pair of particles (j, k)
+ */
+static inline void check_pair(const real *vec, const real *vel, const real radii[], int j, int k, real t) {
+    real dx = vec[j * 3] - vec[k * 3];
+    real dy = vec[j * 3 + 1] - vec[k * 3 + 1];
+    real dz = vec[j * 3 + 2] - vec[k * 3 + 2];
+    real rel_sep2 = dx * dx + dy * dy + dz * dz;
+    real rel_sep = sqrt(rel_sep2);
+    real r = radii[j] + radii[k];
+
+    // close encounter detection
+    if (rel_sep <= close_encounter_distance) {
+        if (buf_ce_events != NULL) {
+            buf_ce_events[(4 * n_close_encounters) % (4 * MAX_N_CE)] = t;
+            buf_ce_events[(4 * n_close_encounters + 1) % (4 * MAX_N_CE)] = j;
+            buf_ce_events[(4 * n_close_encounters + 2) % (4 * MAX_N_CE)] = k;
+            buf_ce_events[(4 * n_close_encounters + 3) % (4 * MAX_N_CE)] = rel_sep;
+        }
+        n_close_encounters += 1;
+    }
+
+    // collision detection
+    if ((r > 0) && (rel_sep <= r) && (collision_outcome_global != COLLISION_STOP)) {
 #if OPENMP
-#pragma omp parallel for private(dx, dy, dz, x, y, z)
+#pragma omp critical
 #endif
-    for (int j = 0; j < N; j++){
-        x = vec[j * 3];
-        y = vec[j * 3 + 1];
-        z = vec[j * 3 + 2];
-        for (int k = j + 1; k < N; k++) {
-            dx = x - vec[k * 3];
-            dy = y - vec[k * 3 + 1];
-            dz = z - vec[k * 3 + 2];
-            real rel_sep2 = dx * dx + dy * dy + dz * dz;
-            real rel_sep = sqrt(rel_sep2);
-            real r = radii[j] + radii[k];
-
-            // close encounter detection
-            if (rel_sep <= close_encounter_distance){
-                if (buf_ce_events != NULL) {
-                    buf_ce_events[(4 * n_close_encounters) % (4 * MAX_N_CE)] = t;
-                    buf_ce_events[(4 * n_close_encounters + 1) % (4 * MAX_N_CE)] = j;
-                    buf_ce_events[(4 * n_close_encounters + 2) % (4 * MAX_N_CE)] = k;
-                    buf_ce_events[(4 * n_close_encounters + 3)  % (4 * MAX_N_CE)] = rel_sep;
-                }
-                n_close_encounters += 1;
-            }
-
-            // collision detection
-            if ((r > 0) && (rel_sep <= r)) {
-                if (buf_collision_events != NULL) {
-                    buf_collision_events[(4 * n_collisions) % (4 * MAX_N_COLLISIONS)] = t;
-                    buf_collision_events[(4 * n_collisions + 1) % (4 * MAX_N_COLLISIONS)] = j;
-                    buf_collision_events[(4 * n_collisions + 2) % (4 * MAX_N_COLLISIONS)] = k;
-                    buf_collision_events[(4 * n_collisions + 3)  % (4 * MAX_N_COLLISIONS)] = rel_sep;
-                }
-                n_collisions += 1;
-            }
+        collision_pair_append(vec, vel, j, k);
+    } else if ((r > 0) && (rel_sep <= r)) {
+        if (buf_collision_events != NULL) {
+            buf_collision_events[(4 * n_collisions) % (4 * MAX_N_COLLISIONS)] = t;
+            buf_collision_events[(4 * n_collisions + 1) % (4 * MAX_N_COLLISIONS)] = j;
+            buf_collision_events[(4 * n_collisions + 2) % (4 * MAX_N_COLLISIONS)] = k;
+            buf_collision_events[(4 * n_collisions + 3) % (4 * MAX_N_COLLISIONS)] = rel_sep;
         }
+        n_collisions += 1;
     }
-    if ((MAX_N_CE) > 0 && (n_close_encounters >= MAX_N_CE)) return EXIT_MAX_N_CE_EXCEEDED;
+}
+
+static size_t collision_close_encounter_flag() {
+    if (abie_ctx->n_col_pairs > 0) return EXIT_COLLISIONS_PENDING;
+    else if ((MAX_N_CE) > 0 && (n_close_encounters >= MAX_N_CE)) return EXIT_MAX_N_CE_EXCEEDED;
     else if ((MAX_N_COLLISIONS > 0) && (n_collisions >= MAX_N_COLLISIONS)) return EXIT_MAX_N_COLLISIONS_EXCEEDED;
     else return EXIT_NORMAL;
 }
 
-inline size_t check_collisions_close_encounters_serial(const real* vec, const real radii[], size_t N, real t) {
-    real x, y, z;
-    real dx, dy, dz;
+static inline size_t check_collisions_close_encounters_omp(const real* vec, const real *vel, const real radii[], size_t N, real t) {
+#if OPENMP
+#pragma omp parallel for copyin(abie_ctx)
+#endif
+    for (int j = 0; j < N; j++) {
+        for (int k = j + 1; k < N; k++) check_pair(vec, vel, radii, j, k, t);
+    }
+    return collision_close_encounter_flag();
+}
 
+static inline size_t check_collisions_close_encounters_serial(const real* vec, const real *vel, const real radii[], size_t N, real t) {
     for (int j = 0; j < N; j++) {
-        x = vec[j * 3];
-        y = vec[j * 3 + 1];
-        z = vec[j * 3 + 2];
-        for (int k = j + 1; k < N; k++) {
-            dx = x - vec[k * 3];
-            dy = y - vec[k * 3 + 1];
-            dz = z - vec[k * 3 + 2];
-            real rel_sep2 = dx * dx + dy * dy + dz * dz;
-            real rel_sep = sqrt(rel_sep2);
-            real r = radii[j] + radii[k];
-
-            // close encounter detection
-            if (rel_sep <= close_encounter_distance) {
-                if (buf_ce_events != NULL) {
-                    buf_ce_events[(4 * n_close_encounters) % (4 * MAX_N_CE)] = t;
-                    buf_ce_events[(4 * n_close_encounters + 1) % (4 * MAX_N_CE)] = j;
-                    buf_ce_events[(4 * n_close_encounters + 2) % (4 * MAX_N_CE)] = k;
-                    buf_ce_events[(4 * n_close_encounters + 3) % (4 * MAX_N_CE)] = rel_sep;
-                }
-                n_close_encounters += 1;
-            }
+        for (int k = j + 1; k < N; k++) check_pair(vec, vel, radii, j, k, t);
+    }
+    return collision_close_encounter_flag();
+}
 
-            // collision detection
-            if ((r > 0) && (rel_sep <= r)) {
-                if (buf_collision_events != NULL) {
-                    buf_collision_events[(4 * n_collisions) % (4 * MAX_N_COLLISIONS)] = t;
-                    buf_collision_events[(4 * n_collisions + 1) % (4 * MAX_N_COLLISIONS)] = j;
-                    buf_collision_events[(4 * n_collisions + 2) % (4 * MAX_N_COLLISIONS)] = k;
-                    buf_collision_events[(4 * n_collisions + 3) % (4 * MAX_N_COLLISIONS)] = rel_sep;
-                }
-                n_collisions += 1;
-            }
-        }
+/*
+ * Check the pairs of the neighbour list only (see neighbour_grid.c), in the same order as when checking all pairs
+ */
+static inline size_t check_collisions_close_encounters_list(const real* vec, const real *vel, const real radii[], size_t N, real t) {
+    const int *start = abie_ctx->neighbours.start;
+    const int *list = abie_ctx->neighbours.list;
+    for (int j = 0; j < N; j++) {
+        for (int p = start[j]; p < start[j + 1]; p++) check_pair(vec, vel, radii, j, list[p], t);
     }
-    if ((MAX_N_CE) > 0 && (n_close_encounters >= MAX_N_CE)) return EXIT_MAX_N_CE_EXCEEDED;
-    else if ((MAX_N_COLLISIONS > 0) && (n_collisions >= MAX_N_COLLISIONS)) return EXIT_MAX_N_COLLISIONS_EXCEEDED;
-    else return EXIT_NORMAL;
+    return collision_close_encounter_flag();
 }
 
-size_t check_collisions_close_encounters(const real* vec, const real radii[], size_t N, real t) {
+size_t check_collisions_close_encounters(const real* vec, const real *vel, const real radii[], size_t N, real t) {
+    // only the pairs closer than the close encounter distance or than the sum of the two largest radii can be events
+    real r_max1 = 0.0, r_max2 = 0.0;
+    for (size_t i = 0; i < N; i++) {
+        if (radii[i] > r_max1) {
+            r_max2 = r_max1;
+            r_max1 = radii[i];
+        } else if (radii[i] > r_max2) {
+            r_max2 = radii[i];
+        }
+    }
+    real range = (close_encounter_distance > r_max1 + r_max2) ? close_encounter_distance : r_max1 + r_max2;
+    // the detection is disabled without radii and close encounter distance
+    if (range <= 0.0) return collision_close_encounter_flag();
+
+    if (N > NEIGHBOUR_LIST_MIN_N && neighbour_list_update(vec, N, range))
+        return check_collisions_close_encounters_list(vec, vel, radii, N, t);
 #if OPENMP
     if (N > USE_PARALLEL)
-        return check_collisions_close_encounters_omp(vec, radii, N, t);
+        return check_collisions_close_encounters_omp(vec, vel, radii, N, t);
     else
 #endif
-        return check_collisions_close_encounters_serial(vec, radii, N, t);
+        return check_collisions_close_encounters_serial(vec, vel, radii, N, t);
 }
 
 real *vec_scalar_op(const real *vec, real scalar, size_t N, char op) {
@@ -413,7 +580,118 @@ real cross_norm(const real *vec1, const real *vec2) {
     return sqrt(c0 * c0 + c1 * c1 + c2 * c2);
 }
 
-int code_inited = 0;
+/*
+ * Simulation contexts (see context.h). The default context is used by the threads that never select a context.
+ */
+static abie_context abie_default_context = ABIE_CONTEXT_DEFAULTS;
+#if OPENMP
+abie_context *abie_ctx = &abie_default_context;
+#elif defined(_MSC_VER)
+__declspec(thread) abie_context *abie_ctx = &abie_default_context;
+#else
+__thread abie_context *abie_ctx = &abie_default_context;
+#endif
+
+abie_context *abie_create() {
+    abie_context defaults = ABIE_CONTEXT_DEFAULTS;
+    abie_context *ctx = (abie_context *) malloc(sizeof(abie_context));
+    *ctx = defaults;
+    return ctx;
+}
+
+void abie_destroy(abie_context *ctx) {
+    if (ctx == NULL || ctx == &abie_default_context) return;
+    abie_context *prev = abie_use(ctx);
+    finalize_code();
+    abie_use((prev == ctx) ? NULL : prev);
+    free(ctx);
+}
+
+/*
+ * Make ctx the context of the calling thread (the default context if ctx is NULL). Returns the previous context.
+ */
+abie_context *abie_use(abie_context *ctx) {
+    abie_context *prev = abie_ctx;
+    abie_ctx = (ctx != NULL) ? ctx : &abie_default_context;
+#if OPENMP
+    if (abie_ctx->num_threads > 0) omp_set_num_threads(abie_ctx->num_threads);
+#endif
+    return prev;
+}
+
+/*
+ * Workspace arena for the scratch buffers of the integrators and force kernels.
+ *
+ * The arena is a single block that is sized in initialize_code() and only grows when a larger simulation needs it.
+ * Buffers are taken from it in stack order: a routine records workspace_mark() on entry, draws its buffers with
+ * workspace_alloc() and hands them back with workspace_release(mark) on exit. A request that does not fit in the block
+ * is served from the heap; those overflow buffers are freed on release, and the block is enlarged to the high-water
+ * mark once the arena is empty, so that the heap is not touched again in the steady state. Every simulation context
+ * has its own arena, which is not thread-safe: buffers must be drawn outside of OpenMP parallel regions.
+ */
+#define WORKSPACE_ALIGN 64
+
+typedef struct workspace_overflow {
+    struct workspace_overflow *next;
+    size_t offset; // offset of the buffer in the arena, for releasing in stack order
+    void *buf;
+} workspace_overflow;
+
+#define ws_block (abie_ctx->workspace.block)
+#define ws_block_raw (abie_ctx->workspace.block_raw)
+#define ws_size (abie_ctx->workspace.size)
+#define ws_top (abie_ctx->workspace.top)
+#define ws_high (abie_ctx->workspace.high)
+#define ws_overflow (abie_ctx->workspace.overflow)
+
+void workspace_reserve(size_t nbytes) {
+    if (nbytes <= ws_size) return;
+    if (ws_top > 0) return; // buffers are in use; the block is enlarged once they are released
+    free(ws_block_raw);
+    ws_block_raw = (char *) malloc(nbytes + WORKSPACE_ALIGN);
+    ws_block = (char *) ((((size_t) ws_block_raw) + WORKSPACE_ALIGN - 1) & ~((size_t) WORKSPACE_ALIGN - 1));
+    ws_size = nbytes;
+}
+
+void *workspace_alloc(size_t nbytes) {
+    nbytes = (nbytes + WORKSPACE_ALIGN - 1) & ~((size_t) WORKSPACE_ALIGN - 1);
+    size_t offset = ws_top;
+    ws_top += nbytes;
+    if (ws_top > ws_high) ws_high = ws_top;
+    if (ws_top <= ws_size) return ws_block + offset;
+
+    workspace_overflow *node = (workspace_overflow *) malloc(sizeof(workspace_overflow));
+    node->buf = malloc(nbytes);
+    node->offset = offset;
+    node->next = ws_overflow;
+    ws_overflow = node;
+    return node->buf;
+}
+
+size_t workspace_mark() {
+    return ws_top;
+}
+
+void workspace_release(size_t mark) {
+    while (ws_overflow != NULL && ws_overflow->offset >= mark) {
+        workspace_overflow *node = ws_overflow;
+        ws_overflow = node->next;
+        free(node->buf);
+        free(node);
+    }
+    ws_top = mark;
+    if (ws_top == 0) workspace_reserve(ws_high);
+}
+
+void workspace_finalize() {
+    ws_high = 0;
+    workspace_release(0);
+    free(ws_block_raw);
+    ws_block_raw = NULL;
+    ws_block = NULL;
+    ws_size = 0;
+}
+
 int initialize_code(double _G, double _C, int _N_MAX, int _MAX_N_CE, int _MAX_N_COLLISIONS) {
     if ((code_inited > 0) && (_N_MAX == N_global)) return 0;
     printf("Initializing the code...");
@@ -445,11 +723,26 @@ int initialize_code(double _G, double _C, int _N_MAX, int _MAX_N_CE, int _MAX_N_
     }
     if (m_vec_global == NULL) m_vec_global = (real *) malloc(_N_MAX * sizeof(real));
     if (r_vec_global == NULL) r_vec_global = (real *) malloc(_N_MAX * sizeof(real));
+    if (ptype_global == NULL) {
+        ptype_global = (int *) malloc(_N_MAX * sizeof(int));
+        for (size_t i = 0; i < _N_MAX; i++) ptype_global[i] = PTYPE_REGULAR;
+    }
+    if (m_src_global == NULL) m_src_global = (real *) malloc(_N_MAX * sizeof(real));
+    if (active_global == NULL) active_global = (int *) malloc(_N_MAX * sizeof(int));
+    if (passive_global == NULL) passive_global = (int *) malloc(_N_MAX * sizeof(int));
+    if (regular_global == NULL) regular_global = (int *) malloc(_N_MAX * sizeof(int));
+    if (ids_global == NULL) {
+        ids_global = (int *) malloc(_N_MAX * sizeof(int));
+        for (size_t i = 0; i < _N_MAX; i++) ids_global[i] = (int) i;
+    }
 
     // For conveniece access in the python interface, these buffers are allocated as double always
     if (MAX_N_CE > 0) buf_ce_events = (real *) malloc(4 * MAX_N_CE * sizeof(real));
     if (MAX_N_COLLISIONS > 0) buf_collision_events = (real *) malloc(4 * MAX_N_COLLISIONS * sizeof(real));
 
+    // Scratch space of the integrators: the Runge-Kutta stages (6 x 6N) are the largest regular demand
+    workspace_reserve(WORKSPACE_REALS_PER_BODY * _N_MAX * sizeof(real));
+
     // initialize variables
     n_close_encounters = 0;
     // buf_collision_events = NULL;
@@ -473,6 +766,34 @@ double get_close_encounter_distance() {
     return (double) close_encounter_distance;
 }
 
+int set_force_method(int method) {
+    if (method != FORCE_METHOD_DIRECT && method != FORCE_METHOD_TREE && method != FORCE_METHOD_FMM) {
+        printf("Unknown force method: %d\n", method);
+        return -1;
+    }
+    force_method_global = method;
+    return 0;
+}
+
+int get_force_method() {
+    return force_method_global;
+}
+
+void set_num_threads(int n) {
+    if (n > 0) abie_ctx->num_threads = n;
+#if OPENMP
+    if (n > 0) omp_set_num_threads(n);
+#endif
+}
+
+void set_mixed_precision(int flag) {
+    mixed_precision_global = (flag != 0);
+}
+
+int get_mixed_precision() {
+    return mixed_precision_global;
+}
+
 void get_close_encounter_buffer(double *buf_ce) {
     for (size_t i = 0; i < 4 * MAX_N_CE; i++) {
         buf_ce[i] = (double) buf_ce_events[i];
@@ -497,25 +818,236 @@ void reset_collision_buffer() {
     for (size_t i = 0; i < 4 * MAX_N_COLLISIONS; i++) buf_collision_events[i] = 0.0;
 }
 
-void set_state(double *pos_vec, double *vel_vec, double *m_vec, double *r_vec, int N, double G, double C){
+/*
+ * Let the library resolve the collisions instead of returning them to the caller: outcome COLLISION_MERGE merges the
+ * colliding particles, COLLISION_BOUNCE lets them bounce with the given coefficient of restitution (1: elastic), and
+ * COLLISION_STOP (the default) stops the integration at a collision as before. Only the Gauss-Radau15 integrator
+ * (integrator_gr(), and integrate_snapshots() with it) resolves collisions; the others always stop.
+ */
+int set_collision_outcome(int outcome, double restitution) {
+    if (outcome != COLLISION_STOP && outcome != COLLISION_MERGE && outcome != COLLISION_BOUNCE) {
+        printf("Unknown collision outcome: %d\n", outcome);
+        return -1;
+    }
+    collision_outcome_global = outcome;
+    abie_ctx->restitution = (real) restitution;
+    return 0;
+}
+
+/*
+ * If flag is 1 (the default), the Gauss-Radau15 integrator searches the collisions along the paths of the particles
+ * within each step and ends the step at the first contact; otherwise the collisions are only detected at the end of
+ * the steps, and fast particles may pass through each other within a step.
+ */
+void set_continuous_collisions(int flag) {
+    continuous_collisions_global = (flag != 0);
+}
+
+int get_continuous_collisions() {
+    return continuous_collisions_global;
+}
+
+static void collision_log_append(real t, int id1, int id2, real distance, int outcome) {
+    if (abie_ctx->n_col_log == abie_ctx->cap_col_log) {
+        abie_ctx->cap_col_log = (abie_ctx->cap_col_log > 0) ? 2 * abie_ctx->cap_col_log : 64;
+        abie_ctx->col_log = (real *) realloc(abie_ctx->col_log, 5 * abie_ctx->cap_col_log * sizeof(real));
+    }
+    real *record = &abie_ctx->col_log[5 * abie_ctx->n_col_log];
+    record[0] = t;
+    record[1] = (real) id1;
+    record[2] = (real) id2;
+    record[3] = distance;
+    record[4] = (real) outcome;
+    abie_ctx->n_col_log++;
+}
+
+static int compare_pairs(const void *a, const void *b) {
+    const int *p = (const int *) a, *q = (const int *) b;
+    if (p[0] != q[0]) return (p[0] < q[0]) ? -1 : 1;
+    return (p[1] > q[1]) - (p[1] < q[1]);
+}
+
+/*
+ * Resolve the collisions found by check_collisions_close_encounters() in the current state, without returning to the
+ * caller. With COLLISION_MERGE, a pair merges perfectly inelastically into the more massive particle (the first one if
+ * the masses are equal), which takes the total mass and momentum, the position of the center of mass and the radius
+ * of the combined volume, and the other particle is removed. With COLLISION_BOUNCE, the normal component of the
+ * relative velocity of the pair is reversed and scaled by the coefficient of restitution, conserving the momentum.
+ *
+ * All the pairs are resolved in one pass, in the order of their indices; a pair that no longer collides after an
+ * earlier merger in the pass is skipped. The removed particles are then dropped by compacting the state in place, so
+ * that N_global decreases while the other particles keep their order (see get_particle_ids()). Every outcome is
+ * appended to the collision log. Returns the number of collisions resolved.
+ */
+size_t resolve_collisions(real t) {
+    size_t N = N_global;
+    size_t n_pairs = abie_ctx->n_col_pairs;
+    int *pairs = abie_ctx->col_pairs;
+    abie_ctx->n_col_pairs = 0;
+    if (n_pairs == 0) return 0;
+    // the pairs are found in any order by the OpenMP threads
+    qsort(pairs, n_pairs, 2 * sizeof(int), compare_pairs);
+
+    size_t ws = workspace_mark();
+    char *removed = (char *) workspace_alloc(N * sizeof(char));
+    for (size_t i = 0; i < N; i++) removed[i] = 0;
+
+    size_t n_resolved = 0;
+    for (size_t p = 0; p < n_pairs; p++) {
+        int j = pairs[2 * p], k = pairs[2 * p + 1];
+        if (removed[j] || removed[k]) continue;
+        real dx[3], dv[3];
+        for (int d = 0; d < 3; d++) {
+            dx[d] = pos_global[3 * k + d] - pos_global[3 * j + d];
+            dv[d] = vel_global[3 * k + d] - vel_global[3 * j + d];
+        }
+        real rel_sep = vector_norm(dx, 3);
+        if (rel_sep > r_vec_global[j] + r_vec_global[k]) continue;
+        real m = m_vec_global[j] + m_vec_global[k];
+        // the mass fractions of the pair, equal shares for massless particles
+        real fj = (m > 0.0) ? m_vec_global[j] / m : 0.5;
+        real fk = 1.0 - fj;
+
+        if (collision_outcome_global == COLLISION_MERGE) {
+            int s = (m_vec_global[k] > m_vec_global[j]) ? k : j;
+            int o = (s == j) ? k : j;
+            for (int d = 0; d < 3; d++) {
+                pos_global[3 * s + d] = fj * pos_global[3 * j + d] + fk * pos_global[3 * k + d];
+                vel_global[3 * s + d] = fj * vel_global[3 * j + d] + fk * vel_global[3 * k + d];
+            }
+            m_vec_global[s] = m;
+            r_vec_global[s] = pow(pow(r_vec_global[j], 3.0) + pow(r_vec_global[k], 3.0), 1.0 / 3);
+            removed[o] = 1;
+            collision_log_append(t, ids_global[s], ids_global[o], rel_sep, COLLISION_MERGE);
+        } else {
+            if (rel_sep == 0.0) continue;
+            real vn = dot(dv, dx) / rel_sep;
+            if (vn >= 0.0) continue;
+            real dvn = (1.0 + abie_ctx->restitution) * vn / rel_sep;
+            for (int d = 0; d < 3; d++) {
+                vel_global[3 * j + d] += fk * dvn * dx[d];
+                vel_global[3 * k + d] -= fj * dvn * dx[d];
+            }
+            collision_log_append(t, ids_global[j], ids_global[k], rel_sep, COLLISION_BOUNCE);
+        }
+        n_resolved++;
+    }
+
+    // drop the merged particles
+    size_t n = 0;
+    for (size_t i = 0; i < N; i++) {
+        if (removed[i]) continue;
+        if (n != i) {
+            for (int d = 0; d < 3; d++) {
+                pos_global[3 * n + d] = pos_global[3 * i + d];
+                vel_global[3 * n + d] = vel_global[3 * i + d];
+                ext_acc_global[3 * n + d] = ext_acc_global[3 * i + d];
+            }
+            m_vec_global[n] = m_vec_global[i];
+            r_vec_global[n] = r_vec_global[i];
+            ptype_global[n] = ptype_global[i];
+            ids_global[n] = ids_global[i];
+        }
+        n++;
+    }
+    N_global = n;
+    workspace_release(ws);
+    update_active_particles();
+    // the integrators continue from the new state
+    gauss_radau15_reset();
+    wisdom_holman_reset();
+    hermite_reset();
+    return n_resolved;
+}
+
+int get_collision_log_count() {
+    return (int) abie_ctx->n_col_log;
+}
+
+/*
+ * Copy up to max_n records of the collision log, [time, id1, id2, distance, outcome] each, to buf_log. Returns the
+ * number of records copied.
+ */
+int get_collision_log(double *buf_log, int max_n) {
+    size_t n = abie_ctx->n_col_log;
+    if (max_n < 0) max_n = 0;
+    if (n > (size_t) max_n) n = (size_t) max_n;
+    for (size_t i = 0; i < 5 * n; i++) buf_log[i] = (double) abie_ctx->col_log[i];
+    return (int) n;
+}
+
+void reset_collision_log() {
+    abie_ctx->n_col_log = 0;
+}
+
+/*
+ * Copy the index of each particle in the state of the last set_state(), and its mass and radius, which may have been
+ * changed by mergers. Returns the number of particles.
+ */
+int get_particle_ids(int *ids, double *m_vec, double *r_vec) {
+    for (size_t i = 0; i < N_global; i++) {
+        ids[i] = ids_global[i];
+        m_vec[i] = (double) m_vec_global[i];
+        r_vec[i] = (double) r_vec_global[i];
+    }
+    return (int) N_global;
+}
+
+void set_state(double *pos_vec, double *vel_vec, double *m_vec, double *r_vec, int *ptype_vec, int N, double G, double C){
     // initialize if the global arrays are not allocated
     initialize_code(G, C, N, MAX_N_CE, MAX_N_COLLISIONS);
 
-    // copy the data from python to the global array with type casting
-    for (size_t i = 0; i < 3 * N; i++) {
-        pos_global[i] = (real) pos_vec[i];
-        vel_global[i] = (real) vel_vec[i];
+    // copy the data from python to the global array with type casting; NULL vectors leave the positions and the
+    // velocities as they are (e.g., in the buffers registered by set_state_buffers())
+    if (pos_vec != NULL && vel_vec != NULL) {
+        for (size_t i = 0; i < 3 * N; i++) {
+            pos_global[i] = (real) pos_vec[i];
+            vel_global[i] = (real) vel_vec[i];
+        }
     }
     for (size_t i = 0; i < N; i++) {
         m_vec_global[i] = (real) m_vec[i];
         r_vec_global[i] = (real) r_vec[i];
+        // all particles are regular particles if the types are not specified
+        ptype_global[i] = (ptype_vec != NULL) ? ptype_vec[i] : PTYPE_REGULAR;
+        ids_global[i] = (int) i;
     }
+    abie_ctx->n_col_pairs = 0;
     N_global = (size_t) N;
     G_global = (real) G;
     C_global = (real) C;
+    update_active_particles();
+    // the integrators cannot continue from their previous state
+    gauss_radau15_reset();
+    wisdom_holman_reset();
+    hermite_reset();
+}
+
+/*
+ * Determine which particles act as gravitational sources. Must be called whenever the masses or the types
+ * of the particles change.
+ */
+void update_active_particles() {
+    N_active_global = 0;
+    N_passive_global = 0;
+    N_regular_global = 0;
+    for (size_t i = 0; i < N_global; i++) {
+        if (m_vec_global[i] >= 0.0 && ptype_global[i] == PTYPE_TEST) {
+            m_src_global[i] = 0.0;
+            passive_global[N_passive_global++] = (int) i;
+        } else {
+            // deleted particles keep their negative mass, so that the force routines can skip them
+            m_src_global[i] = m_vec_global[i];
+            if (m_vec_global[i] >= 0.0) regular_global[N_regular_global++] = (int) i;
+        }
+        if (m_src_global[i] > 0.0) active_global[N_active_global++] = (int) i;
+    }
 }
 
 int get_state(double *pos_vec, double *vel_vec, double *m_vec, double *r_vec) {
+    // complete the last step of the Wisdom-Holman map, if it was left pending
+    wisdom_holman_synchronize(vel_global, N_global);
+
     // copy the data from the global arrays to the python data space
     for (size_t i = 0; i < 3 * N_global; i++) {
         pos_vec[i] = (double) pos_global[i];
@@ -528,8 +1060,41 @@ int get_state(double *pos_vec, double *vel_vec, double *m_vec, double *r_vec) {
     return (int) N_global;
 }
 
+/*
+ * Let the integrators work in place in the buffers pos_vec[3N] and vel_vec[3N] of the caller (e.g., the NumPy arrays
+ * of the python interface), which then hold the state: they are neither copied in by set_state() (called with NULL
+ * vectors) nor out by get_state(). The buffers are of type real, i.e., long double in the LONGDOUBLE build, and must
+ * stay valid until they are replaced, or until finalize_code(). Must be called after set_state() with the same N.
+ */
+int set_state_buffers(real *pos_vec, real *vel_vec, int N) {
+    if (!code_inited || (size_t) N != N_global || pos_vec == NULL || vel_vec == NULL) return -1;
+    if (!abie_ctx->external_state) {
+        free(pos_global);
+        free(vel_global);
+    }
+    pos_global = pos_vec;
+    vel_global = vel_vec;
+    abie_ctx->external_state = 1;
+    return 0;
+}
+
+/*
+ * Complete the state after an integration, without copying it: the velocities of the Wisdom-Holman map may still
+ * miss the closing half kick of the last step. Returns the number of particles.
+ */
+int synchronize_state() {
+    wisdom_holman_synchronize(vel_global, N_global);
+    return (int) N_global;
+}
+
+// sizeof(real), so that the python interface can allocate state buffers of the matching type
+int get_real_size() {
+    return (int) sizeof(real);
+}
+
 double calculate_energy() {
     real energy = 0.0;
+    wisdom_holman_synchronize(vel_global, N_global);
     real d_pos[3];
     for (size_t i = 0; i < N_global; i++) {
         if (m_vec_global[i] == 0) continue;
@@ -567,6 +1132,52 @@ double calculate_energy_supplied(double* pos_vec, double* vel_vec, double* m_vec
     return energy;
 }
 
+/***
+ * Estimate the relative error of the gravitational accelerations calculated with the selected force method,
+ * by comparing against direct summation for n_sample particles evenly spaced over the current state.
+ * Returns the root-mean-square of |a - a_direct| / |a_direct|.
+ */
+double calculate_force_error(int n_sample) {
+    size_t N = N_global;
+    if (N == 0 || pos_global == NULL || n_sample <= 0) return 0.0;
+    if ((size_t) n_sample > N) n_sample = (int) N;
+
+    size_t ws = workspace_mark();
+    real *acc = (real *) workspace_alloc(3 * N * sizeof(real));
+    calculate_gravity(pos_global, N, G_global, m_vec_global, r_vec_global, SOURCES_ACTIVE, acc);
+
+    double err2 = 0.0;
+    int n_used = 0;
+#if OPENMP
+#pragma omp parallel for reduction(+: err2, n_used) copyin(abie_ctx)
+#endif
+    for (int s = 0; s < n_sample; s++) {
+        size_t i = (size_t) s * N / n_sample;
+        if (m_vec_global[i] < 0.0) continue;
+        real ax = 0.0, ay = 0.0, az = 0.0;
+        for (size_t j = 0; j < N; j++) {
+            if (j == i || m_src_global[j] <= 0.0) continue;
+            real dx = pos_global[3 * i] - pos_global[3 * j];
+            real dy = pos_global[3 * i + 1] - pos_global[3 * j + 1];
+            real dz = pos_global[3 * i + 2] - pos_global[3 * j + 2];
+            real rel_sep2 = dx * dx + dy * dy + dz * dz;
+            real rel_sep3 = G_global * m_src_global[j] / (sqrt(rel_sep2) * rel_sep2);
+            ax -= dx * rel_sep3;
+            ay -= dy * rel_sep3;
+            az -= dz * rel_sep3;
+        }
+        real a_norm2 = ax * ax + ay * ay + az * az;
+        if (a_norm2 == 0.0) continue;
+        real ex = acc[3 * i] - ax;
+        real ey = acc[3 * i + 1] - ay;
+        real ez = acc[3 * i + 2] - az;
+        err2 += (double) ((ex * ex + ey * ey + ez * ez) / a_norm2);
+        n_used++;
+    }
+    workspace_release(ws);
+    return (n_used > 0) ? sqrt(err2 / n_used) : 0.0;
+}
+
 /***
  * Plug the additional forces calculated elsewhere into the integrator.
  * WARNING: if the ext_acc[] array is not updated every integration timestep by
@@ -591,10 +1202,21 @@ size_t set_additional_forces(int N, double ext_acc[]) {
 }
 
 int finalize_code() {
-    free(pos_global);
-    free(vel_global);
+    if (!abie_ctx->external_state) {
+        free(pos_global);
+        free(vel_global);
+    }
+    abie_ctx->external_state = 0;
     free(m_vec_global);
     free(r_vec_global);
+    free(ptype_global);
+    free(m_src_global);
+    free(active_global);
+    free(passive_global);
+    free(regular_global);
+    free(ids_global);
+    free(abie_ctx->col_log);
+    free(abie_ctx->col_pairs);
     free(ext_acc_global);
     free(buf_ce_events);
     free(buf_collision_events);
@@ -603,9 +1225,25 @@ int finalize_code() {
     vel_global = NULL;
     m_vec_global = NULL;
     r_vec_global = NULL;
+    ptype_global = NULL;
+    m_src_global = NULL;
+    active_global = NULL;
+    N_active_global = 0;
+    passive_global = NULL;
+    N_passive_global = 0;
+    regular_global = NULL;
+    N_regular_global = 0;
+    ids_global = NULL;
+    abie_ctx->col_log = NULL;
+    abie_ctx->n_col_log = 0;
+    abie_ctx->cap_col_log = 0;
+    abie_ctx->col_pairs = NULL;
+    abie_ctx->n_col_pairs = 0;
+    abie_ctx->cap_col_pairs = 0;
     ext_acc_global = NULL;
     buf_ce_events = NULL;
     buf_collision_events = NULL;
+    workspace_finalize();
 
     // t = 0.0;
     // t_end = 0.0;
@@ -615,17 +1253,41 @@ int finalize_code() {
 #elif OPENCL
     opencl_finalize();
 #endif
+    tree_finalize();
+    fmm_finalize();
+    simd_finalize();
+    neighbour_finalize();
+    gauss_radau15_finalize();
+    wisdom_holman_finalize();
+    hermite_finalize();
 
     return 0;
 }
 
 int integrator_gr(double t, double t_end, double dt) {
-    int ret = (int) integrator_gauss_radau15(pos_global, vel_global, m_vec_global, r_vec_global, N_global, G_global, t, t_end, dt);
+    int ret;
+    // the collisions resolved by the library end a call of the integrator, which then continues from the new state
+    while ((ret = (int) gauss_radau15_integrate(pos_global, vel_global, m_vec_global, r_vec_global, N_global, G_global,
+                                                t, t_end, dt, SOURCES_ACTIVE)) == EXIT_COLLISIONS_PENDING) {
+        resolve_collisions(t_global);
+        t = (double) t_global;
+        if (N_global < 2) {
+            // a single particle left by the mergers moves freely (with the external acceleration) to t_end
+            real dt_free = (real) t_end - t_global;
+            for (size_t i = 0; i < 3 * N_global; i++) {
+                real acc = (ENABLE_EXT_ACC == 10 && ext_acc_global != NULL) ? ext_acc_global[i] : 0.0;
+                pos_global[i] += vel_global[i] * dt_free + 0.5 * acc * dt_free * dt_free;
+                vel_global[i] += acc * dt_free;
+            }
+            t_global = t_end;
+            return 0;
+        }
+    }
     return ret;
 }
 
 int integrator_rk(double t, double t_end, double dt) {
-    integrator_runge_kutta(pos_global, vel_global, m_vec_global, r_vec_global, N_global, G_global, t, t_end, dt);
+    integrate_rk(pos_global, vel_global, m_vec_global, r_vec_global, N_global, G_global, t, t_end, dt, SOURCES_ACTIVE);
     return 0;
 }
 
@@ -633,3 +1295,64 @@ int integrator_wh(double t, double t_end, double dt) {
     integrator_wisdom_holman(pos_global, vel_global, m_vec_global, r_vec_global, N_global, G_global, t, t_end, dt);
     return 0;
 }
+
+int integrator_hm(double t, double t_end, double dt, double eta) {
+    int ret = (int) hermite_integrate(pos_global, vel_global, m_vec_global, r_vec_global, N_global, G_global, t, t_end, dt, eta,
+                                      SOURCES_ACTIVE);
+    return ret;
+}
+
+int integrator_hy(double t, double t_end, double dt, double hill_factor) {
+    int ret = (int) integrator_hybrid(pos_global, vel_global, m_vec_global, r_vec_global, N_global, G_global, t, t_end, dt, hill_factor);
+    return ret;
+}
+
+/*
+ * Integrate through a schedule of output times in one call, writing a snapshot of the state at every output time to
+ * the buffers provided by the caller (buf_t[n_out], buf_pos[n_out][3N], buf_vel[n_out][3N]). The integration stops
+ * early if a close encounter or collision event ends a call of the integrator, or if particles were merged by the
+ * library (set_collision_outcome()); the snapshots written so far are counted by get_snapshot_count(), and the state
+ * at the event, or at the output time of the merger, is left in the global state as usual.
+ * param is the accuracy parameter eta of the Hermite integrator, or the hill_factor of the hybrid integrator.
+ */
+
+int integrate_snapshots(int integrator, double t, const double t_out[], int n_out, double dt, double param,
+                        double buf_t[], double buf_pos[], double buf_vel[]) {
+    ABIE_N_SNAPSHOTS = 0;
+    size_t N = N_global;
+    size_t ws = workspace_mark();
+    real *vel_sync = (real *) workspace_alloc(3 * N_global * sizeof(real));
+    int ret = 0;
+    for (int k = 0; k < n_out; k++) {
+        if (integrator == SNAPSHOT_GAUSS_RADAU15) {
+            ret = integrator_gr(t, t_out[k], dt);
+        } else if (integrator == SNAPSHOT_WISDOM_HOLMAN) {
+            ret = integrator_wh(t, t_out[k], dt);
+        } else if (integrator == SNAPSHOT_HERMITE) {
+            ret = integrator_hm(t, t_out[k], dt, param);
+        } else if (integrator == SNAPSHOT_HYBRID) {
+            ret = integrator_hy(t, t_out[k], dt, param);
+        } else {
+            printf("Integrator %d does not support snapshots\n", integrator);
+            break;
+        }
+        // stop at an event, and when particles were merged, as the snapshots of the buffers have N particles
+        if (ret > 0 || N_global != N) break;
+        t = (double) t_global;
+
+        // the Wisdom-Holman map keeps its last half kick pending, so the velocities are synchronized in a copy
+        wisdom_holman_velocities(vel_global, N_global, vel_sync);
+        buf_t[k] = t;
+        for (size_t i = 0; i < 3 * N_global; i++) {
+            buf_pos[3 * N_global * k + i] = (double) pos_global[i];
+            buf_vel[3 * N_global * k + i] = (double) vel_sync[i];
+        }
+        ABIE_N_SNAPSHOTS++;
+    }
+    workspace_release(ws);
+    return ret;
+}
+
+int get_snapshot_count() {
+    return ABIE_N_SNAPSHOTS;
+}
@@ -39,67 +39,122 @@
 #endif
 
 #define USE_PARALLEL 256
-
-// Common variables
-real *pos_global;  // the position state vector specified by the users
-real *vel_global;  // the velocity state vector specified by the users
-real *m_vec_global; // masses specified by the users
-real *r_vec_global; // radii specified by the users
-
-real *ext_acc_global; // externally calculated acceleration terms for each body
-// extern real *y00;  // the position state vector used internally by the integrator
-// extern real *dy0;  // the velocity state vector used internally by the integrator
-// extern real *masses; // masses used internally by the integrator
-
-size_t N_global; // number of particles
-// extern size_t dim; // usually 3 * N
-// extern size_t N_active; // number of massive particles
-real G_global; // gravitational constant
-real C_global; // speed of light constant (for PN calculations)
-// extern real *eps; // per-particle softening parameter
-// extern real h; // the internal time step used by the integrator
-// extern real h_min; // minimum time step
-real t_global;
-// extern real t_end;
-extern double dt; // the time step specified by the user
-real close_encounter_distance;  // if 0, ignore close encounters
-size_t n_close_encounters; // number of close encounters
-size_t n_collisions; // number of collision events
-
-// constants and flags
-size_t MAX_N_CE; // number of close encounters before it stops integrating (will lead the Python framework to generate an exception)
-size_t MAX_N_COLLISIONS; // number of close encounters before it stops integrating (will lead the Python framework to generate an exception)
+// Collisions and close encounters are searched with a neighbour list above this number of particles
+#define NEIGHBOUR_LIST_MIN_N 64
+// Number of reals per particle reserved in the workspace arena by initialize_code()
+#define WORKSPACE_REALS_PER_BODY 36
+// Number of particles per block of the cache-blocked OpenMP force kernel
+#define OMP_BLOCK_SIZE 256
+
+// Methods for calculating the gravitational forces between the bodies
+#define FORCE_METHOD_DIRECT 0 // direct summation, O(N^2)
+#define FORCE_METHOD_TREE 1   // Barnes-Hut tree, O(N log N)
+#define FORCE_METHOD_FMM 2    // fast multipole method, O(N)
+
+// Instruction sets used by the direct summation
+#define SIMD_NONE 0
+#define SIMD_AVX2 1
+#define SIMD_AVX512 2
+
+// Integrators driven by integrate_snapshots()
+#define SNAPSHOT_GAUSS_RADAU15 0
+#define SNAPSHOT_WISDOM_HOLMAN 1
+#define SNAPSHOT_HERMITE 2
+#define SNAPSHOT_HYBRID 3
+
+// Sources of the gravitational forces (see calculate_gravity())
+#define SOURCES_ALL 0    // every particle with a positive mass
+#define SOURCES_ACTIVE 1 // the particles of the simulation state, of which the test particles are not sources
+
+// Particle types
+#define PTYPE_REGULAR 0
+#define PTYPE_TEST 1     // test particles feel the forces of the other particles, but never act as sources
+#define PTYPE_LOW_MASS 2
+
+// Outcomes of the collisions (set_collision_outcome())
+#define COLLISION_STOP 0    // the integrator stops and returns the event to the caller
+#define COLLISION_MERGE 1   // the colliding particles are merged by the library, which continues the integration
+#define COLLISION_BOUNCE 2  // the colliding particles bounce off each other, and the integration continues
+
+// Exit codes of the integrators
 size_t EXIT_MAX_N_CE_EXCEEDED;
 size_t EXIT_MAX_N_COLLISIONS_EXCEEDED;
 size_t EXIT_NORMAL;
-size_t ENABLE_EXT_ACC; // enable the externally calculated accelerations
+#define EXIT_COLLISIONS_PENDING 3 // internal: collisions to be resolved by resolve_collisions() before continuing
 
-// buffer for storing close encounter events and collision events
-// format: [time1, id1_event1, id2_event1, distance_event1, time2, id1_event2, id2_event2, distance_event2, ...]
-real *buf_ce_events;
-real *buf_collision_events;
+// The state of the simulation (pos_global, t_global, ...) is kept in the simulation context
+#include "context.h"
 
 // Getters/Setters
-ABIELIBRARY_API void set_state(double *pos_vec, double *vel_vec, double *m_vec, double *r_vec, int N, double G, double C);
+ABIELIBRARY_API void set_state(double *pos_vec, double *vel_vec, double *m_vec, double *r_vec, int *ptype_vec, int N, double G, double C);
 ABIELIBRARY_API int get_state(double *pos_vec, double *vel_vec, double *m_vec, double *r_vec);
+ABIELIBRARY_API int set_state_buffers(real *pos_vec, real *vel_vec, int N);
+ABIELIBRARY_API int synchronize_state();
+ABIELIBRARY_API int get_real_size();
 ABIELIBRARY_API double get_model_time();
 ABIELIBRARY_API void set_close_encounter_distance(double d);
 ABIELIBRARY_API double get_close_encounter_distance();
 ABIELIBRARY_API void set_close_encounter_buffer(double *buf_ce, int max_n_ce);
 ABIELIBRARY_API void set_collision_buffer(double *buf_collision, int max_n_collision);
 ABIELIBRARY_API void get_collision_buffer(double* buf_collision);
+ABIELIBRARY_API int set_force_method(int method);
+ABIELIBRARY_API int get_force_method();
+ABIELIBRARY_API void set_opening_angle(double theta);
+ABIELIBRARY_API double get_opening_angle();
+ABIELIBRARY_API int set_expansion_order(int p);
+ABIELIBRARY_API int get_expansion_order();
+ABIELIBRARY_API int set_simd_level(int level);
+ABIELIBRARY_API int get_simd_level();
+ABIELIBRARY_API void set_mixed_precision(int flag);
+ABIELIBRARY_API void set_num_threads(int n);
+ABIELIBRARY_API int get_mixed_precision();
 
 ABIELIBRARY_API void reset_close_encounter_buffer(); // should be called after the python interface finishes handling a close encounter exception
 ABIELIBRARY_API void reset_collision_buffer(); // should be called after the python interface finishes handling a collision exception
+ABIELIBRARY_API int set_collision_outcome(int outcome, double restitution);
+ABIELIBRARY_API void set_continuous_collisions(int flag);
+ABIELIBRARY_API int get_continuous_collisions();
+ABIELIBRARY_API int get_collision_log_count();
+ABIELIBRARY_API int get_collision_log(double *buf_log, int max_n);
+ABIELIBRARY_API void reset_collision_log();
+ABIELIBRARY_API int get_particle_ids(int *ids, double *m_vec, double *r_vec);
 
 // set the addtional forces calculated by external routines (e.g., in the python interface)
 ABIELIBRARY_API size_t set_additional_forces(int N, double ext_acc[]);
 
 // Utility functions
-size_t ode_n_body_first_order(real *pos, size_t N, real G, const real *masses, real *dxdt);
-size_t ode_n_body_second_order(const real *pos, size_t N, real G, const real *masses, const real *radii, real *acc);
+ABIELIBRARY_API size_t ode_n_body_first_order(real *pos, size_t N, real G, const real *masses, real *dxdt);
+ABIELIBRARY_API size_t ode_n_body_second_order(const real *pos, size_t N, real G, const real *masses, const real *radii, real *acc);
+size_t ode_n_body_second_order_active(const real vec[], size_t N, real G, const real masses[], const int active[], size_t N_active, real acc[]);
+void update_active_particles();
+size_t ode_n_body_second_order_simd(const real vec[], size_t N, real G, const real masses[], const real radii[], real acc[]);
+size_t ode_n_body_second_order_mixed(const real vec[], size_t N, real G, const real masses[], const real src_masses[], real acc[]);
+void simd_finalize();
+size_t ode_n_body_second_order_tree(const real vec[], size_t N, real G, const real masses[], const real radii[], real acc[]);
+void tree_finalize();
+size_t ode_n_body_second_order_fmm(const real vec[], size_t N, real G, const real masses[], const real radii[], real acc[]);
+void fmm_finalize();
+int neighbour_list_update(const real vec[], size_t N, real range);
+void neighbour_finalize();
 // size_t ode_n_body_second_order_sapporo(const real *pos, size_t N, real G, const real *masses, const real *radii, real *acc);
-size_t calculate_accelerations(const real pos[], const real vel[], size_t N, real G, const real masses[], const real radii[], real acc[]);
+void gauss_radau15_reset();
+void gauss_radau15_finalize();
+void wisdom_holman_reset();
+void wisdom_holman_finalize();
+void hermite_reset();
+void hermite_finalize();
+ABIELIBRARY_API void wisdom_holman_synchronize(real *vel, size_t N);
+void wisdom_holman_velocities(const real *vel, size_t N, real *vel_sync);
+// Workspace arena for scratch buffers (see common.c)
+void workspace_reserve(size_t nbytes);
+void *workspace_alloc(size_t nbytes);
+size_t workspace_mark();
+void workspace_release(size_t mark);
+void workspace_finalize();
+size_t calculate_gravity(const real pos[], size_t N, real G, const real masses[], const real radii[], int sources, real acc[]);
+size_t calculate_accelerations(const real pos[], const real vel[], size_t N, real G, const real masses[], const real radii[], int sources, real acc[]);
+// accelerations evaluated by the steps of the Radau integrators (see radau_step()), as by calculate_accelerations()
+typedef size_t (*radau_force)(const real pos[], const real vel[], size_t N, real G, const real masses[], const real radii[], int sources, real acc[]);
 
 // Additonal forces
 size_t calculate_additional_forces(const real pos[], const real vel[], size_t N, real G, real C, const real masses[], const real radii[], real acc[]);
@@ -115,7 +170,9 @@ void opencl_init(int N);
 void opencl_finalize();
 #endif
 
-size_t check_collisions_close_encounters(const real *vec, const real radii[], size_t N, real t);
+size_t check_collisions_close_encounters(const real *vec, const real *vel, const real radii[], size_t N, real t);
+void collision_pair_append(const real *vec, const real *vel, int j, int k);
+size_t resolve_collisions(real t);
 real *vec_scalar_op(const real *vec, real scalar, size_t N, char op);
 real *vec_vec_op(const real *vec1, real *vec2, size_t N, char op);
 real vector_max_abs(const real *vec, size_t N);
@@ -129,13 +186,26 @@ ABIELIBRARY_API int initialize_code(double _G, double _C, int _N_MAX, int _MAX_N
 ABIELIBRARY_API int finalize_code();
 
 ABIELIBRARY_API size_t integrator_gauss_radau15(real *pos, real *vel, real *m_vec, real *r_vec, size_t N, real _G, real _t, real _t_end, real _dt);
+size_t gauss_radau15_integrate(real *pos, real *vel, real *m_vec, real *r_vec, size_t N, real _G, real _t, real _t_end, real _dt, int sources);
 ABIELIBRARY_API int integrator_gr(double t, double t_end, double dt);
 ABIELIBRARY_API void integrator_runge_kutta(real *pos, real *vel, real *m_vec, real *r_vec, size_t N, real G, double _t, double _t_end, double _dt);
+void integrate_rk(real *y0, real *dy0, real *masses, real *radii, size_t N, real G, real t, real t_end, real dt, int sources);
 ABIELIBRARY_API int integrator_rk(double t, double t_end, double dt);
 ABIELIBRARY_API void integrator_wisdom_holman(real *pos, real *vel, real *m_vec, real *r_vec, size_t N, real _G, real _t, real _t_end, real _dt);
 ABIELIBRARY_API int integrator_wh(double t, double t_end, double dt);
+ABIELIBRARY_API size_t integrator_hermite(real *pos, real *vel, real *m_vec, real *r_vec, size_t N, real G, double _t, double _t_end, double _dt, double eta);
+size_t hermite_integrate(real *pos, real *vel, real *m_vec, real *r_vec, size_t N, real G, double _t, double _t_end, double _dt, double eta, int sources);
+ABIELIBRARY_API int integrator_hm(double t, double t_end, double dt, double eta);
+ABIELIBRARY_API size_t integrator_hybrid(real *pos, real *vel, real *m_vec, real *r_vec, size_t N, real G, double _t, double _t_end, double _dt, double hill_factor);
+ABIELIBRARY_API int integrator_hy(double t, double t_end, double dt, double hill_factor);
+ABIELIBRARY_API int integrate_snapshots(int integrator, double t, const double t_out[], int n_out, double dt, double param,
+                                        double buf_t[], double buf_pos[], double buf_vel[]);
+ABIELIBRARY_API int get_snapshot_count();
+ABIELIBRARY_API int integrator_ensemble(double pos[], double vel[], const double masses[], const double radii[], int M, int N,
+                                        double G, double t, double t_end, double ce_distance, int status[], double events[]);
 
 ABIELIBRARY_API double calculate_energy();
 ABIELIBRARY_API double calculate_energy_supplied(double* pos_vec, double* vel_vec, double* m_vec, int N, double G);
+ABIELIBRARY_API double calculate_force_error(int n_sample);
 
 #endif
@@ -0,0 +1,246 @@
+#ifndef CONTEXT_H
+#define CONTEXT_H
+
+#include <stdint.h>
+#include "tree_force.h"
+#include "fmm_force.h"
+
+/*
+ * Simulation context: all the state of one simulation.
+ *
+ * Every entry point of the library works on the context that is current on the calling thread (abie_use()), so that
+ * several simulations can be run side by side from different threads, each with its own context. Threads that never
+ * call abie_use() share the default context, which reproduces the behaviour of a library with global state. A context
+ * must not be used by two threads at the same time. The OpenMP worker threads inherit the context of the thread that
+ * starts the parallel region (copyin), so every parallel region of the library lists copyin(abie_ctx).
+ *
+ * The state is accessed through the macros at the end of this file, which map the names of the former global
+ * variables (pos_global, t_global, ...) to the members of the current context.
+ */
+
+// Workspace arena (see common.c)
+typedef struct {
+    char *block;
+    char *block_raw;
+    size_t size;
+    size_t top;
+    size_t high;
+    struct workspace_overflow *overflow;
+} workspace_state;
+
+// State of the Gauss-Radau15 integrator between calls (see integrator_gauss_radau15.c)
+typedef struct {
+    size_t size;    // size of the work buffers
+    int warm;       // 1 if the state below is valid
+    real t;         // time at the end of the last step
+    real h;         // step size for the next step
+    real t_out;     // time of the state returned by the previous call
+    real t_step;    // start time of the last step
+    real h_step;    // size of the last step
+    const real *masses;
+    real *y0, *dy0, *ddy0, *y, *dy, *db6, *ddy;
+    real *bs0, *bs, *g, *E, *ddys;
+    real *y_step, *dy_step, *ddy_step, *bs_step; // start state and coefficients of the last step
+    real *y_out, *dy_out; // state returned by the previous call
+} gauss_radau15_state;
+
+// State of the Wisdom-Holman map between calls (see integrator_wisdom_holman.c)
+typedef struct {
+    size_t n;       // size of the buffers
+    int warm;       // 1 if the state below is valid
+    int pending;    // 1 if the velocities still miss the closing half kick of the last step
+    real t;         // time at the end of the previous call
+    real dt;        // time step of the previous call
+    const real *masses;
+    real *jacobi_pos, *jacobi_vel, *accel, *chi;
+    real *pos_out, *vel_out; // state returned by the previous call
+} wisdom_holman_state;
+
+// State of the Hermite integrator between calls (see integrator_hermite.c)
+typedef struct {
+    size_t n;       // size of the buffers
+    int warm;       // 1 if the state below is valid
+    real t_base;    // time of tick 0 of the block time steps
+    real dt_base;   // step of level 0, the coarsest level
+    real dt_max;    // the largest step specified by the user when the levels were set up
+    int level_min;  // the coarsest level in use
+    uint64_t ticks; // time of the last block step, in ticks
+    real t_out;     // time of the state returned by the previous call
+    const real *masses;
+    real *pos, *vel, *acc, *jerk, *snap, *crackle; // the state of each particle at the end of its last step
+    uint64_t *t_i;  // end of the last step of each particle, in ticks
+    int *level;     // level of the step of each particle
+    real *pos_out, *vel_out; // state returned by the previous call
+} hermite_state;
+
+// Tables, expansions and work space of the fast multipole method (see fmm_force.c)
+typedef struct {
+    octree tree;
+    // tables of the expansion of the current order
+    int table_order; // 0 if the tables are not built
+    int n_coef;
+    int coef_index[FMM_MAX_ORDER + 1][FMM_MAX_ORDER + 1][FMM_MAX_ORDER + 1];
+    int coef_k[FMM_MAX_COEF][3];
+    int coef_prev[FMM_MAX_COEF];
+    int coef_axis[FMM_MAX_COEF];
+    int coef_down1[FMM_MAX_COEF][3];
+    int coef_down2[FMM_MAX_COEF][3];
+    fmm_term *m2l_terms;
+    int n_m2l;
+    fmm_term *shift_terms;
+    int n_shift;
+    fmm_term *grad_terms;
+    int n_grad;
+    // per-cell expansions and work space of the traversal
+    real *multipoles;
+    real *locals;
+    size_t cap_expansions;
+    char *is_target;
+    int *targets;
+    size_t cap_targets;
+    // the particles in tree order
+    real *sorted_buf;
+    size_t cap_sorted;
+    real *sx, *sy, *sz, *sm;
+    real *sax, *say, *saz;
+    real theta;
+} fmm_state;
+
+// Packed sources of the vectorised direct summation (see simd_force.c)
+typedef struct {
+    float *src_f_buf;
+    size_t cap_src_f;
+    double *soa_buf;
+    size_t cap_soa;
+} simd_state;
+
+// Verlet neighbour list of the collision and close encounter detection (see neighbour_grid.c)
+typedef struct {
+    size_t n;       // number of particles of the list, 0 if there is no valid list
+    real cutoff;    // the list holds the pairs closer than cutoff in the positions pos
+    real *pos;      // positions of the particles when the list was built
+    int *start;     // the neighbours k > j of particle j are list[start[j]] ... list[start[j + 1] - 1]
+    int *list;
+    size_t cap_n;
+    size_t cap_list;
+} neighbour_state;
+
+typedef struct abie_context {
+    real *pos;  // the position state vector specified by the users
+    real *vel;  // the velocity state vector specified by the users
+    real *m_vec; // masses specified by the users
+    real *r_vec; // radii specified by the users
+    int *ptype; // particle types specified by the users (0: regular; 1: test particle; 2: low-mass)
+    real *m_src; // masses of the particles as gravitational sources (0 for test particles)
+    int *active; // indices of the active particles, i.e., the particles that act as gravitational sources
+    size_t N_active; // number of active particles
+    int *passive; // indices of the test particles that are not deleted
+    size_t N_passive; // number of test particles
+    int *regular; // indices of the other particles that are not deleted
+    size_t N_regular; // number of the other particles
+    real *ext_acc; // externally calculated acceleration terms for each body
+    size_t N; // number of particles
+    real G; // gravitational constant
+    real C; // speed of light constant (for PN calculations)
+    real t;
+    real ce_distance;  // if 0, ignore close encounters
+    size_t n_ce; // number of close encounters
+    size_t n_col; // number of collision events
+    size_t max_n_ce; // number of close encounters before it stops integrating
+    size_t max_n_col; // number of collisions before it stops integrating
+    size_t enable_ext_acc; // enable the externally calculated accelerations
+    int inited; // 1 once initialize_code() has allocated the state vectors
+    int external_state; // 1 if pos and vel are buffers of the caller, registered by set_state_buffers()
+    int *ids; // index of each particle in the state of the last set_state(), kept when particles are removed
+    int collision_outcome; // COLLISION_STOP, COLLISION_MERGE or COLLISION_BOUNCE
+    real restitution; // coefficient of restitution of the bounces
+    int continuous_collisions; // if 1, Gauss-Radau15 finds the collisions within its steps (see first_contact())
+    // log of the collisions resolved by the library: [time, id1, id2, distance, outcome] per collision, in the ids
+    // of the particles; the particle id1 survives a merger
+    real *col_log;
+    size_t n_col_log;
+    size_t cap_col_log;
+    int *col_pairs; // the pairs of particles to be resolved by resolve_collisions(), as [j, k] per pair
+    size_t n_col_pairs;
+    size_t cap_col_pairs;
+
+    // buffer for storing close encounter events and collision events
+    // format: [time1, id1_event1, id2_event1, distance_event1, time2, id1_event2, id2_event2, distance_event2, ...]
+    real *buf_ce;
+    real *buf_col;
+
+    // options of the force calculation
+    int force_method; // FORCE_METHOD_DIRECT, FORCE_METHOD_TREE or FORCE_METHOD_FMM
+    int simd_level; // SIMD_NONE, SIMD_AVX2 or SIMD_AVX512, detected at runtime; -1 if not detected yet
+    int mixed_precision; // if 1, the forces on the test particles are calculated in single precision
+    real theta; // opening angle of the Barnes-Hut multipole acceptance criterion
+    int order; // expansion order of the fast multipole method
+    int num_threads; // number of OpenMP threads, 0 for the default
+
+    size_t radau_dim; // size of the system passed to the Radau building blocks, usually 3 * N
+    int n_snapshots; // number of snapshots written by the last call of integrate_snapshots()
+
+    workspace_state workspace;
+    gauss_radau15_state gauss_radau15;
+    wisdom_holman_state wisdom_holman;
+    hermite_state hermite;
+    octree bh_tree; // the tree used by the Barnes-Hut force calculation
+    fmm_state fmm;
+    simd_state simd;
+    neighbour_state neighbours;
+} abie_context;
+
+// initial values of the members of a new context (all others are zero)
+#define ABIE_CONTEXT_DEFAULTS {.simd_level = -1, .theta = 0.5, .order = 4, .restitution = 1.0, .continuous_collisions = 1}
+
+#if OPENMP
+extern abie_context *abie_ctx;
+#pragma omp threadprivate(abie_ctx)
+#elif defined(_MSC_VER)
+extern __declspec(thread) abie_context *abie_ctx;
+#else
+extern __thread abie_context *abie_ctx;
+#endif
+
+ABIELIBRARY_API abie_context *abie_create();
+ABIELIBRARY_API void abie_destroy(abie_context *ctx);
+ABIELIBRARY_API abie_context *abie_use(abie_context *ctx);
+
+#define pos_global (abie_ctx->pos)
+#define vel_global (abie_ctx->vel)
+#define m_vec_global (abie_ctx->m_vec)
+#define r_vec_global (abie_ctx->r_vec)
+#define ptype_global (abie_ctx->ptype)
+#define ids_global (abie_ctx->ids)
+#define collision_outcome_global (abie_ctx->collision_outcome)
+#define continuous_collisions_global (abie_ctx->continuous_collisions)
+#define m_src_global (abie_ctx->m_src)
+#define active_global (abie_ctx->active)
+#define N_active_global (abie_ctx->N_active)
+#define passive_global (abie_ctx->passive)
+#define N_passive_global (abie_ctx->N_passive)
+#define regular_global (abie_ctx->regular)
+#define N_regular_global (abie_ctx->N_regular)
+#define ext_acc_global (abie_ctx->ext_acc)
+#define N_global (abie_ctx->N)
+#define G_global (abie_ctx->G)
+#define C_global (abie_ctx->C)
+#define t_global (abie_ctx->t)
+#define close_encounter_distance (abie_ctx->ce_distance)
+#define n_close_encounters (abie_ctx->n_ce)
+#define n_collisions (abie_ctx->n_col)
+#define MAX_N_CE (abie_ctx->max_n_ce)
+#define MAX_N_COLLISIONS (abie_ctx->max_n_col)
+#define ENABLE_EXT_ACC (abie_ctx->enable_ext_acc)
+#define code_inited (abie_ctx->inited)
+#define buf_ce_events (abie_ctx->buf_ce)
+#define buf_collision_events (abie_ctx->buf_col)
+#define force_method_global (abie_ctx->force_method)
+#define simd_level_global (abie_ctx->simd_level)
+#define mixed_precision_global (abie_ctx->mixed_precision)
+#define opening_angle_global (abie_ctx->theta)
+#define expansion_order_global (abie_ctx->order)
+#define ABIE_RADAU_DIM (abie_ctx->radau_dim)
+#define ABIE_N_SNAPSHOTS (abie_ctx->n_snapshots)
+
+#endif
@@ -0,0 +1,469 @@
+#include <string.h>
+#include "common.h"
+#include "fmm_force.h"
+
+/*
+ * Fast multipole method (FMM) force calculation using Cartesian Taylor expansions.
+ *
+ * With the multi-index notation k = (kx, ky, kz), |k| = kx + ky + kz, the potential of the sources y in a cell
+ * with expansion centre c, evaluated at a field point x in a cell with expansion centre c', is
+ *      phi(x) = -G sum_n L_n (x - c')^n
+ * where the local coefficients follow from the multipole moments M_j = sum m (y - c)^j of the source cell as
+ *      L_n = sum_j (-1)^|j| binom(n + j, j) b_{n+j}(c' - c) M_j,    |n| + |j| <= p
+ * and b_k(R) = D^k (1/|R|) / k! are the Taylor coefficients of 1/|R|, obtained with the recurrence
+ *      |k| R^2 b_k = -(2|k| - 1) sum_i R_i b_{k-e_i} - (|k| - 1) sum_i b_{k-2e_i}
+ *
+ * The interactions are found with a dual tree walk. Two cells interact through their expansions (M2L) if
+ *      bmax_A + bmax_B < theta |com_A - com_B|
+ * and by direct summation otherwise, or if the direct summation is cheaper. The walk is carried out in parallel
+ * for a set of disjoint target cells, so that no two threads write to the same local expansion or particle.
+ */
+
+// The expansion order p (the error of a cell-cell interaction scales as theta^(p+1)), the tables and the work space
+// are kept in the simulation context
+#define fmm_tree (abie_ctx->fmm.tree)
+
+// tables of the expansion of the current order
+#define table_order (abie_ctx->fmm.table_order)
+#define n_coef (abie_ctx->fmm.n_coef)
+#define coef_index (abie_ctx->fmm.coef_index)
+#define coef_k (abie_ctx->fmm.coef_k)
+#define coef_prev (abie_ctx->fmm.coef_prev)     // k - e_axis, where axis is the first non-zero component of k
+#define coef_axis (abie_ctx->fmm.coef_axis)
+#define coef_down1 (abie_ctx->fmm.coef_down1)   // k - e_i, -1 if k_i < 1
+#define coef_down2 (abie_ctx->fmm.coef_down2)   // k - 2 e_i, -1 if k_i < 2
+#define m2l_terms (abie_ctx->fmm.m2l_terms)     // multipole to local
+#define n_m2l (abie_ctx->fmm.n_m2l)
+#define shift_terms (abie_ctx->fmm.shift_terms) // shift of a multipole or a local expansion to another centre
+#define n_shift (abie_ctx->fmm.n_shift)
+#define grad_terms (abie_ctx->fmm.grad_terms)   // gradient of a local expansion
+#define n_grad (abie_ctx->fmm.n_grad)
+
+// per-cell expansions and work space of the traversal
+#define fmm_multipoles (abie_ctx->fmm.multipoles)
+#define fmm_locals (abie_ctx->fmm.locals)
+#define fmm_cap_expansions (abie_ctx->fmm.cap_expansions)
+#define fmm_is_target (abie_ctx->fmm.is_target)
+#define fmm_targets (abie_ctx->fmm.targets)
+#define fmm_cap_targets (abie_ctx->fmm.cap_targets)
+
+// the particles in tree order (every cell is a contiguous range), shared by all threads
+#define fmm_sorted_buf (abie_ctx->fmm.sorted_buf)
+#define fmm_cap_sorted (abie_ctx->fmm.cap_sorted)
+#define fmm_sx (abie_ctx->fmm.sx)
+#define fmm_sy (abie_ctx->fmm.sy)
+#define fmm_sz (abie_ctx->fmm.sz)
+#define fmm_sm (abie_ctx->fmm.sm)
+#define fmm_sax (abie_ctx->fmm.sax)
+#define fmm_say (abie_ctx->fmm.say)
+#define fmm_saz (abie_ctx->fmm.saz)
+#define fmm_theta (abie_ctx->fmm.theta)
+
+static real binomial(int n, int k) {
+    real c = 1.0;
+    for (int i = 1; i <= k; i++) c = c * (n - k + i) / i;
+    return c;
+}
+
+static void fmm_init_tables(int p) {
+    n_coef = 0;
+    for (int deg = 0; deg <= p; deg++) {
+        for (int kx = deg; kx >= 0; kx--) {
+            for (int ky = deg - kx; ky >= 0; ky--) {
+                int kz = deg - kx - ky;
+                coef_index[kx][ky][kz] = n_coef;
+                coef_k[n_coef][0] = kx;
+                coef_k[n_coef][1] = ky;
+                coef_k[n_coef][2] = kz;
+                n_coef++;
+            }
+        }
+    }
+    for (int c = 0; c < n_coef; c++) {
+        const int *k = coef_k[c];
+        for (int i = 0; i < 3; i++) {
+            int k1[3] = {k[0], k[1], k[2]};
+            k1[i] -= 1;
+            coef_down1[c][i] = (k1[i] >= 0) ? coef_index[k1[0]][k1[1]][k1[2]] : -1;
+            k1[i] -= 1;
+            coef_down2[c][i] = (k1[i] >= 0) ? coef_index[k1[0]][k1[1]][k1[2]] : -1;
+        }
+        coef_prev[c] = -1;
+        coef_axis[c] = 0;
+        for (int i = 0; i < 3; i++) {
+            if (k[i] > 0) {
+                coef_prev[c] = coef_down1[c][i];
+                coef_axis[c] = i;
+                break;
+            }
+        }
+    }
+
+    free(m2l_terms);
+    free(shift_terms);
+    free(grad_terms);
+    m2l_terms = (fmm_term *) malloc(n_coef * n_coef * sizeof(fmm_term));
+    shift_terms = (fmm_term *) malloc(n_coef * n_coef * sizeof(fmm_term));
+    grad_terms = (fmm_term *) malloc(3 * n_coef * sizeof(fmm_term));
+    n_m2l = 0;
+    n_shift = 0;
+    n_grad = 0;
+    for (int a = 0; a < n_coef; a++) {
+        const int *ka = coef_k[a];
+        int deg_a = ka[0] + ka[1] + ka[2];
+        for (int b = 0; b < n_coef; b++) {
+            const int *kb = coef_k[b];
+            int deg_b = kb[0] + kb[1] + kb[2];
+            // M2L: L_a += (-1)^|b| binom(a + b, b) b_{a+b} M_b
+            if (deg_a + deg_b <= p) {
+                fmm_term *t = &m2l_terms[n_m2l++];
+                t->out = a;
+                t->in = b;
+                t->k = coef_index[ka[0] + kb[0]][ka[1] + kb[1]][ka[2] + kb[2]];
+                t->c = ((deg_b % 2) ? -1.0 : 1.0) * binomial(ka[0] + kb[0], kb[0]) * binomial(ka[1] + kb[1], kb[1]) * binomial(ka[2] + kb[2], kb[2]);
+            }
+            // shift: X_a += binom(a, b) d^(a-b) Y_b for b <= a
+            if (kb[0] <= ka[0] && kb[1] <= ka[1] && kb[2] <= ka[2]) {
+                fmm_term *t = &shift_terms[n_shift++];
+                t->out = a;
+                t->in = b;
+                t->k = coef_index[ka[0] - kb[0]][ka[1] - kb[1]][ka[2] - kb[2]];
+                t->c = binomial(ka[0], kb[0]) * binomial(ka[1], kb[1]) * binomial(ka[2], kb[2]);
+            }
+        }
+        // gradient: d/dx_i (x^a) = a_i x^(a - e_i)
+        for (int i = 0; i < 3; i++) {
+            if (ka[i] == 0) continue;
+            fmm_term *t = &grad_terms[n_grad++];
+            t->out = a;
+            t->in = coef_down1[a][i];
+            t->k = i;
+            t->c = ka[i];
+        }
+    }
+    table_order = p;
+}
+
+// d^k for all |k| <= p
+static void monomials(const real d[3], real pw[]) {
+    pw[0] = 1.0;
+    for (int c = 1; c < n_coef; c++) pw[c] = pw[coef_prev[c]] * d[coef_axis[c]];
+}
+
+// Taylor coefficients b_k(R) of 1/|R| for all |k| <= p
+static void taylor_coefficients(const real R[3], real b[]) {
+    real r2 = R[0] * R[0] + R[1] * R[1] + R[2] * R[2];
+    b[0] = 1.0 / sqrt(r2);
+    for (int c = 1; c < n_coef; c++) {
+        int deg = coef_k[c][0] + coef_k[c][1] + coef_k[c][2];
+        real s1 = 0.0, s2 = 0.0;
+        for (int i = 0; i < 3; i++) {
+            if (coef_down1[c][i] >= 0) s1 += R[i] * b[coef_down1[c][i]];
+            if (coef_down2[c][i] >= 0) s2 += b[coef_down2[c][i]];
+        }
+        b[c] = -((2 * deg - 1) * s1 + (deg - 1) * s2) / (deg * r2);
+    }
+}
+
+static void fmm_p2m(int n) {
+    const tree_node *node = &fmm_tree.nodes[n];
+    real *M = &fmm_multipoles[n * n_coef];
+    real pw[FMM_MAX_COEF];
+    for (int c = 0; c < n_coef; c++) M[c] = 0.0;
+    for (int p = node->first; p < node->first + node->count; p++) {
+        if (fmm_sm[p] <= 0.0) continue;
+        real d[3] = {fmm_sx[p] - node->com[0], fmm_sy[p] - node->com[1], fmm_sz[p] - node->com[2]};
+        monomials(d, pw);
+        for (int c = 0; c < n_coef; c++) M[c] += fmm_sm[p] * pw[c];
+    }
+}
+
+static void fmm_m2m(int n) {
+    const tree_node *node = &fmm_tree.nodes[n];
+    real *M = &fmm_multipoles[n * n_coef];
+    real pw[FMM_MAX_COEF];
+    for (int c = 0; c < n_coef; c++) M[c] = 0.0;
+    for (int k = 0; k < 8; k++) {
+        if (node->child[k] < 0) continue;
+        const tree_node *child = &fmm_tree.nodes[node->child[k]];
+        if (child->mass <= 0.0) continue;
+        const real *Mc = &fmm_multipoles[node->child[k] * n_coef];
+        real d[3] = {child->com[0] - node->com[0], child->com[1] - node->com[1], child->com[2] - node->com[2]};
+        monomials(d, pw);
+        for (int t = 0; t < n_shift; t++) {
+            M[shift_terms[t].out] += shift_terms[t].c * pw[shift_terms[t].k] * Mc[shift_terms[t].in];
+        }
+    }
+}
+
+static void fmm_m2l(int a, int b) {
+    const tree_node *A = &fmm_tree.nodes[a];
+    const tree_node *B = &fmm_tree.nodes[b];
+    real *L = &fmm_locals[a * n_coef];
+    const real *M = &fmm_multipoles[b * n_coef];
+    real coef[FMM_MAX_COEF];
+    real R[3] = {A->com[0] - B->com[0], A->com[1] - B->com[1], A->com[2] - B->com[2]};
+    taylor_coefficients(R, coef);
+    for (int t = 0; t < n_m2l; t++) {
+        L[m2l_terms[t].out] += m2l_terms[t].c * coef[m2l_terms[t].k] * M[m2l_terms[t].in];
+    }
+}
+
+static void fmm_l2l(int n, int c) {
+    const tree_node *node = &fmm_tree.nodes[n];
+    const tree_node *child = &fmm_tree.nodes[c];
+    const real *L = &fmm_locals[n * n_coef];
+    real *Lc = &fmm_locals[c * n_coef];
+    real pw[FMM_MAX_COEF];
+    real d[3] = {child->com[0] - node->com[0], child->com[1] - node->com[1], child->com[2] - node->com[2]};
+    monomials(d, pw);
+    for (int t = 0; t < n_shift; t++) {
+        Lc[shift_terms[t].in] += shift_terms[t].c * pw[shift_terms[t].k] * L[shift_terms[t].out];
+    }
+}
+
+static void fmm_l2p(int n) {
+    const tree_node *node = &fmm_tree.nodes[n];
+    const real *L = &fmm_locals[n * n_coef];
+    real pw[FMM_MAX_COEF];
+    for (int p = node->first; p < node->first + node->count; p++) {
+        real d[3] = {fmm_sx[p] - node->com[0], fmm_sy[p] - node->com[1], fmm_sz[p] - node->com[2]};
+        real a[3] = {0.0, 0.0, 0.0};
+        monomials(d, pw);
+        for (int t = 0; t < n_grad; t++) {
+            a[grad_terms[t].k] += grad_terms[t].c * L[grad_terms[t].out] * pw[grad_terms[t].in];
+        }
+        fmm_sax[p] += a[0];
+        fmm_say[p] += a[1];
+        fmm_saz[p] += a[2];
+    }
+}
+
+// direct summation of the forces of the particles in cell b on the particles in cell a
+static void fmm_p2p(int a, int b) {
+    const tree_node *A = &fmm_tree.nodes[a];
+    const tree_node *B = &fmm_tree.nodes[b];
+    int q0 = B->first, q1 = B->first + B->count;
+    for (int p = A->first; p < A->first + A->count; p++) {
+        real x = fmm_sx[p], y = fmm_sy[p], z = fmm_sz[p];
+        real ax = 0.0, ay = 0.0, az = 0.0;
+        // the particle itself is recognised by its zero separation
+        for (int q = q0; q < q1; q++) {
+            real dx = x - fmm_sx[q];
+            real dy = y - fmm_sy[q];
+            real dz = z - fmm_sz[q];
+            real rel_sep2 = dx * dx + dy * dy + dz * dz;
+            real rel_sep3 = (rel_sep2 > 0.0) ? fmm_sm[q] / (sqrt(rel_sep2) * rel_sep2) : 0.0;
+            ax -= dx * rel_sep3;
+            ay -= dy * rel_sep3;
+            az -= dz * rel_sep3;
+        }
+        fmm_sax[p] += ax;
+        fmm_say[p] += ay;
+        fmm_saz[p] += az;
+    }
+}
+
+static void fmm_upward(int n) {
+    const tree_node *node = &fmm_tree.nodes[n];
+    if (node->is_leaf) {
+        fmm_p2m(n);
+        return;
+    }
+    for (int k = 0; k < 8; k++) {
+        if (node->child[k] >= 0) fmm_upward(node->child[k]);
+    }
+    fmm_m2m(n);
+}
+
+// the cells above the target cells, whose subtrees have been processed already
+static void fmm_upward_top(int n) {
+    if (fmm_is_target[n]) return;
+    const tree_node *node = &fmm_tree.nodes[n];
+    for (int k = 0; k < 8; k++) {
+        if (node->child[k] >= 0) fmm_upward_top(node->child[k]);
+    }
+    fmm_m2m(n);
+}
+
+static void fmm_interact(int a, int b) {
+    const tree_node *A = &fmm_tree.nodes[a];
+    const tree_node *B = &fmm_tree.nodes[b];
+    if (B->mass <= 0.0) return;
+
+    if (a == b) {
+        if (A->is_leaf) {
+            fmm_p2p(a, a);
+            return;
+        }
+        for (int i = 0; i < 8; i++) {
+            if (A->child[i] < 0) continue;
+            for (int j = 0; j < 8; j++) {
+                if (A->child[j] >= 0) fmm_interact(A->child[i], A->child[j]);
+            }
+        }
+        return;
+    }
+
+    // direct summation is exact, so prefer it whenever it is cheaper than the expansion
+    int cheap = ((size_t) A->count * (size_t) B->count <= (size_t) n_m2l);
+    real dx = A->com[0] - B->com[0];
+    real dy = A->com[1] - B->com[1];
+    real dz = A->com[2] - B->com[2];
+    real r_sum = A->bmax + B->bmax;
+    if (!cheap && r_sum * r_sum < fmm_theta * fmm_theta * (dx * dx + dy * dy + dz * dz)) {
+        fmm_m2l(a, b);
+        return;
+    }
+    if (cheap || (A->is_leaf && B->is_leaf)) {
+        fmm_p2p(a, b);
+        return;
+    }
+    if (B->is_leaf || (!A->is_leaf && A->bmax > B->bmax)) {
+        for (int i = 0; i < 8; i++) {
+            if (A->child[i] >= 0) fmm_interact(A->child[i], b);
+        }
+    } else {
+        for (int j = 0; j < 8; j++) {
+            if (B->child[j] >= 0) fmm_interact(a, B->child[j]);
+        }
+    }
+}
+
+static void fmm_downward(int n) {
+    const tree_node *node = &fmm_tree.nodes[n];
+    if (node->is_leaf) {
+        fmm_l2p(n);
+        return;
+    }
+    for (int k = 0; k < 8; k++) {
+        if (node->child[k] < 0) continue;
+        fmm_l2l(n, node->child[k]);
+        fmm_downward(node->child[k]);
+    }
+}
+
+// split the tree into disjoint target cells that are processed in parallel
+static int collect_targets(int n, int cut, int n_targets) {
+    const tree_node *node = &fmm_tree.nodes[n];
+    if (node->is_leaf || node->count <= cut) {
+        fmm_is_target[n] = 1;
+        fmm_targets[n_targets++] = n;
+        return n_targets;
+    }
+    for (int k = 0; k < 8; k++) {
+        if (node->child[k] >= 0) n_targets = collect_targets(node->child[k], cut, n_targets);
+    }
+    return n_targets;
+}
+
+size_t ode_n_body_second_order_fmm(const real vec[], size_t N, real G, const real masses[], const real radii[], real acc[]) {
+    for (size_t j = 0; j < 3 * N; j++) acc[j] = 0.0;
+    if (table_order != expansion_order_global) fmm_init_tables(expansion_order_global);
+
+    fmm_tree.leaf_size = FMM_LEAF_SIZE;
+    size_t n_nodes = (size_t) octree_build(&fmm_tree, vec, masses, N);
+    if (n_nodes == 0) return EXIT_NORMAL;
+
+    if (fmm_cap_expansions < n_nodes * n_coef) {
+        fmm_multipoles = (real *) realloc(fmm_multipoles, n_nodes * n_coef * sizeof(real));
+        fmm_locals = (real *) realloc(fmm_locals, n_nodes * n_coef * sizeof(real));
+        fmm_cap_expansions = n_nodes * n_coef;
+    }
+    if (fmm_cap_targets < n_nodes) {
+        fmm_is_target = (char *) realloc(fmm_is_target, n_nodes * sizeof(char));
+        fmm_targets = (int *) realloc(fmm_targets, n_nodes * sizeof(int));
+        fmm_cap_targets = n_nodes;
+    }
+    memset(fmm_locals, 0, n_nodes * n_coef * sizeof(real));
+    memset(fmm_is_target, 0, n_nodes * sizeof(char));
+
+    // gather the particles in tree order
+    size_t n = (size_t) fmm_tree.nodes[0].count;
+    if (fmm_cap_sorted < n) {
+        fmm_sorted_buf = (real *) realloc(fmm_sorted_buf, 7 * n * sizeof(real));
+        fmm_cap_sorted = n;
+    }
+    fmm_sx = fmm_sorted_buf;
+    fmm_sy = fmm_sx + n;
+    fmm_sz = fmm_sy + n;
+    fmm_sm = fmm_sz + n;
+    fmm_sax = fmm_sm + n;
+    fmm_say = fmm_sax + n;
+    fmm_saz = fmm_say + n;
+    for (size_t p = 0; p < n; p++) {
+        int i = fmm_tree.index[p];
+        fmm_sx[p] = vec[3 * i];
+        fmm_sy[p] = vec[3 * i + 1];
+        fmm_sz[p] = vec[3 * i + 2];
+        fmm_sm[p] = (masses[i] > 0.0) ? masses[i] : 0.0;
+        fmm_sax[p] = 0.0;
+        fmm_say[p] = 0.0;
+        fmm_saz[p] = 0.0;
+    }
+    // the expansions do not converge for theta >= 1
+    fmm_theta = (opening_angle_global < 0.9) ? opening_angle_global : 0.9;
+
+    int cut = (int) (N / 256);
+    if (cut < FMM_LEAF_SIZE) cut = FMM_LEAF_SIZE;
+    int n_targets = collect_targets(0, cut, 0);
+
+    // upward pass: multipole moments
+#if OPENMP
+#pragma omp parallel for schedule(dynamic, 1) copyin(abie_ctx)
+#endif
+    for (int t = 0; t < n_targets; t++) fmm_upward(fmm_targets[t]);
+    fmm_upward_top(0);
+
+    // interactions and downward pass: local expansions and the accelerations of the particles
+#if OPENMP
+#pragma omp parallel for schedule(dynamic, 1) copyin(abie_ctx)
+#endif
+    for (int t = 0; t < n_targets; t++) {
+        fmm_interact(fmm_targets[t], 0);
+        fmm_downward(fmm_targets[t]);
+    }
+
+    for (size_t p = 0; p < n; p++) {
+        int i = fmm_tree.index[p];
+        acc[3 * i] = G * fmm_sax[p];
+        acc[3 * i + 1] = G * fmm_say[p];
+        acc[3 * i + 2] = G * fmm_saz[p];
+    }
+    return EXIT_NORMAL;
+}
+
+int set_expansion_order(int p) {
+    if (p < 1) p = 1;
+    if (p > FMM_MAX_ORDER) p = FMM_MAX_ORDER;
+    expansion_order_global = p;
+    return expansion_order_global;
+}
+
+int get_expansion_order() {
+    return expansion_order_global;
+}
+
+void fmm_finalize() {
+    octree_free(&fmm_tree);
+    free(fmm_multipoles);
+    free(fmm_locals);
+    free(fmm_is_target);
+    free(fmm_targets);
+    free(m2l_terms);
+    free(shift_terms);
+    free(grad_terms);
+    free(fmm_sorted_buf);
+    fmm_multipoles = NULL;
+    fmm_locals = NULL;
+    fmm_is_target = NULL;
+    fmm_targets = NULL;
+    m2l_terms = NULL;
+    shift_terms = NULL;
+    grad_terms = NULL;
+    fmm_sorted_buf = NULL;
+    fmm_cap_sorted = 0;
+    fmm_cap_expansions = 0;
+    fmm_cap_targets = 0;
+    table_order = 0;
+}
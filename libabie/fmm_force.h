@@ -0,0 +1,23 @@
+#ifndef FMM_FORCE_H
+#define FMM_FORCE_H
+
+#include "common.h"
+#include "tree_force.h"
+
+// Highest supported order of the multipole and local expansions
+#define FMM_MAX_ORDER 12
+// Number of Cartesian expansion coefficients (kx + ky + kz <= FMM_MAX_ORDER)
+#define FMM_MAX_COEF ((FMM_MAX_ORDER + 1) * (FMM_MAX_ORDER + 2) * (FMM_MAX_ORDER + 3) / 6)
+// Maximum number of particles stored in a leaf cell of the FMM tree
+#define FMM_LEAF_SIZE 32
+
+typedef struct fmm_term {
+    int out;    // index of the coefficient that is updated
+    int in;     // index of the coefficient that is read
+    int k;      // index of the geometric factor (or the axis for the gradient terms)
+    real c;     // numerical factor
+} fmm_term;
+
+void fmm_finalize();
+
+#endif
@@ -0,0 +1,217 @@
+#include "common.h"
+#include "integrator_ensemble.h"
+#if OPENMP
+#include <omp.h>
+#endif
+
+/*
+ * Ensemble of independent small systems (e.g., the members of a parameter sweep), integrated in one call.
+ *
+ * The M systems have the same number of bodies N and are stored one after the other in the state vectors
+ * ([system 0: x0, y0, z0, x1, ...], [system 1: ...], ...). Each system is integrated to t_end with its own adaptive
+ * Gauss-Radau15 steps, built from the same Radau blocks as the Gauss-Radau15 integrator, and with a plain pairwise
+ * force summation. The systems are distributed over the OpenMP threads; nothing is shared between them, so the
+ * global state of the library (set_state(), the force method, the event buffers) is neither used nor changed.
+ *
+ * A system stops at the end of the first step in which a pair of its bodies collides (separation below the sum of the
+ * radii) or has a close encounter (separation below close_encounter_distance, if positive). The other systems carry on.
+ * A system whose state or step size is no longer finite stops at its last good step with the status ENSEMBLE_ERROR.
+ */
+
+// the accelerations of a system, with the signature of a radau_force (all bodies with a mass are sources)
+static size_t ensemble_gravity(const real pos[], const real vel[], size_t n, real G, const real m[], const real radii[],
+                               int sources, real acc[]) {
+    for (size_t i = 0; i < 3 * n; i++) acc[i] = 0.0;
+    for (size_t i = 0; i < n; i++) {
+        for (size_t k = i + 1; k < n; k++) {
+            real dx = pos[3 * k] - pos[3 * i];
+            real dy = pos[3 * k + 1] - pos[3 * i + 1];
+            real dz = pos[3 * k + 2] - pos[3 * i + 2];
+            real r2 = dx * dx + dy * dy + dz * dz;
+            real r3_inv = G / (r2 * sqrt(r2));
+            acc[3 * i] += m[k] * r3_inv * dx;
+            acc[3 * i + 1] += m[k] * r3_inv * dy;
+            acc[3 * i + 2] += m[k] * r3_inv * dz;
+            acc[3 * k] -= m[i] * r3_inv * dx;
+            acc[3 * k + 1] -= m[i] * r3_inv * dy;
+            acc[3 * k + 2] -= m[i] * r3_inv * dz;
+        }
+    }
+    return EXIT_NORMAL;
+}
+
+// the first collision, or else the first close encounter, of the system; the event is written as [t, id1, id2, distance]
+static int ensemble_check(const real pos[], const real radii[], size_t n, real ce2, real t, double event[]) {
+    int status = ENSEMBLE_NORMAL;
+    for (size_t i = 0; i < n; i++) {
+        for (size_t k = i + 1; k < n; k++) {
+            real dx = pos[3 * k] - pos[3 * i];
+            real dy = pos[3 * k + 1] - pos[3 * i + 1];
+            real dz = pos[3 * k + 2] - pos[3 * i + 2];
+            real r2 = dx * dx + dy * dy + dz * dz;
+            real r = radii[i] + radii[k];
+            int found = ENSEMBLE_NORMAL;
+            if (r > 0 && r2 <= r * r) found = ENSEMBLE_COLLISION;
+            else if (status == ENSEMBLE_NORMAL && r2 <= ce2) found = ENSEMBLE_CLOSE_ENCOUNTER;
+            if (found == ENSEMBLE_NORMAL) continue;
+            status = found;
+            event[0] = (double) t;
+            event[1] = (double) i;
+            event[2] = (double) k;
+            event[3] = (double) sqrt(r2);
+            if (status == ENSEMBLE_COLLISION) return status;
+        }
+    }
+    return status;
+}
+
+static int ensemble_finite(const real v[], size_t n) {
+    for (size_t i = 0; i < n; i++) {
+        if (!isfinite(v[i])) return 0;
+    }
+    return 1;
+}
+
+// integrate one system from t to t_end in its scratch space; returns its status
+static int ensemble_system(real *y0, real *dy0, const real m[], const real radii[], size_t n, real G, real t,
+                           real t_end, real ce2, real *work, double event[]) {
+    real *ddy0 = work;
+    real *y = work + ABIE_RADAU_DIM;
+    real *dy = work + 2 * ABIE_RADAU_DIM;
+    real *ddy = work + 3 * ABIE_RADAU_DIM;
+    real *db6 = work + 4 * ABIE_RADAU_DIM;
+    real (*bs0)[ABIE_RADAU_DIM] = (real(*)[ABIE_RADAU_DIM]) (work + 5 * ABIE_RADAU_DIM);
+    real (*bs)[ABIE_RADAU_DIM] = (real(*)[ABIE_RADAU_DIM]) (work + 12 * ABIE_RADAU_DIM);
+    real (*g)[ABIE_RADAU_DIM] = (real(*)[ABIE_RADAU_DIM]) (work + 19 * ABIE_RADAU_DIM);
+    real (*E)[ABIE_RADAU_DIM] = (real(*)[ABIE_RADAU_DIM]) (work + 26 * ABIE_RADAU_DIM);
+    real (*ddys)[ABIE_RADAU_DIM] = (real(*)[ABIE_RADAU_DIM]) (work + 33 * ABIE_RADAU_DIM);
+
+    for (int j = 0; j < nh - 1; j++) {
+        for (int i = 0; i < ABIE_RADAU_DIM; i++) {
+            bs0[j][i] = 0.0;
+            bs[j][i] = 0.0;
+            g[j][i] = 0.0;
+            E[j][i] = 0.0;
+        }
+    }
+    ensemble_gravity(y0, dy0, n, G, m, radii, SOURCES_ALL, ddy0);
+
+    // initial step: a small fraction of the shortest dynamical time of the pairs
+    real h = t_end - t;
+    for (size_t i = 0; i < n; i++) {
+        for (size_t k = i + 1; k < n; k++) {
+            real dx[3];
+            for (int d = 0; d < 3; d++) dx[d] = y0[3 * k + d] - y0[3 * i + d];
+            real r = vector_norm(dx, 3);
+            if (m[i] + m[k] <= 0.0) continue;
+            real t_dyn = 0.1 * sqrt(r * r * r / (G * (m[i] + m[k])));
+            if (t_dyn < h) h = t_dyn;
+        }
+    }
+
+    int status = ENSEMBLE_NORMAL;
+    int step_loop_count = 0;
+    int step_loop_max = 100;
+    int done = 0;
+    while (!done) {
+        if (h < h_min) h = h_min;
+        int last = (h >= t_end - t);
+        if (last) h = t_end - t;
+
+        real dtreq;
+        real err = radau_step(ensemble_gravity, n, G, m, radii, SOURCES_ALL, y0, dy0, ddy0, h, bs0, bs, g, ddys, db6, y,
+                              dy, ddy, &dtreq);
+        if (!ensemble_finite(ddy, ABIE_RADAU_DIM)) {
+            // the state of the step is not finite (e.g., two bodies at the same position); keep the last step
+            status = ENSEMBLE_ERROR;
+            break;
+        }
+
+        if (err <= 1 || step_loop_count > step_loop_max) {
+            t = last ? t_end : t + h;
+            done = last;
+            step_loop_count = 0;
+            for (int i = 0; i < ABIE_RADAU_DIM; i++) {
+                y0[i] = y[i];
+                dy0[i] = dy[i];
+                ddy0[i] = ddy[i];
+            }
+            for (int j = 0; j < nh - 1; j++) {
+                for (int i = 0; i < ABIE_RADAU_DIM; i++) bs0[j][i] = bs[j][i];
+            }
+            refine_bs(bs, dtreq / h, E, n);
+
+            status = ensemble_check(y0, radii, n, ce2, t, event);
+            if (status != ENSEMBLE_NORMAL) break;
+        } else {
+            step_loop_count += 1;
+        }
+        h = radau_next_step(h, dtreq);
+        if (!isfinite(h)) {
+            status = ENSEMBLE_ERROR;
+            break;
+        }
+    }
+    if (status == ENSEMBLE_NORMAL || status == ENSEMBLE_ERROR) {
+        event[0] = (double) t;
+        event[1] = -1.0;
+        event[2] = -1.0;
+        event[3] = 0.0;
+    }
+    return status;
+}
+
+int integrator_ensemble(double pos[], double vel[], const double masses[], const double radii[], int M, int N,
+                        double G, double t, double t_end, double ce_distance, int status[], double events[]) {
+    if (M <= 0 || N <= 0 || t_end <= t) return 0;
+
+    // the Radau blocks take the size of the system from dim, which is restored on return
+    size_t dim_saved = ABIE_RADAU_DIM;
+    ABIE_RADAU_DIM = 3 * (size_t) N;
+    real ce2 = (real) (ce_distance * ce_distance);
+
+    int n_threads = 1;
+#if OPENMP
+    n_threads = omp_get_max_threads();
+#endif
+    // scratch space per thread: the Radau buffers, followed by the state, masses and radii of the current system
+    size_t n_work = ENSEMBLE_REALS_PER_DIM * ABIE_RADAU_DIM + 2 * ABIE_RADAU_DIM + 2 * (size_t) N;
+    size_t ws = workspace_mark();
+    real *work_thr = (real *) workspace_alloc(n_threads * n_work * sizeof(real));
+
+    int n_events = 0;
+#if OPENMP
+#pragma omp parallel for schedule(dynamic, 1) reduction(+:n_events) copyin(abie_ctx)
+#endif
+    for (int s = 0; s < M; s++) {
+        int thread = 0;
+#if OPENMP
+        thread = omp_get_thread_num();
+#endif
+        real *work = &work_thr[n_work * thread];
+        real *y0 = work + ENSEMBLE_REALS_PER_DIM * ABIE_RADAU_DIM;
+        real *dy0 = y0 + ABIE_RADAU_DIM;
+        real *m = dy0 + ABIE_RADAU_DIM;
+        real *r = m + N;
+        for (size_t i = 0; i < ABIE_RADAU_DIM; i++) {
+            y0[i] = (real) pos[ABIE_RADAU_DIM * s + i];
+            dy0[i] = (real) vel[ABIE_RADAU_DIM * s + i];
+        }
+        for (int i = 0; i < N; i++) {
+            m[i] = (real) masses[(size_t) N * s + i];
+            r[i] = (real) radii[(size_t) N * s + i];
+        }
+
+        status[s] = ensemble_system(y0, dy0, m, r, N, G, t, t_end, ce2, work, &events[4 * s]);
+        if (status[s] != ENSEMBLE_NORMAL) n_events++;
+
+        for (size_t i = 0; i < ABIE_RADAU_DIM; i++) {
+            pos[ABIE_RADAU_DIM * s + i] = (double) y0[i];
+            vel[ABIE_RADAU_DIM * s + i] = (double) dy0[i];
+        }
+    }
+
+    workspace_release(ws);
+    ABIE_RADAU_DIM = dim_saved;
+    return n_events;
+}
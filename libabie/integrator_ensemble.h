@@ -0,0 +1,23 @@
+#ifndef INTEGRATOR_ENSEMBLE
+#define INTEGRATOR_ENSEMBLE
+
+// Radau building blocks, defined in integrator_gauss_radau15.c
+extern int nh;
+extern real h_min;
+void refine_bs(real b[][ABIE_RADAU_DIM], real q, real E[][ABIE_RADAU_DIM], size_t N);
+real radau_step(radau_force force, size_t N, real G, const real masses[], const real radii[], int sources,
+                const real y0[], const real dy0[], const real ddy0[], real h, real bs0[][ABIE_RADAU_DIM],
+                real bs[][ABIE_RADAU_DIM], real g[][ABIE_RADAU_DIM], real ddys[][ABIE_RADAU_DIM], real db6[], real y[],
+                real dy[], real ddy[], real *dtreq);
+real radau_next_step(real h, real dtreq);
+
+// Number of reals of Radau scratch space per coordinate of a system (ddy0, y, dy, ddy, db6, bs0, bs, g, E, ddys)
+#define ENSEMBLE_REALS_PER_DIM (5 + 4 * 7 + 8)
+
+// Status of a system at the end of integrator_ensemble()
+#define ENSEMBLE_NORMAL 0
+#define ENSEMBLE_CLOSE_ENCOUNTER 1
+#define ENSEMBLE_COLLISION 2
+#define ENSEMBLE_ERROR 3 // the state or the step size of the system is not finite
+
+#endif
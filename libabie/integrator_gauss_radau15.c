@@ -3,23 +3,23 @@
 
 // Global variables
 int nh = 8;
-size_t dim = 0;
 int initialized = 0;
 
-real initial_time_step(const real* y0, real* dy0, real G, real * masses, real *radii, size_t nbodies){
+real initial_time_step(const real* y0, real* dy0, real G, real * masses, real *radii, size_t nbodies, int sources){
 
     int p = 15;
     real d0, d1, d2, dt, dt0, dt1;
-    real *f0 = (real *) malloc(3 * nbodies * sizeof(real));
-    real *F1 = (real *) malloc(3 * nbodies * sizeof(real));
-    real *y1 = (real *) malloc(3 * nbodies * sizeof(real));
-    real *dy1 = (real *) malloc(3 * nbodies * sizeof(real));
+    size_t ws = workspace_mark();
+    real *f0 = (real *) workspace_alloc(3 * nbodies * sizeof(real));
+    real *F1 = (real *) workspace_alloc(3 * nbodies * sizeof(real));
+    real *y1 = (real *) workspace_alloc(3 * nbodies * sizeof(real));
+    real *dy1 = (real *) workspace_alloc(3 * nbodies * sizeof(real));
     //###########   ESTIMATE INITIAL STEP SIZE
     //# Compute scaling
     //# sc =  abs(y0)*epsb
     //# Evaluate function
 
-    calculate_accelerations(y0, dy0, nbodies, G, masses, radii, f0);
+    calculate_accelerations(y0, dy0, nbodies, G, masses, radii, sources, f0);
     d0 = vector_max_abs(y0, nbodies);
     d1 = vector_max_abs(f0, nbodies);
 
@@ -35,7 +35,7 @@ real initial_time_step(const real* y0, real* dy0, real G, real * masses, real *r
         dy1[i] = dy0[i] + dt0 * f0[i];
     }
     // # Call function
-    calculate_accelerations(y1, dy1, nbodies, G, masses, radii, F1);
+    calculate_accelerations(y1, dy1, nbodies, G, masses, radii, sources, F1);
     d2 = -DBL_MAX;
     for (int i = 0; i < nbodies * 3; i++) {
         if (d2 < fabs(F1[i] - f0[i])) d2 = fabs(F1[i] - f0[i]);
@@ -49,25 +49,25 @@ real initial_time_step(const real* y0, real* dy0, real G, real * masses, real *r
     }
 
     dt = fmin(100 * dt0, dt1);
-    free(f0); free(F1); free(y1); free(dy1);
+    workspace_release(ws);
     return dt;
 }
 
-void approx_pos(const real y1[], const real dy1[], const real F1[], real h, real b[][dim], size_t N, real T, real y[]){
+void approx_pos(const real y1[], const real dy1[], const real F1[], real h, real b[][ABIE_RADAU_DIM], size_t N, real T, real y[]){
     for (int i = 0; i < 3 * N; i++) {
         y[i] = y1[i] + T * h * (dy1[i] + T * h * (F1[i] + h * (b[0][i] / 0.3e1 + h * (b[1][i] / 0.6e1 + h * (b[2][i] / 0.10e2 + h * (b[3][i] / 0.15e2 + h * (b[4][i] / 0.21e2 + h * (b[5][i] / 0.28e2 + h * b[6][i] / 0.36e2))))))) / 0.2e1);
     }
     return;
 }
 
-void approx_vel(const real dy1[], const real F1[], real h, real b[][dim], size_t N, real T, real dy[]){
+void approx_vel(const real dy1[], const real F1[], real h, real b[][ABIE_RADAU_DIM], size_t N, real T, real dy[]){
     for (int i = 0; i < 3 * N; i++) {
         dy[i] = dy1[i] + T * h * (F1[i] + h * (b[0][i] / 0.2e1 + h * (b[1][i] / 0.3e1 + h * (b[2][i] / 0.4e1 + h * (b[3][i] / 0.5e1 + h * (b[4][i] / 0.6e1 + h * (b[5][i] / 0.7e1 + h * b[6][i] / 0.8e1)))))));
     }
     return;
 }
 
-void compute_gs(real ddys[][dim], int ih, size_t N, real g[][dim]) {
+void compute_gs(real ddys[][ABIE_RADAU_DIM], int ih, size_t N, real g[][ABIE_RADAU_DIM]) {
 
     const real* F1 = ddys[0];
     const real* F2 = ddys[1];
@@ -126,7 +126,7 @@ void compute_gs(real ddys[][dim], int ih, size_t N, real g[][dim]) {
     return;
 }
 
-void compute_bs_from_gs(real g[][dim], int ih, size_t N, real b[][dim]){
+void compute_bs_from_gs(real g[][ABIE_RADAU_DIM], int ih, size_t N, real b[][ABIE_RADAU_DIM]){
     if (ih == 1) {
         for (int i = 0; i < 3 * N; i++) {
             b[0][i] = cs[0][0]*g[0][i] + cs[1][0]*g[1][i] + cs[2][0]*g[2][i] + cs[3][0]*g[3][i] + cs[4][0]*g[4][i] + cs[5][0]*g[5][i] + cs[6][0]*g[6][i];
@@ -199,7 +199,7 @@ void compute_bs_from_gs(real g[][dim], int ih, size_t N, real b[][dim]){
 }
 
 
-void refine_bs(real b[][dim], real q, real E[][dim], size_t N){
+void refine_bs(real b[][ABIE_RADAU_DIM], real q, real E[][ABIE_RADAU_DIM], size_t N){
 #if 0    
     real bd[nh - 1][3 * N];
     static int inited = 0;
@@ -247,25 +247,355 @@ void refine_bs(real b[][dim], real q, real E[][dim], size_t N){
     return;
 }
 
+/*
+ * One step of size h from the state y0, dy0 with the accelerations ddy0, shared by the Gauss-Radau15, hybrid and
+ * ensemble integrators. The predictor-corrector iterations along the Radau sequence converge the coefficients bs,
+ * which hold the prediction for the step on entry (bs0 holds the coefficients they are compared with in the first
+ * iteration). The state at the end of the step is returned in y, dy and ddy, and the step size that meets the error
+ * tolerance in dtreq. Returns the relative error estimate of the step; without accelerations (e.g., a single particle
+ * or massless bodies) the polynomial is exact, the error is zero and the step grows at the maximum rate.
+ */
+real radau_step(radau_force force, size_t N, real G, const real masses[], const real radii[], int sources,
+                const real y0[], const real dy0[], const real ddy0[], real h, real bs0[][ABIE_RADAU_DIM],
+                real bs[][ABIE_RADAU_DIM], real g[][ABIE_RADAU_DIM], real ddys[][ABIE_RADAU_DIM], real db6[], real y[],
+                real dy[], real ddy[], real *dtreq) {
+    // # Variable number of iterations in PC
+    for (int ipc = 0; ipc < 12; ipc++) {
+        for (int j = 0; j < nh; j++) {
+            for (int i = 0; i < 3 * N; i++) {
+                ddys[j][i] = 0;
+            }
+        }
+        // # Advance along the Radau sequence
+        for (int ih = 0; ih < nh; ih++) {
+            // # Estimate position and velocity with bs0 and current h
+            approx_pos(y0, dy0, ddy0, hs[ih], bs, N, h, y);
+            approx_vel(dy0, ddy0, hs[ih], bs, N, h, dy);
+            // # Evaluate force function and store
+            force(y, dy, N, G, masses, radii, sources, ddys[ih]);
+            compute_gs(ddys, ih, N, g);
+            compute_bs_from_gs(g, ih, N, bs);
+        }
+
+        for (int i = 0; i < ABIE_RADAU_DIM; i++) db6[i] = bs[nh - 2][i] - bs0[nh - 2][i];
+
+        real ddys_max = vector_max_abs(ddys[nh - 1], ABIE_RADAU_DIM);
+        if (ddys_max == 0.0 || vector_max_abs(db6, ABIE_RADAU_DIM) / ddys_max < tolpc) break;
+        for (int j = 0; j < nh - 1; j++) {
+            for (int i = 0; i < ABIE_RADAU_DIM; i++) bs0[j][i] = bs[j][i];
+        }
+    }
+
+    // ################# ADVANCE SOLUTION
+
+    approx_pos(y0, dy0, ddy0, 1., bs, N, h, y);
+    approx_vel(dy0, ddy0, 1., bs, N, h, dy);
+    force(y, dy, N, G, masses, radii, sources, ddy);
+
+    // ################## COMPUTE STEP-SIZE
+    // # Estimate relative error
+    real ddy_max = vector_max_abs(ddy, ABIE_RADAU_DIM);
+    real estim_b6 = (ddy_max > 0.0) ? vector_max_abs(bs[nh - 2], ABIE_RADAU_DIM) / ddy_max : 0.0;
+    real err = pow(estim_b6 / epsb, exponent);
+    *dtreq = (err > 0.0) ? h / err : h / fac;
+    return err;
+}
+
+// the size of the step that follows a step of size h, limited to a change by a factor of 1 / fac
+real radau_next_step(real h, real dtreq) {
+    if (dtreq / h > 1.0 / fac) {
+        return h / fac;
+    } else if (dtreq < 1.e-12) {
+        return h * fac;
+    }
+    return dtreq;
+}
+
+
+/*
+ * Continuous collision detection.
+ *
+ * Checking the separations only at the end of the steps misses the pairs that pass through each other within a step.
+ * Instead, the paths of the particles are followed with the Radau polynomial of the accepted step (approx_pos() with
+ * T in [0, 1]):
+ *  - broad phase: the box swept by each particle over the step is bounded from CONTACT_SAMPLES + 1 points of its
+ *    path, and the pairs of overlapping boxes are found by sweep and prune along x;
+ *  - narrow phase: the candidate pairs are tracked through the same points, looking for a contact at a point or for a
+ *    minimum of the separation between two points, and the time of the first contact is found by bisection.
+ * The contacts are found at a separation slightly smaller (by CONTACT_TOLERANCE) than the sum of the radii, so that
+ * the pair is recognized as colliding at the end of the shortened step despite the rounding errors. Pairs that are
+ * already touching at the start of the step (e.g., just after a bounce) are left to the detection at the step end.
+ */
+#define CONTACT_SAMPLES 8
+#define CONTACT_ITERATIONS 60
+#define CONTACT_TOLERANCE 1.e-10
+
+typedef struct {
+    real lo;
+    int i;
+} swept_box;
+
+static int compare_swept_boxes(const void *a, const void *b) {
+    real lo_a = ((const swept_box *) a)->lo;
+    real lo_b = ((const swept_box *) b)->lo;
+    return (lo_a > lo_b) - (lo_a < lo_b);
+}
+
+/*
+ * The squared separation of particles j and k at the fraction T of the step, minus R2 (in f), and the product of their
+ * relative position and velocity (in g), which is negative while they are approaching
+ */
+static void pair_separation(const real *y0, const real *dy0, const real *ddy0, real b[][ABIE_RADAU_DIM], real h, int j, int k,
+                            real T, real R2, real *f, real *g) {
+    real xj[3], xk[3], vj[3], vk[3];
+    approx_pos(&y0[3 * j], &dy0[3 * j], &ddy0[3 * j], T, (real (*)[ABIE_RADAU_DIM]) &b[0][3 * j], 1, h, xj);
+    approx_pos(&y0[3 * k], &dy0[3 * k], &ddy0[3 * k], T, (real (*)[ABIE_RADAU_DIM]) &b[0][3 * k], 1, h, xk);
+    approx_vel(&dy0[3 * j], &ddy0[3 * j], T, (real (*)[ABIE_RADAU_DIM]) &b[0][3 * j], 1, h, vj);
+    approx_vel(&dy0[3 * k], &ddy0[3 * k], T, (real (*)[ABIE_RADAU_DIM]) &b[0][3 * k], 1, h, vk);
+    *f = -R2;
+    *g = 0.0;
+    for (int c = 0; c < 3; c++) {
+        *f += (xj[c] - xk[c]) * (xj[c] - xk[c]);
+        *g += (xj[c] - xk[c]) * (vj[c] - vk[c]);
+    }
+}
+
+/*
+ * The fraction of the step at the first contact of particles j and k before T_max, or 1 if they do not touch.
+ * samples holds the positions of all particles at the fractions s / CONTACT_SAMPLES of the step.
+ */
+static real pair_contact(const real *y0, const real *dy0, const real *ddy0, real b[][ABIE_RADAU_DIM], real h, size_t N,
+                         const real *samples, int j, int k, real R, real T_max) {
+    real R2 = R * R;
+    real f_a = -R2, f_b, g_a = 0.0, g_b, f, g;
+    const real *x = samples;
+    for (int c = 0; c < 3; c++) f_a += (x[3 * j + c] - x[3 * k + c]) * (x[3 * j + c] - x[3 * k + c]);
+    if (f_a <= 0) return 1.0;
+    int g_a_known = 0;
+
+    for (int s = 1; s <= CONTACT_SAMPLES; s++) {
+        real T_a = (real) (s - 1) / CONTACT_SAMPLES;
+        real T_b = (real) s / CONTACT_SAMPLES;
+        if (T_a >= T_max) break;
+        const real *x_a = x;
+        x = &samples[3 * N * s];
+        f_b = -R2;
+        real L2 = 0.0;
+        for (int c = 0; c < 3; c++) {
+            real d_a = x_a[3 * j + c] - x_a[3 * k + c];
+            real d_b = x[3 * j + c] - x[3 * k + c];
+            f_b += d_b * d_b;
+            L2 += (d_b - d_a) * (d_b - d_a);
+        }
+
+        // bracket the first contact between lo (apart) and hi (touching)
+        real lo = T_a, hi = -1.0;
+        if (f_b <= 0) {
+            hi = T_b;
+        } else if (sqrt(fmin(f_a, f_b) + R2) - 2.0 * sqrt(L2) > R) {
+            // too far apart to touch between the points: the relative path is close to the chord of length sqrt(L2)
+            g_a_known = 0;
+        } else {
+            if (!g_a_known) pair_separation(y0, dy0, ddy0, b, h, j, k, T_a, R2, &f, &g_a);
+            pair_separation(y0, dy0, ddy0, b, h, j, k, T_b, R2, &f, &g_b);
+            if (g_a < 0 && g_b > 0) {
+                // the separation has a minimum within the interval
+                real g_lo = T_a, g_hi = T_b;
+                for (int it = 0; it < CONTACT_ITERATIONS; it++) {
+                    real T = 0.5 * (g_lo + g_hi);
+                    pair_separation(y0, dy0, ddy0, b, h, j, k, T, R2, &f, &g);
+                    if (g < 0) g_lo = T;
+                    else g_hi = T;
+                }
+                pair_separation(y0, dy0, ddy0, b, h, j, k, g_hi, R2, &f, &g);
+                if (f <= 0) hi = g_hi;
+            }
+            g_a = g_b;
+            g_a_known = 1;
+        }
+        if (hi >= 0) {
+            for (int it = 0; it < CONTACT_ITERATIONS; it++) {
+                real T = 0.5 * (lo + hi);
+                pair_separation(y0, dy0, ddy0, b, h, j, k, T, R2, &f, &g);
+                if (f > 0) lo = T;
+                else hi = T;
+            }
+            return hi;
+        }
+        f_a = f_b;
+    }
+    return 1.0;
+}
+
+/*
+ * The fraction of the step h (with the predictor b from y0, dy0, ddy0) at the first contact of two particles, or 1 if
+ * no particles touch during the step
+ */
+static real first_contact(const real *y0, const real *dy0, const real *ddy0, real b[][ABIE_RADAU_DIM], real h,
+                          const real *radii, size_t N) {
+    real r_max = 0.0;
+    for (size_t i = 0; i < N; i++) {
+        if (radii[i] > r_max) r_max = radii[i];
+    }
+    if (r_max <= 0) return 1.0;
+
+    size_t ws = workspace_mark();
+    real *samples = (real *) workspace_alloc((CONTACT_SAMPLES + 1) * 3 * N * sizeof(real));
+    real *box = (real *) workspace_alloc(6 * N * sizeof(real));
+    swept_box *order = (swept_box *) workspace_alloc(N * sizeof(swept_box));
+
+    for (int s = 0; s <= CONTACT_SAMPLES; s++) {
+        approx_pos(y0, dy0, ddy0, (real) s / CONTACT_SAMPLES, b, N, h, &samples[3 * N * s]);
+    }
+    // the boxes swept by the particles, with a margin for the curvature of the paths between the points
+    for (size_t i = 0; i < N; i++) {
+        for (int c = 0; c < 3; c++) {
+            real lo = samples[3 * i + c], hi = lo, step_max = 0.0;
+            for (int s = 1; s <= CONTACT_SAMPLES; s++) {
+                real x = samples[3 * N * s + 3 * i + c];
+                real step = fabs(x - samples[3 * N * (s - 1) + 3 * i + c]);
+                if (x < lo) lo = x;
+                if (x > hi) hi = x;
+                if (step > step_max) step_max = step;
+            }
+            box[6 * i + c] = lo - 0.5 * step_max - radii[i];
+            box[6 * i + 3 + c] = hi + 0.5 * step_max + radii[i];
+        }
+        order[i].lo = box[6 * i];
+        order[i].i = (int) i;
+    }
+    qsort(order, N, sizeof(swept_box), compare_swept_boxes);
+
+    real T_contact = 1.0;
+    for (size_t p = 0; p < N; p++) {
+        int j = order[p].i;
+        for (size_t q = p + 1; q < N && order[q].lo <= box[6 * j + 3]; q++) {
+            int k = order[q].i;
+            if (box[6 * k + 1] > box[6 * j + 4] || box[6 * j + 1] > box[6 * k + 4] ||
+                box[6 * k + 2] > box[6 * j + 5] || box[6 * j + 2] > box[6 * k + 5]) continue;
+            real R = (radii[j] + radii[k]) * (1.0 - CONTACT_TOLERANCE);
+            if (R <= 0) continue;
+            real T = pair_contact(y0, dy0, ddy0, b, h, N, samples, j, k, R, T_contact);
+            if (T < T_contact) T_contact = T;
+        }
+    }
+    workspace_release(ws);
+    return T_contact;
+}
+
+/*
+ * The state of the integrator is kept between the calls (the step size, the predictor coefficients and the work
+ * buffers), so that a call that continues the previous one does not start from scratch. The state is discarded when
+ * set_state() changes the system, when a collision or close encounter ends a call, or when the positions, velocities
+ * or time passed in do not match the end of the previous call.
+ *
+ * The steps are never shortened to land on t_end (dense output): the integrator takes its natural steps until it
+ * reaches or passes t_end, and the state at t_end is evaluated from the Radau polynomial of the last step. That step
+ * is kept as well, so that the following calls with an end time inside the same step do not take any step at all.
+ * The state is kept in the simulation context (see context.h).
+ */
+#define gr_dim (abie_ctx->gauss_radau15.size)
+#define gr_warm (abie_ctx->gauss_radau15.warm)
+#define gr_t (abie_ctx->gauss_radau15.t)
+#define gr_h (abie_ctx->gauss_radau15.h)
+#define gr_t_out (abie_ctx->gauss_radau15.t_out)
+#define gr_t_step (abie_ctx->gauss_radau15.t_step)
+#define gr_h_step (abie_ctx->gauss_radau15.h_step)
+#define gr_masses (abie_ctx->gauss_radau15.masses)
+#define gr_y0 (abie_ctx->gauss_radau15.y0)
+#define gr_dy0 (abie_ctx->gauss_radau15.dy0)
+#define gr_ddy0 (abie_ctx->gauss_radau15.ddy0)
+#define gr_y (abie_ctx->gauss_radau15.y)
+#define gr_dy (abie_ctx->gauss_radau15.dy)
+#define gr_db6 (abie_ctx->gauss_radau15.db6)
+#define gr_ddy (abie_ctx->gauss_radau15.ddy)
+#define gr_bs0 (abie_ctx->gauss_radau15.bs0)
+#define gr_bs (abie_ctx->gauss_radau15.bs)
+#define gr_g (abie_ctx->gauss_radau15.g)
+#define gr_E (abie_ctx->gauss_radau15.E)
+#define gr_ddys (abie_ctx->gauss_radau15.ddys)
+#define gr_y_step (abie_ctx->gauss_radau15.y_step)
+#define gr_dy_step (abie_ctx->gauss_radau15.dy_step)
+#define gr_ddy_step (abie_ctx->gauss_radau15.ddy_step)
+#define gr_bs_step (abie_ctx->gauss_radau15.bs_step)
+#define gr_y_out (abie_ctx->gauss_radau15.y_out)
+#define gr_dy_out (abie_ctx->gauss_radau15.dy_out)
+
+void gauss_radau15_reset() {
+    gr_warm = 0;
+}
+
+void gauss_radau15_finalize() {
+    if (gr_dim == 0) return;
+    free(gr_y0);  free(gr_dy0); free(gr_ddy0);
+    free(gr_y);   free(gr_dy);  free(gr_db6);  free(gr_ddy);
+    free(gr_bs0); free(gr_bs);  free(gr_g);  free(gr_E);
+    free(gr_ddys);
+    free(gr_y_step); free(gr_dy_step); free(gr_ddy_step); free(gr_bs_step);
+    free(gr_y_out); free(gr_dy_out);
+    gr_dim = 0;
+    gr_warm = 0;
+}
+
+static int gauss_radau15_continues(const real *pos, const real *vel, const real *m_vec, size_t N, real t) {
+    if (!gr_warm || gr_dim != 3 * N || gr_t_out != t || gr_masses != m_vec) return 0;
+    for (size_t i = 0; i < 3 * N; i++) {
+        if (gr_y_out[i] != pos[i] || gr_dy_out[i] != vel[i]) return 0;
+    }
+    return 1;
+}
 
 size_t integrator_gauss_radau15(real *pos, real *vel, real *m_vec, real *r_vec, size_t N, real _G, real _t, real _t_end, real _dt) {
+    // the particles passed in are not assumed to be those of the simulation state, so all of them act as sources
+    return gauss_radau15_integrate(pos, vel, m_vec, r_vec, N, _G, _t, _t_end, _dt, SOURCES_ALL);
+}
+
+// sources: SOURCES_ACTIVE if the particles are those of the simulation state (see calculate_gravity())
+size_t gauss_radau15_integrate(real *pos, real *vel, real *m_vec, real *r_vec, size_t N, real _G, real _t, real _t_end,
+                               real _dt, int sources) {
     // # Dimension of the system
-    dim = 3 * N;
+    ABIE_RADAU_DIM = 3 * N;
+
+    int warm = gauss_radau15_continues(pos, vel, m_vec, N, _t);
+    if (!warm && _t_end <= _t) return EXIT_NORMAL;
 
     // allocate
-    real *y0 = (real *) malloc(dim * sizeof(real));
-    real *dy0 = (real *) malloc(dim * sizeof(real));
-    real *masses = (real *) malloc(N * sizeof(real));
-    real *ddy0 = (real *) malloc(dim * sizeof(real));
-    real *y = (real *) malloc(dim * sizeof(real));
-    real *dy = (real *) malloc(dim * sizeof(real));
-    real *db6 = (real *) malloc(dim * sizeof(real));
-    real *ddy = (real *) malloc(dim * sizeof(real));
-    real (*bs0)[dim] = (real(*)[dim])malloc(sizeof(real[nh - 1][dim]));
-    real (*bs)[dim] = (real(*)[dim])malloc(sizeof(real[nh - 1][dim]));
-    real (*g)[dim] = (real(*)[dim])malloc(sizeof(real[nh - 1][dim]));
-    real (*E)[dim] = (real(*)[dim])malloc(sizeof(real[nh - 1][dim]));
-    real (*ddys)[dim] = (real(*)[dim])malloc(sizeof(real[nh][dim]));
+    if (gr_dim != ABIE_RADAU_DIM) {
+        gauss_radau15_finalize();
+        gr_y0 = (real *) malloc(ABIE_RADAU_DIM * sizeof(real));
+        gr_dy0 = (real *) malloc(ABIE_RADAU_DIM * sizeof(real));
+        gr_ddy0 = (real *) malloc(ABIE_RADAU_DIM * sizeof(real));
+        gr_y = (real *) malloc(ABIE_RADAU_DIM * sizeof(real));
+        gr_dy = (real *) malloc(ABIE_RADAU_DIM * sizeof(real));
+        gr_db6 = (real *) malloc(ABIE_RADAU_DIM * sizeof(real));
+        gr_ddy = (real *) malloc(ABIE_RADAU_DIM * sizeof(real));
+        gr_bs0 = (real *) malloc(sizeof(real[nh - 1][ABIE_RADAU_DIM]));
+        gr_bs = (real *) malloc(sizeof(real[nh - 1][ABIE_RADAU_DIM]));
+        gr_g = (real *) malloc(sizeof(real[nh - 1][ABIE_RADAU_DIM]));
+        gr_E = (real *) malloc(sizeof(real[nh - 1][ABIE_RADAU_DIM]));
+        gr_ddys = (real *) malloc(sizeof(real[nh][ABIE_RADAU_DIM]));
+        gr_y_step = (real *) malloc(ABIE_RADAU_DIM * sizeof(real));
+        gr_dy_step = (real *) malloc(ABIE_RADAU_DIM * sizeof(real));
+        gr_ddy_step = (real *) malloc(ABIE_RADAU_DIM * sizeof(real));
+        gr_bs_step = (real *) malloc(sizeof(real[nh - 1][ABIE_RADAU_DIM]));
+        gr_y_out = (real *) malloc(ABIE_RADAU_DIM * sizeof(real));
+        gr_dy_out = (real *) malloc(ABIE_RADAU_DIM * sizeof(real));
+        gr_dim = ABIE_RADAU_DIM;
+    }
+    real *y0 = gr_y0;
+    real *dy0 = gr_dy0;
+    real *masses = m_vec;
+    real *ddy0 = gr_ddy0;
+    real *y = gr_y;
+    real *dy = gr_dy;
+    real *db6 = gr_db6;
+    real *ddy = gr_ddy;
+    real (*bs0)[ABIE_RADAU_DIM] = (real(*)[ABIE_RADAU_DIM]) gr_bs0;
+    real (*bs)[ABIE_RADAU_DIM] = (real(*)[ABIE_RADAU_DIM]) gr_bs;
+    real (*g)[ABIE_RADAU_DIM] = (real(*)[ABIE_RADAU_DIM]) gr_g;
+    real (*E)[ABIE_RADAU_DIM] = (real(*)[ABIE_RADAU_DIM]) gr_E;
+    real (*ddys)[ABIE_RADAU_DIM] = (real(*)[ABIE_RADAU_DIM]) gr_ddys;
+    real (*bs_step)[ABIE_RADAU_DIM] = (real(*)[ABIE_RADAU_DIM]) gr_bs_step;
     real h = (real) _dt; // timestep
 
     // type casting
@@ -273,116 +603,110 @@ size_t integrator_gauss_radau15(real *pos, real *vel, real *m_vec, real *r_vec,
     real t = _t;
     real t_end = _t_end;
     size_t integrator_flag = 0;
+    // the adaptive step size control is sensitive to the rounding noise of single precision forces, so the
+    // forces on the test particles are always calculated in full precision
+    int mixed_precision = mixed_precision_global;
+    mixed_precision_global = 0;
+
+    if (warm) {
+        // # Continue from the end of the last step, with its step size and predictor
+        t = gr_t;
+        h = gr_h;
+    } else {
+        for (size_t i = 0; i < 3 * N; i++) {
+            y0[i] = pos[i];
+            dy0[i] = vel[i];
+        }
 
-    for (size_t i = 0; i < 3 * N; i++) {
-        y0[i] = pos[i];
-        dy0[i] = vel[i];
-    }
-    for (size_t i = 0; i < N; i++) masses[i] = m_vec[i];
-
-    // # Initialize
-    for (int j = 0; j < nh - 1; j++) {
-        for (int i = 0; i < dim; i++) {
-            bs0[j][i] = 0.0;
-            bs[j][i] = 0.0;
-            g[j][i] = 0.0;
-            E[j][i] = 0.0;
+        // # Initialize
+        for (int j = 0; j < nh - 1; j++) {
+            for (int i = 0; i < ABIE_RADAU_DIM; i++) {
+                bs0[j][i] = 0.0;
+                bs[j][i] = 0.0;
+                g[j][i] = 0.0;
+                E[j][i] = 0.0;
+            }
+        }
+        for (int j = 0; j < nh; j++) {
+            for (int i = 0; i < ABIE_RADAU_DIM; i++) ddys[j][i] = 0.0;
+        }
+        for (int i = 0; i < ABIE_RADAU_DIM; i++) {
+            db6[i] = 0.0;
+            ddy[i] = 0.0;
         }
-    }
-    for (int j = 0; j < nh; j++) {
-        for (int i = 0; i < dim; i++) ddys[j][i] = 0.0;
-    }
-    for (int i = 0; i < dim; i++) {
-        db6[i] = 0.0;
-        ddy[i] = 0.0;
-    }
 
-    calculate_accelerations(y0, dy0, N, G, masses, r_vec, ddy0);
+        calculate_accelerations(y0, dy0, N, G, masses, r_vec, sources, ddy0);
 
-    // # Initial time step
-    h = initial_time_step(y0, dy0, G, masses, r_vec, N);
+        // # Initial time step
+        h = initial_time_step(y0, dy0, G, masses, r_vec, N, sources);
+    }
 
-    int advance_step = 1;
+    int advance_step = (t < t_end);
     int step_loop_count = 0;
     int step_loop_max = 100;
     int warning_msg_printed = 0;
     while(advance_step){
-        // # Variable number of iterations in PC
-        for (int ipc = 0; ipc < 12; ipc++) {
-            for (int j = 0; j < nh; j++) {
-                for (int i = 0; i < 3 * N; i++) {
-                    ddys[j][i] = 0;
-                }
-            }
-            // # Advance along the Radau sequence
-            for (int ih = 0; ih < nh; ih++) {
-                // # Estimate position and velocity with bs0 and current h
-                approx_pos(y0, dy0, ddy0, hs[ih], bs, N, h, y);
-                approx_vel(dy0, ddy0, hs[ih], bs, N, h, dy);
-                // # Evaluate force function and store
-                calculate_accelerations(y, dy, N, G, masses, r_vec, ddys[ih]);
-                compute_gs(ddys, ih, N, g);
-                compute_bs_from_gs(g, ih, N, bs);
-            }
-
-            for (int i = 0; i < dim; i++) db6[i] = bs[nh - 2][i] - bs0[nh - 2][i];
-
-            if (vector_max_abs(db6, dim) / vector_max_abs(ddys[nh - 1], dim) < tolpc) break;
-            for (int j = 0; j < nh - 1; j++) {
-                for (int i = 0; i < dim; i++) bs0[j][i] = bs[j][i];
-            }
-            // if (integrator_flag > 0) break;
-        }
-
-        // ################# ADVANCE SOLUTION
-
-        approx_pos(y0, dy0, ddy0, 1., bs, N, h, y);
-        approx_vel(dy0, ddy0, 1., bs, N, h, dy);
-        calculate_accelerations(y, dy, N, G, masses, r_vec, ddy);
-
-        // ################## COMPUTE STEP-SIZE
-        // # Estimate relative error
-        real estim_b6 = vector_max_abs(bs[nh - 2], dim) / vector_max_abs(ddy, dim);
-        real err = pow(estim_b6 / epsb, exponent);
-        real dtreq = h / err;
+        real dtreq;
+        real err = radau_step(calculate_accelerations, N, G, masses, r_vec, sources, y0, dy0, ddy0, h, bs0, bs, g, ddys,
+                              db6, y, dy, ddy, &dtreq);
 
         // # Accept the step
         if (err <= 1 || step_loop_count > step_loop_max) {
+            if (continuous_collisions_global) {
+                // # End the step at the first collision within it
+                real T = first_contact(y0, dy0, ddy0, bs, h, r_vec, N);
+                if (T < 1.0) {
+                    // the polynomial of the shortened step is the same as that of the step, in the variable T * h
+                    real Tk = T;
+                    for (int j = 0; j < nh - 1; j++) {
+                        for (int i = 0; i < ABIE_RADAU_DIM; i++) bs[j][i] *= Tk;
+                        Tk *= T;
+                    }
+                    h *= T;
+                    approx_pos(y0, dy0, ddy0, 1., bs, N, h, y);
+                    approx_vel(dy0, ddy0, 1., bs, N, h, dy);
+                    calculate_accelerations(y, dy, N, G, masses, r_vec, sources, ddy);
+                }
+            }
             t += h;
             t_global = t;
             step_loop_count = 0;
             // param[0] = t;
             // param[1] = h;
             // param[2] = close_encounters;
-            if (t > t_end){
-                h = t_end - t;
+            if (t >= t_end){
                 advance_step = 0;
+                // # Keep the last step for the dense output
+                gr_t_step = t - h;
+                gr_h_step = h;
+                for (int i = 0; i < ABIE_RADAU_DIM; i++) {
+                    gr_y_step[i] = y0[i];
+                    gr_dy_step[i] = dy0[i];
+                    gr_ddy_step[i] = ddy0[i];
+                }
+                for (int j = 0; j < nh - 1; j++) {
+                    for (int i = 0; i < ABIE_RADAU_DIM; i++) bs_step[j][i] = bs[j][i];
+                }
             }
             // # Update step
-            for (int i = 0; i < dim; i++) {
+            for (int i = 0; i < ABIE_RADAU_DIM; i++) {
                 y0[i] = y[i];
                 dy0[i] = dy[i];
                 ddy0[i] = ddy[i];
             }
             for (int j = 0; j < nh - 1; j++) {
-                for (int i = 0; i < dim; i++) bs0[j][i] = bs[j][i];
+                for (int i = 0; i < ABIE_RADAU_DIM; i++) bs0[j][i] = bs[j][i];
             }
 
             refine_bs(bs, dtreq / h, E, N);
-            integrator_flag = check_collisions_close_encounters(y, r_vec, N, t);
+            integrator_flag = check_collisions_close_encounters(y, dy, r_vec, N, t);
             //if (integrator_flag > 0) return integrator_flag; // return if collision or close encounters are detected
             if (integrator_flag > 0) break; // break the while(advance_step) loop, but still allow the subsequent clean-up process
         } else{
             // if the timestep is not accepted, record the times of rejection
             step_loop_count += 1;
         }
-        if (dtreq / h > 1.0 / fac){
-            h /= fac;
-        } else if (dtreq < 1.e-12){
-            h *= fac;
-        } else {
-            h = dtreq;
-        }
+        h = radau_next_step(h, dtreq);
         // printf("h = %g\n", h);
         if (h < h_min){
             if (warning_msg_printed == 0){
@@ -397,16 +721,33 @@ size_t integrator_gauss_radau15(real *pos, real *vel, real *m_vec, real *r_vec,
         } // if (h < h_min)
     } // while(advance_step)
 
+    // # Dense output: the state at t_end from the polynomial of the last step, unless an event stopped the integration
+    real t_out = t;
+    if (integrator_flag == 0 && t_end < t) {
+        t_out = t_end;
+        real T = (t_end - gr_t_step) / gr_h_step;
+        approx_pos(gr_y_step, gr_dy_step, gr_ddy_step, T, bs_step, N, gr_h_step, gr_y_out);
+        approx_vel(gr_dy_step, gr_ddy_step, T, bs_step, N, gr_h_step, gr_dy_out);
+    } else {
+        for (int i = 0; i < ABIE_RADAU_DIM; i++) {
+            gr_y_out[i] = y0[i];
+            gr_dy_out[i] = dy0[i];
+        }
+    }
+    t_global = t_out;
+
     // type casting
     for (size_t i = 0; i < 3 * N; i++) {
-        pos[i] = (double) y0[i];
-        vel[i] = (double) dy[i];
+        pos[i] = (double) gr_y_out[i];
+        vel[i] = (double) gr_dy_out[i];
     }
-    for (size_t i = 0; i < N; i++) m_vec[i] = (double) masses[i];
-    free(y0);  free(dy0); free(masses); free(ddy0); 
-    free(y);   free(dy);  free(db6);    free(ddy);
-    free(bs0); free(bs);  free(g);  free(E);
-    free(ddys);
-
+    // keep the state for the next call, unless the system is about to be changed by handling the event
+    gr_warm = (integrator_flag == 0);
+    gr_t = t;
+    gr_t_out = t_out;
+    gr_h = h;
+    gr_masses = m_vec;
+
+    mixed_precision_global = mixed_precision;
     return integrator_flag;
 }
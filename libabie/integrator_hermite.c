@@ -0,0 +1,375 @@
+#include "common.h"
+#include "integrator_hermite.h"
+#include <stdint.h>
+
+/*
+ * Fourth-order Hermite predictor-corrector with block time steps (Makino & Aarseth 1992).
+ *
+ * Every particle has its own time step, a power-of-two fraction of the integration interval. At each block step
+ * only the particles whose step ends at the block time ("due" particles) are corrected, while all the others are
+ * predicted to the block time to act as sources. A new step follows from the Aarseth criterion
+ *      dt = sqrt(eta (|a| |a''| + |a'|^2) / (|a'| |a'''| + |a''|^2))
+ * and may only be doubled when the particle is synchronized with the coarser level. The times are counted in
+ * integer ticks of the smallest step, so that the block times are exact.
+ *
+ * The step of level 0 is the interval of the first call (e.g., the output interval store_dt), and the state of the
+ * particles (their steps and the times, accelerations and jerks at the end of their last steps) is kept between the
+ * calls, so that every particle keeps its step history through the output times. The state returned at t_end is
+ * extrapolated from the last step of each particle with its 4th and 5th derivatives (from the last correction), which
+ * is exact for the particles whose step ends at t_end, e.g. all of them if t_end is a multiple of the step of level 0.
+ * The state is discarded by set_state(), after an event, and when the positions, velocities or time passed in do not
+ * match the state returned by the previous call. It is kept in the simulation context (see context.h).
+ *
+ * Only the gravitational forces between the particles are included (no additional or external forces).
+ */
+
+static void hermite_record_event(real *buf, size_t *n_events, size_t max_events, real t, int i, int k, real rel_sep) {
+    if (buf != NULL && max_events > 0) {
+        buf[(4 * (*n_events)) % (4 * max_events)] = t;
+        buf[(4 * (*n_events) + 1) % (4 * max_events)] = (i < k) ? i : k;
+        buf[(4 * (*n_events) + 2) % (4 * max_events)] = (i < k) ? k : i;
+        buf[(4 * (*n_events) + 3) % (4 * max_events)] = rel_sep;
+    }
+    *n_events += 1;
+}
+
+// accelerations and jerks of the sinks in the list due to the sources, from the predicted state; also detects
+// close encounters and collisions of the sinks
+static void hermite_force(const real xp[], const real vp[], real G, const real m_src[], const int src[], size_t n_src,
+                          const real radii[], const int sinks[], size_t n_sinks, const char due[], real t,
+                          real acc[], real jerk[]) {
+    real ce2 = close_encounter_distance * close_encounter_distance;
+#if OPENMP
+#pragma omp parallel for schedule(dynamic, 16) if (n_sinks * n_src > USE_PARALLEL * USE_PARALLEL) copyin(abie_ctx)
+#endif
+    for (int s = 0; s < n_sinks; s++) {
+        int i = sinks[s];
+        real ax = 0.0, ay = 0.0, az = 0.0;
+        real jx = 0.0, jy = 0.0, jz = 0.0;
+        for (size_t n = 0; n < n_src; n++) {
+            int k = src[n];
+            if (k == i) continue;
+            real dx = xp[3 * k] - xp[3 * i];
+            real dy = xp[3 * k + 1] - xp[3 * i + 1];
+            real dz = xp[3 * k + 2] - xp[3 * i + 2];
+            real dvx = vp[3 * k] - vp[3 * i];
+            real dvy = vp[3 * k + 1] - vp[3 * i + 1];
+            real dvz = vp[3 * k + 2] - vp[3 * i + 2];
+            real r2 = dx * dx + dy * dy + dz * dz;
+            real inv_r2 = 1.0 / r2;
+            real mr3 = G * m_src[k] * inv_r2 * sqrt(inv_r2);
+            real rv = 3.0 * (dx * dvx + dy * dvy + dz * dvz) * inv_r2;
+            ax += mr3 * dx;
+            ay += mr3 * dy;
+            az += mr3 * dz;
+            jx += mr3 * (dvx - rv * dx);
+            jy += mr3 * (dvy - rv * dy);
+            jz += mr3 * (dvz - rv * dz);
+
+            // each pair of due particles is only checked once
+            if (due[k] && k < i) continue;
+            real r = radii[i] + radii[k];
+            if (r2 <= ce2 || (r > 0 && r2 <= r * r)) {
+#if OPENMP
+#pragma omp critical
+#endif
+                {
+                    if (r2 <= ce2) hermite_record_event(buf_ce_events, &n_close_encounters, MAX_N_CE, t, i, k, sqrt(r2));
+                    if (r > 0 && r2 <= r * r) hermite_record_event(buf_collision_events, &n_collisions, MAX_N_COLLISIONS, t, i, k, sqrt(r2));
+                }
+            }
+        }
+        acc[3 * i] = ax;
+        acc[3 * i + 1] = ay;
+        acc[3 * i + 2] = az;
+        jerk[3 * i] = jx;
+        jerk[3 * i + 1] = jy;
+        jerk[3 * i + 2] = jz;
+    }
+}
+
+#define hm_n (abie_ctx->hermite.n)
+#define hm_warm (abie_ctx->hermite.warm)
+#define hm_t_base (abie_ctx->hermite.t_base)
+#define hm_dt_base (abie_ctx->hermite.dt_base)
+#define hm_dt_max (abie_ctx->hermite.dt_max)
+#define hm_level_min (abie_ctx->hermite.level_min)
+#define hm_ticks (abie_ctx->hermite.ticks)
+#define hm_t_out (abie_ctx->hermite.t_out)
+#define hm_masses (abie_ctx->hermite.masses)
+#define hm_pos (abie_ctx->hermite.pos)
+#define hm_vel (abie_ctx->hermite.vel)
+#define hm_acc (abie_ctx->hermite.acc)
+#define hm_jerk (abie_ctx->hermite.jerk)
+#define hm_snap (abie_ctx->hermite.snap)
+#define hm_crackle (abie_ctx->hermite.crackle)
+#define hm_t_i (abie_ctx->hermite.t_i)
+#define hm_level (abie_ctx->hermite.level)
+#define hm_pos_out (abie_ctx->hermite.pos_out)
+#define hm_vel_out (abie_ctx->hermite.vel_out)
+
+void hermite_reset() {
+    hm_warm = 0;
+}
+
+void hermite_finalize() {
+    if (hm_n == 0) return;
+    free(hm_pos); free(hm_vel); free(hm_acc); free(hm_jerk); free(hm_snap); free(hm_crackle);
+    free(hm_t_i); free(hm_level);
+    free(hm_pos_out); free(hm_vel_out);
+    hm_n = 0;
+    hm_warm = 0;
+}
+
+static int hermite_continues(const real *pos, const real *vel, const real *m_vec, size_t N, real t, real t_end,
+                             double dt_max) {
+    if (!hm_warm || hm_n != N || hm_t_out != t || hm_masses != m_vec || hm_dt_max != (real) dt_max) return 0;
+    // the ticks up to t_end must fit into 64 bits
+    if (t_end - hm_t_base >= ldexp(hm_dt_base, 62 - HERMITE_MAX_LEVEL)) return 0;
+    for (size_t i = 0; i < 3 * N; i++) {
+        if (hm_pos_out[i] != pos[i] || hm_vel_out[i] != vel[i]) return 0;
+    }
+    return 1;
+}
+
+size_t integrator_hermite(real *pos, real *vel, real *m_vec, real *r_vec, size_t N, real G, double _t, double _t_end, double _dt, double eta) {
+    // the particles passed in are not assumed to be those of the simulation state, so all of them act as sources
+    return hermite_integrate(pos, vel, m_vec, r_vec, N, G, _t, _t_end, _dt, eta, SOURCES_ALL);
+}
+
+// sources: SOURCES_ACTIVE if the particles are those of the simulation state (see calculate_gravity())
+size_t hermite_integrate(real *pos, real *vel, real *m_vec, real *r_vec, size_t N, real G, double _t, double _t_end,
+                         double _dt, double eta, int sources) {
+    real t0 = (real) _t;
+    real t_end = (real) _t_end;
+    int warm = hermite_continues(pos, vel, m_vec, N, t0, t_end, _dt);
+    if (t_end <= t0) return EXIT_NORMAL;
+
+    // allocate
+    if (hm_n != N) {
+        hermite_finalize();
+        hm_pos = (real *) malloc(3 * N * sizeof(real));
+        hm_vel = (real *) malloc(3 * N * sizeof(real));
+        hm_acc = (real *) malloc(3 * N * sizeof(real));
+        hm_jerk = (real *) malloc(3 * N * sizeof(real));
+        hm_snap = (real *) malloc(3 * N * sizeof(real));
+        hm_crackle = (real *) malloc(3 * N * sizeof(real));
+        hm_t_i = (uint64_t *) malloc(N * sizeof(uint64_t));
+        hm_level = (int *) malloc(N * sizeof(int));
+        hm_pos_out = (real *) malloc(3 * N * sizeof(real));
+        hm_vel_out = (real *) malloc(3 * N * sizeof(real));
+        hm_n = N;
+    }
+    real *x = hm_pos;
+    real *v = hm_vel;
+    real *acc = hm_acc;
+    real *jerk = hm_jerk;
+    real *snap = hm_snap;
+    real *crackle = hm_crackle;
+    uint64_t *t_i = hm_t_i;
+    int *level = hm_level;
+
+    // sources: the particles with a positive mass (the test particles of the simulation state are excluded)
+    const real *m_src = (sources == SOURCES_ACTIVE && N == N_global) ? m_src_global : m_vec;
+    size_t ws = workspace_mark();
+    int *src = (int *) workspace_alloc(N * sizeof(int));
+    size_t n_src = 0;
+    for (size_t i = 0; i < N; i++) {
+        if (m_src[i] > 0.0) src[n_src++] = (int) i;
+    }
+
+    real *acc1 = (real *) workspace_alloc(3 * N * sizeof(real));
+    real *jerk1 = (real *) workspace_alloc(3 * N * sizeof(real));
+    real *xp = (real *) workspace_alloc(3 * N * sizeof(real));
+    real *vp = (real *) workspace_alloc(3 * N * sizeof(real));
+    int *sinks = (int *) workspace_alloc(N * sizeof(int));
+    char *due = (char *) workspace_alloc(N * sizeof(char));
+
+    // the particles that are not deleted
+    size_t n_sinks = 0;
+    for (size_t i = 0; i < N; i++) {
+        due[i] = 0;
+        if (m_vec[i] < 0.0) continue;
+        sinks[n_sinks++] = (int) i;
+    }
+
+    const uint64_t ticks_base = ((uint64_t) 1) << HERMITE_MAX_LEVEL;
+    if (warm) {
+        // move tick 0 forward by whole steps of level 0, so that the ticks do not overflow
+        uint64_t shift = hm_ticks;
+        for (size_t s = 0; s < n_sinks; s++) {
+            if (t_i[sinks[s]] < shift) shift = t_i[sinks[s]];
+        }
+        shift -= shift % ticks_base;
+        for (size_t s = 0; s < n_sinks; s++) t_i[sinks[s]] -= shift;
+        hm_ticks -= shift;
+        hm_t_base += (real) (shift / ticks_base) * hm_dt_base;
+    } else {
+        // level 0 is the whole interval; the coarsest level in use does not exceed the step specified by the user
+        hm_t_base = t0;
+        hm_dt_base = t_end - t0;
+        hm_dt_max = (real) _dt;
+        hm_level_min = 0;
+        if (_dt > 0) {
+            while (hm_level_min < HERMITE_MAX_LEVEL && ldexp(hm_dt_base, -hm_level_min) > _dt) hm_level_min++;
+        }
+        hm_ticks = 0;
+
+        // initial accelerations and jerks of all particles that are not deleted
+        for (size_t s = 0; s < n_sinks; s++) due[sinks[s]] = 1;
+        for (size_t i = 0; i < 3 * N; i++) {
+            x[i] = pos[i];
+            v[i] = vel[i];
+            acc[i] = 0.0;
+            jerk[i] = 0.0;
+            snap[i] = 0.0;
+            crackle[i] = 0.0;
+        }
+        size_t n_ce_start = n_close_encounters, n_col_start = n_collisions;
+        hermite_force(x, v, G, m_src, src, n_src, r_vec, sinks, n_sinks, due, t0, acc, jerk);
+        n_close_encounters = n_ce_start;
+        n_collisions = n_col_start;
+
+        // initial steps: dt = eta / 2 |a| / |a'|
+        for (size_t s = 0; s < n_sinks; s++) {
+            int i = sinks[s];
+            real a = vector_norm(&acc[3 * i], 3);
+            real j = vector_norm(&jerk[3 * i], 3);
+            real dt = (j > 0.0) ? 0.5 * eta * a / j : hm_dt_base;
+            level[i] = hm_level_min;
+            while (level[i] < HERMITE_MAX_LEVEL && ldexp(hm_dt_base, -level[i]) > dt) level[i]++;
+            t_i[i] = 0;
+            due[i] = 0;
+        }
+    }
+    const real dt_base = hm_dt_base;
+    const int level_min = hm_level_min;
+    const real dt_tick = ldexp(dt_base, -HERMITE_MAX_LEVEL);
+    // the block steps end at the last block time up to t_end (at t_end itself if it lies on the grid of the ticks)
+    const uint64_t ticks_end = (uint64_t) floor((t_end - hm_t_base) / dt_tick + 0.5);
+
+    size_t integrator_flag = EXIT_NORMAL;
+    uint64_t ticks = hm_ticks;
+    while (ticks < ticks_end) {
+        // the next block time and the particles due at that time
+        uint64_t ticks_next = UINT64_MAX;
+        for (size_t s = 0; s < n_sinks; s++) {
+            int i = sinks[s];
+            uint64_t t_due = t_i[i] + (ticks_base >> level[i]);
+            if (t_due < ticks_next) ticks_next = t_due;
+        }
+        if (ticks_next > ticks_end) break;
+        size_t n_due = 0;
+        for (size_t s = 0; s < n_sinks; s++) {
+            int i = sinks[s];
+            due[i] = (t_i[i] + (ticks_base >> level[i]) == ticks_next);
+        }
+        real t_next = hm_t_base + (real) ticks_next * dt_tick;
+
+        // predict all particles to the block time
+#if OPENMP
+#pragma omp parallel for if (n_sinks > USE_PARALLEL) copyin(abie_ctx)
+#endif
+        for (int s = 0; s < n_sinks; s++) {
+            int i = sinks[s];
+            real dt = (real) (ticks_next - t_i[i]) * dt_tick;
+            for (int d = 3 * i; d < 3 * i + 3; d++) {
+                xp[d] = x[d] + dt * (v[d] + dt * (0.5 * acc[d] + dt * jerk[d] / 6.0));
+                vp[d] = v[d] + dt * (acc[d] + 0.5 * dt * jerk[d]);
+            }
+        }
+        // the due particles are moved to the front of the list of sinks
+        for (size_t s = 0; s < n_sinks; s++) {
+            if (due[sinks[s]]) {
+                int tmp = sinks[n_due];
+                sinks[n_due] = sinks[s];
+                sinks[s] = tmp;
+                n_due++;
+            }
+        }
+
+        // new accelerations and jerks of the due particles
+        hermite_force(xp, vp, G, m_src, src, n_src, r_vec, sinks, n_due, due, t_next, acc1, jerk1);
+
+        // correct the due particles and determine their new steps
+#if OPENMP
+#pragma omp parallel for if (n_due > USE_PARALLEL) copyin(abie_ctx)
+#endif
+        for (int s = 0; s < n_due; s++) {
+            int i = sinks[s];
+            real h = (real) (ticks_base >> level[i]) * dt_tick;
+            real a1_2 = 0.0, a2_2 = 0.0, a3_2 = 0.0, j1_2 = 0.0;
+            for (int d = 3 * i; d < 3 * i + 3; d++) {
+                real da = acc[d] - acc1[d];
+                real a2 = (-6.0 * da - h * (4.0 * jerk[d] + 2.0 * jerk1[d])) / (h * h);
+                real a3 = (12.0 * da + 6.0 * h * (jerk[d] + jerk1[d])) / (h * h * h);
+                x[d] = xp[d] + h * h * h * h * (a2 / 24.0 + h * a3 / 120.0);
+                v[d] = vp[d] + h * h * h * (a2 / 6.0 + h * a3 / 24.0);
+                // the derivatives at the end of the step
+                real a2_end = a2 + h * a3;
+                a1_2 += acc1[d] * acc1[d];
+                a2_2 += a2_end * a2_end;
+                a3_2 += a3 * a3;
+                j1_2 += jerk1[d] * jerk1[d];
+                acc[d] = acc1[d];
+                jerk[d] = jerk1[d];
+                snap[d] = a2_end;
+                crackle[d] = a3;
+            }
+            real num = sqrt(a1_2 * a2_2) + j1_2;
+            real den = sqrt(j1_2 * a3_2) + a2_2;
+            real dt_new = (den > 0.0) ? sqrt(eta * num / den) : dt_base;
+
+            t_i[i] = ticks_next;
+            if (dt_new < h) {
+                while (level[i] < HERMITE_MAX_LEVEL && ldexp(dt_base, -level[i]) > dt_new) level[i]++;
+            } else if (dt_new >= 2.0 * h && level[i] > level_min && (ticks_next % (ticks_base >> (level[i] - 1))) == 0) {
+                level[i]--;
+            }
+        }
+        ticks = ticks_next;
+
+        if ((MAX_N_CE > 0) && (n_close_encounters >= MAX_N_CE)) integrator_flag = EXIT_MAX_N_CE_EXCEEDED;
+        else if ((MAX_N_COLLISIONS > 0) && (n_collisions >= MAX_N_COLLISIONS)) integrator_flag = EXIT_MAX_N_COLLISIONS_EXCEEDED;
+        if (integrator_flag > 0) {
+            // synchronize the other particles at the time of the event, and return
+            for (size_t s = 0; s < n_sinks; s++) {
+                int i = sinks[s];
+                for (int d = 3 * i; d < 3 * i + 3; d++) {
+                    pos[d] = (s < n_due) ? x[d] : xp[d];
+                    vel[d] = (s < n_due) ? v[d] : vp[d];
+                }
+            }
+            break;
+        }
+    }
+    hm_ticks = ticks;
+
+    real t_out = t_end;
+    if (integrator_flag > 0) {
+        t_out = hm_t_base + (real) ticks * dt_tick;
+    } else {
+        // the state at t_end, from the last step of each particle
+        for (size_t s = 0; s < n_sinks; s++) {
+            int i = sinks[s];
+            real dt = t_end - (hm_t_base + (real) t_i[i] * dt_tick);
+            for (int d = 3 * i; d < 3 * i + 3; d++) {
+                pos[d] = x[d] + dt * (v[d] + dt * (0.5 * acc[d] + dt * (jerk[d] / 6.0 + dt * (snap[d] / 24.0 + dt * crackle[d] / 120.0))));
+                vel[d] = v[d] + dt * (acc[d] + dt * (0.5 * jerk[d] + dt * (snap[d] / 6.0 + dt * crackle[d] / 24.0)));
+            }
+        }
+    }
+    t_global = t_out;
+
+    // keep the state for the next call, unless the system is about to be changed by handling the event
+    for (size_t i = 0; i < 3 * N; i++) {
+        hm_pos_out[i] = pos[i];
+        hm_vel_out[i] = vel[i];
+    }
+    hm_warm = (integrator_flag == 0);
+    hm_t_out = t_out;
+    hm_masses = m_vec;
+
+    workspace_release(ws);
+    return integrator_flag;
+}
@@ -0,0 +1,9 @@
+#ifndef INTEGRATOR_HERMITE
+#define INTEGRATOR_HERMITE
+
+// Deepest level of the block time steps: the smallest step is (t_end - t) / 2^HERMITE_MAX_LEVEL
+#define HERMITE_MAX_LEVEL 40
+
+size_t integrator_hermite(real *pos, real *vel, real *m_vec, real *r_vec, size_t N, real G, double _t, double _t_end, double _dt, double eta);
+
+#endif
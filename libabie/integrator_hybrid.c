@@ -0,0 +1,313 @@
+#include "common.h"
+#include "integrator_hybrid.h"
+
+/*
+ * Hybrid symplectic integrator, in the spirit of MERCURY (Chambers 1999) and TRACE (Lu et al. 2023).
+ *
+ * The state is kept in heliocentric coordinates, with the central body (particle 0) at rest at the origin. Every
+ * pair of bodies is given a changeover radius of hill_factor times the larger of their Hill radii. As long as no pair
+ * comes within its changeover radius during a step, the step is a regular Wisdom-Holman step. Otherwise, the bodies
+ * in the encountering pairs form a subsystem, and the step is split as
+ *      kick(dt/2) - drift(dt) - kick(dt/2)
+ * where the drift propagates the other bodies on Kepler orbits about the central body, and integrates the subsystem
+ * (the central body and the encountering bodies, with all their mutual forces) with the Gauss-Radau15 scheme; the
+ * kicks apply the remaining interactions. The encounters are thus resolved to the accuracy of Gauss-Radau15, while
+ * the step of the map and the cost of the other bodies are not affected.
+ *
+ * Only the gravitational forces between the bodies are included (no additional or external forces).
+ */
+
+static void hybrid_record_event(real *buf, size_t *n_events, size_t max_events, real t, int i, int k, real rel_sep) {
+    if (buf != NULL && max_events > 0) {
+        buf[(4 * (*n_events)) % (4 * max_events)] = t;
+        buf[(4 * (*n_events) + 1) % (4 * max_events)] = (i < k) ? i : k;
+        buf[(4 * (*n_events) + 2) % (4 * max_events)] = (i < k) ? k : i;
+        buf[(4 * (*n_events) + 3) % (4 * max_events)] = rel_sep;
+    }
+    *n_events += 1;
+}
+
+static void hybrid_check_pair(real t, int i, int k, real r2, real radii_sum) {
+    if (r2 <= close_encounter_distance * close_encounter_distance) {
+        hybrid_record_event(buf_ce_events, &n_close_encounters, MAX_N_CE, t, i, k, sqrt(r2));
+    }
+    if (radii_sum > 0 && r2 <= radii_sum * radii_sum) {
+        hybrid_record_event(buf_collision_events, &n_collisions, MAX_N_COLLISIONS, t, i, k, sqrt(r2));
+    }
+}
+
+// flags the bodies that come within the changeover radius of another body during the next step of size dt, assuming
+// that the pairs move on straight lines; returns the number of encountering pairs. If record is set, the close
+// encounters and collisions at the current time are recorded as well.
+static size_t hybrid_scan(const real pos[], const real vel[], const real m_vec[], const real r_vec[], size_t N,
+                          real dt, real hill_factor, real t, int record, real r_hill[], char in_enc[]) {
+    r_hill[0] = 0.0;
+    in_enc[0] = 0;
+    for (size_t i = 1; i < N; i++) {
+        real m = (m_vec[i] > 0.0) ? m_vec[i] : 0.0;
+        r_hill[i] = hill_factor * vector_norm(&pos[3 * i], 3) * cbrt(m / (3.0 * m_vec[0]));
+        in_enc[i] = 0;
+    }
+    if (record) {
+        for (size_t i = 1; i < N; i++) hybrid_check_pair(t, 0, (int) i, dot(&pos[3 * i], &pos[3 * i]), r_vec[0] + r_vec[i]);
+    }
+
+    size_t n_pairs = 0;
+    for (size_t i = 1; i < N; i++) {
+        for (size_t k = i + 1; k < N; k++) {
+            real dx[3], dv[3];
+            for (int d = 0; d < 3; d++) {
+                dx[d] = pos[3 * k + d] - pos[3 * i + d];
+                dv[d] = vel[3 * k + d] - vel[3 * i + d];
+            }
+            real r2 = dot(dx, dx);
+            if (record) hybrid_check_pair(t, (int) i, (int) k, r2, r_vec[i] + r_vec[k]);
+
+            real r_crit = (r_hill[i] > r_hill[k]) ? r_hill[i] : r_hill[k];
+            if (r_crit <= 0.0) continue;
+
+            // minimum separation during the step
+            real v2 = dot(dv, dv);
+            real t_min = (v2 > 0.0) ? -dot(dx, dv) / v2 : 0.0;
+            if (t_min < 0.0) t_min = 0.0;
+            if (t_min > dt) t_min = dt;
+            real d2_min = 0.0;
+            for (int d = 0; d < 3; d++) d2_min += (dx[d] + t_min * dv[d]) * (dx[d] + t_min * dv[d]);
+            if (d2_min < r_crit * r_crit) {
+                in_enc[i] = 1;
+                in_enc[k] = 1;
+                n_pairs++;
+            }
+        }
+    }
+    return n_pairs;
+}
+
+// heliocentric accelerations of the interactions that are not included in the drift of an encounter step, i.e., all
+// the direct and indirect terms except those between two bodies of the subsystem
+static void hybrid_interaction(const real pos[], const real m_vec[], size_t N, real G, const char in_enc[], real acc[]) {
+    real ind[3] = {0.0, 0.0, 0.0};
+    real ind_enc[3] = {0.0, 0.0, 0.0};
+    for (size_t i = 0; i < 3 * N; i++) acc[i] = 0.0;
+
+    for (size_t i = 1; i < N; i++) {
+        real r = vector_norm(&pos[3 * i], 3);
+        real gm_r3 = G * m_vec[i] / (r * r * r);
+        for (int d = 0; d < 3; d++) {
+            // the term of the body itself is not part of its own indirect acceleration
+            acc[3 * i + d] += gm_r3 * pos[3 * i + d];
+            ind[d] -= gm_r3 * pos[3 * i + d];
+            if (in_enc[i]) ind_enc[d] -= gm_r3 * pos[3 * i + d];
+        }
+    }
+    for (size_t i = 1; i < N; i++) {
+        for (int d = 0; d < 3; d++) {
+            if (in_enc[i]) {
+                acc[3 * i + d] = ind[d] - ind_enc[d];
+            } else {
+                acc[3 * i + d] += ind[d];
+            }
+        }
+    }
+
+    for (size_t i = 1; i < N; i++) {
+        for (size_t k = i + 1; k < N; k++) {
+            if (in_enc[i] && in_enc[k]) continue;
+            real dx[3];
+            for (int d = 0; d < 3; d++) dx[d] = pos[3 * k + d] - pos[3 * i + d];
+            real r = vector_norm(dx, 3);
+            real g_r3 = G / (r * r * r);
+            for (int d = 0; d < 3; d++) {
+                acc[3 * i + d] += m_vec[k] * g_r3 * dx[d];
+                acc[3 * k + d] -= m_vec[i] * g_r3 * dx[d];
+            }
+        }
+    }
+}
+
+// the accelerations of the subsystem, with the signature of a radau_force (the velocities are not used)
+static size_t hybrid_gravity(const real pos[], const real vel[], size_t n, real G, const real m[], const real radii[],
+                             int sources, real acc[]) {
+    return calculate_gravity(pos, n, G, m, radii, sources, acc);
+}
+
+// integrates the subsystem over dt with the Gauss-Radau15 scheme, ending exactly at t + dt; ids[] are the indices of
+// the bodies in the global state, used to record the close encounters and collisions
+static void hybrid_subsystem(real *y0, real *dy0, const real *m, const real *radii, const int *ids, size_t n, real G,
+                             real t, real dt) {
+    ABIE_RADAU_DIM = 3 * n;
+    size_t ws = workspace_mark();
+    real *ddy0 = (real *) workspace_alloc(ABIE_RADAU_DIM * sizeof(real));
+    real *y = (real *) workspace_alloc(ABIE_RADAU_DIM * sizeof(real));
+    real *dy = (real *) workspace_alloc(ABIE_RADAU_DIM * sizeof(real));
+    real *db6 = (real *) workspace_alloc(ABIE_RADAU_DIM * sizeof(real));
+    real *ddy = (real *) workspace_alloc(ABIE_RADAU_DIM * sizeof(real));
+    real (*bs0)[ABIE_RADAU_DIM] = (real(*)[ABIE_RADAU_DIM]) workspace_alloc(sizeof(real[nh - 1][ABIE_RADAU_DIM]));
+    real (*bs)[ABIE_RADAU_DIM] = (real(*)[ABIE_RADAU_DIM]) workspace_alloc(sizeof(real[nh - 1][ABIE_RADAU_DIM]));
+    real (*g)[ABIE_RADAU_DIM] = (real(*)[ABIE_RADAU_DIM]) workspace_alloc(sizeof(real[nh - 1][ABIE_RADAU_DIM]));
+    real (*E)[ABIE_RADAU_DIM] = (real(*)[ABIE_RADAU_DIM]) workspace_alloc(sizeof(real[nh - 1][ABIE_RADAU_DIM]));
+    real (*ddys)[ABIE_RADAU_DIM] = (real(*)[ABIE_RADAU_DIM]) workspace_alloc(sizeof(real[nh][ABIE_RADAU_DIM]));
+
+    for (int j = 0; j < nh - 1; j++) {
+        for (int i = 0; i < ABIE_RADAU_DIM; i++) {
+            bs0[j][i] = 0.0;
+            bs[j][i] = 0.0;
+            g[j][i] = 0.0;
+            E[j][i] = 0.0;
+        }
+    }
+    calculate_gravity(y0, n, G, m, radii, SOURCES_ALL, ddy0);
+
+    // initial step: a small fraction of the shortest dynamical time of the pairs
+    real h = dt;
+    for (size_t i = 0; i < n; i++) {
+        for (size_t k = i + 1; k < n; k++) {
+            real dx[3];
+            for (int d = 0; d < 3; d++) dx[d] = y0[3 * k + d] - y0[3 * i + d];
+            real r = vector_norm(dx, 3);
+            if (m[i] + m[k] <= 0.0) continue;
+            real t_dyn = 0.1 * sqrt(r * r * r / (G * (m[i] + m[k])));
+            if (t_dyn < h) h = t_dyn;
+        }
+    }
+
+    real t_sub = 0.0;
+    int step_loop_count = 0;
+    int step_loop_max = 100;
+    int done = 0;
+    while (!done) {
+        if (h < h_min) h = h_min;
+        int last = (h >= dt - t_sub);
+        if (last) h = dt - t_sub;
+
+        real dtreq;
+        real err = radau_step(hybrid_gravity, n, G, m, radii, SOURCES_ALL, y0, dy0, ddy0, h, bs0, bs, g, ddys, db6, y,
+                              dy, ddy, &dtreq);
+
+        if (err <= 1 || step_loop_count > step_loop_max) {
+            t_sub = last ? dt : t_sub + h;
+            done = last;
+            step_loop_count = 0;
+            for (int i = 0; i < ABIE_RADAU_DIM; i++) {
+                y0[i] = y[i];
+                dy0[i] = dy[i];
+                ddy0[i] = ddy[i];
+            }
+            for (int j = 0; j < nh - 1; j++) {
+                for (int i = 0; i < ABIE_RADAU_DIM; i++) bs0[j][i] = bs[j][i];
+            }
+            refine_bs(bs, dtreq / h, E, n);
+
+            // the events at the end of the step are recorded by the caller
+            if (!done) {
+                for (size_t i = 0; i < n; i++) {
+                    for (size_t k = i + 1; k < n; k++) {
+                        real dx[3];
+                        for (int d = 0; d < 3; d++) dx[d] = y0[3 * k + d] - y0[3 * i + d];
+                        hybrid_check_pair(t + t_sub, ids[i], ids[k], dot(dx, dx), radii[i] + radii[k]);
+                    }
+                }
+            }
+        } else {
+            step_loop_count += 1;
+        }
+        h = radau_next_step(h, dtreq);
+    }
+
+    workspace_release(ws);
+}
+
+// kick - drift - kick step with the encountering bodies integrated together with the central body
+static void hybrid_encounter_step(real *pos, real *vel, real *m_vec, real *r_vec, size_t N, real G, real t, real dt,
+                                  const char in_enc[], real acc[], real y_sub[], real v_sub[], real m_sub[],
+                                  real r_sub[], int ids[]) {
+    hybrid_interaction(pos, m_vec, N, G, in_enc, acc);
+    for (size_t i = 3; i < 3 * N; i++) vel[i] += 0.5 * dt * acc[i];
+
+    // the other bodies move on Kepler orbits about the central body
+    for (size_t i = 1; i < N; i++) {
+        if (!in_enc[i]) propagate_kepler(pos, vel, G * (m_vec[0] + m_vec[i]), dt, N, i);
+    }
+
+    // the subsystem, starting with the central body at rest at the origin
+    size_t n = 0;
+    for (size_t i = 0; i < N; i++) {
+        if (i > 0 && !in_enc[i]) continue;
+        for (int d = 0; d < 3; d++) {
+            y_sub[3 * n + d] = (i > 0) ? pos[3 * i + d] : 0.0;
+            v_sub[3 * n + d] = (i > 0) ? vel[3 * i + d] : 0.0;
+        }
+        m_sub[n] = m_vec[i];
+        r_sub[n] = r_vec[i];
+        ids[n] = (int) i;
+        n++;
+    }
+    hybrid_subsystem(y_sub, v_sub, m_sub, r_sub, ids, n, G, t, dt);
+    for (size_t s = 1; s < n; s++) {
+        int i = ids[s];
+        for (int d = 0; d < 3; d++) {
+            pos[3 * i + d] = y_sub[3 * s + d] - y_sub[d];
+            vel[3 * i + d] = v_sub[3 * s + d] - v_sub[d];
+        }
+    }
+
+    hybrid_interaction(pos, m_vec, N, G, in_enc, acc);
+    for (size_t i = 3; i < 3 * N; i++) vel[i] += 0.5 * dt * acc[i];
+}
+
+size_t integrator_hybrid(real *pos, real *vel, real *m_vec, real *r_vec, size_t N, real G, double _t, double _t_end, double _dt, double hill_factor) {
+    real t = (real) _t;
+    real t_end = (real) _t_end;
+    real h = (_dt > 0) ? (real) _dt : t_end - t;
+    if (t_end <= t) return EXIT_NORMAL;
+
+    size_t ws = workspace_mark();
+    real *jacobi_pos = (real *) workspace_alloc(3 * N * sizeof(real));
+    real *jacobi_vel = (real *) workspace_alloc(3 * N * sizeof(real));
+    real *accel = (real *) workspace_alloc(3 * N * sizeof(real));
+    real *acc_int = (real *) workspace_alloc(3 * N * sizeof(real));
+    real *y_sub = (real *) workspace_alloc(3 * N * sizeof(real));
+    real *v_sub = (real *) workspace_alloc(3 * N * sizeof(real));
+    real *m_sub = (real *) workspace_alloc(N * sizeof(real));
+    real *r_sub = (real *) workspace_alloc(N * sizeof(real));
+    real *r_hill = (real *) workspace_alloc(N * sizeof(real));
+    real *chi = (real *) workspace_alloc(N * sizeof(real));
+    for (size_t i = 0; i < N; i++) chi[i] = 0.0;
+    int *ids = (int *) workspace_alloc(N * sizeof(int));
+    char *in_enc = (char *) workspace_alloc(N * sizeof(char));
+
+    // the central body is at rest at the origin of the heliocentric frame
+    for (int d = 0; d < 3; d++) {
+        pos[d] = 0.0;
+        vel[d] = 0.0;
+    }
+
+    // the accelerations of the Wisdom-Holman map are only valid after a regular step
+    int accel_valid = 0;
+    size_t integrator_flag = EXIT_NORMAL;
+    size_t n_pairs = hybrid_scan(pos, vel, m_vec, r_vec, N, h, hill_factor, t, 0, r_hill, in_enc);
+    while (t < t_end) {
+        real dt = (t + h > t_end) ? t_end - t : h;
+        if (n_pairs == 0) {
+            if (!accel_valid) {
+                helio2jacobi(pos, vel, m_vec, N, jacobi_pos, jacobi_vel);
+                compute_accel(pos, jacobi_pos, m_vec, N, G, accel);
+                accel_valid = 1;
+            }
+            wh_advance_step(pos, vel, jacobi_pos, jacobi_vel, t, dt, m_vec, N, accel, G, chi);
+        } else {
+            hybrid_encounter_step(pos, vel, m_vec, r_vec, N, G, t, dt, in_enc, acc_int, y_sub, v_sub, m_sub, r_sub, ids);
+            accel_valid = 0;
+        }
+        t = (t + h > t_end) ? t_end : t + h;
+        t_global = t;
+
+        n_pairs = hybrid_scan(pos, vel, m_vec, r_vec, N, h, hill_factor, t, 1, r_hill, in_enc);
+        if ((MAX_N_CE > 0) && (n_close_encounters >= MAX_N_CE)) integrator_flag = EXIT_MAX_N_CE_EXCEEDED;
+        else if ((MAX_N_COLLISIONS > 0) && (n_collisions >= MAX_N_COLLISIONS)) integrator_flag = EXIT_MAX_N_COLLISIONS_EXCEEDED;
+        if (integrator_flag > 0) break;
+    }
+
+    workspace_release(ws);
+    return integrator_flag;
+}
@@ -0,0 +1,22 @@
+#ifndef INTEGRATOR_HYBRID
+#define INTEGRATOR_HYBRID
+
+// Radau building blocks, defined in integrator_gauss_radau15.c
+extern int nh;
+extern real h_min;
+void refine_bs(real b[][ABIE_RADAU_DIM], real q, real E[][ABIE_RADAU_DIM], size_t N);
+real radau_step(radau_force force, size_t N, real G, const real masses[], const real radii[], int sources,
+                const real y0[], const real dy0[], const real ddy0[], real h, real bs0[][ABIE_RADAU_DIM],
+                real bs[][ABIE_RADAU_DIM], real g[][ABIE_RADAU_DIM], real ddys[][ABIE_RADAU_DIM], real db6[], real y[],
+                real dy[], real ddy[], real *dtreq);
+real radau_next_step(real h, real dtreq);
+
+// Wisdom-Holman building blocks, defined in integrator_wisdom_holman.c
+void propagate_kepler(real *jacobi_pos, real *jacobi_vel, real gm, real dt, size_t N, size_t particle_id);
+void helio2jacobi(real *pos, real *vel, real *masses, size_t nbodies, real *jacobi_pos, real *jacobi_vel);
+void compute_accel(real *pos, real *jacobi_pos, real *masses, size_t nbodies, real G, real *accel);
+void wh_advance_step(real *pos, real *vel, real *jacobi_pos, real *jacobi_vel, real t, real dt, real *masses, size_t nbodies, real *accel, real G, real *chi);
+
+size_t integrator_hybrid(real *pos, real *vel, real *m_vec, real *r_vec, size_t N, real G, double _t, double _t_end, double _dt, double hill_factor);
+
+#endif
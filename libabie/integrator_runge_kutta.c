@@ -1,36 +1,43 @@
 #include "common.h"
 #include "integrator_runge_kutta.h"
 
+// the derivatives of the first-order system vec = (pos, vel), using the force method selected by the user
+static void rk_derivatives(real *vec, size_t N, real G, real *masses, real *radii, int sources, real *dxdt) {
+    for (size_t i = 0; i < 3 * N; i++) dxdt[i] = vec[3 * N + i];
+    calculate_accelerations(vec, &vec[3 * N], N, G, masses, radii, sources, &dxdt[3 * N]);
+}
+
 // vec is the combination of pos+vel
 // void integrator_runge_kutta(real *vec, size_t N, real G, real dt, const real *masses) {
-void integrate_rk(real *y0, real *dy0, real *masses, real *radii, size_t N, real G, real t, real t_end, real dt) {
-    real *k1 = (real *) malloc(6*N*sizeof(real));
-    real *k2 = (real *) malloc(6*N*sizeof(real));
-    real *k3 = (real *) malloc(6*N*sizeof(real));
-    real *k4 = (real *) malloc(6*N*sizeof(real));
-    real *vec_tmp = (real *) malloc(6*N*sizeof(real));
-    real *vec = (real *) malloc(6*N*sizeof(real));
+void integrate_rk(real *y0, real *dy0, real *masses, real *radii, size_t N, real G, real t, real t_end, real dt, int sources) {
+    size_t ws = workspace_mark();
+    real *k1 = (real *) workspace_alloc(6*N*sizeof(real));
+    real *k2 = (real *) workspace_alloc(6*N*sizeof(real));
+    real *k3 = (real *) workspace_alloc(6*N*sizeof(real));
+    real *k4 = (real *) workspace_alloc(6*N*sizeof(real));
+    real *vec_tmp = (real *) workspace_alloc(6*N*sizeof(real));
+    real *vec = (real *) workspace_alloc(6*N*sizeof(real));
 
     for (int i = 0; i < 3 * N; i++) vec[i] = y0[i];
     for (int i = 3 * N; i < 6 * N; i++) vec[i] = dy0[i - 3 * N];
 
     while (t < t_end) {
-        ode_n_body_first_order(vec, N, G, masses, k1);
+        rk_derivatives(vec, N, G, masses, radii, sources, k1);
 
         for (int i = 0; i < 6 * N; i++) {
             vec_tmp[i] = vec[i] + 0.5 * dt * k1[i];
         }
-        ode_n_body_first_order(vec_tmp, N, G, masses, k2);
+        rk_derivatives(vec_tmp, N, G, masses, radii, sources, k2);
 
         for (int i = 0; i < 6 * N; i++) {
             vec_tmp[i] = vec[i] + 0.5 * dt * k2[i];
         }
-        ode_n_body_first_order(vec_tmp, N, G, masses, k3);
+        rk_derivatives(vec_tmp, N, G, masses, radii, sources, k3);
 
         for (int i = 0; i < 6 * N; i++) {
             vec_tmp[i] = vec[i] + dt * k3[i];
         }
-        ode_n_body_first_order(vec_tmp, N, G, masses, k4);
+        rk_derivatives(vec_tmp, N, G, masses, radii, sources, k4);
 
         // advance the state
         for (int i = 0; i < 6 * N; i++) {
@@ -41,12 +48,7 @@ void integrate_rk(real *y0, real *dy0, real *masses, real *radii, size_t N, real
 
     for (int i = 0; i < 3 * N; i++) y0[i] = vec[i];
     for (int i = 3 * N; i < 6 * N; i++) dy0[i - 3 * N] = vec[i];
-    free(k1);
-    free(k2);
-    free(k3);
-    free(k4);
-    free(vec_tmp);
-    free(vec);
+    workspace_release(ws);
     return;
 }
 
@@ -54,9 +56,9 @@ void integrator_runge_kutta(real *pos, real *vel, real *m_vec, real *r_vec, size
     // allocation
     real t = (real) _t;
     real t_end = (real) _t_end;
-    dt = (real) _dt;
+    real dt = (real) _dt;
 
-    // integrate
-    integrate_rk(pos, vel, m_vec, r_vec, N, G, t, t_end, dt);
+    // integrate; the particles passed in are not assumed to be those of the simulation state, so all of them are sources
+    integrate_rk(pos, vel, m_vec, r_vec, N, G, t, t_end, dt, SOURCES_ALL);
 
 }
@@ -12,7 +12,6 @@
 // real *eps; // per-particle softening parameter
 // real t;
 // real t_end;
-double dt; // the time step specified by the user
 // real close_encounter_distance = 0.0;  // if 0, ignore close encounters
 // size_t close_encounters = 0; // number of close encounters
 
@@ -1,5 +1,8 @@
 #include "common.h"
 #include "integrator_wisdom_holman.h"
+#if OPENMP
+#include <omp.h>
+#endif
 
 /*
 ####################################################################################################
@@ -132,6 +135,139 @@ void propagate_kepler(real *jacobi_pos, real *jacobi_vel, real gm, real dt, size
 
 
 
+/*
+####################################################################################################
+# Stumpff functions C2 and C3, without trigonometric functions: the argument is reduced below 0.1 in
+# magnitude by factors of 4, the series are summed, and the quadrupling formulas are applied back.
+#
+# INPUT:
+#  - psi: universal variable
+#
+# OUTPUT:
+#  - c2, c3: auxiliary C2 and C3 functions
+#
+*/
+static inline void stumpff_c2c3(real psi, real *c2, real *c3) {
+    int n = 0;
+    real x = psi;
+    while (fabs(x) > 0.1) {
+        x *= 0.25;
+        n++;
+    }
+    real s2 = 1.0 / 2 - x * (1.0 / 24 - x * (1.0 / 720 - x * (1.0 / 40320 - x * (1.0 / 3628800 - x * (1.0 / 479001600 - x / 87178291200.0)))));
+    real s3 = 1.0 / 6 - x * (1.0 / 120 - x * (1.0 / 5040 - x * (1.0 / 362880 - x * (1.0 / 39916800 - x * (1.0 / 6227020800.0 - x / 1307674368000.0)))));
+    for (; n > 0; n--) {
+        // C0 = 1 - x C2, C1 = 1 - x C3
+        real s0 = 1.0 - x * s2;
+        real s1 = 1.0 - x * s3;
+        s3 = 0.25 * (s2 + s0 * s3);
+        s2 = 0.5 * s1 * s1;
+        x *= 4.0;
+    }
+    *c2 = s2;
+    *c3 = s3;
+}
+
+/*
+####################################################################################################
+# Propagate the Keplerian states of bodies first, ..., N - 1 at once. The bodies are solved in blocks
+# of KEPLER_BLOCK in lockstep, with a mask of the bodies that have not converged yet, and the blocks
+# are distributed over the OpenMP threads.
+#
+# INPUT:
+#  - jacobi_pos, jacobi_vel: initial states
+#  - gm: gravitational parameter of each body
+#  - dt: time step
+#  - chi: universal anomalies of the previous step, used as the initial guess if not zero
+#
+# OUTPUT:
+#  - jacobi_pos, jacobi_vel: states at t + dt
+#  - chi: universal anomalies of this step
+#
+*/
+void propagate_kepler_batch(real *jacobi_pos, real *jacobi_vel, const real gm[], real dt, size_t first, size_t N, real chi[]) {
+#if OPENMP
+#pragma omp parallel for schedule(static) if (N - first > USE_PARALLEL) copyin(abie_ctx)
+#endif
+    for (long b = (long) first; b < (long) N; b += KEPLER_BLOCK) {
+        int n = (N - b < KEPLER_BLOCK) ? (int) (N - b) : KEPLER_BLOCK;
+        real r0[KEPLER_BLOCK], rv[KEPLER_BLOCK], sqrtgm[KEPLER_BLOCK], alpha[KEPLER_BLOCK], x[KEPLER_BLOCK];
+        real psi[KEPLER_BLOCK], c2[KEPLER_BLOCK], c3[KEPLER_BLOCK], r[KEPLER_BLOCK];
+        char active[KEPLER_BLOCK];
+
+        for (int l = 0; l < n; l++) {
+            size_t i = b + l;
+            real *vr0 = &jacobi_pos[3 * i];
+            real *vv0 = &jacobi_vel[3 * i];
+            r0[l] = vector_norm(vr0, 3);
+            sqrtgm[l] = sqrt(gm[i]);
+            rv[l] = dot(vr0, vv0) / sqrtgm[l];
+            alpha[l] = 2.0 / r0[l] - dot(vv0, vv0) / gm[i];
+            if (chi != NULL && chi[i] != 0.0) {
+                x[l] = chi[i];
+            } else if (alpha[l] > tol_energy) {
+                // Elliptic orbits:
+                x[l] = sqrtgm[l] * dt * alpha[l];
+            } else if (alpha[l] < tol_energy) {
+                // Hyperbolic orbits:
+                real sma = 1.0 / alpha[l];
+                x[l] = sign(dt) * (sqrt(-sma) * log(-2.0 * gm[i] * alpha[l] * dt / (dot(vr0, vv0) + sqrt(-gm[i] * sma) * (1.0 - r0[l] * alpha[l]))));
+            } else {
+                // Parabolic orbits:
+                real cn = cross_norm(vr0, vv0);
+                real p = cn * cn / gm[i];
+                real s = 0.5 * atan(1.0 / (3.0 * sqrt(gm[i] / (p * p * p)) * dt));
+                real w = atan(pow(tan(s), 1.0 / 3.0));
+                x[l] = sqrt(p) * 2 / tan(2 * w);
+            }
+            active[l] = 1;
+        }
+
+        // Solve Kepler's equation with Newton's method:
+        int n_active = n;
+        for (size_t j = 0; j < MAX_KEPLER_ITERATION && n_active > 0; j++) {
+            n_active = 0;
+            for (int l = 0; l < n; l++) {
+                if (!active[l]) continue;
+                real x2 = x[l] * x[l];
+                psi[l] = x2 * alpha[l];
+                stumpff_c2c3(psi[l], &c2[l], &c3[l]);
+                r[l] = x2 * c2[l] + rv[l] * x[l] * (1.0 - psi[l] * c3[l]) + r0[l] * (1.0 - psi[l] * c2[l]);
+                real dx = (sqrtgm[l] * dt - x2 * x[l] * c3[l] - rv[l] * x2 * c2[l] - r0[l] * x[l] * (1.0 - psi[l] * c3[l])) / r[l];
+                x[l] += dx;
+                if (fabs(dx) < tol) {
+                    active[l] = 0;
+                } else {
+                    n_active++;
+                }
+            }
+        }
+
+        for (int l = 0; l < n; l++) {
+            size_t i = b + l;
+            if (active[l]) printf("WARNING: failed to solver Kepler's equation, particle %zu\n", i);
+            if (chi != NULL) chi[i] = x[l];
+
+            // Compute f and g functions, together with their derivatives:
+            real x2 = x[l] * x[l];
+            real f  = 1.0 - x2 / r0[l] * c2[l];
+            real g  = dt - x2 * x[l] / sqrtgm[l] * c3[l];
+            real dg = 1.0 - x2 / r[l] * c2[l];
+            real df = sqrtgm[l] / (r[l] * r0[l]) * x[l] * (psi[l] * c3[l] - 1.0);
+
+            // Propagate states:
+            for (size_t d = 0; d < 3; d++) {
+                real vr0 = jacobi_pos[3 * i + d];
+                real vv0 = jacobi_vel[3 * i + d];
+                jacobi_pos[3 * i + d] = f * vr0 + g * vv0;
+                jacobi_vel[3 * i + d] = df * vr0 + dg * vv0;
+            }
+        }
+    }
+    return;
+}
+
+
 /*
 ####################################################################################################
 # Apply momentum kick following the Wisdom-Holman mapping strategy.
@@ -165,27 +301,27 @@ void wh_kick(real *vel, real dt, real *masses, size_t nbodies, real *accel) {
 #  - masses: masses of the bodies
 #  - nbodies: number of bodies
 #  - G: gravitational constant
+#  - chi: universal anomalies of the previous drift (see propagate_kepler_batch)
 #
 # OUTPUT:
 #  - drift: state at t + dt after drift
 #
 */
-void wh_drift(real *jacobi_pos, real *jacobi_vel, real dt, real *masses, size_t nbodies, real G) {
+void wh_drift(real *jacobi_pos, real *jacobi_vel, real dt, real *masses, size_t nbodies, real G, real *chi) {
 
-    // Propagate each body assuming Keplerina motion:
+    // Compute the equivalent GM of each body from the interior masses:
+    size_t ws = workspace_mark();
+    real *gm = (real *) workspace_alloc(nbodies * sizeof(real));
     real eta0 = masses[0];
     for (size_t i = 1; i < nbodies; i++) {
-        // Interior mass:
         real eta = eta0 + masses[i];
-
-        // Compute equivalent GM:
-        real gm = G * masses[0] * eta / eta0;
-
-        // Propagate:
-        propagate_kepler(jacobi_pos, jacobi_vel, gm, dt, nbodies, i);
-
+        gm[i] = G * masses[0] * eta / eta0;
         eta0 = eta;
     }
+
+    // Propagate all bodies assuming Keplerian motion:
+    propagate_kepler_batch(jacobi_pos, jacobi_vel, gm, dt, 1, nbodies, chi);
+    workspace_release(ws);
     return;
 }
 
@@ -206,7 +342,8 @@ void helio2jacobi(real *pos, real *vel, real *masses, size_t nbodies, real *jaco
 
 
     // Compute eta (interior masses):
-    real eta[nbodies];
+    size_t ws = workspace_mark();
+    real *eta = (real *) workspace_alloc(nbodies * sizeof(real));
     eta[0] = masses[0];
     for (size_t i = 1; i < nbodies; i++) {
         eta[i] = masses[i] + eta[i - 1];
@@ -260,6 +397,7 @@ void helio2jacobi(real *pos, real *vel, real *masses, size_t nbodies, real *jaco
             Vi[2] = auxV[2] / eta[i];
         }
     }
+    workspace_release(ws);
     return;
 }
 
@@ -283,7 +421,8 @@ void jacobi2helio(real *jacobi_pos, real *jacobi_vel, real *masses, size_t nbodi
     vel[3] = jacobi_vel[3]; vel[4] = jacobi_vel[4]; vel[5] = jacobi_vel[5];
 
     // Compute etas (interior masses):
-    real eta[nbodies];
+    size_t ws = workspace_mark();
+    real *eta = (real *) workspace_alloc(nbodies * sizeof(real));
     eta[0] = masses[0];
     for (size_t i = 1; i < nbodies; i++) {
         eta[i] = masses[i] + eta[i - 1];
@@ -327,6 +466,7 @@ void jacobi2helio(real *jacobi_pos, real *jacobi_vel, real *masses, size_t nbodi
         for (size_t i = 0; i < 3; i++) {
         }
     }
+    workspace_release(ws);
     return;
 }
 
@@ -349,12 +489,11 @@ void compute_accel(real *pos, real *jacobi_pos, real *masses, size_t nbodies, re
 
     // Allocate:
     // accel = np.zeros(nbodies * 3)
+    size_t ws = workspace_mark();
 
     // Acceleration of first body is assumed zero:
-    real inv_r3helio[nbodies];
-    real inv_r3jac[nbodies];
-    // real inv_rhelio[nbodies];
-    // real inv_rjac[nbodies];
+    real *inv_r3helio = (real *) workspace_alloc(nbodies * sizeof(real));
+    real *inv_r3jac = (real *) workspace_alloc(nbodies * sizeof(real));
     real *inv_rhelio = inv_r3helio;
     real *inv_rjac = inv_r3jac;
     for (size_t i = 0; i < nbodies; i++) {
@@ -372,7 +511,7 @@ void compute_accel(real *pos, real *jacobi_pos, real *masses, size_t nbodies, re
     }
 
     // Compute all indirect terms at once:
-    real accel_ind[3 * nbodies];
+    real *accel_ind = (real *) workspace_alloc(3 * nbodies * sizeof(real));
     real accel_ind_tmp[3];
     accel_ind_tmp[0] = 0.0; accel_ind_tmp[1] = 0.0; accel_ind_tmp[2] = 0.0;
     for (size_t i = 0; i < 3 * nbodies; i++) accel_ind[i] = 0.0;
@@ -387,7 +526,7 @@ void compute_accel(real *pos, real *jacobi_pos, real *masses, size_t nbodies, re
 
 
     // Compute contribution from central body:
-    real accel_cent[3 * nbodies];
+    real *accel_cent = (real *) workspace_alloc(3 * nbodies * sizeof(real));
     for (size_t i = 0; i < 3 * nbodies; i++) accel_cent[i] = 0.0;
     for (size_t i = 2; i < nbodies; i++) {
         accel_cent[3 * i] = G * masses[0] * (jacobi_pos[3 * i] * inv_r3jac[i] - pos[3 * i] * inv_r3helio[i]);
@@ -396,7 +535,7 @@ void compute_accel(real *pos, real *jacobi_pos, real *masses, size_t nbodies, re
     }
 
     // Compute third part of the Hamiltonian:
-    real accel2[3 * nbodies];
+    real *accel2 = (real *) workspace_alloc(3 * nbodies * sizeof(real));
     for (size_t i = 0; i < 3 * nbodies; i++) accel2[i] = 0.0;
     real etai = masses[0];
     for (size_t i = 2; i < nbodies; i++) {
@@ -407,7 +546,7 @@ void compute_accel(real *pos, real *jacobi_pos, real *masses, size_t nbodies, re
     }
 
     // Compute final part of the Hamiltonian:
-    real accel3[3 * nbodies];
+    real *accel3 = (real *) workspace_alloc(3 * nbodies * sizeof(real));
 
     for (size_t i = 0; i < 3 * nbodies; i++)
         accel3[i] = 0.0;
@@ -415,23 +554,36 @@ void compute_accel(real *pos, real *jacobi_pos, real *masses, size_t nbodies, re
 #if OPENMP
     if (nbodies > USE_PARALLEL)
     {
-#pragma omp parallel for reduction(+: accel3[:3*nbodies]) schedule(dynamic)
-        for (size_t i = 1; i < nbodies - 1; i++) {
-            for (size_t j = i + 1; j < nbodies; j++) {
-                real diff[3];
-
-                diff[0] = pos[3 * j] - pos[3 * i];
-                diff[1] = pos[3 * j + 1] - pos[3 * i + 1];
-                diff[2] = pos[3 * j + 2] - pos[3 * i + 2];
-                real aux = G / pow(vector_norm(diff, 3), 3.0);
-                accel3[3 * j] -= masses[i] * aux * diff[0];
-                accel3[3 * j + 1] -= masses[i] * aux * diff[1];
-                accel3[3 * j + 2] -= masses[i] * aux * diff[2];
-                accel3[3 * i] += masses[j] * aux * diff[0];
-                accel3[3 * i + 1] += masses[j] * aux * diff[1];
-                accel3[3 * i + 2] += masses[j] * aux * diff[2];
+        // every thread accumulates its pairs in its own slice of the workspace, and the slices are summed up
+        // afterwards; this replaces the array reduction, which would place a private copy of accel3 on the stack of
+        // every thread
+        int n_threads = omp_get_max_threads();
+        real *accel3_thr = (real *) workspace_alloc(n_threads * 3 * nbodies * sizeof(real));
+        for (size_t i = 0; i < n_threads * 3 * nbodies; i++) accel3_thr[i] = 0.0;
+#pragma omp parallel copyin(abie_ctx)
+        {
+            real *acc_thr = &accel3_thr[3 * nbodies * omp_get_thread_num()];
+#pragma omp for schedule(dynamic)
+            for (size_t i = 1; i < nbodies - 1; i++) {
+                for (size_t j = i + 1; j < nbodies; j++) {
+                    real diff[3];
+
+                    diff[0] = pos[3 * j] - pos[3 * i];
+                    diff[1] = pos[3 * j + 1] - pos[3 * i + 1];
+                    diff[2] = pos[3 * j + 2] - pos[3 * i + 2];
+                    real aux = G / pow(vector_norm(diff, 3), 3.0);
+                    acc_thr[3 * j] -= masses[i] * aux * diff[0];
+                    acc_thr[3 * j + 1] -= masses[i] * aux * diff[1];
+                    acc_thr[3 * j + 2] -= masses[i] * aux * diff[2];
+                    acc_thr[3 * i] += masses[j] * aux * diff[0];
+                    acc_thr[3 * i + 1] += masses[j] * aux * diff[1];
+                    acc_thr[3 * i + 2] += masses[j] * aux * diff[2];
+                }
             }
         }
+        for (int n = 0; n < n_threads; n++) {
+            for (size_t i = 0; i < 3 * nbodies; i++) accel3[i] += accel3_thr[3 * nbodies * n + i];
+        }
     }
     else
 #endif
@@ -459,6 +611,7 @@ void compute_accel(real *pos, real *jacobi_pos, real *masses, size_t nbodies, re
         accel[i] = accel_ind[i] + accel_cent[i] + accel2[i] + accel3[i];
     }
 
+    workspace_release(ws);
     return;
 }
 
@@ -474,13 +627,14 @@ void compute_accel(real *pos, real *jacobi_pos, real *masses, size_t nbodies, re
 #  - nbodies: number of bodies
 #  - accel: acceleration from H_interaction
 #  - G: gravitational constant
+#  - chi: universal anomalies of the previous step
 #
 # OUTPUT:
 #  - helio: heliocentric state at t + dt
 #  - accel: updated acceleration at dt
 #
 */
-void wh_advance_step(real *pos, real *vel, real *jacobi_pos, real *jacobi_vel, real t, real dt, real *masses, size_t nbodies, real *accel, real G){
+void wh_advance_step(real *pos, real *vel, real *jacobi_pos, real *jacobi_vel, real t, real dt, real *masses, size_t nbodies, real *accel, real G, real *chi){
 
     // Kick:
     wh_kick(vel, dt / 2, masses, nbodies, accel);
@@ -489,7 +643,7 @@ void wh_advance_step(real *pos, real *vel, real *jacobi_pos, real *jacobi_vel, r
     helio2jacobi(pos, vel, masses, nbodies, jacobi_pos, jacobi_vel);
 
     // Drift
-    wh_drift(jacobi_pos, jacobi_vel, dt, masses, nbodies, G);
+    wh_drift(jacobi_pos, jacobi_vel, dt, masses, nbodies, G, chi);
 
     // Convert from Jacobi to heliocentric for kicking:
     jacobi2helio(jacobi_pos, jacobi_vel, masses, nbodies, pos, vel);
@@ -503,6 +657,64 @@ void wh_advance_step(real *pos, real *vel, real *jacobi_pos, real *jacobi_vel, r
     return;
 }
 
+/*
+ * The state of the map is kept between the calls: the Jacobi coordinates, the acceleration at the current positions
+ * and the universal anomalies of the last drift. A call that continues the previous one resumes the map from them,
+ * and the closing half kick of the last step is left pending until the state is read (get_state), so that the map runs
+ * through the output times as if it were not interrupted. The state is discarded by set_state(), and when the
+ * positions, velocities or time passed in do not match the state returned by the previous call (e.g., the state was
+ * edited in the buffers of the caller). The state is kept in the simulation context (see context.h).
+ */
+#define wh_n (abie_ctx->wisdom_holman.n)
+#define wh_warm (abie_ctx->wisdom_holman.warm)
+#define wh_pending (abie_ctx->wisdom_holman.pending)
+#define wh_t (abie_ctx->wisdom_holman.t)
+#define wh_dt (abie_ctx->wisdom_holman.dt)
+#define wh_masses (abie_ctx->wisdom_holman.masses)
+#define wh_jacobi_pos (abie_ctx->wisdom_holman.jacobi_pos)
+#define wh_jacobi_vel (abie_ctx->wisdom_holman.jacobi_vel)
+#define wh_accel (abie_ctx->wisdom_holman.accel)
+#define wh_chi (abie_ctx->wisdom_holman.chi)
+#define wh_pos_out (abie_ctx->wisdom_holman.pos_out)
+#define wh_vel_out (abie_ctx->wisdom_holman.vel_out)
+
+void wisdom_holman_reset() {
+    wh_warm = 0;
+    wh_pending = 0;
+}
+
+void wisdom_holman_finalize() {
+    if (wh_n == 0) return;
+    free(wh_jacobi_pos); free(wh_jacobi_vel); free(wh_accel); free(wh_chi);
+    free(wh_pos_out); free(wh_vel_out);
+    wh_n = 0;
+    wisdom_holman_reset();
+}
+
+// apply the pending half kick, if any, to the velocities of the state
+void wisdom_holman_synchronize(real *vel, size_t N) {
+    if (!wh_pending || N != wh_n) return;
+    wh_kick(vel, wh_dt / 2, (real *) wh_masses, N, wh_accel);
+    wh_pending = 0;
+    // the synchronized velocities continue the map as well
+    for (size_t i = 0; i < 3 * N; i++) wh_vel_out[i] = vel[i];
+}
+
+static int wisdom_holman_continues(const real *pos, const real *vel, const real *m_vec, size_t N, real t) {
+    if (!wh_warm || wh_n != N || wh_t != t || wh_masses != m_vec) return 0;
+    for (size_t i = 0; i < 3 * N; i++) {
+        if (wh_pos_out[i] != pos[i] || wh_vel_out[i] != vel[i]) return 0;
+    }
+    return 1;
+}
+
+// synchronized copy of the velocities, which leaves the pending half kick in place
+void wisdom_holman_velocities(const real *vel, size_t N, real *vel_sync) {
+    for (size_t i = 0; i < 3 * N; i++) vel_sync[i] = vel[i];
+    if (!wh_pending || N != wh_n) return;
+    wh_kick(vel_sync, wh_dt / 2, (real *) wh_masses, N, wh_accel);
+}
+
 /*
 ####################################################################################################
 # Propagate orbit using the WH symplectic mapping.
@@ -523,27 +735,58 @@ void wh_advance_step(real *pos, real *vel, real *jacobi_pos, real *jacobi_vel, r
 #
 */
 void integrator_wisdom_holman(real *pos, real *vel, real *m_vec, real *r_vec, size_t N, real _G, real _t, real _t_end, real _dt) {
-    // allocation
-    real jacobi_pos[3 * N];
-    real jacobi_vel[3 * N];
-    real accel[3 * N];
-
-    // Initialize: compute Jacobi coordinates and initial acceleration:
-    for (size_t i = 0; i < 3 * N; i++) accel[i] = 0.0;
-    for (size_t i = 0; i < 3 * N; i++) jacobi_pos[i] = 0.0;
-    for (size_t i = 0; i < 3 * N; i++) jacobi_vel[i] = 0.0;
+    int warm = wisdom_holman_continues(pos, vel, m_vec, N, _t);
 
-    helio2jacobi(pos, vel, m_vec, N, jacobi_pos, jacobi_vel);
-    compute_accel(pos, jacobi_pos, m_vec, N, _G, accel);
+    // allocation
+    if (wh_n != N) {
+        wisdom_holman_finalize();
+        wh_jacobi_pos = (real *) malloc(3 * N * sizeof(real));
+        wh_jacobi_vel = (real *) malloc(3 * N * sizeof(real));
+        wh_accel = (real *) malloc(3 * N * sizeof(real));
+        wh_chi = (real *) malloc(N * sizeof(real));
+        wh_pos_out = (real *) malloc(3 * N * sizeof(real));
+        wh_vel_out = (real *) malloc(3 * N * sizeof(real));
+        wh_n = N;
+    }
+    real *jacobi_pos = wh_jacobi_pos;
+    real *jacobi_vel = wh_jacobi_vel;
+    real *accel = wh_accel;
+    real *chi = wh_chi;
+
+    if (!warm) {
+        // Initialize: compute Jacobi coordinates and initial acceleration:
+        for (size_t i = 0; i < 3 * N; i++) accel[i] = 0.0;
+        for (size_t i = 0; i < N; i++) chi[i] = 0.0;
+        for (size_t i = 0; i < 3 * N; i++) jacobi_pos[i] = 0.0;
+        for (size_t i = 0; i < 3 * N; i++) jacobi_vel[i] = 0.0;
+
+        helio2jacobi(pos, vel, m_vec, N, jacobi_pos, jacobi_vel);
+        compute_accel(pos, jacobi_pos, m_vec, N, _G, accel);
+        wh_pending = 0;
+    }
 
     // Main loop:
     while (_t < _t_end) {
-        // Advance one step:
-        wh_advance_step(pos, vel, jacobi_pos, jacobi_vel, _t, _dt, m_vec, N, accel, _G);
+        // Advance one step; the closing half kick of the previous step and the opening half kick of this step are
+        // applied together:
+        wh_kick(vel, _dt / 2 + (wh_pending ? wh_dt / 2 : 0.0), m_vec, N, accel);
+        helio2jacobi(pos, vel, m_vec, N, jacobi_pos, jacobi_vel);
+        wh_drift(jacobi_pos, jacobi_vel, _dt, m_vec, N, _G, chi);
+        jacobi2helio(jacobi_pos, jacobi_vel, m_vec, N, pos, vel);
+        compute_accel(pos, jacobi_pos, m_vec, N, _G, accel);
+        wh_pending = 1;
+        wh_dt = _dt;
 
         // Advance time:
         _t += _dt;
         t_global = _t;
     }
+    for (size_t i = 0; i < 3 * N; i++) {
+        wh_pos_out[i] = pos[i];
+        wh_vel_out[i] = vel[i];
+    }
+    wh_t = _t;
+    wh_masses = m_vec;
+    wh_warm = 1;
     return;
 }
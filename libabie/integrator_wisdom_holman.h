@@ -10,6 +10,10 @@ real tol = 1e-12;
 // ideally 0:
 real tol_energy = 0.0;
 size_t MAX_KEPLER_ITERATION = 500;
+
+// Number of bodies solved in lockstep by the batched Kepler solver
+#define KEPLER_BLOCK 8
+
 void integrator_wisdom_holman(real *pos, real *vel, real *m_vec, real *r_vec, size_t N, real _G, real _t, real _t_end, real _dt);
 
 #endif
@@ -0,0 +1,162 @@
+#include <stdint.h>
+#include "common.h"
+
+/*
+ * Broad phase of the collision and close encounter detection.
+ *
+ * The detection only needs the pairs of particles closer than a range: the larger of close_encounter_distance and
+ * the sum of the two largest radii. Instead of testing all N (N - 1) / 2 pairs after every step, the candidate pairs
+ * are kept in a Verlet neighbour list of the pairs closer than
+ *      cutoff = range * (1 + NEIGHBOUR_SKIN)
+ * The pairs are found with a uniform grid of cubic cells with a side of cutoff, so that the neighbours of a particle
+ * are in the 27 cells around it; the occupied cells are stored in a hash table of linked lists. The list remains
+ * valid as long as
+ *      range + 2 * dmax <= cutoff
+ * where dmax is the largest displacement of a particle since the list was built, and is only rebuilt after the
+ * particles moved by a fraction of the range. Building the list and checking its pairs cost O(N) in disks and rings,
+ * where a particle has few neighbours within the range.
+ *
+ * The list is not used if the particles are crowded on the scale of the range (more than NEIGHBOUR_MAX_PAIRS pairs
+ * per particle), where testing all pairs is cheaper.
+ */
+
+#define NEIGHBOUR_SKIN 0.5          // margin of the neighbour list, relative to the range
+#define NEIGHBOUR_MAX_PAIRS 64      // largest number of pairs per particle in the list
+#define CELL_COORD_MAX 1.0e15       // the cell coordinates are clamped to remain exact in integers
+
+// the neighbour list, kept in the simulation context
+#define neighbour_list (abie_ctx->neighbours)
+
+static void cell_of(const real x[3], real inv_cell, int64_t cell[3]) {
+    for (int d = 0; d < 3; d++) {
+        double u = floor((double) (x[d] * inv_cell));
+        if (u > CELL_COORD_MAX) u = CELL_COORD_MAX;
+        if (u < -CELL_COORD_MAX) u = -CELL_COORD_MAX;
+        cell[d] = (int64_t) u;
+    }
+}
+
+static size_t cell_hash(const int64_t cell[3], size_t mask) {
+    uint64_t h = ((uint64_t) cell[0] * 73856093u) ^ ((uint64_t) cell[1] * 19349663u) ^ ((uint64_t) cell[2] * 83492791u);
+    return (size_t) (h ^ (h >> 32)) & mask;
+}
+
+/*
+ * Visit the neighbours k > j of particle j closer than the cutoff. With list == NULL, the neighbours are only counted;
+ * otherwise they are written to list. Returns the number of neighbours, or stops counting beyond max_n.
+ */
+static size_t find_neighbours(const real *vec, int j, const int64_t *cell, const int *head, const int *next,
+                              size_t mask, real cutoff2, int *list, size_t max_n) {
+    size_t n = 0;
+    int64_t c[3];
+    for (int64_t cx = -1; cx <= 1; cx++)
+        for (int64_t cy = -1; cy <= 1; cy++)
+            for (int64_t cz = -1; cz <= 1; cz++) {
+                c[0] = cell[3 * j] + cx;
+                c[1] = cell[3 * j + 1] + cy;
+                c[2] = cell[3 * j + 2] + cz;
+                // several cells may share a bucket: the particles of other cells are skipped
+                for (int k = head[cell_hash(c, mask)]; k >= 0; k = next[k]) {
+                    if (k <= j || cell[3 * k] != c[0] || cell[3 * k + 1] != c[1] || cell[3 * k + 2] != c[2]) continue;
+                    real dx = vec[3 * j] - vec[3 * k];
+                    real dy = vec[3 * j + 1] - vec[3 * k + 1];
+                    real dz = vec[3 * j + 2] - vec[3 * k + 2];
+                    if (dx * dx + dy * dy + dz * dz > cutoff2) continue;
+                    if (list != NULL) list[n] = k;
+                    if (++n > max_n) return n;
+                }
+            }
+    return n;
+}
+
+static int neighbour_list_build(const real *vec, size_t N, real cutoff) {
+    size_t ws = workspace_mark();
+    size_t n_buckets = 1;
+    while (n_buckets < 2 * N) n_buckets <<= 1;
+    int *head = (int *) workspace_alloc(n_buckets * sizeof(int));
+    int *next = (int *) workspace_alloc(N * sizeof(int));
+    int64_t *cell = (int64_t *) workspace_alloc(3 * N * sizeof(int64_t));
+    real inv_cell = 1.0 / cutoff;
+    real cutoff2 = cutoff * cutoff;
+
+    for (size_t b = 0; b < n_buckets; b++) head[b] = -1;
+    for (size_t i = 0; i < N; i++) {
+        cell_of(&vec[3 * i], inv_cell, &cell[3 * i]);
+        size_t b = cell_hash(&cell[3 * i], n_buckets - 1);
+        next[i] = head[b];
+        head[b] = (int) i;
+    }
+
+    if (neighbour_list.cap_n < N) {
+        neighbour_list.pos = (real *) realloc(neighbour_list.pos, 3 * N * sizeof(real));
+        neighbour_list.start = (int *) realloc(neighbour_list.start, (N + 1) * sizeof(int));
+        neighbour_list.cap_n = N;
+    }
+    // count the neighbours of every particle, giving up if the particles are too crowded
+    size_t max_pairs = NEIGHBOUR_MAX_PAIRS * N;
+    size_t n_pairs = 0;
+    neighbour_list.start[0] = 0;
+    for (size_t j = 0; j < N; j++) {
+        n_pairs += find_neighbours(vec, (int) j, cell, head, next, n_buckets - 1, cutoff2, NULL, max_pairs - n_pairs);
+        if (n_pairs > max_pairs) {
+            neighbour_list.n = 0;
+            workspace_release(ws);
+            return 0;
+        }
+        neighbour_list.start[j + 1] = (int) n_pairs;
+    }
+    if (neighbour_list.cap_list < n_pairs) {
+        neighbour_list.list = (int *) realloc(neighbour_list.list, n_pairs * sizeof(int));
+        neighbour_list.cap_list = n_pairs;
+    }
+    for (size_t j = 0; j < N; j++) {
+        int *list = &neighbour_list.list[neighbour_list.start[j]];
+        size_t n = neighbour_list.start[j + 1] - neighbour_list.start[j];
+        find_neighbours(vec, (int) j, cell, head, next, n_buckets - 1, cutoff2, list, n);
+        // the pairs are checked in the order of the indices, as when testing all pairs
+        for (size_t p = 1; p < n; p++) {
+            int k = list[p];
+            size_t q = p;
+            for (; q > 0 && list[q - 1] > k; q--) list[q] = list[q - 1];
+            list[q] = k;
+        }
+    }
+    for (size_t i = 0; i < 3 * N; i++) neighbour_list.pos[i] = vec[i];
+    neighbour_list.n = N;
+    neighbour_list.cutoff = cutoff;
+    workspace_release(ws);
+    return 1;
+}
+
+/*
+ * Make the neighbour list cover the pairs of particles closer than range in the positions vec, rebuilding it if
+ * needed. The neighbours k > j of particle j are then list[start[j]] ... list[start[j + 1] - 1] of neighbour_list,
+ * in increasing order. Returns 0 if the particles are too crowded for the list, which must then not be used.
+ */
+int neighbour_list_update(const real vec[], size_t N, real range) {
+    if (neighbour_list.n == N) {
+        real d2max = 0.0;
+        for (size_t i = 0; i < 3 * N; i += 3) {
+            real dx = vec[i] - neighbour_list.pos[i];
+            real dy = vec[i + 1] - neighbour_list.pos[i + 1];
+            real dz = vec[i + 2] - neighbour_list.pos[i + 2];
+            real d2 = dx * dx + dy * dy + dz * dz;
+            if (d2 > d2max) d2max = d2;
+        }
+        if (range + 2.0 * sqrt(d2max) <= neighbour_list.cutoff) return 1;
+    }
+    return neighbour_list_build(vec, N, range * (1.0 + NEIGHBOUR_SKIN));
+}
+
+void neighbour_finalize() {
+    free(neighbour_list.pos);
+    free(neighbour_list.start);
+    free(neighbour_list.list);
+    neighbour_list.pos = NULL;
+    neighbour_list.start = NULL;
+    neighbour_list.list = NULL;
+    neighbour_list.n = 0;
+    neighbour_list.cap_n = 0;
+    neighbour_list.cap_list = 0;
+    neighbour_list.cutoff = 0.0;
+}
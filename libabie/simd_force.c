@@ -0,0 +1,547 @@
+#include "common.h"
+
+/*
+ * Direct summation with explicit vectorization (AVX2 / AVX-512).
+ *
+ * The sources are copied into a structure-of-arrays layout (separate x, y, z and m arrays), padded with massless
+ * sources to a multiple of the SIMD width. Only the sources with a positive mass are packed, so with the masses of
+ * the active particles (passive particles as zero) the cost scales as N_active * N, as in
+ * ode_n_body_second_order_active(). The inverse distance is computed with the hardware reciprocal square root
+ * estimate followed by Newton-Raphson iterations y <- y (3 - r2 y^2) / 2, which double the number of correct bits
+ * at each iteration:
+ *      AVX-512: rsqrt14 (14 bits) + 2 iterations
+ *      AVX2:    single precision rsqrt (12 bits) + 3 iterations; lanes outside the single precision range fall
+ *               back to 1 / sqrt(r2)
+ * The code path is selected at runtime according to the capabilities of the CPU. The public layout of the state
+ * vectors (interleaved xyz) is not affected.
+ *
+ * The sinks are split into blocks of OMP_BLOCK_SIZE, which are distributed dynamically over the OpenMP threads, and
+ * every block runs over the sources in tiles of OMP_BLOCK_SIZE, so that the packed sources of a tile stay in the
+ * cache of the thread while it sums their forces on all the sinks of the block. Every thread writes to the
+ * accelerations of its own sinks only, so there is no reduction or synchronization between the threads.
+ *
+ * In the mixed precision mode, the forces on the test particles are calculated in single precision: the positions
+ * relative to the most massive source are rounded to float, and the separations and inverse distances are computed
+ * in float, while the sum over the sources is accumulated in double. The forces on the other particles are
+ * calculated in full precision.
+ */
+
+// the SIMD kernels are only available for double precision on x86 with GCC-compatible compilers
+#if !defined(LONGDOUBLE) && (defined(__GNUC__) || defined(__clang__)) && !defined(_MSC_VER) && (defined(__x86_64__) || defined(__i386__))
+#define ABIE_SIMD_X86 1
+#include <immintrin.h>
+#endif
+
+#define SIMD_PAD 8  // pad the source arrays to a multiple of the widest SIMD width (8 doubles)
+#define MIXED_GROUP 16  // number of sources summed in single precision by the mixed precision kernels
+
+// the instruction sets supported by the CPU; the level in use (simd_level_global) is an option of the context
+static int simd_level_supported = -1;
+
+// packed sources, kept in the simulation context
+#define src_f_buf (abie_ctx->simd.src_f_buf)
+#define cap_src_f (abie_ctx->simd.cap_src_f)
+
+#ifdef ABIE_SIMD_X86
+#define soa_buf (abie_ctx->simd.soa_buf)
+#define cap_soa (abie_ctx->simd.cap_soa)
+
+// pack the sources with a positive mass; returns the padded number of sources
+static size_t simd_pack_sources(const real vec[], size_t N, const real masses[], double **sx, double **sy, double **sz, double **sm) {
+    size_t n_src = 0;
+    for (size_t k = 0; k < N; k++) {
+        if (masses[k] > 0.0) n_src++;
+    }
+    size_t n_pad = (n_src + SIMD_PAD - 1) / SIMD_PAD * SIMD_PAD;
+    if (n_pad == 0) n_pad = SIMD_PAD;
+    if (cap_soa < n_pad) {
+        free(soa_buf);
+        soa_buf = (double *) malloc(4 * n_pad * sizeof(double));
+        cap_soa = n_pad;
+    }
+    *sx = soa_buf;
+    *sy = soa_buf + n_pad;
+    *sz = soa_buf + 2 * n_pad;
+    *sm = soa_buf + 3 * n_pad;
+
+    size_t n = 0;
+    for (size_t k = 0; k < N; k++) {
+        if (masses[k] <= 0.0) continue;
+        (*sx)[n] = vec[3 * k];
+        (*sy)[n] = vec[3 * k + 1];
+        (*sz)[n] = vec[3 * k + 2];
+        (*sm)[n] = masses[k];
+        n++;
+    }
+    // padding: massless sources at the position of the first source, so that the separations stay finite
+    double px = (n_src > 0) ? (*sx)[0] : 0.0;
+    double py = (n_src > 0) ? (*sy)[0] : 0.0;
+    double pz = (n_src > 0) ? (*sz)[0] : 0.0;
+    for (; n < n_pad; n++) {
+        (*sx)[n] = px;
+        (*sy)[n] = py;
+        (*sz)[n] = pz;
+        (*sm)[n] = 0.0;
+    }
+    return n_pad;
+}
+
+__attribute__((target("avx512f")))
+static void simd_kernel_avx512(const real vec[], size_t N, real G, const real masses[], real acc[],
+                               const double *sx, const double *sy, const double *sz, const double *sm, size_t n_pad,
+                               const int sinks[], size_t n_sinks) {
+    int n_blocks = (int) ((n_sinks + OMP_BLOCK_SIZE - 1) / OMP_BLOCK_SIZE);
+#if OPENMP
+#pragma omp parallel for schedule(dynamic) if (n_sinks > USE_PARALLEL) copyin(abie_ctx)
+#endif
+    for (int b = 0; b < n_blocks; b++) {
+        int j0 = b * OMP_BLOCK_SIZE;
+        int j1 = (j0 + OMP_BLOCK_SIZE < n_sinks) ? j0 + OMP_BLOCK_SIZE : (int) n_sinks;
+        for (int j = j0; j < j1; j++) {
+            int i = (sinks != NULL) ? sinks[j] : j;
+            acc[3 * i] = 0.0;
+            acc[3 * i + 1] = 0.0;
+            acc[3 * i + 2] = 0.0;
+        }
+        for (size_t k0 = 0; k0 < n_pad; k0 += OMP_BLOCK_SIZE) {
+            size_t k1 = (k0 + OMP_BLOCK_SIZE < n_pad) ? k0 + OMP_BLOCK_SIZE : n_pad;
+            for (int j = j0; j < j1; j++) {
+                int i = (sinks != NULL) ? sinks[j] : j;
+                // if the mass is negative, the particle is deleted
+                if (masses[i] < 0.0) continue;
+                const __m512d xi = _mm512_set1_pd(vec[3 * i]);
+                const __m512d yi = _mm512_set1_pd(vec[3 * i + 1]);
+                const __m512d zi = _mm512_set1_pd(vec[3 * i + 2]);
+                const __m512d zero = _mm512_setzero_pd();
+                const __m512d half = _mm512_set1_pd(0.5);
+                const __m512d three_half = _mm512_set1_pd(1.5);
+                __m512d ax = _mm512_setzero_pd();
+                __m512d ay = _mm512_setzero_pd();
+                __m512d az = _mm512_setzero_pd();
+                for (size_t k = k0; k < k1; k += 8) {
+                    __m512d dx = _mm512_sub_pd(_mm512_loadu_pd(&sx[k]), xi);
+                    __m512d dy = _mm512_sub_pd(_mm512_loadu_pd(&sy[k]), yi);
+                    __m512d dz = _mm512_sub_pd(_mm512_loadu_pd(&sz[k]), zi);
+                    __m512d r2 = _mm512_fmadd_pd(dx, dx, _mm512_fmadd_pd(dy, dy, _mm512_mul_pd(dz, dz)));
+                    // the particle itself (zero separation) is masked out
+                    __mmask8 valid = _mm512_cmp_pd_mask(r2, zero, _CMP_GT_OQ);
+                    __m512d y = _mm512_maskz_rsqrt14_pd(valid, r2);
+                    __m512d hr2 = _mm512_mul_pd(half, r2);
+                    y = _mm512_mul_pd(y, _mm512_fnmadd_pd(_mm512_mul_pd(hr2, y), y, three_half));
+                    y = _mm512_mul_pd(y, _mm512_fnmadd_pd(_mm512_mul_pd(hr2, y), y, three_half));
+                    __m512d s = _mm512_mul_pd(_mm512_mul_pd(_mm512_loadu_pd(&sm[k]), y), _mm512_mul_pd(y, y));
+                    ax = _mm512_fmadd_pd(s, dx, ax);
+                    ay = _mm512_fmadd_pd(s, dy, ay);
+                    az = _mm512_fmadd_pd(s, dz, az);
+                }
+                acc[3 * i] += G * _mm512_reduce_add_pd(ax);
+                acc[3 * i + 1] += G * _mm512_reduce_add_pd(ay);
+                acc[3 * i + 2] += G * _mm512_reduce_add_pd(az);
+            }
+        }
+    }
+}
+
+__attribute__((target("avx2,fma")))
+static double simd_hsum_avx2(__m256d v) {
+    __m128d lo = _mm256_castpd256_pd128(v);
+    __m128d hi = _mm256_extractf128_pd(v, 1);
+    lo = _mm_add_pd(lo, hi);
+    return _mm_cvtsd_f64(_mm_add_sd(lo, _mm_unpackhi_pd(lo, lo)));
+}
+
+__attribute__((target("avx2,fma")))
+static void simd_kernel_avx2(const real vec[], size_t N, real G, const real masses[], real acc[],
+                             const double *sx, const double *sy, const double *sz, const double *sm, size_t n_pad,
+                             const int sinks[], size_t n_sinks) {
+    int n_blocks = (int) ((n_sinks + OMP_BLOCK_SIZE - 1) / OMP_BLOCK_SIZE);
+#if OPENMP
+#pragma omp parallel for schedule(dynamic) if (n_sinks > USE_PARALLEL) copyin(abie_ctx)
+#endif
+    for (int b = 0; b < n_blocks; b++) {
+        int j0 = b * OMP_BLOCK_SIZE;
+        int j1 = (j0 + OMP_BLOCK_SIZE < n_sinks) ? j0 + OMP_BLOCK_SIZE : (int) n_sinks;
+        for (int j = j0; j < j1; j++) {
+            int i = (sinks != NULL) ? sinks[j] : j;
+            acc[3 * i] = 0.0;
+            acc[3 * i + 1] = 0.0;
+            acc[3 * i + 2] = 0.0;
+        }
+        for (size_t k0 = 0; k0 < n_pad; k0 += OMP_BLOCK_SIZE) {
+            size_t k1 = (k0 + OMP_BLOCK_SIZE < n_pad) ? k0 + OMP_BLOCK_SIZE : n_pad;
+            for (int j = j0; j < j1; j++) {
+                int i = (sinks != NULL) ? sinks[j] : j;
+                // if the mass is negative, the particle is deleted
+                if (masses[i] < 0.0) continue;
+                const __m256d xi = _mm256_set1_pd(vec[3 * i]);
+                const __m256d yi = _mm256_set1_pd(vec[3 * i + 1]);
+                const __m256d zi = _mm256_set1_pd(vec[3 * i + 2]);
+                const __m256d zero = _mm256_setzero_pd();
+                const __m256d half = _mm256_set1_pd(0.5);
+                const __m256d three_half = _mm256_set1_pd(1.5);
+                const __m256d flt_min = _mm256_set1_pd(FLT_MIN);
+                const __m256d flt_max = _mm256_set1_pd(FLT_MAX);
+                __m256d ax = _mm256_setzero_pd();
+                __m256d ay = _mm256_setzero_pd();
+                __m256d az = _mm256_setzero_pd();
+                for (size_t k = k0; k < k1; k += 4) {
+                    __m256d dx = _mm256_sub_pd(_mm256_loadu_pd(&sx[k]), xi);
+                    __m256d dy = _mm256_sub_pd(_mm256_loadu_pd(&sy[k]), yi);
+                    __m256d dz = _mm256_sub_pd(_mm256_loadu_pd(&sz[k]), zi);
+                    __m256d r2 = _mm256_fmadd_pd(dx, dx, _mm256_fmadd_pd(dy, dy, _mm256_mul_pd(dz, dz)));
+                    __m256d y = _mm256_cvtps_pd(_mm_rsqrt_ps(_mm256_cvtpd_ps(r2)));
+                    __m256d hr2 = _mm256_mul_pd(half, r2);
+                    y = _mm256_mul_pd(y, _mm256_fnmadd_pd(_mm256_mul_pd(hr2, y), y, three_half));
+                    y = _mm256_mul_pd(y, _mm256_fnmadd_pd(_mm256_mul_pd(hr2, y), y, three_half));
+                    y = _mm256_mul_pd(y, _mm256_fnmadd_pd(_mm256_mul_pd(hr2, y), y, three_half));
+                    // separations that cannot be represented in single precision
+                    __m256d out = _mm256_or_pd(_mm256_cmp_pd(r2, flt_min, _CMP_LT_OQ), _mm256_cmp_pd(r2, flt_max, _CMP_GT_OQ));
+                    if (_mm256_movemask_pd(out)) {
+                        y = _mm256_blendv_pd(y, _mm256_div_pd(_mm256_set1_pd(1.0), _mm256_sqrt_pd(r2)), out);
+                    }
+                    // the particle itself (zero separation) is masked out
+                    y = _mm256_and_pd(y, _mm256_cmp_pd(r2, zero, _CMP_GT_OQ));
+                    __m256d s = _mm256_mul_pd(_mm256_mul_pd(_mm256_loadu_pd(&sm[k]), y), _mm256_mul_pd(y, y));
+                    ax = _mm256_fmadd_pd(s, dx, ax);
+                    ay = _mm256_fmadd_pd(s, dy, ay);
+                    az = _mm256_fmadd_pd(s, dz, az);
+                }
+                acc[3 * i] += G * simd_hsum_avx2(ax);
+                acc[3 * i + 1] += G * simd_hsum_avx2(ay);
+                acc[3 * i + 2] += G * simd_hsum_avx2(az);
+            }
+        }
+    }
+}
+#endif
+
+static int simd_detect() {
+    if (simd_level_supported < 0) {
+        simd_level_supported = SIMD_NONE;
+#ifdef ABIE_SIMD_X86
+        __builtin_cpu_init();
+        if (__builtin_cpu_supports("avx512f")) {
+            simd_level_supported = SIMD_AVX512;
+        } else if (__builtin_cpu_supports("avx2") && __builtin_cpu_supports("fma")) {
+            simd_level_supported = SIMD_AVX2;
+        }
+#endif
+    }
+    return simd_level_supported;
+}
+
+int get_simd_level() {
+    if (simd_level_global < 0) simd_level_global = simd_detect();
+    return simd_level_global;
+}
+
+/*
+ * Select the instruction set used by the direct summation (SIMD_NONE, SIMD_AVX2 or SIMD_AVX512). The level is
+ * limited to what the CPU supports. Returns the level in use.
+ */
+int set_simd_level(int level) {
+    int supported = simd_detect();
+    if (level < SIMD_NONE) level = SIMD_NONE;
+    simd_level_global = (level < supported) ? level : supported;
+    return simd_level_global;
+}
+
+size_t ode_n_body_second_order_simd(const real vec[], size_t N, real G, const real masses[], const real radii[], real acc[]) {
+#ifdef ABIE_SIMD_X86
+    int level = get_simd_level();
+    if (level > SIMD_NONE) {
+        double *sx, *sy, *sz, *sm;
+        size_t n_pad = simd_pack_sources(vec, N, masses, &sx, &sy, &sz, &sm);
+        if (level == SIMD_AVX512) {
+            simd_kernel_avx512(vec, N, G, masses, acc, sx, sy, sz, sm, n_pad, NULL, N);
+        } else {
+            simd_kernel_avx2(vec, N, G, masses, acc, sx, sy, sz, sm, n_pad, NULL, N);
+        }
+        return EXIT_NORMAL;
+    }
+#endif
+    return ode_n_body_second_order(vec, N, G, masses, radii, acc);
+}
+
+/*
+ * Full precision forces on the sinks in the list, due to the active sources
+ */
+static void mixed_regular_sinks(const real vec[], size_t N, real G, const real masses[], const real src_masses[],
+                                real acc[], const int sinks[], size_t n_sinks) {
+#ifdef ABIE_SIMD_X86
+    if (get_simd_level() > SIMD_NONE) {
+        double *sx, *sy, *sz, *sm;
+        size_t n_pad = simd_pack_sources(vec, N, src_masses, &sx, &sy, &sz, &sm);
+        if (get_simd_level() == SIMD_AVX512) {
+            simd_kernel_avx512(vec, N, G, masses, acc, sx, sy, sz, sm, n_pad, sinks, n_sinks);
+        } else {
+            simd_kernel_avx2(vec, N, G, masses, acc, sx, sy, sz, sm, n_pad, sinks, n_sinks);
+        }
+        return;
+    }
+#endif
+#if OPENMP
+#pragma omp parallel for if (n_sinks > USE_PARALLEL) copyin(abie_ctx)
+#endif
+    for (int j = 0; j < n_sinks; j++) {
+        int i = sinks[j];
+        real x = vec[3 * i], y = vec[3 * i + 1], z = vec[3 * i + 2];
+        real ax = 0.0, ay = 0.0, az = 0.0;
+        for (size_t n = 0; n < N_active_global; n++) {
+            int k = active_global[n];
+            if (k == i) continue;
+            real dx = vec[3 * k] - x;
+            real dy = vec[3 * k + 1] - y;
+            real dz = vec[3 * k + 2] - z;
+            real r2 = dx * dx + dy * dy + dz * dz;
+            real s = src_masses[k] / (sqrt(r2) * r2);
+            ax += s * dx;
+            ay += s * dy;
+            az += s * dz;
+        }
+        acc[3 * i] = G * ax;
+        acc[3 * i + 1] = G * ay;
+        acc[3 * i + 2] = G * az;
+    }
+}
+
+/*
+ * Single precision forces on the test particles in the list. ref is the origin of the single precision coordinates,
+ * (fx, fy, fz, fm) are the positions relative to ref and the masses of the sources.
+ */
+static void mixed_test_sinks(const real vec[], real G, real acc[], const real ref[], const float *fx, const float *fy,
+                             const float *fz, const float *fm, size_t n_src, const int sinks[], size_t n_sinks) {
+#if OPENMP
+#pragma omp parallel for if (n_sinks > USE_PARALLEL) copyin(abie_ctx)
+#endif
+    for (int j = 0; j < n_sinks; j++) {
+        int i = sinks[j];
+        float px = (float) (vec[3 * i] - ref[0]);
+        float py = (float) (vec[3 * i + 1] - ref[1]);
+        float pz = (float) (vec[3 * i + 2] - ref[2]);
+        double ax = 0.0, ay = 0.0, az = 0.0;
+        for (size_t k = 0; k < n_src; k++) {
+            float dx = fx[k] - px;
+            float dy = fy[k] - py;
+            float dz = fz[k] - pz;
+            float r2 = dx * dx + dy * dy + dz * dz;
+            // a test particle at the position of a source does not feel its force
+            if (r2 == 0.0f) continue;
+            float inv_r = 1.0f / sqrtf(r2);
+            float s = fm[k] * inv_r * inv_r * inv_r;
+            ax += (double) (s * dx);
+            ay += (double) (s * dy);
+            az += (double) (s * dz);
+        }
+        acc[3 * i] = G * ax;
+        acc[3 * i + 1] = G * ay;
+        acc[3 * i + 2] = G * az;
+    }
+}
+
+#ifdef ABIE_SIMD_X86
+/*
+ * The vectorized versions process 16 (AVX-512) or 8 (AVX2) test particles at once. The contributions of up to
+ * MIXED_GROUP sources are summed in single precision before they are added to the double precision accumulators.
+ */
+__attribute__((target("avx512f")))
+static void mixed_kernel_avx512(const real vec[], real G, real acc[], const real ref[], const float *fx, const float *fy,
+                                const float *fz, const float *fm, size_t n_src, const int sinks[], size_t n_sinks) {
+    int n_vec = (int) ((n_sinks + 15) / 16);
+#if OPENMP
+#pragma omp parallel for if (n_sinks > USE_PARALLEL) copyin(abie_ctx)
+#endif
+    for (int b = 0; b < n_vec; b++) {
+        float px[16], py[16], pz[16];
+        double bx[16], by[16], bz[16];
+        const int *idx = sinks + 16 * (size_t) b;
+        int n = (int) (n_sinks - 16 * (size_t) b);
+        if (n > 16) n = 16;
+        for (int j = 0; j < 16; j++) {
+            // the unused lanes repeat the first test particle
+            int i = idx[(j < n) ? j : 0];
+            px[j] = (float) (vec[3 * i] - ref[0]);
+            py[j] = (float) (vec[3 * i + 1] - ref[1]);
+            pz[j] = (float) (vec[3 * i + 2] - ref[2]);
+        }
+        const __m512 xi = _mm512_loadu_ps(px);
+        const __m512 yi = _mm512_loadu_ps(py);
+        const __m512 zi = _mm512_loadu_ps(pz);
+        const __m512 zero = _mm512_setzero_ps();
+        const __m512 half = _mm512_set1_ps(0.5f);
+        const __m512 three_half = _mm512_set1_ps(1.5f);
+        __m512d ax_lo = _mm512_setzero_pd(), ax_hi = _mm512_setzero_pd();
+        __m512d ay_lo = _mm512_setzero_pd(), ay_hi = _mm512_setzero_pd();
+        __m512d az_lo = _mm512_setzero_pd(), az_hi = _mm512_setzero_pd();
+        for (size_t k0 = 0; k0 < n_src; k0 += MIXED_GROUP) {
+            size_t k1 = (k0 + MIXED_GROUP < n_src) ? k0 + MIXED_GROUP : n_src;
+            __m512 gx = _mm512_setzero_ps(), gy = _mm512_setzero_ps(), gz = _mm512_setzero_ps();
+            for (size_t k = k0; k < k1; k++) {
+                __m512 dx = _mm512_sub_ps(_mm512_set1_ps(fx[k]), xi);
+                __m512 dy = _mm512_sub_ps(_mm512_set1_ps(fy[k]), yi);
+                __m512 dz = _mm512_sub_ps(_mm512_set1_ps(fz[k]), zi);
+                __m512 r2 = _mm512_fmadd_ps(dx, dx, _mm512_fmadd_ps(dy, dy, _mm512_mul_ps(dz, dz)));
+                __mmask16 valid = _mm512_cmp_ps_mask(r2, zero, _CMP_GT_OQ);
+                __m512 y = _mm512_maskz_rsqrt14_ps(valid, r2);
+                y = _mm512_mul_ps(y, _mm512_fnmadd_ps(_mm512_mul_ps(_mm512_mul_ps(half, r2), y), y, three_half));
+                __m512 s = _mm512_mul_ps(_mm512_mul_ps(_mm512_set1_ps(fm[k]), y), _mm512_mul_ps(y, y));
+                gx = _mm512_fmadd_ps(s, dx, gx);
+                gy = _mm512_fmadd_ps(s, dy, gy);
+                gz = _mm512_fmadd_ps(s, dz, gz);
+            }
+            ax_lo = _mm512_add_pd(ax_lo, _mm512_cvtps_pd(_mm512_castps512_ps256(gx)));
+            ay_lo = _mm512_add_pd(ay_lo, _mm512_cvtps_pd(_mm512_castps512_ps256(gy)));
+            az_lo = _mm512_add_pd(az_lo, _mm512_cvtps_pd(_mm512_castps512_ps256(gz)));
+            ax_hi = _mm512_add_pd(ax_hi, _mm512_cvtps_pd(_mm256_castpd_ps(_mm512_extractf64x4_pd(_mm512_castps_pd(gx), 1))));
+            ay_hi = _mm512_add_pd(ay_hi, _mm512_cvtps_pd(_mm256_castpd_ps(_mm512_extractf64x4_pd(_mm512_castps_pd(gy), 1))));
+            az_hi = _mm512_add_pd(az_hi, _mm512_cvtps_pd(_mm256_castpd_ps(_mm512_extractf64x4_pd(_mm512_castps_pd(gz), 1))));
+        }
+        _mm512_storeu_pd(bx, ax_lo);
+        _mm512_storeu_pd(bx + 8, ax_hi);
+        _mm512_storeu_pd(by, ay_lo);
+        _mm512_storeu_pd(by + 8, ay_hi);
+        _mm512_storeu_pd(bz, az_lo);
+        _mm512_storeu_pd(bz + 8, az_hi);
+        for (int j = 0; j < n; j++) {
+            int i = idx[j];
+            acc[3 * i] = G * bx[j];
+            acc[3 * i + 1] = G * by[j];
+            acc[3 * i + 2] = G * bz[j];
+        }
+    }
+}
+
+__attribute__((target("avx2,fma")))
+static void mixed_kernel_avx2(const real vec[], real G, real acc[], const real ref[], const float *fx, const float *fy,
+                              const float *fz, const float *fm, size_t n_src, const int sinks[], size_t n_sinks) {
+    int n_vec = (int) ((n_sinks + 7) / 8);
+#if OPENMP
+#pragma omp parallel for if (n_sinks > USE_PARALLEL) copyin(abie_ctx)
+#endif
+    for (int b = 0; b < n_vec; b++) {
+        float px[8], py[8], pz[8];
+        double bx[8], by[8], bz[8];
+        const int *idx = sinks + 8 * (size_t) b;
+        int n = (int) (n_sinks - 8 * (size_t) b);
+        if (n > 8) n = 8;
+        for (int j = 0; j < 8; j++) {
+            // the unused lanes repeat the first test particle
+            int i = idx[(j < n) ? j : 0];
+            px[j] = (float) (vec[3 * i] - ref[0]);
+            py[j] = (float) (vec[3 * i + 1] - ref[1]);
+            pz[j] = (float) (vec[3 * i + 2] - ref[2]);
+        }
+        const __m256 xi = _mm256_loadu_ps(px);
+        const __m256 yi = _mm256_loadu_ps(py);
+        const __m256 zi = _mm256_loadu_ps(pz);
+        const __m256 zero = _mm256_setzero_ps();
+        const __m256 half = _mm256_set1_ps(0.5f);
+        const __m256 three_half = _mm256_set1_ps(1.5f);
+        __m256d ax_lo = _mm256_setzero_pd(), ax_hi = _mm256_setzero_pd();
+        __m256d ay_lo = _mm256_setzero_pd(), ay_hi = _mm256_setzero_pd();
+        __m256d az_lo = _mm256_setzero_pd(), az_hi = _mm256_setzero_pd();
+        for (size_t k0 = 0; k0 < n_src; k0 += MIXED_GROUP) {
+            size_t k1 = (k0 + MIXED_GROUP < n_src) ? k0 + MIXED_GROUP : n_src;
+            __m256 gx = _mm256_setzero_ps(), gy = _mm256_setzero_ps(), gz = _mm256_setzero_ps();
+            for (size_t k = k0; k < k1; k++) {
+                __m256 dx = _mm256_sub_ps(_mm256_set1_ps(fx[k]), xi);
+                __m256 dy = _mm256_sub_ps(_mm256_set1_ps(fy[k]), yi);
+                __m256 dz = _mm256_sub_ps(_mm256_set1_ps(fz[k]), zi);
+                __m256 r2 = _mm256_fmadd_ps(dx, dx, _mm256_fmadd_ps(dy, dy, _mm256_mul_ps(dz, dz)));
+                __m256 y = _mm256_rsqrt_ps(r2);
+                y = _mm256_mul_ps(y, _mm256_fnmadd_ps(_mm256_mul_ps(_mm256_mul_ps(half, r2), y), y, three_half));
+                // the test particle at the position of a source (zero separation) is masked out
+                y = _mm256_and_ps(y, _mm256_cmp_ps(r2, zero, _CMP_GT_OQ));
+                __m256 s = _mm256_mul_ps(_mm256_mul_ps(_mm256_set1_ps(fm[k]), y), _mm256_mul_ps(y, y));
+                gx = _mm256_fmadd_ps(s, dx, gx);
+                gy = _mm256_fmadd_ps(s, dy, gy);
+                gz = _mm256_fmadd_ps(s, dz, gz);
+            }
+            ax_lo = _mm256_add_pd(ax_lo, _mm256_cvtps_pd(_mm256_castps256_ps128(gx)));
+            ay_lo = _mm256_add_pd(ay_lo, _mm256_cvtps_pd(_mm256_castps256_ps128(gy)));
+            az_lo = _mm256_add_pd(az_lo, _mm256_cvtps_pd(_mm256_castps256_ps128(gz)));
+            ax_hi = _mm256_add_pd(ax_hi, _mm256_cvtps_pd(_mm256_extractf128_ps(gx, 1)));
+            ay_hi = _mm256_add_pd(ay_hi, _mm256_cvtps_pd(_mm256_extractf128_ps(gy, 1)));
+            az_hi = _mm256_add_pd(az_hi, _mm256_cvtps_pd(_mm256_extractf128_ps(gz, 1)));
+        }
+        _mm256_storeu_pd(bx, ax_lo);
+        _mm256_storeu_pd(bx + 4, ax_hi);
+        _mm256_storeu_pd(by, ay_lo);
+        _mm256_storeu_pd(by + 4, ay_hi);
+        _mm256_storeu_pd(bz, az_lo);
+        _mm256_storeu_pd(bz + 4, az_hi);
+        for (int j = 0; j < n; j++) {
+            int i = idx[j];
+            acc[3 * i] = G * bx[j];
+            acc[3 * i + 1] = G * by[j];
+            acc[3 * i + 2] = G * bz[j];
+        }
+    }
+}
+#endif
+
+/*
+ * Gravitational accelerations with the forces on the test particles (passive_global) calculated in single precision.
+ * src_masses are the masses of the particles as sources (m_src_global).
+ */
+size_t ode_n_body_second_order_mixed(const real vec[], size_t N, real G, const real masses[], const real src_masses[], real acc[]) {
+    // deleted particles
+    for (size_t i = 0; i < N; i++) {
+        if (masses[i] < 0.0) {
+            acc[3 * i] = 0.0;
+            acc[3 * i + 1] = 0.0;
+            acc[3 * i + 2] = 0.0;
+        }
+    }
+    mixed_regular_sinks(vec, N, G, masses, src_masses, acc, regular_global, N_regular_global);
+
+    // origin of the single precision coordinates: the most massive source, which dominates the forces
+    size_t n_src = N_active_global;
+    real ref[3] = {0.0, 0.0, 0.0};
+    real m_max = 0.0;
+    for (size_t n = 0; n < n_src; n++) {
+        int k = active_global[n];
+        if (src_masses[k] > m_max) {
+            m_max = src_masses[k];
+            ref[0] = vec[3 * k];
+            ref[1] = vec[3 * k + 1];
+            ref[2] = vec[3 * k + 2];
+        }
+    }
+    if (cap_src_f < n_src) {
+        free(src_f_buf);
+        src_f_buf = (float *) malloc(4 * n_src * sizeof(float));
+        cap_src_f = n_src;
+    }
+    float *fx = src_f_buf, *fy = src_f_buf + n_src, *fz = src_f_buf + 2 * n_src, *fm = src_f_buf + 3 * n_src;
+    for (size_t n = 0; n < n_src; n++) {
+        int k = active_global[n];
+        fx[n] = (float) (vec[3 * k] - ref[0]);
+        fy[n] = (float) (vec[3 * k + 1] - ref[1]);
+        fz[n] = (float) (vec[3 * k + 2] - ref[2]);
+        fm[n] = (float) src_masses[k];
+    }
+
+#ifdef ABIE_SIMD_X86
+    if (get_simd_level() == SIMD_AVX512) {
+        mixed_kernel_avx512(vec, G, acc, ref, fx, fy, fz, fm, n_src, passive_global, N_passive_global);
+        return EXIT_NORMAL;
+    } else if (get_simd_level() == SIMD_AVX2) {
+        mixed_kernel_avx2(vec, G, acc, ref, fx, fy, fz, fm, n_src, passive_global, N_passive_global);
+        return EXIT_NORMAL;
+    }
+#endif
+    mixed_test_sinks(vec, G, acc, ref, fx, fy, fz, fm, n_src, passive_global, N_passive_global);
+    return EXIT_NORMAL;
+}
+
+void simd_finalize() {
+    free(src_f_buf);
+    src_f_buf = NULL;
+    cap_src_f = 0;
+#ifdef ABIE_SIMD_X86
+    free(soa_buf);
+    soa_buf = NULL;
+    cap_soa = 0;
+#endif
+}
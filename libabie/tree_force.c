@@ -0,0 +1,304 @@
+#include "common.h"
+#include "tree_force.h"
+
+/*
+ * Barnes-Hut octree force calculation.
+ *
+ * The tree is rebuilt on every force evaluation. Every cell carries the monopole and the (traceless)
+ * quadrupole moment of its sources about their centre of mass. A cell is accepted as a whole when
+ *      d > bmax / theta
+ * where d is the distance between the sink and the centre of mass of the cell, bmax is the radius of the
+ * sphere around the centre of mass enclosing all particles of the cell, and theta is the opening angle.
+ * theta = 0 reduces to direct summation. A cell that contains the sink is always opened, so that no particle
+ * feels itself through a multipole expansion, whatever the opening angle.
+ */
+
+// the tree used by the Barnes-Hut force calculation, kept in the simulation context
+#define bh_tree (abie_ctx->bh_tree)
+
+static int new_node(octree *tree) {
+    if (tree->n_nodes == tree->cap_nodes) {
+        size_t cap = (tree->cap_nodes > 0) ? 2 * tree->cap_nodes : 64;
+        tree->nodes = (tree_node *) realloc(tree->nodes, cap * sizeof(tree_node));
+        tree->cap_nodes = cap;
+    }
+    return (int) tree->n_nodes++;
+}
+
+static void leaf_moments(octree *tree, const real pos[], const real masses[], tree_node *node) {
+    real m = 0.0, cx = 0.0, cy = 0.0, cz = 0.0;
+    for (int p = node->first; p < node->first + node->count; p++) {
+        int j = tree->index[p];
+        if (masses[j] <= 0.0) continue;
+        m += masses[j];
+        cx += masses[j] * pos[3 * j];
+        cy += masses[j] * pos[3 * j + 1];
+        cz += masses[j] * pos[3 * j + 2];
+    }
+    node->mass = m;
+    if (m > 0.0) {
+        node->com[0] = cx / m;
+        node->com[1] = cy / m;
+        node->com[2] = cz / m;
+    } else {
+        node->com[0] = node->center[0];
+        node->com[1] = node->center[1];
+        node->com[2] = node->center[2];
+    }
+    for (int k = 0; k < 6; k++) node->quad[k] = 0.0;
+    real bmax2 = 0.0;
+    for (int p = node->first; p < node->first + node->count; p++) {
+        int j = tree->index[p];
+        real dx = pos[3 * j] - node->com[0];
+        real dy = pos[3 * j + 1] - node->com[1];
+        real dz = pos[3 * j + 2] - node->com[2];
+        real d2 = dx * dx + dy * dy + dz * dz;
+        if (d2 > bmax2) bmax2 = d2;
+        if (masses[j] <= 0.0) continue;
+        node->quad[0] += masses[j] * (3.0 * dx * dx - d2);
+        node->quad[1] += masses[j] * 3.0 * dx * dy;
+        node->quad[2] += masses[j] * 3.0 * dx * dz;
+        node->quad[3] += masses[j] * (3.0 * dy * dy - d2);
+        node->quad[4] += masses[j] * 3.0 * dy * dz;
+        node->quad[5] += masses[j] * (3.0 * dz * dz - d2);
+    }
+    node->bmax = sqrt(bmax2);
+}
+
+static void cell_moments(octree *tree, tree_node *node) {
+    real m = 0.0, cx = 0.0, cy = 0.0, cz = 0.0;
+    for (int k = 0; k < 8; k++) {
+        if (node->child[k] < 0) continue;
+        const tree_node *c = &tree->nodes[node->child[k]];
+        m += c->mass;
+        cx += c->mass * c->com[0];
+        cy += c->mass * c->com[1];
+        cz += c->mass * c->com[2];
+    }
+    node->mass = m;
+    if (m > 0.0) {
+        node->com[0] = cx / m;
+        node->com[1] = cy / m;
+        node->com[2] = cz / m;
+    } else {
+        node->com[0] = node->center[0];
+        node->com[1] = node->center[1];
+        node->com[2] = node->center[2];
+    }
+    // shift the quadrupole moments of the children to the new centre of mass (parallel axis theorem)
+    for (int k = 0; k < 6; k++) node->quad[k] = 0.0;
+    real bmax = 0.0;
+    for (int k = 0; k < 8; k++) {
+        if (node->child[k] < 0) continue;
+        const tree_node *c = &tree->nodes[node->child[k]];
+        real sx = c->com[0] - node->com[0];
+        real sy = c->com[1] - node->com[1];
+        real sz = c->com[2] - node->com[2];
+        real s2 = sx * sx + sy * sy + sz * sz;
+        node->quad[0] += c->quad[0] + c->mass * (3.0 * sx * sx - s2);
+        node->quad[1] += c->quad[1] + c->mass * 3.0 * sx * sy;
+        node->quad[2] += c->quad[2] + c->mass * 3.0 * sx * sz;
+        node->quad[3] += c->quad[3] + c->mass * (3.0 * sy * sy - s2);
+        node->quad[4] += c->quad[4] + c->mass * 3.0 * sy * sz;
+        node->quad[5] += c->quad[5] + c->mass * (3.0 * sz * sz - s2);
+        real b = sqrt(s2) + c->bmax;
+        if (b > bmax) bmax = b;
+    }
+    node->bmax = bmax;
+}
+
+static void build_cell(octree *tree, const real pos[], const real masses[], int n, int depth) {
+    tree_node *node = &tree->nodes[n];
+    int first = node->first;
+    int count = node->count;
+    for (int k = 0; k < 8; k++) node->child[k] = -1;
+
+    int leaf_size = (tree->leaf_size > 0) ? tree->leaf_size : TREE_LEAF_SIZE;
+    if (count <= leaf_size || depth >= TREE_MAX_DEPTH) {
+        node->is_leaf = 1;
+        leaf_moments(tree, pos, masses, node);
+        return;
+    }
+    node->is_leaf = 0;
+
+    // sort the particles of this cell into octants (counting sort)
+    real cx = node->center[0], cy = node->center[1], cz = node->center[2];
+    real half = node->half;
+    int counts[8] = {0, 0, 0, 0, 0, 0, 0, 0};
+    int offsets[8];
+    for (int p = first; p < first + count; p++) {
+        int i = tree->index[p];
+        int oct = (pos[3 * i] >= cx) | ((pos[3 * i + 1] >= cy) << 1) | ((pos[3 * i + 2] >= cz) << 2);
+        counts[oct]++;
+    }
+    offsets[0] = first;
+    for (int k = 1; k < 8; k++) offsets[k] = offsets[k - 1] + counts[k - 1];
+    for (int p = first; p < first + count; p++) {
+        int i = tree->index[p];
+        int oct = (pos[3 * i] >= cx) | ((pos[3 * i + 1] >= cy) << 1) | ((pos[3 * i + 2] >= cz) << 2);
+        tree->scratch[offsets[oct]++] = i;
+    }
+    for (int p = first; p < first + count; p++) tree->index[p] = tree->scratch[p];
+
+    int start = first;
+    for (int k = 0; k < 8; k++) {
+        if (counts[k] == 0) continue;
+        // note: new_node() may move the node array, so do not keep pointers across this call
+        int c = new_node(tree);
+        tree_node *child = &tree->nodes[c];
+        child->half = 0.5 * half;
+        child->center[0] = cx + ((k & 1) ? 0.5 : -0.5) * half;
+        child->center[1] = cy + ((k & 2) ? 0.5 : -0.5) * half;
+        child->center[2] = cz + ((k & 4) ? 0.5 : -0.5) * half;
+        child->first = start;
+        child->count = counts[k];
+        tree->nodes[n].child[k] = c;
+        start += counts[k];
+        build_cell(tree, pos, masses, c, depth + 1);
+    }
+    cell_moments(tree, &tree->nodes[n]);
+}
+
+/*
+ * Build the octree of all particles that are not deleted (mass >= 0). Massless particles are part of the
+ * tree but do not contribute to the moments of the cells.
+ * Returns the number of cells.
+ */
+int octree_build(octree *tree, const real pos[], const real masses[], size_t N) {
+    if (tree->cap_index < N) {
+        tree->index = (int *) realloc(tree->index, N * sizeof(int));
+        tree->scratch = (int *) realloc(tree->scratch, N * sizeof(int));
+        tree->cap_index = N;
+    }
+    tree->n_nodes = 0;
+
+    real lo[3] = {DBL_MAX, DBL_MAX, DBL_MAX};
+    real hi[3] = {-DBL_MAX, -DBL_MAX, -DBL_MAX};
+    int n = 0;
+    for (size_t i = 0; i < N; i++) {
+        if (masses[i] < 0.0) continue;
+        tree->index[n++] = (int) i;
+        for (int k = 0; k < 3; k++) {
+            if (pos[3 * i + k] < lo[k]) lo[k] = pos[3 * i + k];
+            if (pos[3 * i + k] > hi[k]) hi[k] = pos[3 * i + k];
+        }
+    }
+    if (n == 0) return 0;
+
+    int root = new_node(tree);
+    real half = 0.0;
+    for (int k = 0; k < 3; k++) {
+        tree->nodes[root].center[k] = 0.5 * (lo[k] + hi[k]);
+        if (0.5 * (hi[k] - lo[k]) > half) half = 0.5 * (hi[k] - lo[k]);
+    }
+    // make sure that the particles on the boundary fall inside the root cell
+    tree->nodes[root].half = (half > 0.0) ? half * (1.0 + 1.e-10) : 1.0;
+    tree->nodes[root].first = 0;
+    tree->nodes[root].count = n;
+    build_cell(tree, pos, masses, root, 0);
+    return (int) tree->n_nodes;
+}
+
+void octree_free(octree *tree) {
+    free(tree->nodes);
+    free(tree->index);
+    free(tree->scratch);
+    tree->nodes = NULL;
+    tree->index = NULL;
+    tree->scratch = NULL;
+    tree->n_nodes = 0;
+    tree->cap_nodes = 0;
+    tree->cap_index = 0;
+}
+
+static void tree_walk(const octree *tree, const real vec[], const real masses[], int i, real theta2, real a[3]) {
+    int stack[8 * TREE_MAX_DEPTH + 8];
+    int top = 0;
+    real x = vec[3 * i], y = vec[3 * i + 1], z = vec[3 * i + 2];
+    real ax = 0.0, ay = 0.0, az = 0.0;
+
+    stack[top++] = 0;
+    while (top > 0) {
+        const tree_node *node = &tree->nodes[stack[--top]];
+        if (node->mass <= 0.0) continue;
+        if (node->is_leaf) {
+            for (int p = node->first; p < node->first + node->count; p++) {
+                int j = tree->index[p];
+                if (j == i || masses[j] <= 0.0) continue;
+                real dx = x - vec[3 * j];
+                real dy = y - vec[3 * j + 1];
+                real dz = z - vec[3 * j + 2];
+                real rel_sep2 = dx * dx + dy * dy + dz * dz;
+                real rel_sep3 = masses[j] / (sqrt(rel_sep2) * rel_sep2);
+                ax -= dx * rel_sep3;
+                ay -= dy * rel_sep3;
+                az -= dz * rel_sep3;
+            }
+            continue;
+        }
+        real dx = x - node->com[0];
+        real dy = y - node->com[1];
+        real dz = z - node->com[2];
+        real r2 = dx * dx + dy * dy + dz * dz;
+        // a cell that contains the sink is always opened (it may be accepted otherwise if theta >= 1)
+        int inside = fabs(x - node->center[0]) <= node->half && fabs(y - node->center[1]) <= node->half &&
+                     fabs(z - node->center[2]) <= node->half;
+        if (!inside && r2 * theta2 > node->bmax * node->bmax) {
+            // the cell is far enough: use its multipole expansion
+            real rinv = 1.0 / sqrt(r2);
+            real rinv2 = rinv * rinv;
+            real rinv3 = rinv * rinv2;
+            real rinv5 = rinv3 * rinv2;
+            const real *q = node->quad;
+            real qdx = q[0] * dx + q[1] * dy + q[2] * dz;
+            real qdy = q[1] * dx + q[3] * dy + q[4] * dz;
+            real qdz = q[2] * dx + q[4] * dy + q[5] * dz;
+            real dqd = 2.5 * (dx * qdx + dy * qdy + dz * qdz) * rinv2;
+            ax += -node->mass * rinv3 * dx + (qdx - dqd * dx) * rinv5;
+            ay += -node->mass * rinv3 * dy + (qdy - dqd * dy) * rinv5;
+            az += -node->mass * rinv3 * dz + (qdz - dqd * dz) * rinv5;
+        } else {
+            // open the cell
+            for (int k = 0; k < 8; k++) {
+                if (node->child[k] >= 0) stack[top++] = node->child[k];
+            }
+        }
+    }
+    a[0] = ax;
+    a[1] = ay;
+    a[2] = az;
+}
+
+size_t ode_n_body_second_order_tree(const real vec[], size_t N, real G, const real masses[], const real radii[], real acc[]) {
+    for (size_t j = 0; j < 3 * N; j++) acc[j] = 0.0;
+    if (octree_build(&bh_tree, vec, masses, N) == 0) return EXIT_NORMAL;
+
+    real theta2 = opening_angle_global * opening_angle_global;
+    int n = bh_tree.nodes[0].count;
+
+    // loop over the sinks in tree order, so that neighbouring sinks walk similar parts of the tree
+#if OPENMP
+#pragma omp parallel for schedule(dynamic, 64) copyin(abie_ctx)
+#endif
+    for (int p = 0; p < n; p++) {
+        int i = bh_tree.index[p];
+        real a[3];
+        tree_walk(&bh_tree, vec, masses, i, theta2, a);
+        acc[3 * i] = G * a[0];
+        acc[3 * i + 1] = G * a[1];
+        acc[3 * i + 2] = G * a[2];
+    }
+    return EXIT_NORMAL;
+}
+
+void set_opening_angle(double theta) {
+    opening_angle_global = (real) theta;
+}
+
+double get_opening_angle() {
+    return (double) opening_angle_global;
+}
+
+void tree_finalize() {
+    octree_free(&bh_tree);
+}
@@ -0,0 +1,38 @@
+#ifndef TREE_FORCE_H
+#define TREE_FORCE_H
+
+#include "common.h"
+
+// Maximum number of particles stored in a leaf cell
+#define TREE_LEAF_SIZE 8
+// Cells are not split beyond this depth (protects against coincident particles)
+#define TREE_MAX_DEPTH 48
+
+typedef struct {
+    real center[3];   // geometric centre of the cubic cell
+    real half;        // half of the side length of the cell
+    real com[3];      // centre of mass of the sources in the cell
+    real mass;        // total mass of the sources in the cell
+    real quad[6];     // traceless quadrupole about com: xx, xy, xz, yy, yz, zz
+    real bmax;        // distance from com to the farthest particle in the cell
+    int child[8];     // index of the child cells, -1 if the octant is empty
+    int first;        // first entry of the cell in the permuted index array
+    int count;        // number of particles in the cell
+    int is_leaf;
+} tree_node;
+
+typedef struct {
+    tree_node *nodes;
+    size_t n_nodes;
+    size_t cap_nodes;
+    int *index;       // particle indices, permuted such that every cell is a contiguous range
+    int *scratch;     // work space used while partitioning the index array
+    size_t cap_index;
+    int leaf_size;    // maximum number of particles in a leaf cell, TREE_LEAF_SIZE if 0
+} octree;
+
+int octree_build(octree *tree, const real pos[], const real masses[], size_t N);
+void octree_free(octree *tree);
+void tree_finalize();
+
+#endif
@@ -26,7 +26,14 @@ if platform.system() != 'Windows':
                                 'libabie/integrator_wisdom_holman.c',
                                 'libabie/integrator_runge_kutta.c',
                                 'libabie/common.c',
-                                'libabie/additional_forces.c'],
+                                'libabie/additional_forces.c',
+                                'libabie/tree_force.c',
+                                'libabie/fmm_force.c',
+                                'libabie/simd_force.c',
+                                'libabie/integrator_hermite.c',
+                                'libabie/integrator_hybrid.c',
+                                'libabie/integrator_ensemble.c',
+                                'libabie/neighbour_grid.c'],
                             include_dirs = ['libabie'],
                             extra_compile_args=['-fstrict-aliasing', '-O3','-std=c99','-march=native','-fPIC', '-shared', '-fcommon', '-fopenmp', '-DOPENMP'],
                             extra_link_args=extra_link_args,